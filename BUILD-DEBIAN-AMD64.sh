@@ -456,6 +456,12 @@ else
     warn "Will create Smart TV interface during build"
 fi
 
+# Shared Python package imported by the GUI scripts
+if [ -d "$BASE_DIR/overlays/usr/lib/python3/dist-packages/pitv" ]; then
+    cp -r "$BASE_DIR/overlays/usr/lib/python3/dist-packages/pitv" stage2/99-custom-gui/files/
+    log "✓ Shared pitv package copied from repository"
+fi
+
 cat > stage2/99-custom-gui/00-run.sh << 'EOFGUI'
 #!/bin/bash -e
 on_chroot << EOFCHROOT
@@ -463,6 +469,44 @@ mkdir -p /usr/local/bin
 mkdir -p /home/pi/.config/autostart
 
 # Install GUI script if it exists
+if [ -d "/tmp/files/pitv" ]; then
+  mkdir -p /usr/lib/python3/dist-packages
+  cp -r /tmp/files/pitv /usr/lib/python3/dist-packages/
+  python3 -c "import pitv" || { echo "pitv is not importable"; exit 1; }
+
+  # Root broker that runs privileged commands for the GUI
+  cat > /etc/systemd/system/pitv-broker.service << 'BROKER'
+[Unit]
+Description=Privileged command broker for the GUIs
+After=local-fs.target
+
+[Service]
+Type=simple
+ExecStart=/usr/bin/python3 -m pitv.broker --allow-user pi
+Restart=always
+
+[Install]
+WantedBy=multi-user.target
+BROKER
+  systemctl enable pitv-broker.service
+
+  # Casting/idle CPU governor and IRQ affinity profiles
+  cat > /etc/systemd/system/pitv-profiles.service << 'PROFILES'
+[Unit]
+Description=Activity-based CPU governor and IRQ affinity profiles
+After=local-fs.target
+
+[Service]
+Type=simple
+ExecStart=/usr/bin/python3 -m pitv.profiles
+Restart=always
+
+[Install]
+WantedBy=multi-user.target
+PROFILES
+  systemctl enable pitv-profiles.service
+fi
+
 if [ -f "/tmp/files/raspberry-pi-gui.py" ]; then
   install -m 755 /tmp/files/raspberry-pi-gui.py /usr/local/bin/
   echo "Custom GUI script installed"
@@ -0,0 +1,4 @@
+"""
+Raspberry Pi Custom OS - shared library
+Code shared by the GTK/Qt front ends and the remote control server
+"""
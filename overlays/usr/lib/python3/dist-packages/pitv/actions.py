@@ -0,0 +1,275 @@
+"""
+Non-blocking action dispatcher
+Runs user actions (launches, privileged commands, slow sampling) off the UI
+thread and reports progress, completion, cancellation and timeouts back on it
+"""
+
+import asyncio
+import subprocess
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+TIMEOUT = 'timeout'
+CANCELLED = 'cancelled'
+FINISHED = (DONE, FAILED, TIMEOUT, CANCELLED)
+
+
+class ActionTimeout(Exception):
+    """Raised (passed to on_error) when an action overruns its timeout"""
+
+
+class Action:
+    """Handle for a submitted action"""
+
+    def __init__(self, dispatcher, name, timeout=None, on_error=None):
+        self.dispatcher = dispatcher
+        self.name = name
+        self.timeout = timeout
+        self.on_error = on_error
+        self.state = PENDING
+        self.progress = None
+        self.message = None
+        self.result = None
+        self.error = None
+        self.submitted = time.monotonic()
+        self.finished = None
+        self.future = None
+        self.timer = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        """True once the action was cancelled or timed out"""
+        return self.cancel_event.is_set()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.submitted
+
+    def cancel(self):
+        """Cancel the action; running commands are killed"""
+        self.dispatcher.finish(self, CANCELLED)
+
+    def report(self, progress=None, message=None):
+        """Report progress from the worker (progress is 0.0 - 1.0)"""
+        self.progress = progress
+        self.message = message
+        self.dispatcher.emit(self)
+
+
+class Dispatcher:
+    """Thread pool plus asyncio loop that report back on the UI thread
+
+    `post(func, *args)` must run func on the UI thread; use glib_poster() or
+    qt_poster(). Callbacks and listeners are always called through it.
+    """
+
+    def __init__(self, post, workers=4):
+        self.post = post
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='action')
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.active = set()
+        self.loop = None
+
+    def listen(self, callback):
+        """Call callback(action) on the UI thread whenever an action changes state"""
+        self.listeners.append(callback)
+
+    def emit(self, action):
+        self.post(self._notify, action)
+
+    def _notify(self, action):
+        for callback in self.listeners:
+            callback(action)
+
+    def _start(self, name, timeout, on_error):
+        action = Action(self, name, timeout, on_error)
+        with self.lock:
+            self.active.add(action)
+        if timeout:
+            action.timer = threading.Timer(timeout, self.finish, (action, TIMEOUT))
+            action.timer.daemon = True
+            action.timer.start()
+        return action
+
+    def finish(self, action, state, result=None, error=None, callback=None):
+        """Move an action to a final state; later results are ignored"""
+        with self.lock:
+            if action.state in FINISHED:
+                return
+            action.state = state
+            action.result = result
+            action.error = error
+            action.finished = time.monotonic()
+            self.active.discard(action)
+        if action.timer is not None:
+            action.timer.cancel()
+        if state in (CANCELLED, TIMEOUT):
+            action.cancel_event.set()
+            if action.future is not None:
+                action.future.cancel()
+            if state == TIMEOUT:
+                action.error = ActionTimeout(f"{action.name} timed out after {action.timeout}s")
+                callback = action.on_error
+                error = action.error
+        # Listeners first, so a callback's own status message wins
+        self.emit(action)
+        if callback is not None:
+            self.post(callback, result if state == DONE else error)
+
+    def submit(self, name, func, *args, timeout=None, on_done=None, on_error=None):
+        """Run func(action, *args) on the thread pool"""
+        action = self._start(name, timeout, on_error)
+        action.future = self.pool.submit(self._execute, action, func, args, on_done, on_error)
+        return action
+
+    def _execute(self, action, func, args, on_done, on_error):
+        if action.cancelled:
+            return
+        action.state = RUNNING
+        self.emit(action)
+        try:
+            result = func(action, *args)
+        except CancelledError:
+            self.finish(action, CANCELLED)
+        except Exception as e:
+            self.finish(action, FAILED, error=e, callback=on_error)
+        else:
+            self.finish(action, DONE, result=result, callback=on_done)
+
+    def run(self, name, argv, timeout=30, on_done=None, on_error=None):
+        """Run a command to completion off the UI thread; result is its stdout"""
+        return self.submit(name, run_command, argv, timeout=timeout,
+                           on_done=on_done, on_error=on_error)
+
+    def spawn(self, name, argv, on_done=None, on_error=None):
+        """Start a program without waiting for it; result is the Popen"""
+        return self.submit(name, spawn_command, argv, on_done=on_done, on_error=on_error)
+
+    def call(self, name, func, *args, timeout=None, on_done=None, on_error=None):
+        """Run a plain func(*args) (e.g. psutil sampling) off the UI thread"""
+        return self.submit(name, lambda action, *a: func(*a), *args, timeout=timeout,
+                           on_done=on_done, on_error=on_error)
+
+    def event_loop(self):
+        """The dispatcher's asyncio loop, started on first use"""
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self.loop.run_forever,
+                                          name='action-loop', daemon=True)
+                thread.start()
+        return self.loop
+
+    def submit_async(self, name, coro, timeout=None, on_done=None, on_error=None):
+        """Run a coroutine on the dispatcher's asyncio loop"""
+        action = self._start(name, timeout, on_error)
+
+        async def runner():
+            action.state = RUNNING
+            self.emit(action)
+            return await coro
+
+        def done(future):
+            if future.cancelled():
+                self.finish(action, CANCELLED)
+            elif future.exception() is not None:
+                self.finish(action, FAILED, error=future.exception(), callback=on_error)
+            else:
+                self.finish(action, DONE, result=future.result(), callback=on_done)
+
+        action.future = asyncio.run_coroutine_threadsafe(runner(), self.event_loop())
+        action.future.add_done_callback(done)
+        return action
+
+    def cancel_all(self):
+        with self.lock:
+            active = list(self.active)
+        for action in active:
+            action.cancel()
+
+    def shutdown(self):
+        """Cancel outstanding actions and stop the workers"""
+        self.cancel_all()
+        self.pool.shutdown(wait=False)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def run_command(action, argv):
+    """Run argv, killing it if the action is cancelled or times out"""
+    proc = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    while True:
+        try:
+            out, err = proc.communicate(timeout=0.1)
+            break
+        except subprocess.TimeoutExpired:
+            if action.cancelled:
+                proc.kill()
+                proc.communicate()
+                raise CancelledError()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, argv, out, err)
+    return out
+
+
+def spawn_command(action, argv):
+    """Start argv detached from the UI's stdio"""
+    return subprocess.Popen(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+
+
+def describe(action):
+    """One-line human readable status of an action"""
+    if action.state == RUNNING:
+        if action.message:
+            return f"⏳ {action.name}: {action.message}"
+        return f"⏳ {action.name}..."
+    if action.state == DONE:
+        return f"✅ {action.name} ({action.elapsed:.1f}s)"
+    if action.state == TIMEOUT:
+        return f"⌛ {action.name} timed out after {action.timeout}s"
+    if action.state == CANCELLED:
+        return f"🚫 {action.name} cancelled"
+    if action.state == FAILED:
+        return f"❌ {action.name} failed: {action.error}"
+    return f"{action.name}"
+
+
+def glib_poster():
+    """Post callbacks onto the GLib main loop"""
+    from gi.repository import GLib
+
+    def post(func, *args):
+        def call():
+            func(*args)
+            return False
+        GLib.idle_add(call)
+    return post
+
+
+def qt_poster():
+    """Post callbacks onto the Qt main thread (create it on that thread)"""
+    from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+
+    class Poster(QObject):
+        posted = pyqtSignal(object)
+
+        @pyqtSlot(object)
+        def call(self, func):
+            func()
+
+    poster = Poster()
+    poster.posted.connect(poster.call)
+
+    def post(func, *args):
+        poster.posted.emit(lambda: func(*args))
+    # Keep the QObject alive as long as the poster is
+    post.poster = poster
+    return post
@@ -0,0 +1,76 @@
+"""
+Socket activation and idle exit for the on-demand servers
+systemd holds the listening socket and starts the server on the first
+connection (LISTEN_FDS, see sd_listen_fds(3)); the server exits again once
+it has been idle for a while and systemd goes back to listening
+"""
+
+import os
+import socket
+import threading
+import time
+
+LISTEN_FDS_START = 3
+
+
+def listen_sockets():
+    """Listening sockets passed in by systemd, or [] when started by hand"""
+    if os.environ.get('LISTEN_PID') != str(os.getpid()):
+        return []
+    count = int(os.environ.get('LISTEN_FDS', '0'))
+    # Not for our children
+    for name in ('LISTEN_PID', 'LISTEN_FDS', 'LISTEN_FDNAMES'):
+        os.environ.pop(name, None)
+    sockets = []
+    for fd in range(LISTEN_FDS_START, LISTEN_FDS_START + count):
+        os.set_inheritable(fd, False)
+        sockets.append(socket.socket(fileno=fd))
+    return sockets
+
+
+def hand_over(count):
+    """preexec_fn passing our inherited sockets (already at fds 3...) on to a child"""
+    def preexec():
+        os.environ['LISTEN_FDS'] = str(count)
+        os.environ['LISTEN_PID'] = str(os.getpid())
+    return preexec
+
+
+class IdleTimer:
+    """Calls on_idle once no request has been in flight for `timeout` seconds
+
+    Servers call begin() and end() around each request. A timeout of 0
+    disables the timer.
+    """
+
+    def __init__(self, timeout, on_idle):
+        self.timeout = timeout
+        self.on_idle = on_idle
+        self.active = 0
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def begin(self):
+        with self.lock:
+            self.active += 1
+            self.last = time.monotonic()
+
+    def end(self):
+        with self.lock:
+            self.active -= 1
+            self.last = time.monotonic()
+
+    def start(self):
+        if self.timeout > 0:
+            threading.Thread(target=self.run, name='idle', daemon=True).start()
+
+    def run(self):
+        while True:
+            with self.lock:
+                remaining = self.timeout - (time.monotonic() - self.last)
+                idle = self.active == 0 and remaining <= 0
+            if idle:
+                print(f"Idle for {self.timeout:.0f} s, exiting")
+                self.on_idle()
+                return
+            time.sleep(max(remaining, 1.0))
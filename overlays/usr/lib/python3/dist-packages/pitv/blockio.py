@@ -0,0 +1,237 @@
+"""
+Block device I/O monitor
+Read/write IOPS, throughput, average service time, utilisation and
+in-flight requests per disk from /proc/diskstats, plus the write volume
+needed to estimate SD card wear
+
+Try it with:  python3 -m pitv.blockio
+"""
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+
+from pitv.humanize import format_bytes, format_rate
+
+# /proc/diskstats columns after major, minor and name
+READS, READ_SECTORS, READ_MS = 0, 2, 3
+WRITES, WRITE_SECTORS, WRITE_MS = 4, 6, 7
+IN_FLIGHT, IO_MS, QUEUE_MS = 8, 9, 10
+
+SECTOR = 512
+
+# Whole disks only: no partitions, loop or ram devices
+DEVICE_PATTERN = re.compile(r'^(mmcblk\d+|sd[a-z]+|nvme\d+n\d+|vd[a-z]+)$')
+
+# Program/erase cycles assumed for consumer SD cards and USB sticks. The
+# real figure varies widely by card, so wear is only a rough guide.
+PE_CYCLES = 1000
+
+WEAR_PATH = os.path.expanduser('~/.local/state/pitv/block-wear.json')
+
+
+def read_boot_id(proc='/proc'):
+    try:
+        with open(os.path.join(proc, 'sys/kernel/random/boot_id')) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+class WearTracker:
+    """Bytes written to each device across reboots
+
+    diskstats counters start from zero at boot, so the total of previous
+    boots is kept in a small JSON file. Every process that samples the
+    disks updates the same file; they all see the same kernel counters, so
+    the last writer is as right as any other.
+    """
+
+    def __init__(self, path=WEAR_PATH, proc='/proc', sys='/sys', save_every=600.0):
+        self.path = path
+        self.proc = proc
+        self.sys = sys
+        self.save_every = save_every
+        self.boot_id = read_boot_id(proc)
+        self.last_save = None
+        self.state = self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        devices = state.get('devices', {})
+        if state.get('boot_id') != self.boot_id:
+            # New boot: fold what the last boot wrote into the history
+            for device in devices.values():
+                device['previous_boots'] = device.get('previous_boots', 0) + device.get('this_boot', 0)
+                device['this_boot'] = 0
+        return {'boot_id': self.boot_id, 'devices': devices}
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.state, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Block I/O: cannot save {self.path}: {e}")
+
+    def capacity(self, device):
+        try:
+            with open(os.path.join(self.sys, 'block', device, 'size')) as f:
+                return int(f.read()) * SECTOR
+        except (OSError, ValueError):
+            return 0
+
+    def emmc_life_time(self, device):
+        """eMMC life time estimate in percent used (None for SD cards)"""
+        try:
+            with open(os.path.join(self.sys, 'block', device, 'device/life_time')) as f:
+                # Two values (type A/B cells), 0x01 = 0-10% used ... 0x0B = exceeded
+                worst = max(int(v, 16) for v in f.read().split())
+        except (OSError, ValueError):
+            return None
+        return min(worst * 10, 100) if worst else None
+
+    def update(self, device, written, now):
+        """Record this boot's bytes written and return the wear estimate"""
+        entry = self.state['devices'].setdefault(device, {'previous_boots': 0, 'this_boot': 0})
+        entry['this_boot'] = max(entry['this_boot'], written)
+        total = entry['previous_boots'] + entry['this_boot']
+        if self.last_save is None or now - self.last_save >= self.save_every:
+            self.last_save = now
+            self.save()
+
+        capacity = entry.get('capacity') or self.capacity(device)
+        entry['capacity'] = capacity
+        endurance = capacity * PE_CYCLES
+        try:
+            with open(os.path.join(self.proc, 'uptime')) as f:
+                days = float(f.read().split()[0]) / 86400.0
+        except (OSError, ValueError):
+            days = 0.0
+        daily = entry['this_boot'] / days if days else 0.0
+        return {
+            'written': total,
+            'daily': daily,
+            'endurance': endurance,
+            'used': 100.0 * total / endurance if endurance else None,
+            'years_left': (endurance - total) / daily / 365.0 if daily and endurance else None,
+            'life_time': self.emmc_life_time(device),
+        }
+
+
+class BlockCollector:
+    """Per-device rates from successive /proc/diskstats samples"""
+
+    def __init__(self, proc='/proc', sys='/sys', wear_path=WEAR_PATH):
+        self.proc = proc
+        self.previous = {}
+        self.last_time = None
+        self.last = None
+        self.lock = threading.Lock()
+        self.wear = WearTracker(wear_path, proc, sys) if wear_path else None
+
+    def read_stats(self):
+        stats = {}
+        with open(os.path.join(self.proc, 'diskstats')) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 14 and DEVICE_PATTERN.match(fields[2]):
+                    stats[fields[2]] = [int(v) for v in fields[3:14]]
+        return stats
+
+    def sample(self, now=None):
+        with self.lock:
+            self.last = self.sample_devices(time.monotonic() if now is None else now)
+            return self.last
+
+    def latest(self, max_age=1.0):
+        """Last sample if it is recent enough, otherwise a new one"""
+        with self.lock:
+            if self.last is not None and time.monotonic() - self.last_time < max_age:
+                return self.last
+        return self.sample()
+
+    def sample_devices(self, now):
+        current = self.read_stats()
+        elapsed = now - self.last_time if self.last_time is not None else None
+        self.last_time = now
+
+        devices = {}
+        for name, values in current.items():
+            device = {
+                'read_iops': 0.0, 'write_iops': 0.0,
+                'read_rate': 0.0, 'write_rate': 0.0,
+                'read_await': 0.0, 'write_await': 0.0, 'await': 0.0,
+                'util': 0.0, 'queue': 0.0,
+                'in_flight': values[IN_FLIGHT],
+            }
+            previous = self.previous.get(name)
+            if previous is not None and elapsed:
+                delta = [c - p for c, p in zip(values, previous)]
+                reads, writes = delta[READS], delta[WRITES]
+                device['read_iops'] = reads / elapsed
+                device['write_iops'] = writes / elapsed
+                device['read_rate'] = delta[READ_SECTORS] * SECTOR / elapsed
+                device['write_rate'] = delta[WRITE_SECTORS] * SECTOR / elapsed
+                # Average time per completed request, queueing included (iostat's await)
+                device['read_await'] = delta[READ_MS] / reads if reads else 0.0
+                device['write_await'] = delta[WRITE_MS] / writes if writes else 0.0
+                ios = reads + writes
+                device['await'] = (delta[READ_MS] + delta[WRITE_MS]) / ios if ios else 0.0
+                device['util'] = min(100.0 * delta[IO_MS] / (elapsed * 1000.0), 100.0)
+                device['queue'] = delta[QUEUE_MS] / (elapsed * 1000.0)
+            if self.wear is not None:
+                device['wear'] = self.wear.update(name, values[WRITE_SECTORS] * SECTOR, now)
+            devices[name] = device
+        self.previous = current
+        return devices
+
+
+def describe_device(name, device):
+    """One line for a status panel"""
+    return (f"{name}: r {format_rate(device['read_rate'])} ({device['read_iops']:.0f} IOPS) · "
+            f"w {format_rate(device['write_rate'])} ({device['write_iops']:.0f} IOPS) · "
+            f"await {device['await']:.1f} ms · {device['in_flight']} in flight")
+
+
+def describe_wear(wear):
+    text = f"written {format_bytes(wear['written'])} ({format_bytes(wear['daily'])}/day)"
+    if wear['life_time'] is not None:
+        text += f" · eMMC life used ~{wear['life_time']}%"
+    elif wear['used'] is not None:
+        text += f" · ~{wear['used']:.2f}% of rated endurance"
+        if wear['years_left'] is not None:
+            text += f", ~{wear['years_left']:.0f} years left"
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Block device I/O monitor")
+    parser.add_argument('--proc', default='/proc')
+    parser.add_argument('--sys', default='/sys')
+    parser.add_argument('--interval', type=float, default=2.0)
+    args = parser.parse_args()
+
+    collector = BlockCollector(args.proc, args.sys)
+    collector.sample()
+    try:
+        while True:
+            time.sleep(args.interval)
+            for name, device in collector.sample().items():
+                print(describe_device(name, device))
+                print(f"  {describe_wear(device['wear'])}")
+    except KeyboardInterrupt:
+        collector.wear.save()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,359 @@
+"""
+Privileged command broker
+A small root-owned daemon that performs a fixed set of typed privileged
+commands for the GUIs over a Unix socket, so they no longer need sudo.
+
+Frames are a 3 byte header (opcode or status, payload length) followed by
+a UTF-8 payload. Callers are authorized by their SO_PEERCRED credentials.
+
+Run with:  python3 -m pitv.broker --allow-user pi
+"""
+
+import argparse
+import glob
+import grp
+import os
+import pwd
+import socket
+import socketserver
+import struct
+import subprocess
+import threading
+import time
+
+SOCKET_PATH = '/run/pitv/broker.sock'
+
+HEADER = struct.Struct('!BH')
+PEERCRED = struct.Struct('3i')
+
+# Request opcodes
+PING = 0
+UNIT_START = 1
+UNIT_STOP = 2
+UNIT_RESTART = 3
+REBOOT = 4
+SHUTDOWN = 5
+SET_GOVERNOR = 6
+BACKGROUND_PRIORITY = 7
+
+# Response status codes
+OK = 0
+DENIED = 1
+BAD_REQUEST = 2
+FAILED = 3
+
+# Units the GUIs are allowed to control
+ALLOWED_UNITS = (
+    'ssh', 'shairport-sync', 'avahi-daemon', 'smbd', 'nginx',
+    'airplay', 'google-cast', 'remote-control',
+)
+
+GOVERNORS = ('performance', 'ondemand', 'powersave', 'conservative', 'schedutil')
+
+# Services that can be deprioritised while the SoC is hot
+BACKGROUND_UNITS = ('smbd', 'nginx', 'avahi-daemon')
+PRIORITIES = {'low': 20, 'normal': 100}
+
+
+class BrokerError(Exception):
+    """A command was refused or failed, or the broker is unreachable"""
+
+
+def encode(code, text=''):
+    payload = text.encode('utf-8')[:0xffff]
+    return HEADER.pack(code, len(payload)) + payload
+
+
+def recv_exact(sock, size):
+    """Read exactly size bytes; returns b'' on a clean EOF"""
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            if data:
+                raise ConnectionError("connection closed mid-frame")
+            return b''
+        data += chunk
+    return data
+
+
+def read_frame(sock):
+    """Read one (code, text) frame, or None at EOF"""
+    header = recv_exact(sock, HEADER.size)
+    if not header:
+        return None
+    code, length = HEADER.unpack(header)
+    payload = recv_exact(sock, length) if length else b''
+    if length and not payload:
+        raise ConnectionError("connection closed mid-frame")
+    return code, payload.decode('utf-8', 'replace')
+
+
+def peer_credentials(sock):
+    """(pid, uid, gid) of the process on the other end of a Unix socket"""
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, PEERCRED.size)
+    return PEERCRED.unpack(creds)
+
+
+def peer_groups(pid):
+    """Supplementary group ids of a process"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('Groups:'):
+                    return {int(g) for g in line.split()[1:]}
+    except OSError:
+        pass
+    return set()
+
+
+class SystemBackend:
+    """Performs commands on the real system"""
+
+    def __init__(self, sysfs='/sys'):
+        self.sysfs = sysfs
+
+    def systemctl(self, *args):
+        result = subprocess.run(['systemctl', *args], capture_output=True, text=True, timeout=10)
+        if result.returncode != 0:
+            raise BrokerError(result.stderr.strip() or f"systemctl {' '.join(args)} failed")
+
+    def unit(self, verb, unit):
+        # --no-block queues the job and returns instead of waiting for the unit
+        self.systemctl('--no-block', verb, unit)
+
+    def reboot(self):
+        self.systemctl('--no-block', 'reboot')
+
+    def shutdown(self):
+        self.systemctl('--no-block', 'poweroff')
+
+    def background_priority(self, priority):
+        weight = PRIORITIES[priority]
+        for unit in BACKGROUND_UNITS:
+            self.systemctl('set-property', '--runtime', unit,
+                           f'CPUWeight={weight}', f'IOWeight={weight}')
+
+    def set_governor(self, governor):
+        paths = glob.glob(os.path.join(self.sysfs, 'devices/system/cpu/cpu[0-9]*/cpufreq/scaling_governor'))
+        if not paths:
+            raise BrokerError("cpufreq is not available")
+        for path in paths:
+            with open(path, 'w') as f:
+                f.write(governor)
+
+
+class FakeBackend:
+    """Records commands instead of running them (for unprivileged runs)"""
+
+    def __init__(self):
+        self.calls = []
+
+    def unit(self, verb, unit):
+        self.calls.append(('unit', verb, unit))
+
+    def reboot(self):
+        self.calls.append(('reboot',))
+
+    def shutdown(self):
+        self.calls.append(('shutdown',))
+
+    def set_governor(self, governor):
+        self.calls.append(('set_governor', governor))
+
+    def background_priority(self, priority):
+        self.calls.append(('background_priority', priority))
+
+
+class Broker:
+    """Validates, authorizes and executes commands"""
+
+    def __init__(self, backend, allowed_uids=(), allowed_gids=()):
+        self.backend = backend
+        self.allowed_uids = set(allowed_uids) | {0}
+        self.allowed_gids = set(allowed_gids)
+        self.commands = {
+            PING: ('ping', None, lambda arg: 'pong'),
+            UNIT_START: ('start', ALLOWED_UNITS, lambda arg: self.backend.unit('start', arg)),
+            UNIT_STOP: ('stop', ALLOWED_UNITS, lambda arg: self.backend.unit('stop', arg)),
+            UNIT_RESTART: ('restart', ALLOWED_UNITS, lambda arg: self.backend.unit('restart', arg)),
+            REBOOT: ('reboot', None, lambda arg: self.backend.reboot()),
+            SHUTDOWN: ('shutdown', None, lambda arg: self.backend.shutdown()),
+            SET_GOVERNOR: ('governor', GOVERNORS, lambda arg: self.backend.set_governor(arg)),
+            BACKGROUND_PRIORITY: ('priority', tuple(PRIORITIES),
+                                  lambda arg: self.backend.background_priority(arg)),
+        }
+
+    def authorized(self, pid, uid, gid):
+        if uid in self.allowed_uids:
+            return True
+        if not self.allowed_gids:
+            return False
+        return gid in self.allowed_gids or bool(peer_groups(pid) & self.allowed_gids)
+
+    def execute(self, op, arg, pid, uid, gid):
+        """Run one command; returns (status, message)"""
+        command = self.commands.get(op)
+        if command is None:
+            return BAD_REQUEST, f"unknown command {op}"
+        name, allowed, handler = command
+        if allowed is not None and arg not in allowed:
+            return BAD_REQUEST, f"{name}: {arg!r} is not allowed"
+        if op != PING and not self.authorized(pid, uid, gid):
+            print(f"Broker: denied {name} {arg} for pid {pid} uid {uid}")
+            return DENIED, "permission denied"
+
+        try:
+            result = handler(arg)
+        except Exception as e:
+            print(f"Broker: {name} {arg} failed: {e}")
+            return FAILED, str(e)
+        if op != PING:
+            print(f"Broker: {name} {arg} for pid {pid} uid {uid}")
+        return OK, result or ''
+
+
+class BrokerHandler(socketserver.BaseRequestHandler):
+    """Serves frames on one client connection until it closes"""
+
+    def handle(self):
+        pid, uid, gid = peer_credentials(self.request)
+        while True:
+            try:
+                frame = read_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            if frame is None:
+                return
+            op, arg = frame
+            status, message = self.server.broker.execute(op, arg, pid, uid, gid)
+            self.request.sendall(encode(status, message))
+
+
+class BrokerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, broker):
+        self.broker = broker
+        if os.path.exists(path):
+            os.unlink(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        super().__init__(path, BrokerHandler)
+        # Anyone may connect; each command is authorized by peer credentials
+        os.chmod(path, 0o666)
+
+
+class BrokerClient:
+    """Persistent connection to the broker; safe to share between threads"""
+
+    def __init__(self, path=SOCKET_PATH, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self.sock = None
+        self.lock = threading.Lock()
+        self.latency = None
+
+    def connect(self):
+        if self.sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            self.sock = sock
+        return self.sock
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def request(self, op, arg=''):
+        """Send one command and wait for its result
+
+        Only a failed connect or send is retried: once the request is
+        written the broker may be acting on it, and a second copy could
+        reboot twice or restart a unit twice.
+        """
+        with self.lock:
+            start = time.monotonic()
+            self.send(encode(op, arg))
+            try:
+                frame = read_frame(self.sock)
+            except OSError as e:
+                self.close()
+                raise BrokerError(f"no reply from the broker: {e}")
+            if frame is None:
+                self.close()
+                raise BrokerError("broker closed the connection before replying")
+            self.latency = time.monotonic() - start
+        status, message = frame
+        if status != OK:
+            raise BrokerError(message)
+        return message
+
+    def send(self, data):
+        # A kept connection goes stale when the broker restarts; reconnect once
+        reused = self.sock is not None
+        for attempt in range(2 if reused else 1):
+            try:
+                self.connect().sendall(data)
+                return
+            except OSError as e:
+                self.close()
+                error = e
+        raise BrokerError(f"broker unavailable: {error}")
+
+    def ping(self):
+        return self.request(PING)
+
+    def unit_start(self, unit):
+        return self.request(UNIT_START, unit)
+
+    def unit_stop(self, unit):
+        return self.request(UNIT_STOP, unit)
+
+    def unit_restart(self, unit):
+        return self.request(UNIT_RESTART, unit)
+
+    def reboot(self):
+        return self.request(REBOOT)
+
+    def shutdown(self):
+        return self.request(SHUTDOWN)
+
+    def set_governor(self, governor):
+        return self.request(SET_GOVERNOR, governor)
+
+    def background_priority(self, priority):
+        return self.request(BACKGROUND_PRIORITY, priority)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Privileged command broker")
+    parser.add_argument('--socket', default=SOCKET_PATH)
+    parser.add_argument('--allow-user', action='append', default=[],
+                        help="user allowed to send commands (repeatable)")
+    parser.add_argument('--allow-group', action='append', default=[],
+                        help="group allowed to send commands (repeatable)")
+    parser.add_argument('--fake', action='store_true',
+                        help="record commands instead of running them")
+    args = parser.parse_args()
+
+    uids = [pwd.getpwnam(user).pw_uid for user in args.allow_user]
+    gids = [grp.getgrnam(group).gr_gid for group in args.allow_group]
+    if args.fake:
+        uids.append(os.getuid())
+    backend = FakeBackend() if args.fake else SystemBackend()
+
+    server = BrokerServer(args.socket, Broker(backend, uids, gids))
+    print(f"Broker listening on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,431 @@
+"""
+Casting session telemetry
+Follows shairport-sync's metadata pipe and statistics log plus the cast HTTP
+server's access log to track who is casting, with what codec and how well
+the stream is keeping up
+
+Live:          python3 -m pitv.casting
+Record:        python3 -m pitv.casting --record /tmp/airplay.xml
+Replay:        python3 -m pitv.casting --replay /tmp/airplay.xml
+"""
+
+import argparse
+import base64
+import json
+import os
+import posixpath
+import re
+import subprocess
+import threading
+import time
+from collections import deque
+from urllib.parse import unquote
+
+from pitv.humanize import format_duration, format_rate
+
+METADATA_PIPE = '/tmp/shairport-sync-metadata'
+
+# Cast HTTP server document root, to size the files it serves
+CAST_ROOT = '/home/pi'
+
+# syslog identifiers of the receivers (airplay.service and google-cast.service)
+AIRPLAY_TAG = 'shairport-sync'
+CAST_TAG = 'google-cast'
+
+# A cast client with no requests for this long has stopped
+CAST_IDLE = 30.0
+
+# AirPlay stream types (ssnc/styp) and the codec each carries
+STREAM_CODECS = {'Classic': 'ALAC', 'Realtime': 'ALAC', 'Buffered': 'AAC'}
+AAC_BITRATE = 256000
+
+MEDIA_CODECS = {
+    '.mp4': 'H.264/AAC', '.m4v': 'H.264/AAC', '.mkv': 'Matroska', '.webm': 'VP9/Opus',
+    '.mp3': 'MP3', '.m4a': 'AAC', '.aac': 'AAC', '.flac': 'FLAC', '.ogg': 'Vorbis',
+    '.m3u8': 'HLS', '.ts': 'MPEG-TS', '.mpd': 'DASH',
+}
+
+ITEM_PATTERN = re.compile(
+    r'<item><type>([0-9a-f]{8})</type><code>([0-9a-f]{8})</code><length>(\d+)</length>'
+    r'(?:\s*<data encoding="base64">\s*([^<]*)</data>)?\s*</item>', re.S)
+
+# http.server's log_message(): 'host - - [date] "GET /path HTTP/1.1" 200 -'
+ACCESS_PATTERN = re.compile(r'^(\S+) - \S+ \[[^\]]*\] "(\S+) (\S+)[^"]*" (\d{3}) (\S+)')
+
+
+def decode_tag(hex_tag):
+    return bytes.fromhex(hex_tag).decode('ascii', 'replace')
+
+
+def parse_metadata(chunks):
+    """(type, code, data) for each item in shairport-sync's metadata stream
+
+    chunks is any iterable of text, e.g. a file read in blocks. Items can
+    straddle chunk boundaries, so unparsed text is carried over.
+    """
+    buffer = ''
+    for chunk in chunks:
+        buffer += chunk
+        end = 0
+        for match in ITEM_PATTERN.finditer(buffer):
+            type_, code, length, data = match.groups()
+            payload = base64.b64decode(data) if data and int(length) else b''
+            yield decode_tag(type_), decode_tag(code), payload
+            end = match.end()
+        buffer = buffer[end:]
+        if len(buffer) > 1 << 20:
+            # Lost sync (e.g. a stalled cover art item): drop to the next item
+            start = buffer.find('<item>', 1)
+            buffer = buffer[start:] if start > 0 else ''
+
+
+class StatisticsParser:
+    """Rows of shairport-sync's --statistics table
+
+    The column titles differ between releases ("Missing" vs "missing
+    packets", '|' vs ',' separators), so columns are matched by keyword.
+    """
+
+    COLUMNS = (
+        ('sync error', 'sync_error_ms'),
+        ('too late', 'too_late'),
+        ('late', 'late'),
+        ('missing', 'missing'),
+        ('resend', 'resends'),
+        ('dac queue', 'dac_queue'),
+        ('packets', 'packets'),
+    )
+
+    def __init__(self):
+        self.columns = None
+
+    def split(self, line):
+        return [field.strip() for field in line.split('|' if '|' in line else ',')]
+
+    def feed(self, line):
+        """Statistics for a data row, None for anything else"""
+        fields = self.split(line)
+        if 'sync error' in line.lower():
+            self.columns = []
+            for title in fields:
+                title = title.lower()
+                self.columns.append(next((key for word, key in self.COLUMNS if word in title), None))
+            return None
+        if self.columns is None or len(fields) != len(self.columns):
+            return None
+        try:
+            values = [float(field) for field in fields]
+        except ValueError:
+            return None
+        return {key: value for key, value in zip(self.columns, values) if key}
+
+
+def parse_access(line):
+    """(client, method, path, status, bytes or None) from an access log line"""
+    match = ACCESS_PATTERN.match(line)
+    if match is None:
+        return None
+    client, method, path, status, size = match.groups()
+    return client, method, path, int(status), int(size) if size.isdigit() else None
+
+
+def served_path(path):
+    """Request path of a served file, relative to the directory served
+
+    Decoded, without query or fragment, and with '..' dropped the way
+    SimpleHTTPRequestHandler.translate_path does.
+    """
+    path = path.split('?', 1)[0].split('#', 1)[0]
+    path = posixpath.normpath(unquote(path))
+    return '/'.join(part for part in path.split('/') if part and part not in (os.curdir, os.pardir))
+
+
+class CastTelemetry:
+    """Active and recent casting sessions
+
+    The AirPlay session is built from metadata items (client, codec, track,
+    play/pause) and updated from the statistics log (sync error, packets
+    that arrived too late or never and were played as silence). Cast
+    sessions are one per client address of the HTTP server. Finished
+    sessions go into a ring buffer, and each session keeps its last
+    samples for graphs.
+    """
+
+    def __init__(self, history=20, samples=60, cast_root=CAST_ROOT, idle=CAST_IDLE):
+        self.airplay = None
+        self.casts = {}
+        self.history = deque(maxlen=history)
+        self.samples = samples
+        self.cast_root = cast_root
+        self.idle = idle
+        self.statistics = StatisticsParser()
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def new_session(self, protocol, now):
+        return {
+            'protocol': protocol,
+            'client': None,
+            'address': None,
+            'user_agent': None,
+            'codec': None,
+            'bitrate': None,
+            'state': 'playing',
+            'artist': None,
+            'title': None,
+            'started': now,
+            'updated': now,
+            'duration': 0.0,
+            'underruns': 0,
+            'flushes': 0,
+            'sync_error_ms': None,
+            'requests': 0,
+            'errors': 0,
+            'bytes': 0,
+            'samples': deque(maxlen=self.samples),
+        }
+
+    def finish(self, session, now):
+        session['state'] = 'ended'
+        session['duration'] = now - session['started']
+        self.history.append(session)
+
+    def airplay_session(self, now):
+        if self.airplay is None:
+            self.airplay = self.new_session('airplay', now)
+            self.airplay['codec'] = 'ALAC'
+            self.airplay['bitrate'] = 44100 * 16 * 2
+        self.airplay['updated'] = now
+        return self.airplay
+
+    def feed_metadata(self, type_, code, data, now=None):
+        now = time.monotonic() if now is None else now
+        text = data.decode('utf-8', 'replace')
+        with self.lock:
+            if type_ == 'ssnc' and code in ('pend', 'disc'):
+                if self.airplay is not None:
+                    self.finish(self.airplay, now)
+                    self.airplay = None
+                return
+            if type_ == 'ssnc' and code in ('abeg', 'conn', 'pbeg', 'prsm', 'pfls', 'snam', 'snua',
+                                            'clip', 'styp', 'ofps'):
+                session = self.airplay_session(now)
+            elif type_ == 'core' and code in ('minm', 'asar') and self.airplay is not None:
+                session = self.airplay_session(now)
+            else:
+                return
+
+            if code in ('pbeg', 'prsm'):
+                session['state'] = 'playing'
+            elif code == 'pfls':
+                session['state'] = 'paused'
+                session['flushes'] += 1
+            elif code == 'snam':
+                session['client'] = text
+            elif code == 'snua':
+                session['user_agent'] = text
+            elif code == 'clip':
+                session['address'] = text
+                session['client'] = session['client'] or text
+            elif code == 'styp':
+                session['codec'] = STREAM_CODECS.get(text, text)
+                if session['codec'] == 'AAC':
+                    session['bitrate'] = AAC_BITRATE
+            elif code == 'ofps' and text.isdigit() and session['codec'] == 'ALAC':
+                # Uncompressed stereo 16 bit; ALAC compresses to roughly 60-70% of this
+                session['bitrate'] = int(text) * 16 * 2
+            elif code == 'minm':
+                session['title'] = text
+            elif code == 'asar':
+                session['artist'] = text
+
+    def feed_statistics(self, line, now=None):
+        now = time.monotonic() if now is None else now
+        stats = self.statistics.feed(line)
+        if stats is None:
+            return
+        with self.lock:
+            if self.airplay is None:
+                return
+            session = self.airplay_session(now)
+            if 'sync_error_ms' in stats:
+                session['sync_error_ms'] = stats['sync_error_ms']
+            # Counters are per session; packets missing or too late were played as silence
+            lost = int(stats.get('missing', 0) + stats.get('too_late', 0))
+            session['underruns'] = max(session['underruns'], lost)
+            session['samples'].append((now, session['sync_error_ms'], session['underruns']))
+
+    def feed_access(self, line, now=None):
+        now = time.monotonic() if now is None else now
+        entry = parse_access(line)
+        if entry is None:
+            return
+        client, method, path, status, size = entry
+        with self.lock:
+            session = self.casts.get(client)
+            if session is None:
+                session = self.casts[client] = self.new_session('cast', now)
+                session['client'] = session['address'] = client
+            session['updated'] = now
+            session['requests'] += 1
+            if status >= 400:
+                session['errors'] += 1
+                return
+            path = served_path(path)
+            codec = MEDIA_CODECS.get(os.path.splitext(path)[1].lower())
+            if codec:
+                session['codec'] = codec
+                session['title'] = os.path.basename(path)
+            if size is None and method == 'GET':
+                # http.server doesn't log sizes; it always sends the whole file
+                try:
+                    size = os.path.getsize(os.path.join(self.cast_root, *path.split('/')))
+                except OSError:
+                    size = 0
+            session['bytes'] += size or 0
+            elapsed = now - session['started']
+            if elapsed > 0:
+                session['bitrate'] = session['bytes'] * 8 / elapsed
+            session['samples'].append((now, session['bitrate'], session['requests']))
+
+    def expire(self, now):
+        """End cast sessions that went quiet (lock held)"""
+        for client, session in list(self.casts.items()):
+            if now - session['updated'] >= self.idle:
+                del self.casts[client]
+                self.finish(session, now)
+
+    def export(self, session, now):
+        exported = {key: value for key, value in session.items() if key != 'samples'}
+        if exported['state'] != 'ended':
+            exported['duration'] = now - session['started']
+        exported['samples'] = list(session['samples'])
+        return exported
+
+    def snapshot(self, now=None):
+        """{'airplay': session or None, 'cast': [sessions], 'history': [sessions]}"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.expire(now)
+            return {
+                'airplay': self.export(self.airplay, now) if self.airplay else None,
+                'cast': [self.export(s, now) for s in self.casts.values()],
+                'history': [self.export(s, now) for s in self.history],
+            }
+
+    def session(self, protocol):
+        """The live session shown on a casting card, or None"""
+        snapshot = self.snapshot()
+        if protocol == 'airplay':
+            return snapshot['airplay']
+        return max(snapshot['cast'], key=lambda s: s['updated'], default=None)
+
+    def follow_pipe(self, path=METADATA_PIPE):
+        """Read the metadata FIFO forever, reopening it when the writer goes away"""
+        while True:
+            try:
+                with open(path, errors='replace') as f:
+                    for type_, code, data in parse_metadata(iter(lambda: f.read(4096), '')):
+                        self.feed_metadata(type_, code, data)
+            except OSError:
+                pass
+            time.sleep(5)
+
+    def follow_journal(self):
+        """Statistics and access lines from the receivers' syslog output"""
+        argv = ['journalctl', '--follow', '--lines=0', '--output=json',
+                '--identifier', AIRPLAY_TAG, '--identifier', CAST_TAG]
+        while True:
+            try:
+                with subprocess.Popen(argv, stdout=subprocess.PIPE, text=True) as journal:
+                    for line in journal.stdout:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        message = record.get('MESSAGE')
+                        if not isinstance(message, str):
+                            continue
+                        if record.get('SYSLOG_IDENTIFIER') == CAST_TAG:
+                            self.feed_access(message)
+                        else:
+                            self.feed_statistics(message)
+            except OSError as e:
+                print(f"Casting telemetry: cannot follow the journal: {e}")
+                return
+            time.sleep(5)
+
+    def start(self, pipe=METADATA_PIPE):
+        for target, args in ((self.follow_pipe, (pipe,)), (self.follow_journal, ())):
+            thread = threading.Thread(target=target, args=args, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+
+def describe_session(session):
+    """Status line for a casting card"""
+    if session is None:
+        return "Ready"
+    parts = [f"{'▶' if session['state'] == 'playing' else '⏸'} {session['client'] or 'unknown'}"]
+    if session['codec']:
+        parts.append(session['codec'])
+    if session['bitrate']:
+        parts.append(format_rate(session['bitrate'] / 8))
+    if session['protocol'] == 'airplay':
+        if session['sync_error_ms'] is not None:
+            parts.append(f"sync {session['sync_error_ms']:+.1f} ms")
+        if session['underruns']:
+            parts.append(f"⚠️ {session['underruns']} dropouts")
+    elif session['errors']:
+        parts.append(f"⚠️ {session['errors']} failed requests")
+    parts.append(format_duration(session['duration']))
+    text = " · ".join(parts)
+    track = " — ".join(filter(None, (session['artist'], session['title'])))
+    return f"{text}\n{track}" if track else text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Casting session telemetry")
+    parser.add_argument('--pipe', default=METADATA_PIPE)
+    parser.add_argument('--record', metavar='FILE', help="copy the metadata pipe to FILE")
+    parser.add_argument('--replay', metavar='FILE', help="print sessions from a recorded metadata stream")
+    parser.add_argument('--statistics', metavar='FILE', help="with --replay, also feed a saved statistics log")
+    args = parser.parse_args()
+
+    if args.record:
+        with open(args.pipe, 'rb') as source, open(args.record, 'wb') as target:
+            try:
+                for chunk in iter(lambda: source.read(4096), b''):
+                    target.write(chunk)
+                    target.flush()
+            except KeyboardInterrupt:
+                pass
+        return
+
+    telemetry = CastTelemetry()
+    if args.replay:
+        with open(args.replay, errors='replace') as f:
+            for type_, code, data in parse_metadata(iter(lambda: f.read(4096), '')):
+                telemetry.feed_metadata(type_, code, data)
+                print(f"{type_}/{code} {data[:60]!r}")
+        if args.statistics:
+            with open(args.statistics) as f:
+                for line in f:
+                    telemetry.feed_statistics(line)
+        snapshot = telemetry.snapshot()
+        for session in ([snapshot['airplay']] if snapshot['airplay'] else []) + snapshot['history']:
+            print(f"{session['protocol']}: {describe_session(session)}")
+        return
+
+    telemetry.start(args.pipe)
+    try:
+        while True:
+            time.sleep(2)
+            print(f"AirPlay: {describe_session(telemetry.session('airplay'))}")
+            print(f"Cast:    {describe_session(telemetry.session('cast'))}")
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
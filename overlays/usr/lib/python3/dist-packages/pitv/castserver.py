@@ -0,0 +1,77 @@
+"""
+Cast HTTP server
+Serves the media directory on port 8008 like `python3 -m http.server`
+(same access log format, which pitv.casting reads) plus the DIAL endpoints
+from pitv.dial, and can take its listening socket from systemd and exit
+when idle
+
+Run with:  python3 -m pitv.castserver --directory /home/pi
+"""
+
+import argparse
+import functools
+import socket
+from http.server import ThreadingHTTPServer
+
+from pitv.activation import IdleTimer, listen_sockets
+from pitv.dial import DIAL_PORT, DialRequestHandler
+
+CAST_PORT = DIAL_PORT
+
+
+class CastHTTPServer(ThreadingHTTPServer):
+    """Threading HTTP server that reports requests to an IdleTimer"""
+
+    idle = None
+
+    def process_request(self, request, client_address):
+        if self.idle is not None:
+            self.idle.begin()
+        super().process_request(request, client_address)
+
+    def shutdown_request(self, request):
+        super().shutdown_request(request)
+        if self.idle is not None:
+            self.idle.end()
+
+
+def make_server(handler, port=CAST_PORT, sock=None):
+    """Server on an inherited socket if given, otherwise bound to the port"""
+    if sock is None:
+        return CastHTTPServer(('', port), handler)
+    server = CastHTTPServer(sock.getsockname()[:2], handler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = sock
+    server.server_address = sock.getsockname()
+    # server_bind() would also look up our FQDN, which can stall on a Pi without DNS
+    server.server_name = socket.gethostname()
+    server.server_port = server.server_address[1]
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cast HTTP server")
+    parser.add_argument('--port', type=int, default=CAST_PORT)
+    parser.add_argument('--directory', default='.')
+    parser.add_argument('--idle-timeout', type=float, default=600.0,
+                        help="exit after this many idle seconds when socket-activated (0: never)")
+    args = parser.parse_args()
+
+    sockets = listen_sockets()
+    handler = functools.partial(DialRequestHandler, directory=args.directory)
+    server = make_server(handler, args.port, sockets[0] if sockets else None)
+    if sockets:
+        # Only exit if systemd is holding the port to start us again
+        server.idle = IdleTimer(args.idle_timeout, server.shutdown)
+        server.idle.start()
+    print(f"Serving {args.directory} on port {server.server_port}"
+          f"{' (socket-activated)' if sockets else ''}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
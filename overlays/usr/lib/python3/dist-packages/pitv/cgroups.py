@@ -0,0 +1,208 @@
+"""
+Per-service resource accounting from cgroup v2
+Reads CPU time, memory and IO bytes straight from each unit's cgroup under
+/sys/fs/cgroup/system.slice and turns the counters into rates
+
+Try it with:  python3 -m pitv.cgroups --units ssh smbd
+Fake tree:    python3 -m pitv.cgroups --root /tmp/cgroup --make-fake
+"""
+
+import argparse
+import os
+import time
+
+from pitv.humanize import format_bytes, format_duration, format_rate
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+SLICE = 'system.slice'
+
+# Units shown in the services panels
+SERVICE_UNITS = (
+    'ssh', 'shairport-sync', 'avahi-daemon', 'smbd', 'nginx', 'lightdm',
+    'airplay', 'google-cast', 'remote-control',
+)
+
+
+def read_keyed(path):
+    """'key value' lines (cpu.stat, memory.stat) as a dict of ints"""
+    values = {}
+    with open(path) as f:
+        for line in f:
+            key, _, value = line.partition(' ')
+            try:
+                values[key] = int(value)
+            except ValueError:
+                pass
+    return values
+
+
+def read_int(path):
+    with open(path) as f:
+        return int(f.read())
+
+
+def read_io(path):
+    """(read bytes, written bytes) summed over the devices in io.stat"""
+    rbytes = wbytes = 0
+    with open(path) as f:
+        for line in f:
+            for field in line.split()[1:]:
+                key, _, value = field.partition('=')
+                if key == 'rbytes':
+                    rbytes += int(value)
+                elif key == 'wbytes':
+                    wbytes += int(value)
+    return rbytes, wbytes
+
+
+class CgroupMonitor:
+    """Samples the cgroups of a fixed set of units
+
+    A unit's cgroup only exists while it has processes, so a missing
+    directory means the unit is stopped. A missing file only means that
+    controller is off (Raspberry Pi kernels boot with cgroup_disable=memory)
+    and its figures are None. Counters are cumulative; rates are computed
+    against the previous sample of the same cgroup and reset when the unit
+    restarts (its counters go back to zero).
+    """
+
+    def __init__(self, units=SERVICE_UNITS, root=CGROUP_ROOT, slice=SLICE):
+        self.units = units
+        self.root = root
+        self.slice_dir = os.path.join(root, slice)
+        self.previous = {}
+        self.peaks = {}
+
+    @property
+    def available(self):
+        """True on a unified (cgroup v2) hierarchy"""
+        return os.path.exists(os.path.join(self.root, 'cgroup.controllers'))
+
+    def unit_dir(self, unit):
+        if '.' not in unit:
+            unit += '.service'
+        return os.path.join(self.slice_dir, unit)
+
+    def sample_unit(self, unit, now=None):
+        """Usage of one unit, or None if it isn't running"""
+        now = time.monotonic() if now is None else now
+        path = self.unit_dir(unit)
+        if not os.path.isdir(path):
+            self.previous.pop(unit, None)
+            self.peaks.pop(unit, None)
+            return None
+        try:
+            cpu_usec = read_keyed(os.path.join(path, 'cpu.stat'))['usage_usec']
+        except (OSError, KeyError):
+            cpu_usec = None
+        try:
+            memory = read_int(os.path.join(path, 'memory.current'))
+        except (OSError, ValueError):
+            memory = None
+        try:
+            peak = read_int(os.path.join(path, 'memory.peak'))
+        except (OSError, ValueError):
+            # memory.peak is new in Linux 5.19; fall back to the highest we've seen
+            peak = max(self.peaks.get(unit, 0), memory) if memory is not None else None
+        if peak is not None:
+            self.peaks[unit] = peak
+        try:
+            rbytes, wbytes = read_io(os.path.join(path, 'io.stat'))
+        except (OSError, ValueError):
+            rbytes = wbytes = 0
+
+        usage = {
+            'cpu_seconds': cpu_usec / 1000000.0 if cpu_usec is not None else None,
+            'cpu': 0.0 if cpu_usec is not None else None,
+            'memory': memory,
+            'memory_peak': peak,
+            'read_bytes': rbytes,
+            'write_bytes': wbytes,
+            'read_rate': 0.0,
+            'write_rate': 0.0,
+        }
+        previous = self.previous.get(unit)
+        if previous is not None and now > previous[0]:
+            elapsed = now - previous[0]
+            if cpu_usec is not None and previous[1] is not None and cpu_usec >= previous[1]:
+                usage['cpu'] = 100.0 * (cpu_usec - previous[1]) / 1000000.0 / elapsed
+            usage['read_rate'] = max(rbytes - previous[2], 0) / elapsed
+            usage['write_rate'] = max(wbytes - previous[3], 0) / elapsed
+        self.previous[unit] = (now, cpu_usec, rbytes, wbytes)
+        return usage
+
+    def sample(self, now=None):
+        """{unit: usage or None} for every unit"""
+        now = time.monotonic() if now is None else now
+        return {unit: self.sample_unit(unit, now) for unit in self.units}
+
+
+def describe_usage(usage):
+    """One line for a services panel"""
+    if usage is None:
+        return "stopped"
+    parts = []
+    if usage['cpu'] is not None:
+        parts.append(f"CPU {usage['cpu']:.1f}% ({format_duration(usage['cpu_seconds'])})")
+    if usage['memory'] is not None:
+        parts.append(f"{format_bytes(usage['memory'])} (peak {format_bytes(usage['memory_peak'])})")
+    io = usage['read_rate'] + usage['write_rate']
+    if io:
+        parts.append(f"IO {format_rate(io)}")
+    # Running, but with the cpu and memory controllers off
+    return " · ".join(parts) or "running"
+
+
+def write_fake_unit(root, unit, cpu_usec=0, memory=0, memory_peak=None, rbytes=0, wbytes=0,
+                    slice=SLICE):
+    """Create or update a unit's files in a fake cgroupfs tree"""
+    path = CgroupMonitor((), root, slice).unit_dir(unit)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(root, 'cgroup.controllers'), 'w') as f:
+        f.write('cpu io memory pids\n')
+    files = {
+        'cpu.stat': f'usage_usec {cpu_usec}\nuser_usec {cpu_usec}\nsystem_usec 0\n',
+        'memory.current': f'{memory}\n',
+        'memory.peak': f'{memory if memory_peak is None else memory_peak}\n',
+        'io.stat': f'179:0 rbytes={rbytes} wbytes={wbytes} rios=0 wios=0 dbytes=0 dios=0\n',
+    }
+    for name, content in files.items():
+        with open(os.path.join(path, name), 'w') as f:
+            f.write(content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-service cgroup v2 accounting")
+    parser.add_argument('--root', default=CGROUP_ROOT)
+    parser.add_argument('--units', nargs='+', default=list(SERVICE_UNITS))
+    parser.add_argument('--interval', type=float, default=2.0)
+    parser.add_argument('--make-fake', action='store_true',
+                        help="populate --root with a fake tree for the units and exit")
+    args = parser.parse_args()
+
+    if args.make_fake:
+        for i, unit in enumerate(args.units):
+            write_fake_unit(args.root, unit, cpu_usec=(i + 1) * 1500000,
+                            memory=(i + 1) * 4 << 20, memory_peak=(i + 1) * 6 << 20)
+        print(f"Fake cgroupfs with {len(args.units)} units in {args.root}")
+        return
+
+    monitor = CgroupMonitor(args.units, args.root)
+    if not monitor.available:
+        print(f"{args.root} is not a cgroup v2 hierarchy")
+        return
+    try:
+        while True:
+            start = time.perf_counter()
+            usage = monitor.sample()
+            elapsed = (time.perf_counter() - start) * 1000000.0
+            for unit, stats in usage.items():
+                print(f"{unit:<16} {describe_usage(stats)}")
+            print(f"({elapsed:.0f} µs)\n")
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,414 @@
+"""
+Collector framework
+Each metric is a small collector with its own interval, cost and change
+detection. One timer wheel decides which collectors are due, so values that
+rarely change (disk, hostname, IP) aren't re-read on every CPU tick
+
+Benchmark with:  python3 -m pitv.collectors
+"""
+
+import argparse
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+from pitv.cpu import CpuCollector
+from pitv.thermal import ThermalGovernor, read_temperature
+
+# rtnetlink multicast groups: link state and IPv4/IPv6 address changes
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+
+
+class Collector:
+    """One metric
+
+    `read` returns the current value. `interval` is in seconds; None means
+    the collector only runs when triggered. `watch`, if given, is called
+    with a trigger function and returns False if it can't deliver events,
+    in which case the collector is polled every `fallback` seconds.
+    Changes are detected on `key(value)`, or on the value rounded to
+    `precision`. `cost` is the estimated read time in µs until measured.
+    """
+
+    def __init__(self, name, read, interval=2.0, precision=None, key=None,
+                 watch=None, fallback=30.0, cost=100.0):
+        self.name = name
+        self.read = read
+        self.interval = interval
+        self.precision = precision
+        self.key = key
+        self.watch = watch
+        self.fallback = fallback
+        self.cost = cost
+        self.next_tick = None
+        self.last_key = None
+        self.runs = 0
+        self.changes = 0
+        self.errors = 0
+        self.total_us = 0.0
+        self.max_us = 0.0
+
+    def change_key(self, value):
+        if self.key is not None:
+            return self.key(value)
+        if self.precision is not None and isinstance(value, float):
+            return round(value, self.precision)
+        return value
+
+    def measure(self):
+        """Read the value, timing it; returns (value, µs)"""
+        start = time.perf_counter()
+        value = self.read()
+        return value, (time.perf_counter() - start) * 1000000.0
+
+
+class TimerWheel:
+    """Hashed timing wheel
+
+    Entries are (tick, item) in slot tick % size, so scheduling is O(1) and
+    advancing only looks at the slots passed over. Entries further away than
+    one turn simply stay in their slot until their tick comes round.
+    """
+
+    def __init__(self, resolution=0.5, size=256):
+        self.resolution = resolution
+        self.size = size
+        self.slots = [[] for _ in range(size)]
+        self.tick = -1
+
+    def schedule(self, tick, item):
+        self.slots[tick % self.size].append((tick, item))
+
+    def entries(self, tick):
+        """Entries due exactly at tick"""
+        return [entry for entry in self.slots[tick % self.size] if entry[0] == tick]
+
+    def advance(self, tick):
+        """Remove and return the entries due up to and including tick"""
+        due = []
+        if tick <= self.tick:
+            return due
+        for t in range(self.tick + 1, self.tick + 1 + min(tick - self.tick, self.size)):
+            index = t % self.size
+            slot = self.slots[index]
+            if slot:
+                due.extend(entry for entry in slot if entry[0] <= tick)
+                self.slots[index] = [entry for entry in slot if entry[0] > tick]
+        self.tick = tick
+        return due
+
+    def next_tick(self):
+        """Tick of the earliest entry, or None if the wheel is empty"""
+        for t in range(self.tick + 1, self.tick + 1 + self.size):
+            if self.entries(t):
+                return t
+        later = [entry[0] for slot in self.slots for entry in slot]
+        return min(later) if later else None
+
+
+class CollectorScheduler:
+    """Runs collectors when they are due and reports changed values
+
+    run() is driven by a timer (usually an AdaptivePoller) and calls the
+    listeners with {name: value} for the collectors whose value changed.
+    Every collector runs on the first run(); after that periodic collectors
+    are spread over the wheel so expensive ones don't land on the same tick.
+    """
+
+    def __init__(self, collectors=(), resolution=0.5, size=256):
+        self.wheel = TimerWheel(resolution, size)
+        self.origin = time.monotonic()
+        self.collectors = {}
+        self.values = {}
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.triggered = set()
+        for collector in collectors:
+            self.add(collector)
+
+    def add(self, collector):
+        self.collectors[collector.name] = collector
+        if collector.watch is not None:
+            name = collector.name
+            if not collector.watch(lambda: self.trigger(name)):
+                collector.interval = collector.fallback
+        self.trigger(collector.name)
+
+    def listen(self, callback):
+        self.listeners.append(callback)
+
+    def trigger(self, name):
+        """Run a collector on the next run(); safe to call from any thread"""
+        with self.lock:
+            self.triggered.add(name)
+
+    def refresh(self):
+        """Run every collector now"""
+        with self.lock:
+            self.triggered.update(self.collectors)
+        return self.run()
+
+    def tick_of(self, now):
+        return int((now - self.origin) / self.wheel.resolution)
+
+    def interval_ticks(self, collector):
+        return max(1, round(collector.interval / self.wheel.resolution))
+
+    def slot_load(self, tick):
+        return sum(item.cost for t, item in self.wheel.entries(tick) if item.next_tick == t)
+
+    def reschedule(self, collector, tick, base):
+        if collector.interval is None:
+            collector.next_tick = None
+            return
+        step = self.interval_ticks(collector)
+        if collector.next_tick is None:
+            # First placement: the least loaded tick within one interval
+            target = min(range(tick + 1, tick + step + 1), key=lambda t: (self.slot_load(t), -t))
+        else:
+            # From the due tick rather than now, so the interval doesn't drift
+            target = base + step
+            if target <= tick:
+                target = tick + step
+        collector.next_tick = target
+        self.wheel.schedule(target, collector)
+
+    def run(self, now=None):
+        """Run due and triggered collectors; returns seconds until the next is due"""
+        now = time.monotonic() if now is None else now
+        tick = self.tick_of(now)
+
+        ready = {}
+        for due, collector in self.wheel.advance(tick):
+            # Entries left behind by a trigger or refresh are stale
+            if collector.next_tick == due:
+                ready[collector.name] = (collector, due)
+        with self.lock:
+            triggered, self.triggered = self.triggered, set()
+        for name in triggered:
+            if name not in ready and name in self.collectors:
+                ready[name] = (self.collectors[name], tick)
+
+        changes = {}
+        for collector, due in ready.values():
+            try:
+                value, elapsed = collector.measure()
+            except Exception as e:
+                collector.errors += 1
+                print(f"Collector {collector.name} failed: {e}")
+            else:
+                collector.cost = elapsed if not collector.runs else 0.8 * collector.cost + 0.2 * elapsed
+                collector.runs += 1
+                collector.total_us += elapsed
+                collector.max_us = max(collector.max_us, elapsed)
+                key = collector.change_key(value)
+                if collector.runs == 1 or key != collector.last_key:
+                    collector.last_key = key
+                    collector.changes += 1
+                    self.values[collector.name] = value
+                    changes[collector.name] = value
+            self.reschedule(collector, tick, due)
+
+        if changes:
+            for callback in self.listeners:
+                callback(changes)
+        return self.next_delay(now)
+
+    def next_delay(self, now):
+        with self.lock:
+            if self.triggered:
+                return 0.0
+        next_tick = self.wheel.next_tick()
+        if next_tick is None:
+            return None
+        return max(self.origin + next_tick * self.wheel.resolution - now, 0.0)
+
+    def report(self):
+        """Per-collector runs, changes and cost"""
+        rows = []
+        for collector in self.collectors.values():
+            mean = collector.total_us / collector.runs if collector.runs else 0.0
+            rows.append({
+                'name': collector.name,
+                'interval': collector.interval,
+                'runs': collector.runs,
+                'changes': collector.changes,
+                'errors': collector.errors,
+                'mean_us': round(mean, 1),
+                'max_us': round(collector.max_us, 1),
+                # Average cost per second of wall time at the configured interval
+                'us_per_second': round(mean / collector.interval, 1) if collector.interval else None,
+            })
+        return rows
+
+
+def watch_netlink(trigger, groups=RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR):
+    """Call trigger() from a daemon thread on every link or address change"""
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        sock.bind((0, groups))
+    except (OSError, AttributeError):
+        return False
+
+    def loop():
+        while True:
+            try:
+                sock.recv(65536)
+            except OSError:
+                return
+            trigger()
+
+    threading.Thread(target=loop, name='netlink', daemon=True).start()
+    return True
+
+
+def read_memory(proc='/proc'):
+    """Used memory in percent, counting reclaimable memory as free"""
+    info = {}
+    with open(os.path.join(proc, 'meminfo')) as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            info[name] = int(value.split()[0])
+            if 'MemTotal' in info and 'MemAvailable' in info:
+                break
+    return 100.0 * (info['MemTotal'] - info['MemAvailable']) / info['MemTotal']
+
+
+def read_disk(path='/'):
+    """Used space in percent as df reports it (reserved blocks excluded)"""
+    st = os.statvfs(path)
+    used = st.f_blocks - st.f_bfree
+    total = used + st.f_bavail
+    return 100.0 * used / total if total else 0.0
+
+
+def read_uptime(proc='/proc'):
+    with open(os.path.join(proc, 'uptime')) as f:
+        return float(f.read().split()[0])
+
+
+def read_ip():
+    """Address of the interface holding the default route, or None"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # connect() on a UDP socket only picks a route, nothing is sent
+        s.connect(('8.8.8.8', 80))
+        return s.getsockname()[0]
+    except OSError:
+        return None
+    finally:
+        s.close()
+
+
+def cpu_usage(cpu, name='cpu', interval=1.0):
+    """Total CPU utilisation in percent"""
+    return Collector(name, lambda: cpu.latest(interval / 2)['total']['util'],
+                     interval=interval, precision=1, cost=150.0)
+
+
+def cpu_cores(cpu, name='cores', interval=1.0):
+    """Per-core statistics (shares the sample with cpu_usage)"""
+    return Collector(name, lambda: cpu.latest(interval / 2)['cores'], interval=interval,
+                     key=lambda cores: tuple((round(c['util']), c['freq']) for c in cores),
+                     cost=150.0)
+
+
+def thermal(governor, name='thermal', interval=2.0):
+    """ThermalGovernor report; also keeps the governor's trend up to date"""
+    def read():
+        governor.update()
+        return governor.report()
+    return Collector(name, read, interval=interval, cost=200.0,
+                     key=lambda r: (r['level'], r['temperature'] and round(r['temperature'], 1),
+                                    tuple(r['throttle_flags'])))
+
+
+def temperature(sys='/sys', name='temp', interval=2.0):
+    """Hottest thermal zone in °C"""
+    return Collector(name, lambda: read_temperature(sys), interval=interval, precision=1)
+
+
+def memory_usage(proc='/proc', name='memory', interval=2.0):
+    return Collector(name, lambda: read_memory(proc), interval=interval, precision=1)
+
+
+def disk_usage(path='/', name='disk', interval=60.0):
+    return Collector(name, lambda: read_disk(path), interval=interval, precision=1)
+
+
+def uptime(proc='/proc', name='uptime', interval=30.0):
+    """Seconds since boot; only reported when the minute changes"""
+    return Collector(name, lambda: read_uptime(proc), interval=interval,
+                     key=lambda seconds: int(seconds // 60))
+
+
+def hostname(name='hostname', interval=600.0):
+    return Collector(name, socket.gethostname, interval=interval, cost=5.0)
+
+
+def ip_address(name='ip'):
+    """Primary IP address, re-read only on netlink link/address events"""
+    return Collector(name, read_ip, interval=None, watch=watch_netlink, fallback=30.0, cost=50.0)
+
+
+def clock(fmt='%H:%M:%S', name='time', interval=1.0):
+    return Collector(name, lambda: datetime.now().strftime(fmt), interval=interval, cost=10.0)
+
+
+def benchmark(collectors, rounds=100):
+    """Time each collector's read(); {name: (mean, p95, max)} in µs"""
+    results = {}
+    for collector in collectors:
+        times = []
+        for _ in range(rounds):
+            try:
+                times.append(collector.measure()[1])
+            except Exception as e:
+                print(f"{collector.name}: {e}")
+                break
+        if times:
+            times.sort()
+            results[collector.name] = (sum(times) / len(times),
+                                       times[min(int(len(times) * 0.95), len(times) - 1)],
+                                       times[-1])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the built-in collectors")
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--proc', default='/proc')
+    parser.add_argument('--sys', default='/sys')
+    args = parser.parse_args()
+
+    cpu = CpuCollector(args.proc, args.sys)
+    collectors = [
+        # Sample directly so every round pays for a full /proc/stat read
+        Collector('cpu', cpu.sample, interval=1.0),
+        thermal(ThermalGovernor(args.sys)),
+        temperature(args.sys),
+        memory_usage(args.proc),
+        disk_usage(),
+        uptime(args.proc),
+        hostname(),
+        Collector('ip', read_ip, interval=None),
+        clock(),
+    ]
+    results = benchmark(collectors, args.rounds)
+
+    print(f"{'collector':<12}{'mean µs':>10}{'p95 µs':>10}{'max µs':>10}{'interval':>10}{'µs/s':>10}")
+    for collector in collectors:
+        if collector.name not in results:
+            continue
+        mean, p95, worst = results[collector.name]
+        interval = f"{collector.interval:g}s" if collector.interval else "event"
+        load = f"{mean / collector.interval:.1f}" if collector.interval else "-"
+        print(f"{collector.name:<12}{mean:>10.1f}{p95:>10.1f}{worst:>10.1f}{interval:>10}{load:>10}")
+
+
+if __name__ == '__main__':
+    main()
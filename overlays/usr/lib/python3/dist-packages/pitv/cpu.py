@@ -0,0 +1,137 @@
+"""
+Per-core CPU collector
+Reads /proc/stat and the cpufreq sysfs once per tick and computes per-core
+utilisation, iowait, steal and frequency plus the firmware throttle flags
+"""
+
+import os
+import threading
+import time
+from array import array
+
+# /proc/stat columns used: user nice system idle iowait irq softirq steal
+COLUMNS = 8
+IDLE, IOWAIT, STEAL = 3, 4, 7
+
+# Firmware get_throttled bits
+UNDERVOLTAGE = 0x1
+FREQ_CAPPED = 0x2
+THROTTLED = 0x4
+SOFT_TEMP_LIMIT = 0x8
+THROTTLE_FLAGS = {
+    UNDERVOLTAGE: 'under-voltage',
+    FREQ_CAPPED: 'frequency capped',
+    THROTTLED: 'throttled',
+    SOFT_TEMP_LIMIT: 'soft temperature limit',
+}
+
+
+def throttle_names(flags):
+    """Names of the currently active throttle bits"""
+    return [name for bit, name in THROTTLE_FLAGS.items() if flags & bit]
+
+
+def read_throttled(sys='/sys'):
+    """Firmware throttle/undervoltage bit field, or None if unavailable"""
+    try:
+        with open(os.path.join(sys, 'devices/platform/soc/soc:firmware/get_throttled')) as f:
+            return int(f.read().strip(), 16)
+    except (OSError, ValueError):
+        return None
+
+
+class CpuCollector:
+    """Per-core CPU statistics from one read of /proc/stat per sample
+
+    The counters of all rows ('cpu' total first, then cpu0..N) are kept in one
+    flat array, so a sample is a single element-wise delta over that array
+    followed by cheap per-row sums. proc/sys can point at fake trees.
+    """
+
+    def __init__(self, proc='/proc', sys='/sys'):
+        self.proc = proc
+        self.sys = sys
+        self.previous = None
+        self.lock = threading.Lock()
+        self.last = None
+        self.last_time = 0.0
+        self.cpu_ids = []
+        # Prime the counters so the first sample() already has a delta
+        self.previous = self.read_counters()
+
+    def read_counters(self):
+        """Flat array of the first COLUMNS counters of every cpu row"""
+        counters = array('Q')
+        cpu_ids = []
+        with open(os.path.join(self.proc, 'stat')) as f:
+            for line in f:
+                if not line.startswith('cpu'):
+                    break
+                fields = line.split()
+                if fields[0] != 'cpu':
+                    # Offline cores have no row, so keep the real ids
+                    cpu_ids.append(int(fields[0][3:]))
+                counters.extend(int(v) for v in fields[1:COLUMNS + 1])
+        self.cpu_ids = cpu_ids
+        return counters
+
+    def read_freq(self, cpu):
+        """Current frequency of a core in MHz (0 when unknown)"""
+        path = os.path.join(self.sys, f'devices/system/cpu/cpu{cpu}/cpufreq/scaling_cur_freq')
+        try:
+            with open(path) as f:
+                return int(f.read()) // 1000
+        except (OSError, ValueError):
+            return 0
+
+    def sample(self):
+        """Take a new sample and return per-core and total statistics"""
+        with self.lock:
+            current = self.read_counters()
+            previous = self.previous
+            self.previous = current
+            if previous is None or len(previous) != len(current):
+                previous = array('Q', bytes(current.itemsize * len(current)))
+
+            # One element-wise delta over every row and column
+            delta = [c - p for c, p in zip(current, previous)]
+
+            rows = []
+            for start in range(0, len(delta), COLUMNS):
+                row = delta[start:start + COLUMNS]
+                total = sum(row)
+                if not total:
+                    # No ticks since the last sample (read twice within one jiffy)
+                    rows.append({'util': 0.0, 'iowait': 0.0, 'steal': 0.0})
+                    continue
+                rows.append({
+                    'util': 100.0 * (total - row[IDLE] - row[IOWAIT]) / total,
+                    'iowait': 100.0 * row[IOWAIT] / total,
+                    'steal': 100.0 * row[STEAL] / total,
+                })
+
+            cores = rows[1:]
+            for cpu, core in zip(self.cpu_ids, cores):
+                core['cpu'] = cpu
+                core['freq'] = self.read_freq(cpu)
+
+            throttled = read_throttled(self.sys)
+            self.last = {
+                'total': rows[0],
+                'cores': cores,
+                'throttled': throttled,
+                'throttle_flags': throttle_names(throttled or 0),
+            }
+            self.last_time = time.monotonic()
+            return self.last
+
+    def latest(self, max_age=1.0):
+        """Last sample if it is recent enough, otherwise a new one
+
+        Lets many API clients share one sampling rate instead of each
+        shortening the delta window of the others.
+        """
+        with self.lock:
+            if self.last is not None and time.monotonic() - self.last_time < max_age:
+                return self.last
+        return self.sample()
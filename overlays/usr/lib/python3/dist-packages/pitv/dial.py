@@ -0,0 +1,206 @@
+"""
+DIAL REST service
+Device description and app launch/status/stop endpoints for second-screen
+clients (YouTube on phones), served by the cast HTTP server on port 8008.
+Discovery is pitv.ssdp.
+"""
+
+import os
+import signal
+import subprocess
+import uuid
+from http.server import SimpleHTTPRequestHandler
+from urllib.parse import quote
+
+FRIENDLY_NAME = 'Raspberry Pi Custom OS'
+DIAL_PORT = 8008
+DESCRIPTION_PATH = '/ssdp/device-desc.xml'
+APPS_PATH = '/apps/'
+
+DEVICE_TYPE = 'urn:dial-multiscreen-org:device:dial:1'
+SERVICE_TYPE = 'urn:dial-multiscreen-org:service:dial:1'
+
+# DIAL app name -> launcher; the POST body (e.g. YouTube's pairingCode) becomes the query string
+APPS = {
+    'YouTube': ['chromium-browser', '--app=https://www.youtube.com/tv'],
+}
+
+MAX_BODY = 4096
+
+
+def device_uuid(machine_id='/etc/machine-id'):
+    """Stable UUID for the UDN, from the machine id"""
+    try:
+        with open(machine_id) as f:
+            return str(uuid.UUID(f.read().strip()))
+    except (OSError, ValueError):
+        return str(uuid.uuid5(uuid.NAMESPACE_DNS, os.uname().nodename))
+
+
+UUID = device_uuid()
+
+
+def device_description(udn=UUID, name=FRIENDLY_NAME):
+    return (
+        '<?xml version="1.0"?>\n'
+        '<root xmlns="urn:schemas-upnp-org:device-1-0">\n'
+        '<specVersion><major>1</major><minor>0</minor></specVersion>\n'
+        '<device>\n'
+        f'<deviceType>{DEVICE_TYPE}</deviceType>\n'
+        f'<friendlyName>{name}</friendlyName>\n'
+        '<manufacturer>Raspberry Pi</manufacturer>\n'
+        '<modelName>Pi Smart TV</modelName>\n'
+        f'<UDN>uuid:{udn}</UDN>\n'
+        '<serviceList><service>\n'
+        f'<serviceType>{SERVICE_TYPE}</serviceType>\n'
+        '<serviceId>urn:dial-multiscreen-org:serviceId:dial</serviceId>\n'
+        '<controlURL>/ssdp/notfound</controlURL>\n'
+        '<eventSubURL>/ssdp/notfound</eventSubURL>\n'
+        '<SCPDURL>/ssdp/notfound</SCPDURL>\n'
+        '</service></serviceList>\n'
+        '</device>\n'
+        '</root>\n'
+    ).encode()
+
+
+def app_status(name, running):
+    link = '<link rel="run" href="run"/>\n' if running else ''
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<service xmlns="urn:dial-multiscreen-org:schemas:dial" dialVer="2.1">\n'
+        f'<name>{name}</name>\n'
+        '<options allowStop="true"/>\n'
+        f'<state>{"running" if running else "stopped"}</state>\n'
+        f'{link}'
+        '</service>\n'
+    ).encode()
+
+
+def app_pids(argv, proc='/proc'):
+    """Pids of running instances of a launcher (survives our own restarts)
+
+    Matched on the app URL argument: the launcher is usually a wrapper
+    script that execs the browser under another name.
+    """
+    target = argv[-1].encode()
+    pids = []
+    for entry in os.listdir(proc):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(os.path.join(proc, entry, 'cmdline'), 'rb') as f:
+                cmdline = f.read()
+        except OSError:
+            continue
+        # The URL may have launch parameters appended
+        if any(arg.startswith(target) for arg in cmdline.split(b'\0')[1:]):
+            pids.append(int(entry))
+    return pids
+
+
+def launch_app(argv, body=''):
+    argv = list(argv)
+    if body:
+        argv[-1] += ('&' if '?' in argv[-1] else '?') + body
+    subprocess.Popen(argv, start_new_session=True, stdin=subprocess.DEVNULL,
+                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop_app(argv):
+    for pid in app_pids(argv):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+
+class DialRequestHandler(SimpleHTTPRequestHandler):
+    """Static files plus the DIAL endpoints
+
+    The device description is rendered once and reused; the Application-URL
+    header is built from the address the client connected to.
+    """
+
+    description = device_description()
+    apps = APPS
+
+    def application_url(self):
+        host = self.connection.getsockname()[0]
+        return f'http://{host}:{self.server.server_port}{APPS_PATH}'
+
+    def send_body(self, code, body, content_type='text/xml; charset="utf-8"', headers=()):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def app_request(self):
+        """(app name, launcher, trailing path) for /apps/<name>[/run], or None"""
+        if not self.path.startswith(APPS_PATH):
+            return None
+        name, _, rest = self.path[len(APPS_PATH):].partition('/')
+        argv = self.apps.get(name)
+        if argv is None:
+            self.send_error(404)
+            return False
+        return name, argv, rest
+
+    def foreign_origin(self):
+        """DIAL: web pages may not launch apps, only native senders"""
+        origin = self.headers.get('Origin')
+        if origin and origin.startswith(('http:', 'https:', 'file:')):
+            self.send_error(403)
+            return True
+        return False
+
+    def do_GET(self):
+        if self.path == DESCRIPTION_PATH:
+            self.send_body(200, self.description, headers=[
+                ('Application-URL', self.application_url()),
+                ('Access-Control-Expose-Headers', 'Application-URL'),
+            ])
+            return
+        request = self.app_request()
+        if request is None:
+            super().do_GET()
+        elif request:
+            name, argv, rest = request
+            self.send_body(200, app_status(name, bool(app_pids(argv))))
+
+    def do_POST(self):
+        request = self.app_request()
+        if request is None:
+            self.send_error(501)
+            return
+        if not request or self.foreign_origin():
+            return
+        name, argv, rest = request
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY:
+            self.send_error(413)
+            return
+        body = self.rfile.read(length).decode('utf-8', 'replace').strip()
+        running = bool(app_pids(argv))
+        if not running:
+            launch_app(argv, quote(body, safe='=&'))
+        self.send_body(200 if running else 201, b'', 'text/plain', [
+            ('Location', f'{self.application_url()}{name}/run'),
+        ])
+
+    def do_DELETE(self):
+        request = self.app_request()
+        if request is None:
+            self.send_error(501)
+            return
+        if not request or self.foreign_origin():
+            return
+        name, argv, rest = request
+        if rest != 'run' or not app_pids(argv):
+            self.send_error(404)
+            return
+        stop_app(argv)
+        self.send_body(200, b'', 'text/plain')
@@ -0,0 +1,509 @@
+"""
+Storage analyzer
+Walks a filesystem once in a low-priority thread to build a directory-size
+index, persists it, and keeps it current so the biggest consumers can be
+served instantly. Directories that fill up (/home, /var, media mounts) are
+followed with inotify; the rest of the tree is polled.
+
+The index runs in its own service (pitv-diskusage) and saves to
+/var/cache/pitv; the web server only reads the saved index.
+
+Service:         python3 -m pitv.diskusage --serve /
+Run with:        python3 -m pitv.diskusage /
+Benchmark with:  python3 -m pitv.diskusage --benchmark /
+"""
+
+import argparse
+import ctypes
+import errno
+import heapq
+import json
+import os
+import select
+import shutil
+import signal
+import struct
+import tempfile
+import threading
+import time
+
+from pitv.humanize import format_bytes
+
+INDEX_PATH = '/var/cache/pitv/diskusage.json'
+
+# Where space actually goes, relative to the root: logs, caches, downloads,
+# media. Watch allowance is per user and finite, so the rest is polled.
+WATCHED = ('home', 'var', 'media', 'mnt', 'srv')
+POLL_EVERY = 3600.0
+
+# inotify(7)
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_DONT_FOLLOW = 0x2000000
+IN_EXCL_UNLINK = 0x4000000
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+EVENT = struct.Struct('iIII')
+
+
+def lower_priority():
+    """Idle CPU scheduling for the calling thread
+
+    Linux applies scheduling policy per thread, and the BFQ/CFQ I/O
+    schedulers put SCHED_IDLE tasks in the idle I/O class as well.
+    """
+    try:
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+    except (AttributeError, OSError):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+
+
+class Inotify:
+    """Minimal inotify binding through libc"""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.paths = {}
+        self.wds = {}
+
+    def add(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        self.paths[wd] = path
+        self.wds[path] = wd
+
+    def remove(self, path):
+        wd = self.wds.pop(path, None)
+        if wd is not None:
+            self.paths.pop(wd, None)
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout):
+        """[(directory, mask)] of the events that arrived within timeout"""
+        events = []
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return events
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return events
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size + length
+            if mask & IN_IGNORED:
+                # Watch removed by the kernel (directory deleted or unmounted)
+                path = self.paths.pop(wd, None)
+                if path is not None and self.wds.get(path) == wd:
+                    del self.wds[path]
+                continue
+            events.append((self.paths.get(wd), mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DiskUsageIndex:
+    """Directory sizes for one filesystem
+
+    For every directory the index keeps the bytes of the files directly in
+    it (`own`), its subdirectories and the subtree total. A change to one
+    directory only rescans that directory and adds the size difference to
+    its ancestors. The scan stays on the root's filesystem and counts
+    allocated blocks, like du.
+
+    Only directories under `watched` get inotify watches; the others (and
+    any beyond the watch limit) are rescanned every `poll_every` seconds.
+    Rescans and reloads stat every file, so a file growing in place, which
+    leaves its directory's mtime alone, is still counted.
+    """
+
+    def __init__(self, root='/', path=INDEX_PATH, settle=2.0, save_every=600.0,
+                 watched=WATCHED, poll_every=POLL_EVERY):
+        self.root = os.path.abspath(root)
+        self.path = path
+        self.settle = settle
+        self.save_every = save_every
+        self.watched = [os.path.normpath(os.path.join(self.root, p)) for p in watched]
+        self.poll_every = poll_every
+        self.own = {}
+        self.total = {}
+        self.children = {}
+        self.lock = threading.Lock()
+        self.inotify = None
+        self.unwatched = set()
+        self.dirty = set()
+        self.dirty_since = None
+        self.changed = False
+        self.last_save = time.monotonic()
+        self.ready = False
+        self.stopping = threading.Event()
+        self.device = None
+        self.stats = {'scan_seconds': None, 'updates': 0, 'last_update_ms': None}
+        # Report saved by the indexer service, when only following its index
+        self.followed = None
+        self.followed_mtime = None
+
+    def parent(self, path):
+        return None if path == self.root else os.path.dirname(path)
+
+    def add_to_ancestors(self, path, delta):
+        while path is not None:
+            self.total[path] = self.total.get(path, 0) + delta
+            path = self.parent(path)
+
+    def scan_dir(self, path):
+        """(bytes of files, subdirectory names) of one directory"""
+        own = 0
+        subdirs = set()
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if st.st_dev == self.device:
+                        subdirs.add(entry.name)
+                else:
+                    own += st.st_blocks * 512
+        return own, subdirs
+
+    def is_watched(self, path):
+        return any(path == top or path.startswith(top.rstrip('/') + '/') for top in self.watched)
+
+    def watch(self, path):
+        if self.inotify is None:
+            return
+        if not self.is_watched(path):
+            self.unwatched.add(path)
+            return
+        try:
+            self.inotify.add(path)
+        except OSError as e:
+            if e.errno == errno.ENOSPC and not self.unwatched:
+                print("Disk usage: out of inotify watches, polling the rest")
+            self.unwatched.add(path)
+
+    def update_dir(self, path):
+        """Rescan one directory; returns the new subdirectories"""
+        try:
+            own, subdirs = self.scan_dir(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.remove_subtree(path)
+            return []
+        except OSError:
+            # Unreadable: keep what we had
+            return []
+
+        with self.lock:
+            if path not in self.own:
+                parent = self.parent(path)
+                if parent is not None:
+                    self.children.setdefault(parent, set()).add(os.path.basename(path))
+                self.own[path] = 0
+                self.total.setdefault(path, 0)
+                self.children[path] = set()
+            delta = own - self.own[path]
+            if delta:
+                self.own[path] = own
+                self.add_to_ancestors(path, delta)
+                self.changed = True
+            known = self.children[path]
+            for name in known - subdirs:
+                self.remove_subtree(os.path.join(path, name))
+            added = [os.path.join(path, name) for name in subdirs - known]
+        return added
+
+    def remove_subtree(self, path):
+        """Drop a directory and everything below it (lock held)"""
+        if path not in self.own:
+            return
+        self.add_to_ancestors(self.parent(path), -self.total.get(path, 0))
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            stack.extend(os.path.join(current, name) for name in self.children.pop(current, ()))
+            self.own.pop(current, None)
+            self.total.pop(current, None)
+            self.unwatched.discard(current)
+            if self.inotify is not None:
+                self.inotify.remove(current)
+        parent = self.parent(path)
+        if parent in self.children:
+            self.children[parent].discard(os.path.basename(path))
+        self.changed = True
+
+    def scan_tree(self, path):
+        """Index a directory and everything below it"""
+        stack = [path]
+        count = 0
+        while stack and not self.stopping.is_set():
+            current = stack.pop()
+            self.watch(current)
+            stack.extend(self.update_dir(current))
+            count += 1
+            if count % 200 == 0:
+                # Give the SD card a breather between batches
+                time.sleep(0.005)
+        return count
+
+    def process_dirty(self):
+        start = time.perf_counter()
+        dirty, self.dirty, self.dirty_since = self.dirty, set(), None
+        for path in sorted(dirty):
+            if path in self.own:
+                for added in self.update_dir(path):
+                    self.scan_tree(added)
+        self.stats['updates'] += 1
+        self.stats['last_update_ms'] = round((time.perf_counter() - start) * 1000.0, 2)
+
+    def reconcile(self, paths=None):
+        """Re-watch a loaded index and rescan its directories
+
+        Every directory is rescanned, not just those with a new mtime:
+        appending to a file doesn't touch its directory.
+        """
+        if paths is None:
+            for path in list(self.own):
+                self.watch(path)
+        self.dirty.update(self.own if paths is None else paths)
+        self.process_dirty()
+
+    def poll(self, timeout):
+        """Wait for inotify events and apply them once they have settled"""
+        if self.inotify is None:
+            self.stopping.wait(timeout)
+            return
+        for directory, mask in self.inotify.read(timeout):
+            if mask & IN_Q_OVERFLOW:
+                print("Disk usage: inotify queue overflowed, rechecking everything")
+                self.dirty.update(self.own)
+            elif directory is not None:
+                self.dirty.add(directory)
+            if self.dirty_since is None:
+                self.dirty_since = time.monotonic()
+        if self.dirty and time.monotonic() - self.dirty_since >= self.settle:
+            self.process_dirty()
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name='diskusage', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopping.set()
+
+    def run(self):
+        lower_priority()
+        self.device = os.stat(self.root).st_dev
+        try:
+            self.inotify = Inotify()
+        except (OSError, AttributeError) as e:
+            print(f"Disk usage: inotify unavailable ({e}), rescanning hourly")
+
+        start = time.perf_counter()
+        if self.load():
+            # The saved figures are good enough to serve while they're checked
+            self.followed = None
+            self.ready = True
+            self.reconcile()
+        else:
+            self.scan_tree(self.root)
+        self.stats['scan_seconds'] = round(time.perf_counter() - start, 2)
+        self.ready = True
+        self.save()
+
+        last_poll = time.monotonic()
+        while not self.stopping.is_set():
+            self.poll(self.settle)
+            now = time.monotonic()
+            if now - last_poll >= self.poll_every:
+                last_poll = now
+                if self.inotify is None:
+                    self.reconcile()
+                elif self.unwatched:
+                    self.reconcile(set(self.unwatched))
+            if self.changed and now - self.last_save >= self.save_every:
+                self.save()
+        if self.changed:
+            self.save()
+
+    def load(self):
+        """Read a saved index; False if there is none for this root"""
+        if not self.path:
+            return False
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if saved.get('root') != self.root:
+            return False
+        with self.lock:
+            self.own, self.total, self.children = {}, {}, {}
+            # Older indexes also saved each directory's mtime
+            for path, own, *_ in saved['dirs']:
+                self.own[path] = own
+                self.children.setdefault(path, set())
+            # Totals bottom-up: deepest directories first
+            for path in sorted(self.own, key=lambda p: p.count('/'), reverse=True):
+                self.total[path] = self.total.get(path, 0) + self.own[path]
+                parent = self.parent(path)
+                if parent is not None and parent in self.own:
+                    self.children.setdefault(parent, set()).add(os.path.basename(path))
+                    self.total[parent] = self.total.get(parent, 0) + self.total[path]
+            self.followed = saved.get('report')
+        return True
+
+    def follow(self):
+        """Pick up the index the indexer service saved, if it changed; returns ready"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return self.ready
+        if mtime != self.followed_mtime and self.load():
+            self.followed_mtime = mtime
+            self.ready = True
+        return self.ready
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            dirs = [[path, own] for path, own in self.own.items()]
+            self.changed = False
+        report = {key: value for key, value in self.report().items() if key != 'ready'}
+        self.last_save = time.monotonic()
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'root': self.root, 'saved': time.time(), 'report': report, 'dirs': dirs}, f,
+                          separators=(',', ':'))
+            # The web server (another user) reads it
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Disk usage: cannot save {self.path}: {e}")
+
+    def top(self, path=None, n=10):
+        """Biggest subdirectories of a directory"""
+        path = self.root if path is None else os.path.abspath(path)
+        with self.lock:
+            if path not in self.own:
+                return None
+            children = [os.path.join(path, name) for name in self.children.get(path, ())]
+            biggest = heapq.nlargest(n, children, key=lambda p: self.total.get(p, 0))
+            return {
+                'path': path,
+                'total': self.total.get(path, 0),
+                'files': self.own[path],
+                'children': [{'path': p, 'size': self.total.get(p, 0)} for p in biggest],
+            }
+
+    def largest(self, n=10):
+        """Directories holding the most file data directly"""
+        with self.lock:
+            return [{'path': p, 'size': size}
+                    for p, size in heapq.nlargest(n, self.own.items(), key=lambda item: item[1])]
+
+    def report(self):
+        if self.inotify is None and self.followed is not None:
+            return {'ready': self.ready, **self.followed, 'directories': len(self.own)}
+        return {
+            'ready': self.ready,
+            'directories': len(self.own),
+            'watched': len(self.inotify.wds) if self.inotify else 0,
+            'unwatched': len(self.unwatched),
+            **self.stats,
+        }
+
+
+def benchmark(root, files=200):
+    """Time the initial scan and one incremental update"""
+    index = DiskUsageIndex(root, path=None, settle=0.0)
+    index.device = os.stat(index.root).st_dev
+    index.inotify = Inotify()
+
+    start = time.perf_counter()
+    count = index.scan_tree(index.root)
+    elapsed = time.perf_counter() - start
+    print(f"Initial scan: {count} directories, {format_bytes(index.total[index.root])} "
+          f"in {elapsed:.2f} s ({elapsed / max(count, 1) * 1000000:.0f} µs per directory), "
+          f"{len(index.unwatched)} unwatched")
+
+    scratch = tempfile.mkdtemp(prefix='diskusage-', dir=index.root)
+    try:
+        index.poll(0.5)
+        for i in range(files):
+            with open(os.path.join(scratch, f'file{i}'), 'wb') as f:
+                f.write(b'\0' * 8192)
+        deadline = time.monotonic() + 5
+        while scratch not in index.own or index.own[scratch] == 0:
+            index.poll(0.2)
+            if time.monotonic() > deadline:
+                print("Incremental update: no events arrived")
+                return
+        print(f"Incremental update after {files} new files: {index.stats['last_update_ms']} ms, "
+              f"{format_bytes(index.own[scratch])} seen")
+    finally:
+        shutil.rmtree(scratch)
+        index.inotify.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Directory-size index of a filesystem")
+    parser.add_argument('root', nargs='?', default='/')
+    parser.add_argument('--index', default=INDEX_PATH)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--serve', action='store_true', help="keep the index current until stopped")
+    parser.add_argument('--save-every', type=float, default=60.0, help="with --serve: seconds between saves")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="time a full scan and an incremental update (writes a scratch directory under root)")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.root)
+        return
+
+    if args.serve:
+        index = DiskUsageIndex(args.root, args.index, save_every=args.save_every)
+        signal.signal(signal.SIGTERM, lambda signum, frame: index.stop())
+        print(f"Disk usage: indexing {index.root}, watching {', '.join(index.watched)}")
+        thread = index.start()
+        # join() with a timeout so SIGTERM gets handled
+        while thread.is_alive():
+            thread.join(1.0)
+        return
+
+    index = DiskUsageIndex(args.root, args.index)
+    index.start()
+    while not index.ready:
+        time.sleep(0.5)
+    print(f"Indexed {index.report()['directories']} directories in {index.stats['scan_seconds']} s")
+    for entry in index.largest(args.top):
+        print(f"{format_bytes(entry['size']):>10}  {entry['path']}")
+    index.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,462 @@
+"""
+Fleet hub
+Polls /api/status on many TVs concurrently over kept-alive connections and
+serves one aggregated dashboard and API. Each device gets a timeout from its
+own round-trip history and backs off exponentially while it is down.
+
+Run with:       python3 -m pitv.fleet --config /etc/pitv/fleet.conf [--discover] [--port 8090]
+Stand-ins:      python3 -m pitv.fleet --simulate 500 --duration 30
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import resource
+import time
+from array import array
+from urllib.parse import urlsplit
+
+STATUS_PORT = 8080
+STATUS_PATH = '/api/status'
+HUB_PORT = 8090
+CONFIG_PATH = '/etc/pitv/fleet.conf'
+
+INTERVAL = 5.0
+MAX_BACKOFF = 300.0
+INITIAL_TIMEOUT = 2.0
+MIN_TIMEOUT = 0.5
+MAX_TIMEOUT = 10.0
+# Requests in flight at once; the rest wait their turn rather than burst
+CONCURRENCY = 64
+
+UNKNOWN, UP, DOWN = 0, 1, 2
+STATES = ('unknown', 'up', 'down')
+
+
+class HTTPError(Exception):
+    """Malformed or unexpected HTTP response"""
+
+
+class Device:
+    """One TV: its kept-alive connection and round-trip estimate
+
+    The timeout follows RFC 6298's retransmission timer (smoothed RTT plus
+    four deviations), so a TV on slow Wi-Fi isn't declared down and a dead
+    one on the wired network is noticed quickly.
+    """
+
+    __slots__ = ('row', 'name', 'host', 'port', 'reader', 'writer', 'srtt', 'rttvar', 'failures')
+
+    def __init__(self, row, name, host, port=STATUS_PORT):
+        self.row = row
+        self.name = name
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.srtt = None
+        self.rttvar = None
+        self.failures = 0
+
+    def timeout(self):
+        if self.srtt is None:
+            return INITIAL_TIMEOUT
+        return min(max(self.srtt + 4 * self.rttvar, MIN_TIMEOUT), MAX_TIMEOUT)
+
+    def observe(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def exchange(self, path):
+        self.writer.write(f'GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n\r\n'.encode())
+        status = await self.reader.readline()
+        if not status:
+            raise ConnectionResetError()
+        parts = status.split()
+        if len(parts) < 2 or parts[1] != b'200':
+            raise HTTPError(status.decode('latin-1').strip())
+        length = None
+        keep_alive = parts[0] == b'HTTP/1.1'
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'connection':
+                keep_alive = value.strip().lower() == 'keep-alive'
+        if length is None:
+            body = await self.reader.read()
+            keep_alive = False
+        else:
+            body = await self.reader.readexactly(length)
+        if not keep_alive:
+            self.close()
+        return body
+
+    async def get(self, path, stats):
+        """Body of a GET, reusing the open connection when there is one"""
+        reused = self.writer is not None
+        if not reused:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            stats['connects'] += 1
+        try:
+            return await self.exchange(path)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            if not reused:
+                raise
+        # The TV closed an idle connection (or restarted): one retry on a fresh one
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        stats['connects'] += 1
+        return await self.exchange(path)
+
+
+class FleetTable:
+    """Latest state of every device, column-wise in typed arrays
+
+    A few dozen bytes per device instead of a dict each, and the JSON for
+    the API is rendered straight from the columns.
+    """
+
+    def __init__(self, names):
+        n = len(names)
+        self.names = list(names)
+        self.addresses = [''] * n
+        self.cpu = array('f', [0.0] * n)
+        self.memory = array('f', [0.0] * n)
+        self.rtt = array('f', [0.0] * n)
+        self.seen = array('d', [0.0] * n)
+        self.failures = array('H', [0] * n)
+        self.state = array('B', [UNKNOWN] * n)
+        self.version = 0
+
+    def update(self, row, status, rtt):
+        self.cpu[row] = status.get('cpu') or 0.0
+        self.memory[row] = status.get('memory') or 0.0
+        self.rtt[row] = rtt * 1000.0
+        self.seen[row] = time.time()
+        self.failures[row] = 0
+        self.state[row] = UP
+        self.version += 1
+
+    def fail(self, row):
+        self.failures[row] = min(self.failures[row] + 1, 0xFFFF)
+        self.state[row] = DOWN
+        self.version += 1
+
+    def row(self, i):
+        return {
+            'name': self.names[i],
+            'address': self.addresses[i],
+            'state': STATES[self.state[i]],
+            'cpu': round(self.cpu[i], 1),
+            'memory': round(self.memory[i], 1),
+            'rtt_ms': round(self.rtt[i], 1),
+            'seen': round(self.seen[i]) or None,
+            'failures': self.failures[i],
+        }
+
+    def summary(self):
+        up = [i for i, state in enumerate(self.state) if state == UP]
+        return {
+            'devices': len(self.names),
+            'up': len(up),
+            'down': self.state.count(DOWN),
+            'cpu': round(sum(self.cpu[i] for i in up) / len(up), 1) if up else None,
+            'memory': round(sum(self.memory[i] for i in up) / len(up), 1) if up else None,
+        }
+
+
+class Hub:
+    """Polls every device and keeps the table current"""
+
+    def __init__(self, devices, interval=INTERVAL, concurrency=CONCURRENCY):
+        self.devices = [Device(i, name, host, port) for i, (name, host, port) in enumerate(devices)]
+        self.table = FleetTable([d.name for d in self.devices])
+        for device in self.devices:
+            self.table.addresses[device.row] = f'{device.host}:{device.port}'
+        self.interval = interval
+        self.slots = asyncio.Semaphore(concurrency)
+        self.stats = {'polls': 0, 'failures': 0, 'timeouts': 0, 'connects': 0}
+        self.latencies = []
+        self.rendered = None
+        self.rendered_version = None
+
+    async def poll(self, device):
+        async with self.slots:
+            start = time.perf_counter()
+            try:
+                body = await asyncio.wait_for(device.get(STATUS_PATH, self.stats), device.timeout())
+                status = json.loads(body)
+            except asyncio.TimeoutError:
+                # A half-answered request leaves the connection unusable
+                device.close()
+                self.stats['timeouts'] += 1
+                return False
+            except (OSError, HTTPError, ValueError, asyncio.IncompleteReadError):
+                device.close()
+                return False
+            rtt = time.perf_counter() - start
+        device.observe(rtt)
+        self.table.update(device.row, status, rtt)
+        self.latencies.append(rtt)
+        if len(self.latencies) > 10000:
+            del self.latencies[:5000]
+        return True
+
+    async def run_device(self, device):
+        # Spread the first round over the interval instead of one burst
+        await asyncio.sleep(random.uniform(0, self.interval))
+        while True:
+            self.stats['polls'] += 1
+            if await self.poll(device):
+                device.failures = 0
+                delay = self.interval
+            else:
+                self.stats['failures'] += 1
+                device.failures += 1
+                self.table.fail(device.row)
+                delay = min(self.interval * 2 ** device.failures, MAX_BACKOFF)
+            await asyncio.sleep(delay * random.uniform(0.9, 1.1))
+
+    def start(self):
+        return [asyncio.ensure_future(self.run_device(device)) for device in self.devices]
+
+    def fleet_json(self):
+        """API body, re-rendered only when the table has changed"""
+        if self.rendered_version != self.table.version:
+            self.rendered = json.dumps({
+                'summary': self.table.summary(),
+                'devices': [self.table.row(i) for i in range(len(self.devices))],
+            }).encode()
+            self.rendered_version = self.table.version
+        return self.rendered
+
+    def report(self):
+        ordered = sorted(self.latencies)
+
+        def pick(fraction):
+            return round(ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] * 1000.0, 1)
+        return {**self.stats, **self.table.summary(),
+                'p50_ms': pick(0.5) if ordered else None, 'p99_ms': pick(0.99) if ordered else None}
+
+
+DASHBOARD = b'''<!DOCTYPE html>
+<html>
+<head>
+    <title>Pi TV Fleet</title>
+    <style>
+        body { font-family: Arial; background: #2c3e50; color: white; padding: 20px; }
+        .card { background: #34495e; padding: 20px; margin: 10px; border-radius: 10px; }
+        h1 { text-align: center; }
+        table { width: 100%; border-collapse: collapse; }
+        td, th { padding: 4px 8px; text-align: left; }
+        .down { color: #e74c3c; }
+        .unknown { color: #95a5a6; }
+    </style>
+</head>
+<body>
+    <h1>Pi TV Fleet</h1>
+    <div class="card"><p id="summary">Loading...</p></div>
+    <div class="card">
+        <table>
+            <thead><tr><th>Name</th><th>Address</th><th>State</th><th>CPU</th><th>Memory</th><th>RTT</th></tr></thead>
+            <tbody id="devices"></tbody>
+        </table>
+    </div>
+    <script>
+        function load() {
+            fetch('/api/fleet').then(r => r.json()).then(d => {
+                const s = d.summary;
+                document.getElementById('summary').textContent =
+                    `${s.up} of ${s.devices} up, ${s.down} down` + (s.cpu === null ? '' : `, average CPU ${s.cpu}%, memory ${s.memory}%`);
+                document.getElementById('devices').innerHTML = d.devices.map(e =>
+                    `<tr class="${e.state}"><td>${e.name}</td><td>${e.address}</td><td>${e.state}</td>` +
+                    `<td>${e.cpu}%</td><td>${e.memory}%</td><td>${e.rtt_ms} ms</td></tr>`).join('');
+            });
+        }
+        load();
+        setInterval(load, 5000);
+    </script>
+</body>
+</html>
+'''
+
+
+async def serve_http(hub, port, host='0.0.0.0'):
+    """Dashboard on / and the table on /api/fleet, with keep-alive"""
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                parts = request.split()
+                path = parts[1].decode('latin-1') if len(parts) > 1 else '/'
+                if path == '/':
+                    code, content_type, body = '200 OK', 'text/html; charset=utf-8', DASHBOARD
+                elif path == '/api/fleet':
+                    code, content_type, body = '200 OK', 'application/json', hub.fleet_json()
+                elif path == '/api/fleet/stats':
+                    code, content_type, body = '200 OK', 'application/json', json.dumps(hub.report()).encode()
+                else:
+                    code, content_type, body = '404 Not Found', 'text/plain', b'not found\n'
+                writer.write(f'HTTP/1.1 {code}\r\nContent-Type: {content_type}\r\n'
+                             f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+def parse_address(text, default_port=STATUS_PORT):
+    host, _, port = text.rpartition(':') if text.count(':') == 1 else (text, '', '')
+    return host, int(port) if port else default_port
+
+
+def load_config(path):
+    """`[name] host[:port]` per line; # comments"""
+    devices = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            address = fields[-1]
+            host, port = parse_address(address)
+            devices.append((fields[0] if len(fields) > 1 else host, host, port))
+    return devices
+
+
+def discover(timeout=2.0):
+    """TVs answering our SSDP search (pitv.ssdp), at their status port"""
+    from pitv.ssdp import parse_request, search
+
+    devices = {}
+    for _, peer, data in search(count=2, timeout=timeout):
+        _, headers = parse_request(data)
+        host = urlsplit(headers.get('location', '')).hostname or peer[0]
+        devices[host] = (host, host, STATUS_PORT)
+    return sorted(devices.values())
+
+
+async def stand_in(latency=(0.005, 0.05), hang=0.02):
+    """A fake TV: answers /api/status with random figures, or sometimes never"""
+    hanging = random.random() < hang
+
+    async def handle(reader, writer):
+        try:
+            while await reader.readline():
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                if hanging:
+                    await asyncio.sleep(3600)
+                await asyncio.sleep(random.uniform(*latency))
+                body = json.dumps({'cpu': round(random.uniform(0, 100), 1),
+                                   'memory': round(random.uniform(20, 80), 1)}).encode()
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: %d\r\n\r\n' % len(body) + body)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, '127.0.0.1', 0)
+
+
+async def simulate(count, duration, interval, dead=0.02):
+    """Poll `count` local stand-in TVs for `duration` seconds and report"""
+    servers = [await stand_in() for _ in range(count)]
+    devices = []
+    for i, server in enumerate(servers):
+        port = server.sockets[0].getsockname()[1]
+        if random.random() < dead:
+            # Nothing listening any more: connection refused
+            server.close()
+        devices.append((f'tv-{i:03d}', '127.0.0.1', port))
+    hub = Hub(devices, interval=interval)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    tasks = hub.start()
+    await asyncio.sleep(duration)
+    for task in tasks:
+        task.cancel()
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    report = hub.report()
+    # Stand-ins run in this process too, so this overstates the hub's share
+    cpu = after.ru_utime + after.ru_stime - usage.ru_utime - usage.ru_stime
+    report['cpu_percent'] = round(100.0 * cpu / duration, 1)
+    report['api_bytes'] = len(hub.fleet_json())
+    for server in servers:
+        server.close()
+    return report
+
+
+def raise_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate the status of many Pi TVs")
+    parser.add_argument('--config', default=CONFIG_PATH, help="device list, one `[name] host[:port]` per line")
+    parser.add_argument('--discover', action='store_true', help="also add TVs found by SSDP search")
+    parser.add_argument('--port', type=int, default=HUB_PORT)
+    parser.add_argument('--interval', type=float, default=INTERVAL)
+    parser.add_argument('--simulate', type=int, metavar='N', help="poll N local stand-in TVs and report")
+    parser.add_argument('--duration', type=float, default=30.0, help="with --simulate: seconds to run")
+    args = parser.parse_args()
+
+    # One kept-alive socket per TV, plus the dashboard's clients
+    raise_file_limit()
+
+    if args.simulate:
+        print(json.dumps(asyncio.run(simulate(args.simulate, args.duration, args.interval))))
+        return
+
+    devices = []
+    try:
+        devices = load_config(args.config)
+    except FileNotFoundError:
+        if not args.discover:
+            parser.error(f"{args.config} not found (use --discover to find TVs by SSDP)")
+    if args.discover:
+        known = {host for _, host, _ in devices}
+        devices += [d for d in discover() if d[1] not in known]
+    print(f"Fleet hub: polling {len(devices)} TVs every {args.interval:g}s, dashboard on port {args.port}")
+
+    async def run():
+        hub = Hub(devices, interval=args.interval)
+        hub.start()
+        server = await serve_http(hub, args.port)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+D-pad focus navigation
+A spatial index of card rectangles, built once per layout, answers
+up/down/left/right neighbour queries with a bisect; FocusEngine moves GTK
+focus with it and scrolls the focused card into view, paced by the frame
+clock
+
+Benchmark:  python3 -m pitv.focus --benchmark 5000
+"""
+
+import argparse
+import bisect
+import random
+import time
+
+DIRECTIONS = ('up', 'down', 'left', 'right')
+
+
+class SpatialIndex:
+    """Rectangles grouped into rows, each sorted left to right
+
+    A rectangle joins the current row while it starts above the row's
+    bottom edge, so the cards of every grid section (and a full-width
+    featured card) form rows. Left/right are the row neighbours; up/down
+    bisect the adjacent row for the nearest horizontal centre.
+    """
+
+    def __init__(self, rects):
+        # rects: (key, x, y, width, height)
+        self.rects = {}
+        self.rows = []
+        self.where = {}
+        row = []
+        bottom = None
+        for key, x, y, width, height in sorted(rects, key=lambda r: (r[2], r[1])):
+            if row and y >= bottom:
+                self.add_row(row)
+                row = []
+            bottom = y + height if not row else max(bottom, y + height)
+            row.append((x + width / 2.0, key))
+            self.rects[key] = (x, y, width, height)
+        if row:
+            self.add_row(row)
+
+    def add_row(self, row):
+        row.sort(key=lambda item: item[0])
+        number = len(self.rows)
+        for column, (centre, key) in enumerate(row):
+            self.where[key] = (number, column)
+        self.rows.append(([centre for centre, key in row], [key for centre, key in row]))
+
+    def __len__(self):
+        return len(self.where)
+
+    def first(self):
+        return self.rows[0][1][0] if self.rows else None
+
+    def neighbour(self, key, direction):
+        """Next key in a direction, or None at the edge"""
+        number, column = self.where[key]
+        centres, keys = self.rows[number]
+        if direction == 'left':
+            return keys[column - 1] if column > 0 else None
+        if direction == 'right':
+            return keys[column + 1] if column + 1 < len(keys) else None
+        number += -1 if direction == 'up' else 1
+        if not 0 <= number < len(self.rows):
+            return None
+        centre = centres[column]
+        centres, keys = self.rows[number]
+        i = bisect.bisect_left(centres, centre)
+        if i == len(keys) or i > 0 and centre - centres[i - 1] <= centres[i] - centre:
+            i -= 1
+        return keys[i]
+
+
+def widget_origin(widget, ancestor):
+    """(x, y) of a widget in an ancestor's coordinates, or None"""
+    result = widget.translate_coordinates(ancestor, 0, 0)
+    # PyGObject versions differ on whether the success flag is returned
+    if not result or len(result) == 3 and not result[0]:
+        return None
+    return result[-2:]
+
+
+class FocusEngine:
+    """Moves keyboard focus between registered cards in a scrolled container
+
+    The index is dropped whenever the container is reallocated and rebuilt
+    on the next move. Scrolling eases to the target over SCROLL_TIME on the
+    widget's tick callback; with `animate` off it jumps.
+    """
+
+    SCROLL_TIME = 0.15
+    MARGIN = 40
+
+    def __init__(self, container, adjustment):
+        self.container = container
+        self.adjustment = adjustment
+        self.cards = []
+        self.index = None
+        self.focused = None
+        self.animate = True
+        self.scroll = None
+        self.tick_id = None
+        self.stats = {'moves': 0, 'rebuilds': 0, 'rebuild_ms': 0.0}
+        container.connect("size-allocate", self.invalidate)
+
+    def add(self, card):
+        self.cards.append(card)
+        card.connect("focus-in-event", self.on_focus_in)
+        self.index = None
+
+    def invalidate(self, *args):
+        self.index = None
+
+    def rectangles(self):
+        for card in self.cards:
+            if not card.get_mapped():
+                continue
+            # Cards do the focusing, not the FlowBox child wrapped around them
+            parent = card.get_parent()
+            if parent is not None and parent.get_can_focus():
+                parent.set_can_focus(False)
+            origin = widget_origin(card, self.container)
+            if origin is None:
+                continue
+            yield card, origin[0], origin[1], card.get_allocated_width(), card.get_allocated_height()
+
+    def rebuild(self):
+        start = time.perf_counter()
+        self.index = SpatialIndex(list(self.rectangles()))
+        self.stats['rebuilds'] += 1
+        self.stats['rebuild_ms'] = (time.perf_counter() - start) * 1000.0
+
+    def move(self, direction, count=1):
+        """Focus the card `count` steps away; returns the focused card"""
+        if self.index is None:
+            self.rebuild()
+        current = self.focused if self.focused is not None and self.focused.has_focus() else None
+        if current is None or current not in self.index.where:
+            target = self.index.first()
+        else:
+            target = current
+            for _ in range(count):
+                following = self.index.neighbour(target, direction)
+                if following is None:
+                    break
+                target = following
+        if target is not None and target is not current:
+            self.stats['moves'] += 1
+            target.grab_focus()
+        return target
+
+    def on_focus_in(self, card, event):
+        # Mouse and Tab focus scroll too
+        self.focused = card
+        self.scroll_to(card)
+        return False
+
+    def scroll_to(self, card):
+        rect = self.index.rects.get(card) if self.index is not None else None
+        if rect is None:
+            origin = widget_origin(card, self.container)
+            if origin is None:
+                return
+            rect = origin + (card.get_allocated_width(), card.get_allocated_height())
+        y, height = rect[1], rect[3]
+        adjustment = self.adjustment
+        value = adjustment.get_value()
+        page = adjustment.get_page_size()
+        if y - self.MARGIN < value:
+            target = y - self.MARGIN
+        elif y + height + self.MARGIN > value + page:
+            target = y + height + self.MARGIN - page
+        else:
+            return
+        target = max(adjustment.get_lower(), min(target, adjustment.get_upper() - page))
+        if not self.animate:
+            adjustment.set_value(target)
+            return
+        # Retargeting mid-scroll starts a new ease from where we are
+        self.scroll = (value, target, None)
+        if self.tick_id is None:
+            self.tick_id = self.container.add_tick_callback(self.on_tick)
+
+    def on_tick(self, widget, frame_clock):
+        start, target, began = self.scroll
+        now = frame_clock.get_frame_time() / 1e6
+        if began is None:
+            began = now
+            self.scroll = (start, target, began)
+        t = min((now - began) / self.SCROLL_TIME, 1.0)
+        # Ease out: quick to respond, soft to land
+        self.adjustment.set_value(start + (target - start) * (1 - (1 - t) ** 3))
+        if t < 1.0:
+            return True
+        self.tick_id = None
+        return False
+
+
+def benchmark(count, columns=6, moves=100000):
+    """Index build and query times for a grid of `count` synthetic cards"""
+    rects = [(i, (i % columns) * 270, (i // columns) * 170, 250, 150) for i in range(count)]
+    random.shuffle(rects)
+    start = time.perf_counter()
+    index = SpatialIndex(rects)
+    built = time.perf_counter() - start
+    key = index.first()
+    start = time.perf_counter()
+    for _ in range(moves):
+        following = index.neighbour(key, random.choice(DIRECTIONS))
+        if following is not None:
+            key = following
+    queried = time.perf_counter() - start
+    return {'cards': len(index), 'rows': len(index.rows), 'build_ms': round(built * 1000.0, 2),
+            'move_us': round(queried / moves * 1e6, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Focus navigation index")
+    parser.add_argument('--benchmark', type=int, metavar='CARDS', default=5000)
+    parser.add_argument('--columns', type=int, default=6)
+    args = parser.parse_args()
+    print(benchmark(args.benchmark, args.columns))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+"""
+Human-readable sizes, rates and durations for the front ends
+"""
+
+BYTE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+
+
+def format_bytes(n):
+    """1536 -> '1.5 KB' (powers of 1024)"""
+    n = float(n)
+    for unit in BYTE_UNITS:
+        if abs(n) < 1024 or unit == BYTE_UNITS[-1]:
+            break
+        n /= 1024
+    return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+
+
+def format_rate(bytes_per_second):
+    return f"{format_bytes(bytes_per_second)}/s"
+
+
+def format_duration(seconds):
+    """3725 -> '1h 2m', 65 -> '1m 5s'"""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds}s"
@@ -0,0 +1,332 @@
+"""
+OpenMetrics exposition
+Renders the collectors' samples and the server's request latency histograms
+as OpenMetrics text for /metrics. The text (and its gzip) is built once per
+collection cycle and shared by every scraper.
+
+Preview with:  python3 -m pitv.metrics
+"""
+
+import argparse
+import bisect
+import gzip
+import math
+import os
+import threading
+import time
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Seconds; API requests on a Pi land between a few ms and a second
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def format_value(value):
+    if value is None or isinstance(value, float) and math.isnan(value):
+        return 'NaN'
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricWriter:
+    """Accumulates metric families; text() closes the exposition
+
+    Samples are kept per family, so per-device loops can write several
+    families at once and still come out grouped as OpenMetrics requires.
+    """
+
+    def __init__(self):
+        self.families = {}
+        self.current = None
+
+    def family(self, name, kind, help, unit=None):
+        self.current = self.families.get(name)
+        if self.current is None:
+            header = f'# TYPE {name} {kind}\n'
+            if unit:
+                header += f'# UNIT {name} {unit}\n'
+            header += f'# HELP {name} {escape(help)}\n'
+            self.current = self.families[name] = [header]
+
+    def sample(self, name, value, labels=None):
+        """Sample of the family declared last"""
+        if labels:
+            label_text = ','.join(f'{k}="{escape(v)}"' for k, v in labels.items())
+            self.current.append(f'{name}{{{label_text}}} {format_value(value)}\n')
+        else:
+            self.current.append(f'{name} {format_value(value)}\n')
+
+    def gauge(self, name, help, value, labels=None, unit=None):
+        self.family(name, 'gauge', help, unit)
+        self.sample(name, value, labels)
+
+    def counter(self, name, help, value, labels=None):
+        self.family(name, 'counter', help)
+        self.sample(f'{name}_total', value, labels)
+
+    def text(self):
+        return ''.join(line for lines in self.families.values() for line in lines) + '# EOF\n'
+
+
+class Histogram:
+    """Thread-safe histogram with one series per label set"""
+
+    def __init__(self, name, help, label_names, buckets=LATENCY_BUCKETS, unit='seconds'):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self.unit = unit
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf) and the sum
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def write(self, writer):
+        writer.family(self.name, 'histogram', self.help, self.unit)
+        with self.lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in sorted(self.series.items())]
+        for labels, counts, total in series:
+            labels = dict(zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else repr(float(bound))
+                writer.sample(f'{self.name}_bucket', cumulative, dict(labels, le=le))
+            writer.sample(f'{self.name}_count', cumulative, labels)
+            writer.sample(f'{self.name}_sum', total, labels)
+
+
+class MetricsCache:
+    """Runs collect(writer) at most once per `interval`, whoever asks
+
+    Concurrent scrapers that arrive while a collection is running wait for
+    it instead of starting their own, so the cost per cycle is one
+    collection and one gzip regardless of how many scrapers there are.
+    """
+
+    def __init__(self, collect, interval=5.0):
+        self.collect = collect
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.text = None
+        self.compressed = None
+        self.time = None
+        self.stats = {'collections': 0, 'scrapes': 0, 'render_seconds': 0.0, 'bytes': 0, 'gzip_bytes': 0}
+
+    def latest(self):
+        """(text bytes, gzip bytes) of the current cycle"""
+        with self.lock:
+            self.stats['scrapes'] += 1
+            if self.time is None or time.monotonic() - self.time >= self.interval:
+                start = time.perf_counter()
+                writer = MetricWriter()
+                self.collect(writer)
+                self.write_own(writer)
+                self.text = writer.text().encode()
+                # Text this repetitive compresses ~10x; level 6 is plenty
+                self.compressed = gzip.compress(self.text, compresslevel=6)
+                self.time = time.monotonic()
+                self.stats['collections'] += 1
+                self.stats['render_seconds'] = time.perf_counter() - start
+                self.stats['bytes'] = len(self.text)
+                self.stats['gzip_bytes'] = len(self.compressed)
+            return self.text, self.compressed
+
+    def write_own(self, writer):
+        # Previous cycle's figures: this one's aren't known until it's done
+        writer.counter('pitv_metrics_collections', "Metric collection cycles", self.stats['collections'] + 1)
+        writer.counter('pitv_metrics_scrapes', "Requests for /metrics", self.stats['scrapes'])
+        writer.gauge('pitv_metrics_render_seconds', "Time spent on the previous collection",
+                     self.stats['render_seconds'], unit='seconds')
+
+
+def write_cpu(writer, sample):
+    for cpu, row in [('total', sample['total'])] + [(str(c['cpu']), c) for c in sample['cores']]:
+        labels = {'cpu': cpu}
+        writer.gauge('pitv_cpu_utilization_ratio', "Busy share of CPU time since the previous sample",
+                     round(row['util'] / 100.0, 4), labels)
+        writer.gauge('pitv_cpu_iowait_ratio', "Share of CPU time waiting for I/O", round(row['iowait'] / 100.0, 4), labels)
+        writer.gauge('pitv_cpu_steal_ratio', "Share of CPU time stolen", round(row['steal'] / 100.0, 4), labels)
+    for core in sample['cores']:
+        writer.gauge('pitv_cpu_frequency_hertz', "Current core frequency", core['freq'] * 1e6,
+                     {'cpu': str(core['cpu'])}, unit='hertz')
+    if sample['throttled'] is not None:
+        writer.gauge('pitv_throttled_flags', "Firmware get_throttled bits", sample['throttled'])
+
+
+def write_memory(writer, proc='/proc'):
+    values = {}
+    try:
+        with open(os.path.join(proc, 'meminfo')) as f:
+            for line in f:
+                name, _, rest = line.partition(':')
+                if name in ('MemTotal', 'MemAvailable', 'SwapTotal', 'SwapFree'):
+                    values[name] = int(rest.split()[0]) * 1024
+    except OSError:
+        return
+    for name, metric, help in (('MemTotal', 'pitv_memory_total_bytes', "Physical memory"),
+                               ('MemAvailable', 'pitv_memory_available_bytes', "Memory available without swapping"),
+                               ('SwapTotal', 'pitv_swap_total_bytes', "Swap space"),
+                               ('SwapFree', 'pitv_swap_free_bytes', "Unused swap space")):
+        if name in values:
+            writer.gauge(metric, help, values[name], unit='bytes')
+
+
+def write_temperature(writer, celsius):
+    if celsius is not None:
+        writer.gauge('pitv_soc_temperature_celsius', "Hottest thermal zone", celsius, unit='celsius')
+
+
+def write_block(writer, devices):
+    for name, device in sorted(devices.items()):
+        labels = {'device': name}
+        writer.gauge('pitv_disk_read_iops', "Completed reads per second", round(device['read_iops'], 2), labels)
+        writer.gauge('pitv_disk_write_iops', "Completed writes per second", round(device['write_iops'], 2), labels)
+        writer.gauge('pitv_disk_read_bytes_per_second', "Bytes read per second", round(device['read_rate']), labels)
+        writer.gauge('pitv_disk_write_bytes_per_second', "Bytes written per second", round(device['write_rate']), labels)
+        writer.gauge('pitv_disk_await_seconds', "Average time per completed request, queueing included",
+                     device['await'] / 1000.0, labels, unit='seconds')
+        writer.gauge('pitv_disk_utilization_ratio', "Share of time the device was busy",
+                     round(device['util'] / 100.0, 4), labels)
+        writer.gauge('pitv_disk_in_flight', "Requests currently in flight", device['in_flight'], labels)
+        wear = device.get('wear')
+        if wear:
+            writer.gauge('pitv_disk_written_bytes', "Bytes written across boots", wear['written'], labels, unit='bytes')
+            if wear['used'] is not None:
+                writer.gauge('pitv_disk_endurance_used_ratio', "Estimated share of rated write endurance used",
+                             wear['used'] / 100.0, labels)
+
+
+def write_network(writer, sample):
+    writer.gauge('pitv_network_online', "Whether there is a default route", int(sample['online']))
+    for name, stats in sorted(sample['interfaces'].items()):
+        labels = {'interface': name}
+        writer.gauge('pitv_network_primary', "Whether this is the interface the graphs follow",
+                     int(name == sample['primary']), labels)
+        writer.gauge('pitv_network_receive_bytes_per_second', "Bytes received per second, smoothed",
+                     round(stats['rx_rate']), labels)
+        writer.gauge('pitv_network_transmit_bytes_per_second', "Bytes sent per second, smoothed",
+                     round(stats['tx_rate']), labels)
+        writer.counter('pitv_network_errors', "Receive and transmit errors", stats['errors'], labels)
+        writer.counter('pitv_network_dropped', "Receive and transmit drops", stats['dropped'], labels)
+        writer.gauge('pitv_network_error_rate', "Errors and drops per second, smoothed",
+                     round(stats['error_rate'], 2), labels)
+        wifi = stats['wireless']
+        if wifi:
+            writer.gauge('pitv_wifi_signal_dbm', "Wi-Fi signal level, smoothed", wifi['signal'], labels)
+            if wifi['noise'] is not None:
+                writer.gauge('pitv_wifi_noise_dbm', "Wi-Fi noise level, smoothed", wifi['noise'], labels)
+            writer.gauge('pitv_wifi_link_quality', "Wi-Fi link quality as the driver reports it",
+                         wifi['quality'], labels)
+            writer.gauge('pitv_wifi_capacity_bits_per_second', "Estimated usable throughput at this signal level",
+                         wifi['capacity'], labels)
+
+
+def write_services(writer, usage):
+    for unit, row in sorted(usage.items()):
+        labels = {'unit': unit}
+        writer.gauge('pitv_service_running', "Whether the unit has a cgroup", int(row is not None), labels)
+        if row is None:
+            continue
+        # None where the kernel has the controller off
+        if row['cpu'] is not None:
+            writer.counter('pitv_service_cpu_seconds', "CPU time used since the unit started",
+                           row['cpu_seconds'], labels)
+            writer.gauge('pitv_service_cpu_ratio', "Share of one core used since the previous sample",
+                         round(row['cpu'] / 100.0, 4), labels)
+        if row['memory'] is not None:
+            writer.gauge('pitv_service_memory_bytes', "Memory charged to the unit", row['memory'], labels,
+                         unit='bytes')
+            writer.gauge('pitv_service_memory_peak_bytes', "Highest memory charged to the unit",
+                         row['memory_peak'], labels, unit='bytes')
+        writer.counter('pitv_service_read_bytes', "Bytes the unit read from block devices", row['read_bytes'], labels)
+        writer.counter('pitv_service_written_bytes', "Bytes the unit wrote to block devices",
+                       row['write_bytes'], labels)
+
+
+def write_processes(writer, report):
+    writer.gauge('pitv_processes', "Processes seen by the last scan", report['processes'])
+    writer.gauge('pitv_process_scan_seconds', "Duration of the last process scan",
+                 report['scan_ms'] / 1000.0, unit='seconds')
+
+
+def write_disk_usage(writer, report, largest):
+    writer.gauge('pitv_diskusage_ready', "Whether the directory index has finished its first scan", int(report['ready']))
+    writer.gauge('pitv_diskusage_directories', "Directories in the index", report['directories'])
+    writer.gauge('pitv_diskusage_watched', "Directories watched with inotify", report['watched'])
+    for entry in largest:
+        writer.gauge('pitv_directory_size_bytes', "File data held directly in the largest directories",
+                     entry['size'], {'path': entry['path']}, unit='bytes')
+
+
+def write_remote_input(writer, report):
+    writer.gauge('pitv_remote_input_clients', "Connected phone remotes", report['clients'])
+    writer.counter('pitv_remote_input_events', "Remote events relayed to the TV interface", report['events'])
+    for percentile in ('p50', 'p90', 'p99'):
+        if percentile in report['latency']:
+            writer.gauge('pitv_remote_input_latency_seconds', "Touch-to-focus latency over recent events",
+                         report['latency'][percentile] / 1000.0, {'percentile': percentile[1:]}, unit='seconds')
+
+
+def write_uploads(writer, report):
+    writer.gauge('pitv_uploads_active', "Upload requests being received", report['active'])
+    writer.counter('pitv_uploads_completed', "Uploads checked and moved into the media library", report['completed'])
+    writer.counter('pitv_uploads_failed', "Uploads discarded for a checksum mismatch", report['failed'])
+    writer.counter('pitv_upload_received_bytes', "Upload bytes written to disk", report['received_bytes'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print this machine's metrics in OpenMetrics format")
+    parser.add_argument('--proc', default='/proc')
+    parser.add_argument('--sys', default='/sys')
+    args = parser.parse_args()
+
+    from pitv.blockio import BlockCollector
+    from pitv.cgroups import CgroupMonitor
+    from pitv.cpu import CpuCollector
+    from pitv.network import NetworkCollector
+    from pitv.thermal import read_temperature
+
+    cpu = CpuCollector(args.proc, args.sys)
+    block = BlockCollector(args.proc, args.sys, wear_path=None)
+    network = NetworkCollector(args.proc)
+    services = CgroupMonitor()
+    latency = Histogram('pitv_http_request_duration_seconds', "Time to answer HTTP requests", ('route', 'method', 'code'))
+    for value in (0.002, 0.004, 0.03, 0.2):
+        latency.observe(value, '/api/status', 'GET', '200')
+
+    def collect(writer):
+        write_cpu(writer, cpu.sample())
+        write_memory(writer, args.proc)
+        write_temperature(writer, read_temperature(args.sys))
+        write_block(writer, block.sample())
+        write_network(writer, network.sample())
+        if services.available:
+            write_services(writer, services.sample())
+        latency.write(writer)
+
+    cache = MetricsCache(collect)
+    time.sleep(0.5)
+    text, compressed = cache.latest()
+    print(text.decode(), end='')
+    print(f"{len(text)} bytes, {len(compressed)} gzipped, rendered in "
+          f"{cache.stats['render_seconds'] * 1000.0:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""
+Network monitor
+Per-interface throughput, errors and drops from /proc/net/dev plus Wi-Fi
+link quality from /proc/net/wireless, smoothed, with a warning when the
+link looks too weak for the cast stream that is playing
+"""
+
+import os
+import time
+from collections import deque
+
+from pitv.profiles import CASTING, ActivityDetector, current_profile
+
+# /proc/net/dev columns used
+RX_BYTES, RX_PACKETS, RX_ERRS, RX_DROP = 0, 1, 2, 3
+TX_BYTES, TX_PACKETS, TX_ERRS, TX_DROP = 8, 9, 10, 11
+
+# Bitrate a cast stream needs (1080p Google Cast video; AirPlay audio is ~1 Mbit/s)
+CAST_STREAM_BPS = 8000000
+
+# Rough usable TCP throughput of the Pi's 1x1 2.4 GHz 802.11n radio by signal level
+SIGNAL_CAPACITY = (
+    (-50, 30000000),
+    (-60, 20000000),
+    (-67, 12000000),
+    (-70, 8000000),
+    (-75, 4000000),
+    (-80, 1500000),
+)
+MIN_CAPACITY = 500000
+
+
+def estimate_capacity(signal):
+    """Usable bits/s for a signal level in dBm"""
+    for level, capacity in SIGNAL_CAPACITY:
+        if signal >= level:
+            return capacity
+    return MIN_CAPACITY
+
+
+def signal_bars(signal):
+    """0-4 bars for a signal level in dBm"""
+    return sum(signal >= level for level in (-80, -70, -60, -50))
+
+
+def casting_active(proc='/proc'):
+    """Whether a cast stream is playing, from the profile manager if it runs"""
+    profile = current_profile()
+    if profile is not None:
+        return profile == CASTING
+    return ActivityDetector(proc).tcp_sessions() > 0
+
+
+class NetworkCollector:
+    """Samples every interface in one pass over /proc/net
+
+    Rates and Wi-Fi levels are exponentially smoothed with `alpha` so one
+    bursty sample doesn't swing the graphs or the warning. The default-route
+    interface is the primary one; its rx/tx history is kept for graphs.
+    Without a default route the box is offline, and the primary interface
+    is only a guess at whose counters are worth showing.
+    """
+
+    def __init__(self, proc='/proc', alpha=0.3, history=60, required=CAST_STREAM_BPS):
+        self.proc = proc
+        self.alpha = alpha
+        self.required = required
+        self.previous = {}
+        self.smoothed = {}
+        self.history = deque(maxlen=history)
+        self.last_time = None
+
+    def read_dev(self):
+        counters = {}
+        with open(os.path.join(self.proc, 'net/dev')) as f:
+            for line in f:
+                name, sep, values = line.partition(':')
+                if not sep or '|' in name:
+                    continue
+                name = name.strip()
+                if name != 'lo':
+                    counters[name] = [int(v) for v in values.split()]
+        return counters
+
+    def read_wireless(self):
+        """{interface: (link quality, signal dBm, noise dBm or None)}"""
+        wireless = {}
+        try:
+            with open(os.path.join(self.proc, 'net/wireless')) as f:
+                for line in f:
+                    name, sep, values = line.partition(':')
+                    if not sep or '|' in name:
+                        continue
+                    fields = values.split()
+                    link, level, noise = (float(v.rstrip('.')) for v in fields[1:4])
+                    wireless[name.strip()] = (link, level, None if noise <= -256 else noise)
+        except (OSError, ValueError, IndexError):
+            pass
+        return wireless
+
+    def default_interface(self):
+        try:
+            with open(os.path.join(self.proc, 'net/route')) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    if fields[1] == '00000000':
+                        return fields[0]
+        except (OSError, StopIteration, IndexError):
+            pass
+        return None
+
+    def smooth(self, name, key, value):
+        state = self.smoothed.setdefault(name, {})
+        previous = state.get(key)
+        state[key] = value if previous is None else previous + self.alpha * (value - previous)
+        return state[key]
+
+    def sample(self, now=None):
+        now = time.monotonic() if now is None else now
+        counters = self.read_dev()
+        wireless = self.read_wireless()
+        primary = self.default_interface()
+        online = primary is not None
+        elapsed = now - self.last_time if self.last_time is not None else None
+        self.last_time = now
+
+        interfaces = {}
+        for name, values in counters.items():
+            stats = {
+                'rx_rate': 0.0,
+                'tx_rate': 0.0,
+                'errors': values[RX_ERRS] + values[TX_ERRS],
+                'dropped': values[RX_DROP] + values[TX_DROP],
+                'error_rate': 0.0,
+                'wireless': None,
+            }
+            previous = self.previous.get(name)
+            if previous is not None and elapsed:
+                # Counters can go backwards if the driver resets them
+                def rate(index):
+                    return max(values[index] - previous[index], 0) / elapsed
+                stats['rx_rate'] = self.smooth(name, 'rx', rate(RX_BYTES))
+                stats['tx_rate'] = self.smooth(name, 'tx', rate(TX_BYTES))
+                stats['error_rate'] = self.smooth(name, 'err', sum(
+                    rate(i) for i in (RX_ERRS, TX_ERRS, RX_DROP, TX_DROP)))
+            self.previous[name] = values
+
+            if name in wireless:
+                link, signal, noise = wireless[name]
+                signal = self.smooth(name, 'signal', signal)
+                stats['wireless'] = {
+                    'quality': round(self.smooth(name, 'quality', link)),
+                    'signal': round(signal),
+                    'noise': round(self.smooth(name, 'noise', noise)) if noise is not None else None,
+                    'bars': signal_bars(signal),
+                    'capacity': estimate_capacity(signal),
+                }
+            interfaces[name] = stats
+
+        for name in list(self.previous):
+            if name not in counters:
+                del self.previous[name]
+                self.smoothed.pop(name, None)
+
+        if primary not in interfaces:
+            online = False
+            primary = next((n for n in interfaces if interfaces[n]['wireless']), None) or next(iter(interfaces), None)
+        if primary is not None:
+            self.history.append((interfaces[primary]['rx_rate'], interfaces[primary]['tx_rate']))
+
+        return {
+            'interfaces': interfaces,
+            'primary': primary,
+            'online': online,
+            'history': tuple(self.history),
+            'warning': self.bandwidth_warning(interfaces.get(primary)),
+        }
+
+    def bandwidth_warning(self, stats):
+        """A message if the primary link can't carry the cast stream that is playing"""
+        if stats is None or stats['wireless'] is None:
+            return None
+        wifi = stats['wireless']
+        if wifi['capacity'] >= self.required or not casting_active(self.proc):
+            return None
+        return (f"Wi-Fi too weak for casting: {wifi['signal']} dBm gives about "
+                f"{wifi['capacity'] / 1000000:.1f} Mbit/s, the stream needs "
+                f"{self.required / 1000000:.0f} Mbit/s")
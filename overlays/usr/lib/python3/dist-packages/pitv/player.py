@@ -0,0 +1,387 @@
+"""
+Embedded media player
+GStreamer playbin rendering into the GTK window. The pipeline is kept
+prewarmed in READY (plugins loaded, video sink open), so starting a video
+is a URI and a state change. Tracks time to first frame, seek latency,
+dropped frames, buffering and decode time for the statistics overlay.
+
+Benchmark:  python3 -m pitv.player --benchmark [--runs 5]   (on the TV's display)
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import deque
+
+SEEK_STEP = 10
+
+# GstPlayFlags: video, audio, soft-volume, buffering. Leaving out subtitles,
+# deinterlacing and colour balance keeps converters out of the pipeline.
+PLAY_FLAGS = 0x1 | 0x2 | 0x10 | 0x100
+
+# Network streams start once this much is buffered
+BUFFER_SECONDS = 2
+
+
+def load_gst():
+    """Initialised Gst module, or None when GStreamer isn't installed"""
+    try:
+        import gi
+        gi.require_version('Gst', '1.0')
+        from gi.repository import Gst
+    except (ImportError, ValueError):
+        return None
+    Gst.init(None)
+    return Gst
+
+
+def video_sink(Gst):
+    """(sink, element that keeps render stats, GTK widget); GL when the driver allows it"""
+    gl = Gst.ElementFactory.make('gtkglsink', None)
+    wrapper = Gst.ElementFactory.make('glsinkbin', None) if gl is not None else None
+    if wrapper is not None:
+        wrapper.set_property('sink', gl)
+        return wrapper, gl, gl.get_property('widget')
+    sink = Gst.ElementFactory.make('gtksink', None)
+    if sink is not None:
+        return sink, sink, sink.get_property('widget')
+    return None, None, None
+
+
+class PlaybackStats:
+    """Numbers for the overlay; written from streaming threads, read from the UI"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = None
+        self.first_frame_ms = None
+        self.seek_started = None
+        self.seek_ms = None
+        self.buffering = None
+        self.decode = deque(maxlen=120)
+        self.pending = {}
+
+    def frame(self):
+        """A buffer reached the video sink"""
+        now = time.monotonic()
+        if self.first_frame_ms is None and self.started is not None:
+            self.first_frame_ms = (now - self.started) * 1000.0
+        if self.seek_started is not None:
+            self.seek_ms = (now - self.seek_started) * 1000.0
+            self.seek_started = None
+
+    def decode_in(self, pts):
+        if len(self.pending) > 64:
+            self.pending.clear()
+        self.pending[pts] = time.perf_counter()
+
+    def decode_out(self, pts):
+        start = self.pending.pop(pts, None)
+        if start is not None:
+            self.decode.append((time.perf_counter() - start) * 1000.0)
+
+
+def clock(seconds):
+    """m:ss, rounded to the nearest second"""
+    seconds = round(seconds)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def describe_stats(summary):
+    """Overlay text"""
+    lines = []
+    if summary['first_frame_ms'] is not None:
+        lines.append(f"first frame {summary['first_frame_ms']:.0f} ms")
+    if summary['seek_ms'] is not None:
+        lines.append(f"last seek {summary['seek_ms']:.0f} ms")
+    lines.append(f"rendered {summary['rendered']} · dropped {summary['dropped']}")
+    if summary['decode_ms'] is not None:
+        lines.append(f"decode {summary['decode_ms']:.1f} ms/frame")
+    if summary['buffer_percent'] is not None:
+        lines.append(f"buffer {summary['buffer_percent']}%")
+    if summary['position'] is not None:
+        position = clock(summary['position'])
+        if summary['duration']:
+            position += f" / {clock(summary['duration'])}"
+        lines.append(position)
+    return '\n'.join(lines)
+
+
+class Player:
+    """playbin with a given video sink, held in READY between videos
+
+    Callbacks run from the GLib main loop (bus signal watch).
+    """
+
+    def __init__(self, Gst, sink, stats_sink=None, on_error=None, on_eos=None):
+        self.Gst = Gst
+        self.playbin = Gst.ElementFactory.make('playbin', 'player')
+        if self.playbin is None:
+            raise OSError("GStreamer playbin is not available")
+        self.playbin.set_property('video-sink', sink)
+        self.playbin.set_property('flags', PLAY_FLAGS)
+        self.playbin.set_property('buffer-duration', BUFFER_SECONDS * Gst.SECOND)
+        self.stats_sink = stats_sink or sink
+        self.on_error = on_error
+        self.on_eos = on_eos
+        self.stats = PlaybackStats()
+        self.uri = None
+        self.paused_for_buffering = False
+
+        self.playbin.connect('element-setup', self.on_element_setup)
+        sink.get_static_pad('sink').add_probe(Gst.PadProbeType.BUFFER, self.on_sink_buffer)
+        bus = self.playbin.get_bus()
+        bus.add_signal_watch()
+        bus.connect('message', self.on_message)
+        # Prewarm: load plugins and open the sink now, not on the first play
+        self.playbin.set_state(Gst.State.READY)
+
+    def on_sink_buffer(self, pad, info):
+        self.stats.frame()
+        return self.Gst.PadProbeReturn.OK
+
+    def on_element_setup(self, playbin, element):
+        # Time video decoders by matching buffer timestamps in and out
+        factory = element.get_factory()
+        klass = factory.get_metadata('klass') if factory is not None else ''
+        if 'Decoder' not in klass or 'Video' not in klass:
+            return
+        sink, src = element.get_static_pad('sink'), element.get_static_pad('src')
+        if sink is None or src is None:
+            return
+        Gst = self.Gst
+        sink.add_probe(Gst.PadProbeType.BUFFER,
+                       lambda pad, info: (self.stats.decode_in(info.get_buffer().pts), Gst.PadProbeReturn.OK)[1])
+        src.add_probe(Gst.PadProbeType.BUFFER,
+                      lambda pad, info: (self.stats.decode_out(info.get_buffer().pts), Gst.PadProbeReturn.OK)[1])
+
+    def on_message(self, bus, message):
+        Gst = self.Gst
+        if message.type == Gst.MessageType.ERROR:
+            error, debug = message.parse_error()
+            self.stop()
+            if self.on_error is not None:
+                self.on_error(error.message)
+        elif message.type == Gst.MessageType.EOS:
+            if self.on_eos is not None:
+                self.on_eos()
+        elif message.type == Gst.MessageType.BUFFERING:
+            percent = message.parse_buffering()
+            self.stats.buffering = percent
+            # Pause while a network stream refills rather than stutter
+            if percent < 100 and not self.paused_for_buffering and self.playing():
+                self.paused_for_buffering = True
+                self.playbin.set_state(Gst.State.PAUSED)
+            elif percent == 100 and self.paused_for_buffering:
+                self.paused_for_buffering = False
+                self.playbin.set_state(Gst.State.PLAYING)
+
+    def playing(self):
+        return self.playbin.get_state(0)[1] == self.Gst.State.PLAYING
+
+    def play(self, uri):
+        Gst = self.Gst
+        self.stats.reset()
+        self.stats.started = time.monotonic()
+        self.paused_for_buffering = False
+        self.uri = uri
+        self.playbin.set_state(Gst.State.READY)
+        self.playbin.set_property('uri', uri)
+        self.playbin.set_state(Gst.State.PLAYING)
+
+    def toggle_pause(self):
+        Gst = self.Gst
+        self.paused_for_buffering = False
+        self.playbin.set_state(Gst.State.PAUSED if self.playing() else Gst.State.PLAYING)
+
+    def seek(self, seconds):
+        """Jump relative to the current position, to the nearest keyframe"""
+        Gst = self.Gst
+        ok, position = self.playbin.query_position(Gst.Format.TIME)
+        if not ok:
+            return False
+        target = max(position + int(seconds * Gst.SECOND), 0)
+        self.stats.seek_started = time.monotonic()
+        return self.playbin.seek_simple(Gst.Format.TIME, Gst.SeekFlags.FLUSH | Gst.SeekFlags.KEY_UNIT, target)
+
+    def stop(self):
+        # READY, not NULL: the sink stays open for the next video
+        self.playbin.set_state(self.Gst.State.READY)
+
+    def shutdown(self):
+        self.playbin.set_state(self.Gst.State.NULL)
+        self.playbin.get_bus().remove_signal_watch()
+
+    def summary(self):
+        Gst = self.Gst
+        rendered = dropped = 0
+        structure = self.stats_sink.get_property('stats')
+        if structure is not None:
+            rendered = structure.get_uint64('rendered')[1]
+            dropped = structure.get_uint64('dropped')[1]
+        ok, position = self.playbin.query_position(Gst.Format.TIME)
+        has_duration, duration = self.playbin.query_duration(Gst.Format.TIME)
+        decode = list(self.stats.decode)
+        return {
+            'first_frame_ms': self.stats.first_frame_ms,
+            'seek_ms': self.stats.seek_ms,
+            'rendered': rendered,
+            'dropped': dropped,
+            'decode_ms': sum(decode) / len(decode) if decode else None,
+            'buffer_percent': self.stats.buffering,
+            'position': position / Gst.SECOND if ok else None,
+            'duration': duration / Gst.SECOND if has_duration and duration > 0 else None,
+        }
+
+
+TEST_CLIPS = (
+    ('mp4', 'x264enc speed-preset=ultrafast tune=zerolatency key-int-max=30 ! h264parse ! mp4mux'),
+    ('webm', 'vp8enc deadline=1 keyframe-max-dist=30 ! webmmux'),
+)
+
+
+def make_test_clip(Gst, directory, seconds=10, size=(1280, 720)):
+    """Encode a test-pattern clip with whichever encoder is installed"""
+    for extension, encoder in TEST_CLIPS:
+        path = os.path.join(directory, f'pattern.{extension}')
+        try:
+            pipeline = Gst.parse_launch(
+                f'videotestsrc pattern=smpte num-buffers={seconds * 30} ! '
+                f'video/x-raw,width={size[0]},height={size[1]},framerate=30/1 ! {encoder} ! '
+                f'filesink location={path}')
+        except Exception:
+            continue
+        pipeline.set_state(Gst.State.PLAYING)
+        message = pipeline.get_bus().timed_pop_filtered(
+            Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+        pipeline.set_state(Gst.State.NULL)
+        if message.type == Gst.MessageType.EOS:
+            return path
+    raise OSError("no H.264 or VP8 encoder to make a test clip with")
+
+
+def wait_for(check, timeout=10.0, context=None):
+    """Poll check() until it returns a value, running `context` (a GLib main context) meanwhile"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        while context is not None and context.pending():
+            context.iteration(False)
+        value = check()
+        if value is not None:
+            return value
+        time.sleep(0.002)
+    return None
+
+
+def benchmark(Gst, clip, runs=5):
+    """Time to first frame and seek latency, cold (new pipeline) and warm (prewarmed)
+
+    Plays through the sink the TV interface uses (video_sink: gtkglsink,
+    else gtksink) in a window of its own, with the GTK main loop running,
+    so the figures include GL upload and drawing like real playback.
+    """
+    import gi
+    gi.require_version('Gtk', '3.0')
+    from gi.repository import GLib, Gtk
+
+    uri = Gst.filename_to_uri(clip)
+    context = GLib.MainContext.default()
+    window = Gtk.Window(title="pitv player benchmark")
+    window.set_default_size(1280, 720)
+
+    def player():
+        sink, stats_sink, widget = video_sink(Gst)
+        if sink is None:
+            raise OSError("no GTK video sink (gstreamer1.0-gtk3)")
+        if window.get_child() is not None:
+            window.remove(window.get_child())
+        window.add(widget)
+        window.show_all()
+        return Player(Gst, sink, stats_sink)
+
+    cold = []
+    for _ in range(runs):
+        start = time.monotonic()
+        p = player()
+        p.play(uri)
+        p.stats.started = start
+        cold.append(wait_for(lambda: p.stats.first_frame_ms, context=context))
+        p.shutdown()
+
+    p = player()
+    warm, seeks = [], []
+    for _ in range(runs):
+        p.play(uri)
+        warm.append(wait_for(lambda: p.stats.first_frame_ms, context=context))
+        wait_for(lambda: p.summary()['position'] or None, context=context)
+        p.seek(5)
+        seeks.append(wait_for(lambda: p.stats.seek_ms, context=context))
+        p.stop()
+    p.shutdown()
+    window.destroy()
+    return {'cold_ms': cold, 'warm_ms': warm, 'seek_ms': seeks}
+
+
+def benchmark_vlc(clip, runs=3):
+    """Wall time for VLC to start, show the first frame and quit: an upper bound on its time to first frame
+
+    VLC draws with its default video output, as it does when media opens
+    in VLC without the embedded player.
+    """
+    vlc = shutil.which('cvlc')
+    if vlc is None:
+        return None
+    times = []
+    for _ in range(runs):
+        start = time.monotonic()
+        subprocess.run([vlc, '--intf', 'dummy', '--no-audio', '--play-and-exit',
+                        '--stop-time', '0.04', clip], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append((time.monotonic() - start) * 1000.0)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedded player benchmark")
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--clip', help="media file to use instead of a generated test pattern")
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    if not args.benchmark:
+        parser.print_help()
+        return
+
+    Gst = load_gst()
+    if Gst is None:
+        parser.error("GStreamer (gir1.2-gstreamer-1.0) is not installed")
+    with tempfile.TemporaryDirectory() as directory:
+        clip = os.path.abspath(args.clip) if args.clip else make_test_clip(Gst, directory)
+
+        def show(name, values):
+            values = [v for v in values if v is not None]
+            if values:
+                print(f"{name:>22}: median {sorted(values)[len(values) // 2]:7.1f} ms  "
+                      f"({', '.join(f'{v:.0f}' for v in values)})")
+            else:
+                print(f"{name:>22}: no frames")
+
+        try:
+            results = benchmark(Gst, clip, args.runs)
+        except (ImportError, ValueError, OSError) as e:
+            parser.error(f"cannot play through the GTK sink: {e}")
+        show("playbin cold start", results['cold_ms'])
+        show("playbin prewarmed", results['warm_ms'])
+        show("playbin seek", results['seek_ms'])
+        vlc = benchmark_vlc(clip)
+        if vlc is None:
+            print(f"{'VLC launch':>22}: cvlc not installed")
+        else:
+            show("VLC launch to exit", vlc)
+
+
+if __name__ == '__main__':
+    main()
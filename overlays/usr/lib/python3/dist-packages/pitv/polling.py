@@ -0,0 +1,214 @@
+"""
+Adaptive polling
+Samples quickly while the dashboard is on screen and in use, backs off
+exponentially while it is hidden, covered, blanked or idle, and wakes up
+immediately on input
+"""
+
+import glob
+import os
+import threading
+import time
+
+
+def screen_blanked(sys='/sys'):
+    """True if every connected display is in a DPMS power-saving state"""
+    states = []
+    for connector in glob.glob(os.path.join(sys, 'class/drm/card*-*')):
+        try:
+            with open(os.path.join(connector, 'status')) as f:
+                if f.read().strip() != 'connected':
+                    continue
+            with open(os.path.join(connector, 'dpms')) as f:
+                states.append(f.read().strip())
+        except OSError:
+            continue
+    return bool(states) and all(state != 'On' for state in states)
+
+
+class AdaptivePoller:
+    """Decides when a sampling callback runs
+
+    The front end reports what it knows (visible, focused, last input) and
+    the poller picks the interval: `fast` while the dashboard is watched,
+    doubling up to `slow` otherwise. Timing is driven by attach_glib(),
+    attach_qt() or run_blocking(). `scale` stretches every interval (used
+    by the thermal governor).
+    """
+
+    def __init__(self, callback, fast=2.0, slow=60.0, factor=2.0, idle_after=300.0,
+                 sys='/sys', report_every=3600.0):
+        self.callback = callback
+        self.fast = fast
+        self.slow = slow
+        self.factor = factor
+        self.idle_after = idle_after
+        self.sys = sys
+        self.scale = 1
+        self.interval = fast
+        self.visible = True
+        self.focused = True
+        self.last_input = time.monotonic()
+        self.wake_event = threading.Event()
+        self.rearm = None
+        self.started = time.monotonic()
+        self.samples = 0
+        self.cpu_seconds = 0.0
+        self.report_every = report_every
+        self.last_report = self.started
+
+    def watched(self):
+        """True if someone is plausibly looking at the dashboard"""
+        if not (self.visible and self.focused):
+            return False
+        if time.monotonic() - self.last_input > self.idle_after:
+            return False
+        return not screen_blanked(self.sys)
+
+    def next_interval(self):
+        if self.watched():
+            self.interval = self.fast
+        else:
+            self.interval = min(self.interval * self.factor, self.slow)
+        return self.interval * self.scale
+
+    def tick(self):
+        """Run the callback once and return the delay until the next run"""
+        start = time.thread_time()
+        try:
+            result = self.callback()
+        finally:
+            self.samples += 1
+            self.cpu_seconds += time.thread_time() - start
+        if self.report_every and time.monotonic() - self.last_report >= self.report_every:
+            self.last_report = time.monotonic()
+            print(f"Polling: {self.summary()}")
+        interval = self.next_interval()
+        # A callback that knows when it next has work (CollectorScheduler.run)
+        # returns that delay, and the poller doesn't wake up before it
+        if isinstance(result, float):
+            interval = max(interval, result)
+        return interval
+
+    def set_visible(self, visible):
+        was_visible = self.visible
+        self.visible = visible
+        if visible and not was_visible:
+            self.wake()
+
+    def set_focused(self, focused):
+        was_focused = self.focused
+        self.focused = focused
+        if focused and not was_focused:
+            self.wake()
+
+    def input(self):
+        """Note user input; wakes the poller if it had backed off"""
+        self.last_input = time.monotonic()
+        if self.interval > self.fast:
+            self.wake()
+
+    def set_scale(self, scale):
+        self.scale = scale
+
+    def wake(self):
+        """Sample now and go back to the fast interval"""
+        self.interval = self.fast
+        self.wake_event.set()
+        if self.rearm is not None:
+            self.rearm(0)
+
+    def attach_glib(self):
+        """Drive the poller from the GLib main loop"""
+        from gi.repository import GLib
+        source = [None]
+
+        def run():
+            source[0] = None
+            rearm(self.tick())
+            return False
+
+        def rearm(delay):
+            if source[0] is not None:
+                GLib.source_remove(source[0])
+            source[0] = GLib.timeout_add(int(delay * 1000), run)
+
+        self.rearm = rearm
+        rearm(0)
+
+    def attach_qt(self):
+        """Drive the poller from a Qt single-shot timer"""
+        from PyQt5.QtCore import QTimer
+        timer = QTimer()
+        timer.setSingleShot(True)
+        timer.timeout.connect(lambda: timer.start(int(self.tick() * 1000)))
+        self.rearm = lambda delay: timer.start(int(delay * 1000))
+        self.qt_timer = timer
+        timer.start(0)
+
+    def watch_gtk(self, window):
+        """Follow a Gtk.Window's visibility, focus and input"""
+        from gi.repository import Gdk
+
+        def on_window_state(widget, event):
+            state = event.new_window_state
+            self.set_visible(not state & Gdk.WindowState.ICONIFIED)
+            self.set_focused(bool(state & Gdk.WindowState.FOCUSED))
+
+        def on_visibility(widget, event):
+            # Fully obscured e.g. by a fullscreen VLC or Chromium window
+            self.set_visible(event.state != Gdk.VisibilityState.FULLY_OBSCURED)
+
+        window.add_events(Gdk.EventMask.VISIBILITY_NOTIFY_MASK | Gdk.EventMask.POINTER_MOTION_MASK)
+        window.connect("window-state-event", on_window_state)
+        window.connect("visibility-notify-event", on_visibility)
+        for signal in ("key-press-event", "button-press-event", "motion-notify-event"):
+            window.connect(signal, lambda w, e: self.input())
+
+    def watch_qt(self, window):
+        """Follow a QWidget window's visibility, focus and application input"""
+        from PyQt5.QtCore import QEvent, QObject
+        from PyQt5.QtWidgets import QApplication
+        poller = self
+        inputs = (QEvent.KeyPress, QEvent.MouseButtonPress, QEvent.MouseMove, QEvent.Wheel)
+        states = (QEvent.WindowStateChange, QEvent.ActivationChange, QEvent.Show, QEvent.Hide)
+
+        class Watcher(QObject):
+            def eventFilter(self, obj, event):
+                if event.type() in inputs:
+                    poller.input()
+                elif obj is window and event.type() in states:
+                    poller.set_visible(window.isVisible() and not window.isMinimized())
+                    poller.set_focused(window.isActiveWindow())
+                return False
+
+        self.qt_watcher = Watcher()
+        QApplication.instance().installEventFilter(self.qt_watcher)
+
+    def run_blocking(self, stop=None):
+        """Drive the poller from the calling (worker) thread"""
+        while stop is None or not stop.is_set():
+            delay = self.tick()
+            self.wake_event.wait(delay)
+            self.wake_event.clear()
+
+    def report(self):
+        """Samples taken vs. sampling at the fast rate all the time"""
+        elapsed = time.monotonic() - self.started
+        fast_samples = elapsed / self.fast
+        cost = self.cpu_seconds / self.samples if self.samples else 0.0
+        return {
+            'elapsed': elapsed,
+            'samples': self.samples,
+            'fast_samples': int(fast_samples),
+            'interval': self.interval * self.scale,
+            'cpu_seconds': self.cpu_seconds,
+            'cpu_seconds_saved': max(fast_samples - self.samples, 0) * cost,
+        }
+
+    def summary(self):
+        r = self.report()
+        hours = r['elapsed'] / 3600.0
+        return (f"{r['samples']} samples in {hours:.1f} h "
+                f"(vs {r['fast_samples']} at {self.fast:g}s), "
+                f"{r['cpu_seconds']:.1f} s CPU used, ~{r['cpu_seconds_saved']:.1f} s saved")
@@ -0,0 +1,204 @@
+"""
+Process monitor
+Keeps per-pid state between scans of /proc so each scan is one directory
+listing plus one pread() of /proc/<pid>/stat per process, and picks the
+top-N processes by CPU or memory with a heap
+
+Benchmark with:  python3 -m pitv.processes
+"""
+
+import argparse
+import errno
+import heapq
+import os
+import threading
+import time
+
+SORT_KEYS = ('cpu', 'memory')
+
+# Fields of /proc/<pid>/stat counted after the ")" that closes comm
+STATE, UTIME, STIME, RSS = 0, 11, 12, 21
+
+STAT_SIZE = 1024
+
+
+class Process:
+    """What we remember about one pid between scans"""
+
+    __slots__ = ('pid', 'fd', 'name', 'state', 'raw', 'ticks', 'rss', 'cpu')
+
+    def __init__(self, pid, fd):
+        self.pid = pid
+        self.fd = fd
+        self.name = None
+        self.state = '?'
+        self.raw = None
+        self.ticks = None
+        self.rss = 0
+        self.cpu = 0.0
+
+
+class ProcessScanner:
+    """Incremental /proc scanner
+
+    The stat file of every known process stays open and is re-read with
+    pread(), so a scan costs one syscall per process. A stat line that is
+    byte-for-byte unchanged (the common case for sleeping processes) isn't
+    parsed again. RSS comes from the same stat line, so statm isn't read.
+    A pid that exits fails the read with ESRCH and is dropped; if the pid is
+    reused, the new process turns up in the next listing.
+    """
+
+    def __init__(self, proc='/proc'):
+        self.proc = proc
+        self.processes = {}
+        self.ticks_per_second = os.sysconf('SC_CLK_TCK')
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+        self.total_memory = self.read_total_memory()
+        self.last_time = None
+        self.lock = threading.Lock()
+        self.scans = 0
+        self.scan_ms = 0.0
+        self.parsed = 0
+
+    def read_total_memory(self):
+        try:
+            with open(os.path.join(self.proc, 'meminfo')) as f:
+                for line in f:
+                    if line.startswith('MemTotal:'):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+        return 0
+
+    def open_stat(self, pid):
+        try:
+            return os.open(os.path.join(self.proc, str(pid), 'stat'), os.O_RDONLY)
+        except OSError:
+            return None
+
+    def drop(self, pid):
+        process = self.processes.pop(pid)
+        os.close(process.fd)
+
+    def scan(self, now=None):
+        """Refresh every process; CPU is the share of one core since the last scan"""
+        start = time.perf_counter()
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            elapsed = now - self.last_time if self.last_time is not None else None
+            self.last_time = now
+            scale = 100.0 / (self.ticks_per_second * elapsed) if elapsed else 0.0
+
+            listed = set()
+            for entry in os.listdir(self.proc):
+                if entry.isdigit():
+                    listed.add(int(entry))
+            for pid in self.processes.keys() - listed:
+                self.drop(pid)
+
+            parsed = 0
+            for pid in listed:
+                process = self.processes.get(pid)
+                if process is None:
+                    fd = self.open_stat(pid)
+                    if fd is None:
+                        continue
+                    process = self.processes[pid] = Process(pid, fd)
+                try:
+                    raw = os.pread(process.fd, STAT_SIZE, 0)
+                except OSError as e:
+                    if e.errno != errno.ESRCH:
+                        print(f"Processes: cannot read {pid}: {e}")
+                    self.drop(pid)
+                    continue
+                if not raw:
+                    self.drop(pid)
+                    continue
+
+                if raw == process.raw:
+                    # Nothing changed, so no CPU was used either
+                    process.cpu = 0.0
+                    continue
+                process.raw = raw
+                parsed += 1
+
+                head, _, tail = raw.rpartition(b')')
+                if process.name is None:
+                    process.name = head.partition(b'(')[2].decode('utf-8', 'replace')
+                fields = tail.split()
+                ticks = int(fields[UTIME]) + int(fields[STIME])
+                process.state = fields[STATE].decode()
+                process.rss = int(fields[RSS]) * self.page_size
+                process.cpu = (ticks - process.ticks) * scale if process.ticks is not None else 0.0
+                process.ticks = ticks
+
+            self.scans += 1
+            self.parsed = parsed
+            self.scan_ms = (time.perf_counter() - start) * 1000.0
+
+    def top(self, n=10, key='cpu'):
+        """The n processes using the most CPU or memory, as dicts"""
+        if key not in SORT_KEYS:
+            raise ValueError(f"unknown sort key {key!r}")
+        with self.lock:
+            if key == 'cpu':
+                chosen = heapq.nlargest(n, self.processes.values(), key=lambda p: (p.cpu, p.rss))
+            else:
+                chosen = heapq.nlargest(n, self.processes.values(), key=lambda p: p.rss)
+            return [{
+                'pid': p.pid,
+                'name': p.name,
+                'state': p.state,
+                'cpu': round(p.cpu, 1),
+                'rss': p.rss,
+                'memory': round(100.0 * p.rss / self.total_memory, 1) if self.total_memory else 0.0,
+            } for p in chosen]
+
+    def latest(self, n=10, key='cpu', max_age=1.0):
+        """top() after a scan, unless the last scan is recent enough"""
+        if self.last_time is None or time.monotonic() - self.last_time >= max_age:
+            self.scan()
+        return self.top(n, key)
+
+    def report(self):
+        return {
+            'processes': len(self.processes),
+            'parsed': self.parsed,
+            'scan_ms': round(self.scan_ms, 2),
+        }
+
+    def close(self):
+        with self.lock:
+            for pid in list(self.processes):
+                self.drop(pid)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the process scanner")
+    parser.add_argument('--proc', default='/proc')
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    scanner = ProcessScanner(args.proc)
+    start = time.perf_counter()
+    scanner.scan()
+    print(f"First scan: {(time.perf_counter() - start) * 1000.0:.2f} ms "
+          f"({len(scanner.processes)} processes)")
+
+    times = []
+    for _ in range(args.rounds):
+        time.sleep(0.05)
+        scanner.scan()
+        times.append(scanner.scan_ms)
+    times.sort()
+    print(f"Rescan: mean {sum(times) / len(times):.2f} ms, p95 {times[int(len(times) * 0.95)]:.2f} ms, "
+          f"max {times[-1]:.2f} ms, {scanner.parsed} of {len(scanner.processes)} parsed last time")
+
+    for p in scanner.top(args.top):
+        print(f"{p['pid']:>7} {p['name']:<16} {p['cpu']:>6.1f}% {p['rss'] / 1048576:>8.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
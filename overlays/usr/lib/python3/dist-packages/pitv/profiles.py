@@ -0,0 +1,299 @@
+"""
+Activity-based performance profiles
+Switches the cpufreq governor and network IRQ affinity between a "casting"
+profile (performance governor, network IRQs kept off the UI core) and an
+"idle" profile (ondemand/powersave, IRQs on any core)
+
+Run as root with:  python3 -m pitv.profiles
+"""
+
+import argparse
+import os
+import signal
+import sys
+import time
+
+CASTING = 'casting'
+IDLE = 'idle'
+
+# Established TCP sessions on these local ports mean someone is casting:
+# 8008 cast HTTP server, 5000/7000 AirPlay (RTSP / AirPlay 2)
+CAST_PORTS = (8008, 5000, 7000)
+
+# Receivers that use noticeable CPU only while playing
+CAST_PROCESSES = ('shairport-sync',)
+
+# /proc/interrupts names of the network devices (Pi 3B: USB LAN, SDIO Wi-Fi)
+NETWORK_IRQS = ('dwc_otg', 'eth0', 'wlan0', 'mmc1')
+
+TCP_ESTABLISHED = '01'
+
+# Current profile, for the GUIs to display
+STATE_PATH = '/run/pitv/profile'
+
+
+class ActivityDetector:
+    """Detects casting from socket state and receiver CPU use"""
+
+    def __init__(self, proc='/proc', ports=CAST_PORTS, processes=CAST_PROCESSES,
+                 cpu_threshold=0.02):
+        self.proc = proc
+        self.ports = set(ports)
+        self.processes = set(processes)
+        self.cpu_threshold = cpu_threshold
+        self.ticks_per_second = os.sysconf('SC_CLK_TCK')
+        self.pids = {}
+        self.last_ticks = {}
+        self.last_time = None
+
+    def tcp_sessions(self):
+        """Established TCP connections on the cast ports"""
+        count = 0
+        for name in ('tcp', 'tcp6'):
+            try:
+                with open(os.path.join(self.proc, 'net', name)) as f:
+                    next(f)
+                    for line in f:
+                        fields = line.split()
+                        if fields[3] != TCP_ESTABLISHED:
+                            continue
+                        if int(fields[1].rsplit(':', 1)[1], 16) in self.ports:
+                            count += 1
+            except (OSError, StopIteration):
+                pass
+        return count
+
+    def find_pids(self):
+        """pid -> comm of the receiver processes"""
+        pids = {}
+        for entry in os.listdir(self.proc):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(os.path.join(self.proc, entry, 'comm')) as f:
+                    comm = f.read().strip()
+            except OSError:
+                continue
+            if comm in self.processes:
+                pids[int(entry)] = comm
+        return pids
+
+    def process_ticks(self, pid):
+        with open(os.path.join(self.proc, str(pid), 'stat')) as f:
+            # comm may contain spaces, so split after its closing parenthesis
+            fields = f.read().rsplit(')', 1)[1].split()
+        return int(fields[11]) + int(fields[12])
+
+    def busy_processes(self, now):
+        """Receivers whose CPU share since the last check is over threshold"""
+        busy = []
+        ticks = {}
+        for pid, comm in list(self.pids.items()):
+            try:
+                ticks[pid] = self.process_ticks(pid)
+            except (OSError, IndexError, ValueError):
+                continue
+        if len(ticks) != len(self.pids) or not self.pids:
+            # A receiver exited or none is known yet: rescan /proc
+            self.pids = self.find_pids()
+            for pid in self.pids:
+                try:
+                    ticks[pid] = self.process_ticks(pid)
+                except (OSError, IndexError, ValueError):
+                    pass
+
+        if self.last_time is not None and now > self.last_time:
+            elapsed = now - self.last_time
+            for pid, value in ticks.items():
+                if pid in self.last_ticks:
+                    share = (value - self.last_ticks[pid]) / self.ticks_per_second / elapsed
+                    if share >= self.cpu_threshold:
+                        busy.append(self.pids.get(pid, str(pid)))
+        self.last_ticks = ticks
+        self.last_time = now
+        return busy
+
+    def detect(self, now=None):
+        """(active, reasons) for the current moment"""
+        now = time.monotonic() if now is None else now
+        reasons = []
+        sessions = self.tcp_sessions()
+        if sessions:
+            reasons.append(f"{sessions} cast connection(s)")
+        reasons.extend(f"{comm} busy" for comm in self.busy_processes(now))
+        return bool(reasons), reasons
+
+
+class ProfileManager:
+    """Applies a profile for the detected activity, with hysteresis
+
+    Casting must be seen on `enter_checks` consecutive checks before the
+    casting profile is applied, and activity must have stopped for
+    `idle_seconds` before going back to idle.
+    """
+
+    def __init__(self, root='/', detector=None, ui_core=0, enter_checks=2, idle_seconds=60.0,
+                 irq_names=NETWORK_IRQS):
+        self.sys = os.path.join(root, 'sys')
+        self.proc = os.path.join(root, 'proc')
+        self.detector = detector or ActivityDetector(self.proc)
+        self.ui_core = ui_core
+        self.enter_checks = enter_checks
+        self.idle_seconds = idle_seconds
+        self.irq_names = irq_names
+        self.state_path = os.path.join(root, STATE_PATH.lstrip('/'))
+        self.profile = None
+        self.active_checks = 0
+        self.last_active = None
+        self.transitions = []
+
+    def cpu_dir(self, *parts):
+        return os.path.join(self.sys, 'devices/system/cpu', *parts)
+
+    def cpus(self):
+        return sorted(int(name[3:]) for name in os.listdir(self.cpu_dir())
+                      if name.startswith('cpu') and name[3:].isdigit())
+
+    def idle_governor(self):
+        """ondemand if the kernel offers it, otherwise powersave"""
+        try:
+            with open(self.cpu_dir('cpu0/cpufreq/scaling_available_governors')) as f:
+                available = f.read().split()
+        except OSError:
+            available = []
+        return 'ondemand' if 'ondemand' in available else 'powersave'
+
+    def set_governor(self, governor):
+        for cpu in self.cpus():
+            path = self.cpu_dir(f'cpu{cpu}', 'cpufreq/scaling_governor')
+            try:
+                with open(path, 'w') as f:
+                    f.write(governor)
+            except OSError as e:
+                print(f"Profiles: cannot set governor on cpu{cpu}: {e}")
+
+    def network_irqs(self):
+        """IRQ numbers of the network devices from /proc/interrupts"""
+        irqs = []
+        try:
+            with open(os.path.join(self.proc, 'interrupts')) as f:
+                for line in f:
+                    number, _, rest = line.partition(':')
+                    if number.strip().isdigit() and any(name in rest for name in self.irq_names):
+                        irqs.append(int(number))
+        except OSError:
+            pass
+        return irqs
+
+    def set_irq_affinity(self, mask):
+        for irq in self.network_irqs():
+            path = os.path.join(self.proc, 'irq', str(irq), 'smp_affinity')
+            try:
+                with open(path, 'w') as f:
+                    f.write(f'{mask:x}')
+            except OSError as e:
+                # Some interrupt controllers don't support affinity
+                print(f"Profiles: cannot set affinity of IRQ {irq}: {e}")
+
+    def all_cpus(self):
+        mask = 0
+        for cpu in self.cpus():
+            mask |= 1 << cpu
+        return mask
+
+    def apply(self, profile, reasons=()):
+        all_cpus = self.all_cpus()
+        if profile == CASTING:
+            governor = 'performance'
+            mask = (all_cpus & ~(1 << self.ui_core)) or all_cpus
+        else:
+            governor = self.idle_governor()
+            mask = all_cpus
+
+        self.set_governor(governor)
+        self.set_irq_affinity(mask)
+        print(f"Profiles: {self.profile or 'startup'} -> {profile} "
+              f"(governor {governor}, network IRQ mask {mask:x}"
+              f"{', ' + ', '.join(reasons) if reasons else ''})")
+        self.transitions.append((time.time(), self.profile, profile))
+        self.profile = profile
+        self.write_state()
+
+    def write_state(self):
+        try:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            with open(self.state_path, 'w') as f:
+                f.write(self.profile + '\n')
+        except OSError as e:
+            print(f"Profiles: cannot write {self.state_path}: {e}")
+
+    def stop(self):
+        """Put back the default governor and IRQ affinity and withdraw the state
+
+        Without this the GUIs and network.casting_active() would keep
+        reporting the last profile after the manager has gone.
+        """
+        if self.profile is not None:
+            self.set_governor(self.idle_governor())
+            self.set_irq_affinity(self.all_cpus())
+            print(f"Profiles: {self.profile} -> defaults (stopping)")
+            self.profile = None
+        try:
+            os.unlink(self.state_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Profiles: cannot remove {self.state_path}: {e}")
+
+    def check(self, now=None):
+        """Detect activity and switch profile if needed; returns the profile"""
+        now = time.monotonic() if now is None else now
+        active, reasons = self.detector.detect(now)
+
+        if active:
+            self.active_checks += 1
+            self.last_active = now
+        else:
+            self.active_checks = 0
+
+        if self.profile is None:
+            self.apply(CASTING if active else IDLE, reasons)
+        elif self.profile != CASTING and self.active_checks >= self.enter_checks:
+            self.apply(CASTING, reasons)
+        elif self.profile == CASTING and not active and now - self.last_active >= self.idle_seconds:
+            self.apply(IDLE, [f"idle for {now - self.last_active:.0f}s"])
+        return self.profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Activity-based performance profiles")
+    parser.add_argument('--root', default='/', help="filesystem root (for fake sysfs/procfs trees)")
+    parser.add_argument('--interval', type=float, default=5.0)
+    parser.add_argument('--idle-seconds', type=float, default=60.0)
+    parser.add_argument('--ui-core', type=int, default=0)
+    args = parser.parse_args()
+
+    manager = ProfileManager(args.root, ui_core=args.ui_core, idle_seconds=args.idle_seconds)
+    # systemctl stop sends SIGTERM: unwind through the finally below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while True:
+            manager.check()
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.stop()
+
+
+def current_profile(path=STATE_PATH):
+    """Profile last applied by the manager, or None if it isn't running"""
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == '__main__':
+    main()
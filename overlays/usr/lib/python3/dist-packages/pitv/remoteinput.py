@@ -0,0 +1,376 @@
+"""
+Remote input channel
+Phone remote -> remote-control-server (WebSocket /ws/input) -> SmartTVApp
+over a local Unix datagram socket. D-pad repeats that queue up while the
+UI is busy are coalesced, and each event's one-way latency from touch to
+focus change is measured and acknowledged back to the phone.
+
+Replay a trace:  python3 -m pitv.remoteinput --replay trace.json --url ws://pi:8080/ws/input
+Make a trace:    python3 -m pitv.remoteinput --generate 200 > trace.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import select
+import socket
+import tempfile
+import threading
+import time
+from collections import deque
+
+from pitv.websocket import ConnectionClosed, WebSocket, connect, forbidden_response, handshake_response, same_origin
+
+DIRECTIONS = ('up', 'down', 'left', 'right')
+KEYS = DIRECTIONS + ('select', 'back', 'home')
+
+SYNC_ROUNDS = 5
+
+
+def input_socket_path():
+    """Per-user socket shared by the server and the TV interface"""
+    runtime = f'/run/user/{os.getuid()}'
+    return os.path.join(runtime if os.path.isdir(runtime) else tempfile.gettempdir(), 'pitv-input.sock')
+
+
+def now_ms():
+    return time.time() * 1000.0
+
+
+def is_number(value):
+    # JSON true/false arrive as bool, which is an int
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class LatencyStats:
+    """Recent latencies in a ring buffer, summarised as percentiles"""
+
+    def __init__(self, size=1000):
+        self.samples = deque(maxlen=size)
+
+    def add(self, latency):
+        if latency is not None:
+            self.samples.append(latency)
+
+    def percentiles(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {'count': 0}
+
+        def pick(fraction):
+            return round(ordered[min(int(fraction * len(ordered)), len(ordered) - 1)], 1)
+        return {'count': len(ordered), 'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99),
+                'max': round(ordered[-1], 1)}
+
+
+def coalesce(events):
+    """Merge runs of the same D-pad key (and of text) into one event with a count
+
+    Every original event stays listed in 'parts' so each still gets its
+    own acknowledgement and latency sample.
+    """
+    merged = []
+    for event in events:
+        part = (event.get('sender'), event.get('client'), event.get('seq'), event.get('sent'))
+        last = merged[-1] if merged else None
+        if (last is not None and event['type'] == last['type'] == 'key'
+                and event['key'] == last['key'] and event['key'] in DIRECTIONS):
+            last['count'] += 1
+            last['parts'].append(part)
+        elif last is not None and event['type'] == last['type'] == 'text':
+            last['text'] += event['text']
+            last['parts'].append(part)
+        else:
+            merged.append(dict(event, count=1, parts=[part]))
+    return merged
+
+
+class InputReceiver:
+    """TV interface side of the channel
+
+    Everything waiting on the socket is read at once, coalesced and handed
+    to handler(event); events carry 'count' for merged repeats. Once the
+    handler returns (focus has moved) each original event is acked with
+    its latency.
+    """
+
+    def __init__(self, handler, path=None):
+        self.handler = handler
+        self.path = path or input_socket_path()
+        self.stats = LatencyStats()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.sock.setblocking(False)
+
+    def drain(self):
+        events = []
+        while True:
+            try:
+                data, sender = self.sock.recvfrom(4096)
+            except BlockingIOError:
+                break
+            try:
+                event = json.loads(data)
+            except ValueError:
+                continue
+            if event.get('type') == 'key' and event.get('key') in KEYS or event.get('type') == 'text':
+                event['sender'] = sender
+                events.append(event)
+        return coalesce(events)
+
+    def dispatch(self):
+        for event in self.drain():
+            try:
+                self.handler(event)
+            except Exception as e:
+                print(f"Remote input: {event['type']} failed: {e}")
+            done = now_ms()
+            for sender, client, seq, sent in event['parts']:
+                latency = done - sent if sent else None
+                self.stats.add(latency)
+                if not sender:
+                    continue
+                ack = {'type': 'ack', 'client': client, 'seq': seq, 'latency': latency,
+                       'coalesced': event['count']}
+                try:
+                    self.sock.sendto(json.dumps(ack).encode(), sender)
+                except OSError:
+                    pass
+
+    def attach_glib(self):
+        """Dispatch from the GLib main loop, ahead of redraws"""
+        from gi.repository import GLib
+
+        def ready(fd, condition):
+            self.dispatch()
+            return True
+        GLib.io_add_watch(self.sock.fileno(), GLib.PRIORITY_HIGH, GLib.IO_IN, ready)
+
+    def close(self):
+        self.sock.close()
+
+
+class InputRelay:
+    """Server side: WebSocket clients in, datagrams to the TV, acks back out
+
+    Phones stamp events with their own clock, so each connection first
+    estimates the phone-to-server clock offset from a few ping/echo rounds
+    (keeping the one with the shortest round trip) and rewrites the stamp
+    into local time. The server and the TV share a clock.
+    """
+
+    def __init__(self, path=None):
+        # Resolved per send: /run/user/<uid> only appears once the TV session logs in
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # Autobind to an abstract address the receiver can ack to
+        self.sock.bind('')
+        self.clients = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.stats = LatencyStats()
+        self.events = 0
+        threading.Thread(target=self.read_acks, name='input-acks', daemon=True).start()
+
+    def send(self, event):
+        try:
+            self.sock.sendto(json.dumps(event).encode(), self.path or input_socket_path())
+            self.events += 1
+            return True
+        except OSError:
+            return False
+
+    def read_acks(self):
+        while True:
+            try:
+                ack = json.loads(self.sock.recv(4096))
+            except (OSError, ValueError):
+                continue
+            self.stats.add(ack.get('latency'))
+            with self.lock:
+                ws = self.clients.get(ack.pop('client', None))
+            if ws is not None:
+                try:
+                    ws.send(json.dumps(ack))
+                except OSError:
+                    pass
+
+    def report(self):
+        return {'clients': len(self.clients), 'events': self.events, 'latency': self.stats.percentiles()}
+
+    def serve(self, ws):
+        """Handle one connection until it closes"""
+        client = next(self.ids)
+        with self.lock:
+            self.clients[client] = ws
+        offset = None
+        best_rtt = None
+        try:
+            for _ in range(SYNC_ROUNDS):
+                ws.send(json.dumps({'type': 'sync', 't1': now_ms()}))
+            while True:
+                try:
+                    message = json.loads(ws.receive())
+                except ValueError:
+                    continue
+                # A malformed message is dropped, not the phone's connection
+                if not isinstance(message, dict):
+                    continue
+                kind = message.get('type')
+                if kind == 'sync':
+                    if not (is_number(message.get('t1')) and is_number(message.get('tc'))):
+                        continue
+                    received = now_ms()
+                    rtt = received - message['t1']
+                    if best_rtt is None or rtt < best_rtt:
+                        best_rtt = rtt
+                        offset = message['t1'] + rtt / 2 - message['tc']
+                    continue
+                if kind == 'key' and message.get('key') in KEYS:
+                    event = {'type': 'key', 'key': message['key']}
+                elif kind == 'text' and isinstance(message.get('text'), str):
+                    event = {'type': 'text', 'text': message['text'][:256]}
+                else:
+                    continue
+                # Until the clock is synced only the server-to-UI part is measured
+                sent = message.get('t') if is_number(message.get('t')) else None
+                event.update(client=client, seq=message.get('seq'),
+                             sent=sent + offset if offset is not None and sent else now_ms())
+                if not self.send(event):
+                    ws.send(json.dumps({'type': 'error', 'seq': message.get('seq'),
+                                        'message': 'TV interface is not running'}))
+        except (ConnectionClosed, OSError):
+            pass
+        finally:
+            with self.lock:
+                del self.clients[client]
+            ws.close()
+
+
+def serve_wsgi(environ, relay):
+    """Take over a werkzeug request's socket for a WebSocket; False if it isn't an upgrade
+
+    Cross-origin handshakes are refused with a 403.
+    """
+    sock = environ.get('werkzeug.socket')
+    key = environ.get('HTTP_SEC_WEBSOCKET_KEY')
+    if sock is None or key is None or environ.get('HTTP_UPGRADE', '').lower() != 'websocket':
+        return False
+    if not same_origin(environ):
+        # Answered: a page on another site, not a client of ours
+        sock.sendall(forbidden_response())
+        return True
+    sock.sendall(handshake_response(key))
+    relay.serve(WebSocket(sock))
+    return True
+
+
+def generate_trace(n, seed=None):
+    """Browsing-like D-pad trace: single presses plus held-key repeat bursts"""
+    rng = random.Random(seed)
+    trace = []
+    at = 0.0
+    while len(trace) < n:
+        if rng.random() < 0.2:
+            key = rng.choice(DIRECTIONS)
+            for _ in range(rng.randint(3, 12)):
+                trace.append({'at': round(at), 'key': key})
+                at += 40
+        else:
+            trace.append({'at': round(at), 'key': rng.choice(KEYS[:5])})
+        at += rng.uniform(150, 600)
+    return trace[:n]
+
+
+def replay(url, trace, timeout=2.0):
+    """Play a trace against a server; returns the latency percentiles of the acks"""
+    ws = connect(url)
+    stats = LatencyStats(size=len(trace) or 1)
+    acked = set()
+    errors = []
+
+    def receive():
+        try:
+            while True:
+                message = json.loads(ws.receive())
+                if message['type'] == 'sync':
+                    ws.send(json.dumps({'type': 'sync', 't1': message['t1'], 'tc': now_ms()}))
+                elif message['type'] == 'ack':
+                    acked.add(message['seq'])
+                    stats.add(message['latency'])
+                elif message['type'] == 'error':
+                    errors.append(message['message'])
+        except (ConnectionClosed, OSError):
+            pass
+
+    threading.Thread(target=receive, daemon=True).start()
+    # Let the clock sync finish first
+    time.sleep(0.2)
+    start = time.monotonic()
+    for seq, step in enumerate(trace, 1):
+        delay = start + step['at'] / 1000.0 - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if 'text' in step:
+            event = {'type': 'text', 'text': step['text']}
+        else:
+            event = {'type': 'key', 'key': step['key']}
+        ws.send(json.dumps(dict(event, seq=seq, t=now_ms())))
+    deadline = time.monotonic() + timeout
+    while len(acked) < len(trace) and time.monotonic() < deadline and not errors:
+        time.sleep(0.05)
+    ws.close()
+    result = stats.percentiles()
+    result['sent'] = len(trace)
+    result['acked'] = len(acked)
+    if errors:
+        result['error'] = errors[0]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remote input channel tools")
+    parser.add_argument('--generate', type=int, metavar='N', help="print a synthetic trace of N events")
+    parser.add_argument('--replay', metavar='TRACE', help="replay a JSON trace against --url")
+    parser.add_argument('--url', default='ws://127.0.0.1:8080/ws/input')
+    parser.add_argument('--fake-ui', action='store_true',
+                        help="receive events with a no-op handler (when SmartTVApp isn't running)")
+    parser.add_argument('--ui-delay', type=float, default=0.0, help="with --fake-ui: ms each event takes")
+    args = parser.parse_args()
+
+    if args.generate:
+        print(json.dumps(generate_trace(args.generate)))
+        return
+
+    receiver = None
+    if args.fake_ui:
+        receiver = InputReceiver(lambda event: time.sleep(args.ui_delay / 1000.0))
+
+        def pump():
+            while True:
+                select.select([receiver.sock], [], [])
+                receiver.dispatch()
+        threading.Thread(target=pump, daemon=True).start()
+
+    if args.replay:
+        with open(args.replay) as f:
+            trace = json.load(f)
+        print(json.dumps(replay(args.url, trace)))
+    elif receiver is not None:
+        try:
+            while True:
+                time.sleep(5)
+                print(json.dumps(receiver.stats.percentiles()))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Rendering profiles
+Picks between the "rich" and "lean" styling from measured frame times
+"""
+
+import os
+
+RICH = 'rich'
+LEAN = 'lean'
+PROFILES = (RICH, LEAN)
+
+
+def forced_profile():
+    """Profile forced through PITV_RENDER_PROFILE, or None to measure"""
+    profile = os.environ.get('PITV_RENDER_PROFILE', '').strip().lower()
+    return profile if profile in PROFILES else None
+
+
+class FrameSampler:
+    """Collects frame intervals for a calibration window and picks a profile
+
+    Feed it the frame clock timestamp (in seconds) of every frame with add().
+    Once `duration` seconds have been sampled, choose() returns LEAN if the
+    90th percentile frame interval is over budget, RICH otherwise.
+    """
+
+    def __init__(self, duration=5.0, budget_ms=40.0, min_frames=20):
+        self.duration = duration
+        self.budget_ms = budget_ms
+        self.min_frames = min_frames
+        self.start = None
+        self.last = None
+        self.intervals = []
+
+    def add(self, timestamp):
+        """Record a frame; returns False once the window is complete"""
+        if self.start is None:
+            self.start = self.last = timestamp
+            return True
+        self.intervals.append((timestamp - self.last) * 1000.0)
+        self.last = timestamp
+        return timestamp - self.start < self.duration
+
+    def percentile(self, p):
+        """Frame interval in ms at percentile p (0-100)"""
+        if not self.intervals:
+            return 0.0
+        ordered = sorted(self.intervals)
+        index = min(len(ordered) - 1, int(len(ordered) * p / 100.0))
+        return ordered[index]
+
+    def fps(self):
+        """Average frames per second over the window"""
+        if not self.intervals:
+            return 0.0
+        return 1000.0 * len(self.intervals) / sum(self.intervals)
+
+    def choose(self):
+        """Pick a profile from the sampled frame times"""
+        # Fewer frames than expected means the main loop was too busy to paint
+        if len(self.intervals) < self.min_frames:
+            return LEAN
+        if self.percentile(90) > self.budget_ms:
+            return LEAN
+        return RICH
+
+    def summary(self):
+        return (f"{len(self.intervals)} frames, {self.fps():.1f} fps, "
+                f"p50 {self.percentile(50):.1f} ms, p90 {self.percentile(90):.1f} ms")
@@ -0,0 +1,493 @@
+"""
+Live screen preview
+Captures the X display at a low frame rate on a worker thread, downscales
+it, and sends viewers only the tiles that changed since the last frame, as
+PNGs over a WebSocket. Capture runs only while someone is watching.
+
+Benchmark with a synthetic source:  python3 -m pitv.screen --synthetic --viewers 3 --duration 10
+Snapshot:                           python3 -m pitv.screen --snapshot screen.png
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import struct
+import threading
+import time
+import zlib
+
+from pitv.websocket import BINARY, ConnectionClosed, WebSocket, forbidden_response, handshake_response, same_origin
+
+FPS = 2.0
+SCALE = 4
+TILE = 32
+
+# Message: frame width, height, then per tile x, y, width, height, PNG length, PNG
+FRAME_HEADER = struct.Struct('!HH')
+TILE_HEADER = struct.Struct('!HHHHI')
+
+
+class XImage(ctypes.Structure):
+    _fields_ = [
+        ('width', ctypes.c_int), ('height', ctypes.c_int), ('xoffset', ctypes.c_int),
+        ('format', ctypes.c_int), ('data', ctypes.c_void_p), ('byte_order', ctypes.c_int),
+        ('bitmap_unit', ctypes.c_int), ('bitmap_bit_order', ctypes.c_int), ('bitmap_pad', ctypes.c_int),
+        ('depth', ctypes.c_int), ('bytes_per_line', ctypes.c_int), ('bits_per_pixel', ctypes.c_int),
+        ('red_mask', ctypes.c_ulong), ('green_mask', ctypes.c_ulong), ('blue_mask', ctypes.c_ulong),
+        ('obdata', ctypes.c_void_p),
+        # struct funcs: create_image, destroy_image, get_pixel, put_pixel, sub_image, add_pixel
+        ('create_image', ctypes.c_void_p), ('destroy_image', ctypes.c_void_p),
+        ('get_pixel', ctypes.c_void_p), ('put_pixel', ctypes.c_void_p),
+        ('sub_image', ctypes.c_void_p), ('add_pixel', ctypes.c_void_p),
+    ]
+
+
+ZPIXMAP = 2
+ALL_PLANES = ctypes.c_ulong(~0).value
+DESTROY_IMAGE = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(XImage))
+ERROR_HANDLER = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+
+# The default handler exits the process on e.g. BadMatch. Xlib keeps one
+# handler per process, so it is installed once and this reference keeps the
+# callback alive for as long as Xlib may call it.
+IGNORE_ERRORS = ERROR_HANDLER(lambda display, event: 0)
+
+x11_lock = threading.Lock()
+x11 = None
+
+
+def load_x11():
+    """libX11 with its prototypes declared and our error handler installed, loaded once"""
+    global x11
+    with x11_lock:
+        if x11 is not None:
+            return x11
+        path = ctypes.util.find_library('X11')
+        if path is None:
+            raise OSError("libX11 not found")
+        library = ctypes.CDLL(path)
+        library.XOpenDisplay.restype = ctypes.c_void_p
+        library.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        library.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        library.XDisplayWidth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        library.XDisplayHeight.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        library.XDefaultRootWindow.restype = ctypes.c_ulong
+        library.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        library.XGetImage.restype = ctypes.POINTER(XImage)
+        library.XGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int, ctypes.c_int,
+                                      ctypes.c_uint, ctypes.c_uint, ctypes.c_ulong, ctypes.c_int]
+        library.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        library.XSetErrorHandler(IGNORE_ERRORS)
+        x11 = library
+        return x11
+
+
+class X11Source:
+    """Root window grabs through libX11 (XGetImage), 32-bit BGRX frames
+
+    Xlib connections aren't thread-safe, so the display is opened by the
+    thread that first captures and only used from there.
+    """
+
+    def __init__(self, display=None):
+        self.display_name = display.encode() if display else None
+        self.display = None
+        # Snapshots make a source per request; the library is shared
+        self.x11 = load_x11()
+
+    def open(self):
+        self.display = self.x11.XOpenDisplay(self.display_name)
+        if not self.display:
+            raise OSError(f"cannot open display {(self.display_name or b'$DISPLAY').decode()}")
+        screen = self.x11.XDefaultScreen(self.display)
+        self.size = (self.x11.XDisplayWidth(self.display, screen), self.x11.XDisplayHeight(self.display, screen))
+        self.root = self.x11.XDefaultRootWindow(self.display)
+
+    def capture(self):
+        """(width, height, stride, BGRX bytes)"""
+        if self.display is None:
+            self.open()
+        width, height = self.size
+        image = self.x11.XGetImage(self.display, self.root, 0, 0, width, height, ALL_PLANES, ZPIXMAP)
+        if not image:
+            raise OSError("XGetImage failed")
+        try:
+            info = image.contents
+            if info.bits_per_pixel != 32:
+                raise OSError(f"unsupported {info.bits_per_pixel}-bit display")
+            data = ctypes.string_at(info.data, info.bytes_per_line * info.height)
+            return info.width, info.height, info.bytes_per_line, data
+        finally:
+            DESTROY_IMAGE(image.contents.destroy_image)(image)
+
+    def close(self):
+        if self.display:
+            self.x11.XCloseDisplay(self.display)
+            self.display = None
+
+
+class SyntheticSource:
+    """Stand-in for the display: a static background, a bouncing box and a ticking counter
+
+    Changes a small part of the frame each time, like a real UI.
+    """
+
+    def __init__(self, width=1920, height=1080):
+        self.size = (width, height)
+        self.frame = 0
+        stride = width * 4
+        rows = []
+        for y in range(height):
+            shade = 40 + 80 * y // height
+            rows.append(bytes([shade, 20, 60, 0]) * width)
+        self.background = bytearray(b''.join(rows))
+        self.stride = stride
+
+    def fill(self, data, x, y, w, h, pixel):
+        span = pixel * w
+        for row in range(y, y + h):
+            start = row * self.stride + x * 4
+            data[start:start + w * 4] = span
+
+    def capture(self):
+        width, height = self.size
+        data = bytearray(self.background)
+        self.frame += 1
+        x = (self.frame * 37) % (width - 200)
+        self.fill(data, x, height // 2, 200, 120, bytes([0, 200, 255, 0]))
+        # A counter-like patch that changes every frame
+        self.fill(data, width - 160, 20, 120, 40, bytes([self.frame % 256, 255, 255 - self.frame % 256, 0]))
+        return width, height, self.stride, bytes(data)
+
+    def close(self):
+        pass
+
+
+def downscale(width, height, stride, data, factor):
+    """BGRX frame -> RGB at 1/factor size, nearest neighbour
+
+    Every step is a strided slice, so the per-pixel work happens in C.
+    """
+    out_width, out_height = width // factor, height // factor
+    view = memoryview(data)
+    out = bytearray(out_width * out_height * 3)
+    step = 4 * factor
+    span = out_width * step
+    for y in range(out_height):
+        row = view[y * factor * stride:y * factor * stride + span]
+        start = y * out_width * 3
+        end = start + out_width * 3
+        out[start:end:3] = row[2::step]
+        out[start + 1:end:3] = row[1::step]
+        out[start + 2:end:3] = row[0::step]
+    return out_width, out_height, bytes(out)
+
+
+def png_chunk(kind, data):
+    return struct.pack('!I', len(data)) + kind + data + struct.pack('!I', zlib.crc32(kind + data))
+
+
+def encode_png(width, height, rows):
+    """PNG from RGB rows (no filtering: tiles are small and mostly flat)"""
+    raw = b''.join(b'\0' + row for row in rows)
+    return (b'\x89PNG\r\n\x1a\n'
+            + png_chunk(b'IHDR', struct.pack('!IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + png_chunk(b'IDAT', zlib.compress(raw, 6))
+            + png_chunk(b'IEND', b''))
+
+
+class TileDiffer:
+    """Splits frames into tiles and reports the ones that changed
+
+    Keeps the last bytes and PNG of every tile, so a viewer that joins
+    mid-stream gets a full frame without anything being re-encoded. A new
+    frame's tiles go into a new dict, so readers of the old one never see
+    it change under them.
+    """
+
+    def __init__(self, tile=TILE):
+        self.tile = tile
+        self.size = None
+        self.tiles = {}
+
+    def diff(self, width, height, rgb):
+        """(tiles, changed) for a new frame, without keeping it"""
+        tiles = dict(self.tiles) if self.size == (width, height) else {}
+        changed = {}
+        line = width * 3
+        for ty in range(0, height, self.tile):
+            th = min(self.tile, height - ty)
+            for tx in range(0, width, self.tile):
+                tw = min(self.tile, width - tx)
+                rows = [rgb[y * line + tx * 3:y * line + (tx + tw) * 3] for y in range(ty, ty + th)]
+                pixels = b''.join(rows)
+                previous = tiles.get((tx, ty))
+                if previous is not None and previous[0] == pixels:
+                    continue
+                png = encode_png(tw, th, rows)
+                tiles[(tx, ty)] = (pixels, tw, th, png)
+                changed[(tx, ty)] = (tw, th, png)
+        return tiles, changed
+
+    def update(self, width, height, rgb):
+        """{(x, y): (w, h, png)} of the tiles that differ from the last frame"""
+        tiles, changed = self.diff(width, height, rgb)
+        self.size, self.tiles = (width, height), tiles
+        return changed
+
+    def full(self):
+        return {key: (tw, th, png) for key, (pixels, tw, th, png) in self.tiles.items()}
+
+
+def pack(size, tiles):
+    parts = [FRAME_HEADER.pack(*size)]
+    for (x, y), (w, h, png) in sorted(tiles.items(), key=lambda item: (item[0][1], item[0][0])):
+        parts.append(TILE_HEADER.pack(x, y, w, h, len(png)))
+        parts.append(png)
+    return b''.join(parts)
+
+
+class Viewer:
+    """Pending tiles for one client; a slow client skips frames, not tiles"""
+
+    def __init__(self, streamer):
+        self.streamer = streamer
+        self.pending = {}
+        self.ready = threading.Condition(streamer.lock)
+        self.closed = False
+        self.stats = {'frames': 0, 'bytes': 0, 'cpu_seconds': 0.0, 'since': time.monotonic()}
+
+    def take(self, timeout=1.0):
+        """Tiles waiting to be sent (merged across frames), or {} on timeout"""
+        with self.ready:
+            if not self.pending and not self.closed:
+                self.ready.wait(timeout)
+            pending, self.pending = self.pending, {}
+            return pending
+
+    def report(self):
+        elapsed = time.monotonic() - self.stats['since']
+        return {'frames': self.stats['frames'], 'bytes': self.stats['bytes'],
+                'cpu_percent': round(100.0 * self.stats['cpu_seconds'] / elapsed, 2) if elapsed else 0.0}
+
+
+class ScreenStreamer:
+    """Capture worker shared by every viewer; runs only while there are viewers"""
+
+    def __init__(self, source_factory, fps=FPS, scale=SCALE, tile=TILE):
+        self.source_factory = source_factory
+        self.fps = fps
+        self.scale = scale
+        self.tile = tile
+        self.lock = threading.Lock()
+        self.viewers = []
+        self.thread = None
+        self.differ = TileDiffer(tile)
+        self.stats = {'frames': 0, 'tiles': 0, 'capture_ms': 0.0, 'downscale_ms': 0.0,
+                      'diff_ms': 0.0, 'cpu_percent': 0.0, 'error': None}
+
+    def subscribe(self):
+        with self.lock:
+            viewer = Viewer(self)
+            self.viewers.append(viewer)
+            # A full picture first; later frames bring only changes
+            viewer.pending = self.differ.full()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='screen-capture', daemon=True)
+                self.thread.start()
+            return viewer
+
+    def unsubscribe(self, viewer):
+        with self.lock:
+            viewer.closed = True
+            if viewer in self.viewers:
+                self.viewers.remove(viewer)
+            viewer.ready.notify_all()
+
+    def frame(self, source):
+        """Capture, downscale and diff one frame; returns the changed tiles"""
+        start = time.perf_counter()
+        width, height, stride, data = source.capture()
+        captured = time.perf_counter()
+        size = downscale(width, height, stride, data, self.scale)
+        scaled = time.perf_counter()
+        # Encoding runs unlocked; subscribe() and snapshot() read the tiles under the lock
+        tiles, changed = self.differ.diff(*size)
+        with self.lock:
+            self.differ.size, self.differ.tiles = size[:2], tiles
+        done = time.perf_counter()
+        self.stats['capture_ms'] = round((captured - start) * 1000.0, 1)
+        self.stats['downscale_ms'] = round((scaled - captured) * 1000.0, 1)
+        self.stats['diff_ms'] = round((done - scaled) * 1000.0, 1)
+        self.stats['frames'] += 1
+        self.stats['tiles'] = len(changed)
+        return changed
+
+    def run(self):
+        try:
+            source = self.source_factory()
+        except OSError as e:
+            self.stats['error'] = str(e)
+            source = None
+        period = 1.0 / self.fps
+        try:
+            while source is not None:
+                start = time.monotonic()
+                cpu = time.thread_time()
+                try:
+                    changed = self.frame(source)
+                except OSError as e:
+                    self.stats['error'] = str(e)
+                    changed = {}
+                with self.lock:
+                    if not self.viewers:
+                        break
+                    for viewer in self.viewers:
+                        viewer.pending.update(changed)
+                        viewer.ready.notify()
+                elapsed = time.monotonic() - start
+                self.stats['cpu_percent'] = round(100.0 * (time.thread_time() - cpu) / max(period, elapsed), 1)
+                time.sleep(max(period - elapsed, 0.0))
+        finally:
+            with self.lock:
+                self.thread = None
+                # Someone may have subscribed while we were stopping
+                if self.viewers:
+                    self.thread = threading.Thread(target=self.run, name='screen-capture', daemon=True)
+                    self.thread.start()
+            if source is not None:
+                source.close()
+
+    def serve(self, ws):
+        """Stream to one WebSocket until it closes"""
+        viewer = self.subscribe()
+
+        def watch_close():
+            try:
+                while True:
+                    ws.receive()
+            except (ConnectionClosed, OSError):
+                self.unsubscribe(viewer)
+        threading.Thread(target=watch_close, daemon=True).start()
+        try:
+            while not viewer.closed:
+                tiles = viewer.take()
+                if not tiles or self.differ.size is None:
+                    continue
+                cpu = time.thread_time()
+                message = pack(self.differ.size, tiles)
+                ws.send_frame(BINARY, message)
+                viewer.stats['cpu_seconds'] += time.thread_time() - cpu
+                viewer.stats['frames'] += 1
+                viewer.stats['bytes'] += len(message)
+        except OSError:
+            pass
+        finally:
+            self.unsubscribe(viewer)
+            ws.close()
+
+    def snapshot(self):
+        """PNG of the preview: from the live tiles while streaming, else one capture"""
+        with self.lock:
+            if self.thread is not None and self.differ.size is not None:
+                width, height = self.differ.size
+                rgb = bytearray(width * height * 3)
+                for (tx, ty), (pixels, tw, th, png) in self.differ.tiles.items():
+                    for row in range(th):
+                        start = ((ty + row) * width + tx) * 3
+                        rgb[start:start + tw * 3] = pixels[row * tw * 3:(row + 1) * tw * 3]
+            else:
+                rgb = None
+        if rgb is None:
+            source = self.source_factory()
+            try:
+                width, height, rgb = downscale(*source.capture(), self.scale)
+            finally:
+                source.close()
+        line = width * 3
+        return encode_png(width, height, [rgb[y * line:(y + 1) * line] for y in range(height)])
+
+    def report(self):
+        with self.lock:
+            return {**self.stats, 'capturing': self.thread is not None,
+                    'viewers': [viewer.report() for viewer in self.viewers]}
+
+
+def serve_wsgi(environ, streamer):
+    """Take over a werkzeug request's socket for a preview stream; False if it isn't an upgrade
+
+    Cross-origin handshakes are refused with a 403.
+    """
+    sock = environ.get('werkzeug.socket')
+    key = environ.get('HTTP_SEC_WEBSOCKET_KEY')
+    if sock is None or key is None or environ.get('HTTP_UPGRADE', '').lower() != 'websocket':
+        return False
+    if not same_origin(environ):
+        # Answered: a page on another site, not a client of ours
+        sock.sendall(forbidden_response())
+        return True
+    sock.sendall(handshake_response(key))
+    streamer.serve(WebSocket(sock))
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Screen preview capture")
+    parser.add_argument('--synthetic', action='store_true', help="use a synthetic frame source instead of X")
+    parser.add_argument('--snapshot', metavar='PNG', help="write one preview frame and exit")
+    parser.add_argument('--viewers', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--fps', type=float, default=FPS)
+    parser.add_argument('--scale', type=int, default=SCALE)
+    args = parser.parse_args()
+
+    streamer = ScreenStreamer(SyntheticSource if args.synthetic else X11Source, args.fps, args.scale)
+    if args.snapshot:
+        with open(args.snapshot, 'wb') as f:
+            f.write(streamer.snapshot())
+        return
+
+    # Viewers over real loopback WebSockets, so sending is measured too
+    import socket
+    from pitv.websocket import connect
+
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen()
+
+    def accept():
+        while True:
+            conn, _ = listener.accept()
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    def handle(conn):
+        request = b''
+        while b'\r\n\r\n' not in request:
+            request += conn.recv(1024)
+        key = next(line.split(b':', 1)[1].strip().decode() for line in request.split(b'\r\n')
+                   if line.lower().startswith(b'sec-websocket-key'))
+        conn.sendall(handshake_response(key))
+        streamer.serve(WebSocket(conn))
+
+    threading.Thread(target=accept, daemon=True).start()
+    url = f'ws://127.0.0.1:{listener.getsockname()[1]}/'
+    received = [0] * args.viewers
+
+    def watch(i):
+        ws = connect(url)
+        try:
+            while True:
+                received[i] += len(ws.receive())
+        except (ConnectionClosed, OSError):
+            pass
+
+    for i in range(args.viewers):
+        threading.Thread(target=watch, args=(i,), daemon=True).start()
+    time.sleep(args.duration)
+    report = streamer.report()
+    report['received_bytes'] = received
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""
+SSDP discovery responder
+Answers M-SEARCH requests for the DIAL device on 239.255.255.250:1900 and
+announces it with NOTIFY, pointing clients at the DIAL description served
+on port 8008 (pitv.dial / pitv.castserver)
+
+Run with:   python3 -m pitv.ssdp
+Probe with: python3 -m pitv.ssdp --search [--address 127.0.0.1] [--count 100]
+"""
+
+import argparse
+import asyncio
+import random
+import signal
+import socket
+import struct
+import time
+
+from pitv.dial import DESCRIPTION_PATH, DEVICE_TYPE, DIAL_PORT, SERVICE_TYPE, UUID
+
+SSDP_GROUP = '239.255.255.250'
+SSDP_PORT = 1900
+MAX_AGE = 1800
+SERVER = 'Linux UPnP/1.1 pitv/1.0'
+
+# Search targets we answer, in the order replies are sent for ssdp:all
+TARGETS = ('upnp:rootdevice', f'uuid:{UUID}', DEVICE_TYPE, SERVICE_TYPE)
+
+
+def usn(target):
+    return target if target.startswith('uuid:') else f'uuid:{UUID}::{target}'
+
+
+def parse_request(data):
+    """(request line, {lower-case header: value}) of an SSDP datagram"""
+    lines = data.decode('utf-8', 'replace').split('\r\n')
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return lines[0], headers
+
+
+def local_address(peer):
+    """Our address on the route to a peer"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # connect() on a UDP socket only picks a route, nothing is sent
+        s.connect((peer, SSDP_PORT))
+        return s.getsockname()[0]
+    except OSError:
+        return None
+    finally:
+        s.close()
+
+
+class RateLimiter:
+    """Token buckets per sender and overall
+
+    An M-SEARCH storm (every app on every phone searching at once, or a
+    misbehaving client) costs one dictionary lookup per datagram once the
+    buckets are empty instead of a burst of replies.
+    """
+
+    def __init__(self, rate=5.0, burst=10.0, total_rate=50.0, total_burst=100.0, max_senders=256):
+        self.rate = rate
+        self.burst = burst
+        self.total = [total_burst, None]
+        self.total_rate = total_rate
+        self.total_burst = total_burst
+        self.senders = {}
+        self.max_senders = max_senders
+
+    def take(self, bucket, rate, burst, now):
+        tokens, last = bucket
+        if last is not None:
+            tokens = min(burst, tokens + (now - last) * rate)
+        bucket[1] = now
+        if tokens < 1.0:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1.0
+        return True
+
+    def allow(self, sender, now):
+        bucket = self.senders.get(sender)
+        if bucket is None:
+            if len(self.senders) >= self.max_senders:
+                self.senders.clear()
+            bucket = self.senders[sender] = [self.burst, None]
+        if not self.take(bucket, self.rate, self.burst, now):
+            return False
+        return self.take(self.total, self.total_rate, self.total_burst, now)
+
+
+class SSDPResponder(asyncio.DatagramProtocol):
+    """Answers M-SEARCH from pre-serialized responses
+
+    Replies are built once per (local address, search target) and reused,
+    so answering is a dictionary lookup and a sendto(). They are sent right
+    away rather than after a random delay of up to MX seconds: the rate
+    limiter already protects the network, and clients see the TV at once.
+    """
+
+    def __init__(self, port=DIAL_PORT, limiter=None):
+        self.port = port
+        self.limiter = limiter or RateLimiter()
+        self.transport = None
+        self.responses = {}
+        self.addresses = {}
+        self.stats = {'searches': 0, 'replies': 0, 'limited': 0}
+
+    def location(self, address):
+        return f'http://{address}:{self.port}{DESCRIPTION_PATH}'
+
+    def response(self, address, target):
+        key = (address, target)
+        response = self.responses.get(key)
+        if response is None:
+            response = self.responses[key] = (
+                'HTTP/1.1 200 OK\r\n'
+                f'CACHE-CONTROL: max-age={MAX_AGE}\r\n'
+                'EXT:\r\n'
+                f'LOCATION: {self.location(address)}\r\n'
+                f'SERVER: {SERVER}\r\n'
+                f'ST: {target}\r\n'
+                f'USN: {usn(target)}\r\n'
+                '\r\n'
+            ).encode()
+        return response
+
+    def notify(self, address, nts):
+        """NOTIFY datagrams announcing (ssdp:alive) or withdrawing (ssdp:byebye) the device"""
+        messages = []
+        for target in TARGETS:
+            message = (
+                'NOTIFY * HTTP/1.1\r\n'
+                f'HOST: {SSDP_GROUP}:{SSDP_PORT}\r\n'
+                f'NT: {target}\r\n'
+                f'NTS: {nts}\r\n'
+                f'USN: {usn(target)}\r\n'
+            )
+            if nts == 'ssdp:alive':
+                message += (
+                    f'CACHE-CONTROL: max-age={MAX_AGE}\r\n'
+                    f'LOCATION: {self.location(address)}\r\n'
+                    f'SERVER: {SERVER}\r\n'
+                )
+            messages.append((message + '\r\n').encode())
+        return messages
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if not data.startswith(b'M-SEARCH'):
+            return
+        self.stats['searches'] += 1
+        _, headers = parse_request(data)
+        if headers.get('man', '').strip('"') != 'ssdp:discover':
+            return
+        target = headers.get('st', '')
+        if target == 'ssdp:all':
+            targets = TARGETS
+        elif target in TARGETS:
+            targets = (target,)
+        else:
+            return
+        if not self.limiter.allow(addr[0], time.monotonic()):
+            self.stats['limited'] += 1
+            return
+        address = self.addresses.get(addr[0])
+        if address is None:
+            address = self.addresses[addr[0]] = local_address(addr[0])
+            if address is None:
+                return
+        for target in targets:
+            self.transport.sendto(self.response(address, target), addr)
+        self.stats['replies'] += len(targets)
+
+
+def multicast_socket(interface='0.0.0.0'):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('', SSDP_PORT))
+    membership = struct.pack('4s4s', socket.inet_aton(SSDP_GROUP), socket.inet_aton(interface))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+    sock.setblocking(False)
+    return sock
+
+
+async def announce(responder, every=MAX_AGE / 2):
+    """Repeat ssdp:alive well within max-age, with a little jitter"""
+    group = (SSDP_GROUP, SSDP_PORT)
+    while True:
+        # Pick up address changes (DHCP) for replies too
+        responder.addresses.clear()
+        responder.responses.clear()
+        address = local_address(SSDP_GROUP)
+        if address is not None:
+            for message in responder.notify(address, 'ssdp:alive'):
+                responder.transport.sendto(message, group)
+        await asyncio.sleep(every * random.uniform(0.8, 1.0))
+
+
+async def serve(port=DIAL_PORT):
+    loop = asyncio.get_running_loop()
+    responder = SSDPResponder(port)
+    transport, _ = await loop.create_datagram_endpoint(lambda: responder, sock=multicast_socket())
+    # Say goodbye on systemctl stop as well as on Ctrl-C
+    loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    print(f"SSDP: advertising uuid:{UUID} on {SSDP_GROUP}:{SSDP_PORT}")
+    try:
+        await announce(responder)
+    finally:
+        address = local_address(SSDP_GROUP)
+        if address is not None:
+            for message in responder.notify(address, 'ssdp:byebye'):
+                transport.sendto(message, (SSDP_GROUP, SSDP_PORT))
+        transport.close()
+
+
+def search(address=SSDP_GROUP, target=SERVICE_TYPE, count=1, timeout=1.0):
+    """Send M-SEARCH requests and time the replies"""
+    request = (
+        'M-SEARCH * HTTP/1.1\r\n'
+        f'HOST: {SSDP_GROUP}:{SSDP_PORT}\r\n'
+        'MAN: "ssdp:discover"\r\n'
+        'MX: 1\r\n'
+        f'ST: {target}\r\n'
+        '\r\n'
+    ).encode()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+    sock.settimeout(timeout)
+    start = time.perf_counter()
+    for _ in range(count):
+        sock.sendto(request, (address, SSDP_PORT))
+    replies = []
+    try:
+        while True:
+            data, peer = sock.recvfrom(2048)
+            replies.append(((time.perf_counter() - start) * 1000.0, peer, data))
+    except socket.timeout:
+        pass
+    sock.close()
+    return replies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSDP responder for the DIAL service")
+    parser.add_argument('--port', type=int, default=DIAL_PORT, help="port of the DIAL HTTP server")
+    parser.add_argument('--search', action='store_true', help="act as a client and print the replies")
+    parser.add_argument('--address', default=SSDP_GROUP, help="with --search: where to send (e.g. 127.0.0.1)")
+    parser.add_argument('--target', default=SERVICE_TYPE)
+    parser.add_argument('--count', type=int, default=1, help="with --search: requests to send at once")
+    args = parser.parse_args()
+
+    if args.search:
+        replies = search(args.address, args.target, args.count)
+        for elapsed, peer, data in replies[:5]:
+            _, headers = parse_request(data)
+            print(f"{elapsed:6.2f} ms  {peer[0]}  {headers.get('location')}  {headers.get('st')}")
+        print(f"{len(replies)} replies to {args.count} searches")
+        return
+
+    try:
+        asyncio.run(serve(args.port))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+if __name__ == '__main__':
+    main()
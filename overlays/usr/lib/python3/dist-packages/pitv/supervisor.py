@@ -0,0 +1,358 @@
+"""
+Receiver supervisor
+Runs the casting receivers as children in the foreground, waits for a
+readiness probe instead of sleeping, health checks them while they run
+and restarts them with exponential backoff
+
+Run with:   python3 -m pitv.supervisor airplay
+
+Sockets passed in by systemd are handed on to programs that take them;
+once such an on-demand program exits cleanly (idle) the supervisor exits
+too and systemd waits for the next connection.
+
+Demo:       python3 -m pitv.supervisor --demo
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import stat
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+from pitv.activation import hand_over, listen_sockets
+from pitv.casting import CAST_ROOT, METADATA_PIPE
+
+
+def port_open(*ports, host='127.0.0.1'):
+    """Probe: something accepts connections on any of the ports"""
+    def probe():
+        for port in ports:
+            try:
+                with socket.create_connection((host, port), timeout=0.2):
+                    return True
+            except OSError:
+                pass
+        return False
+    return probe
+
+
+def fifo_exists(path):
+    """Probe: the named pipe has been created"""
+    def probe():
+        try:
+            return stat.S_ISFIFO(os.stat(path).st_mode)
+        except OSError:
+            return False
+    return probe
+
+
+def all_of(*probes):
+    return lambda: all(probe() for probe in probes)
+
+
+class Program:
+    """A receiver to keep running"""
+
+    def __init__(self, name, argv, ready, cwd=None, stop_timeout=5.0, on_demand=False):
+        self.name = name
+        self.argv = argv
+        self.ready = ready
+        self.cwd = cwd
+        self.stop_timeout = stop_timeout
+        # Takes the activation sockets and exits with 0 when idle
+        self.on_demand = on_demand
+
+
+PROGRAMS = {
+    # AirPlay 1 listens on 5000, AirPlay 2 builds on 7000
+    'airplay': Program('airplay', [
+        'shairport-sync', '-M', f'--metadata-pipename={METADATA_PIPE}', '--statistics',
+    ], ready=all_of(port_open(5000, 7000), fifo_exists(METADATA_PIPE))),
+    'google-cast': Program('google-cast', [
+        sys.executable, '-m', 'pitv.castserver', '--directory', CAST_ROOT, '--idle-timeout', '600',
+    ], ready=port_open(8008), cwd=CAST_ROOT, on_demand=True),
+}
+
+
+def sd_notify(state):
+    """Tell systemd about readiness/status (Type=notify units)"""
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address:
+        return
+    if address.startswith('@'):
+        address = '\0' + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(state.encode(), address)
+    except OSError:
+        pass
+
+
+class Child:
+    """Runtime state of one supervised program"""
+
+    def __init__(self, program):
+        self.program = program
+        self.process = None
+        self.state = 'stopped'
+        self.started = None
+        self.ready_at = None
+        self.down_since = None
+        self.next_start = 0.0
+        self.next_check = 0.0
+        self.restarts = 0
+        self.crashes = 0
+        self.consecutive = 0
+        self.unhealthy = 0
+        self.last_exit = None
+        self.recoveries = deque(maxlen=20)
+
+    def report(self, now):
+        return {
+            'state': self.state,
+            'pid': self.process.pid if self.process and self.state != 'backoff' else None,
+            'uptime': round(now - self.ready_at, 1) if self.state == 'ready' else None,
+            'restarts': self.restarts,
+            'crashes': self.crashes,
+            'last_exit': self.last_exit,
+            'last_recovery': self.recoveries[-1] if self.recoveries else None,
+            'recoveries': list(self.recoveries),
+        }
+
+
+class Supervisor:
+    """Keeps a set of programs running
+
+    A child counts as up once its readiness probe passes; while up, the
+    probe doubles as a health check and a child failing it `unhealthy_after`
+    times in a row is killed. After an exit the first restart is immediate,
+    then each further one waits twice as long (from `initial` up to
+    `maximum`) until a child stays up for `stable` seconds. Recovery time
+    is measured from the exit to the replacement passing its probe.
+    """
+
+    def __init__(self, programs, initial=0.5, maximum=30.0, stable=60.0, ready_timeout=20.0,
+                 check_every=10.0, unhealthy_after=3, state_path=None, sockets=()):
+        self.sockets = sockets
+        self.children = [Child(program) for program in programs]
+        self.initial = initial
+        self.maximum = maximum
+        self.stable = stable
+        self.ready_timeout = ready_timeout
+        self.check_every = check_every
+        self.unhealthy_after = unhealthy_after
+        self.state_path = state_path
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.reload = False
+        self.notified = False
+
+    def spawn(self, child, now):
+        program = child.program
+        if child.started is not None:
+            child.restarts += 1
+        options = {}
+        if program.on_demand and self.sockets:
+            options = {'pass_fds': [s.fileno() for s in self.sockets], 'preexec_fn': hand_over(len(self.sockets))}
+        try:
+            child.process = subprocess.Popen(program.argv, cwd=program.cwd, start_new_session=True, **options)
+        except OSError as e:
+            print(f"{program.name}: cannot start {program.argv[0]}: {e}")
+            child.started = now
+            self.on_exit(child, None, now)
+            return
+        child.state = 'starting'
+        child.started = now
+        child.unhealthy = 0
+
+    def kill(self, child, sig=signal.SIGTERM):
+        try:
+            os.killpg(child.process.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def stop(self, child):
+        """Stop a child and wait for it, escalating to SIGKILL"""
+        if child.process is None or child.process.poll() is not None:
+            return
+        self.kill(child)
+        try:
+            child.process.wait(child.program.stop_timeout)
+        except subprocess.TimeoutExpired:
+            self.kill(child, signal.SIGKILL)
+            child.process.wait()
+
+    def on_exit(self, child, code, now):
+        name = child.program.name
+        if code == 0 and child.program.on_demand and self.sockets:
+            print(f"{name}: exited while idle")
+            child.state = 'stopped'
+            if all(c.state == 'stopped' for c in self.children):
+                self.stopping = True
+            return
+        child.last_exit = code
+        child.crashes += 1
+        child.down_since = child.down_since or now
+        if now - child.started >= self.stable:
+            child.consecutive = 0
+        delay = 0.0 if child.consecutive == 0 else min(self.initial * 2 ** (child.consecutive - 1), self.maximum)
+        child.consecutive += 1
+        child.state = 'backoff'
+        child.next_start = now + delay
+        print(f"{name}: exited with {code}, restarting in {delay:.1f} s")
+
+    def on_ready(self, child, now):
+        child.state = 'ready'
+        child.ready_at = now
+        child.next_check = now + self.check_every
+        if child.down_since is not None:
+            recovery = round(now - child.down_since, 3)
+            child.recoveries.append(recovery)
+            child.down_since = None
+            print(f"{child.program.name}: back up in {recovery:.2f} s (restart {child.restarts})")
+        else:
+            print(f"{child.program.name}: ready in {now - child.started:.2f} s")
+
+    def step(self, now):
+        """Advance every child's state; returns True if anything changed"""
+        changed = False
+        for child in self.children:
+            state = child.state
+            if state in ('starting', 'ready'):
+                code = child.process.poll()
+                if code is not None:
+                    self.on_exit(child, code, now)
+            if child.state == 'starting':
+                if child.program.ready():
+                    self.on_ready(child, now)
+                elif now - child.started >= self.ready_timeout:
+                    print(f"{child.program.name}: not ready after {self.ready_timeout:.0f} s")
+                    self.kill(child, signal.SIGKILL)
+            elif child.state == 'ready' and now >= child.next_check:
+                child.next_check = now + self.check_every
+                child.unhealthy = 0 if child.program.ready() else child.unhealthy + 1
+                if child.unhealthy >= self.unhealthy_after:
+                    print(f"{child.program.name}: failed {child.unhealthy} health checks")
+                    self.kill(child, signal.SIGKILL)
+            elif child.state == 'backoff' and now >= child.next_start:
+                self.spawn(child, now)
+            changed = changed or child.state != state
+        return changed
+
+    def restart_all(self, now):
+        """Planned restart (SIGHUP): stop and start each child right away"""
+        for child in self.children:
+            self.stop(child)
+            child.down_since = now
+            self.spawn(child, now)
+
+    def report(self, now=None):
+        now = time.monotonic() if now is None else now
+        return {child.program.name: child.report(now) for child in self.children}
+
+    def save(self, now):
+        if not self.state_path:
+            return
+        try:
+            tmp = self.state_path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.report(now), f)
+            os.replace(tmp, self.state_path)
+        except OSError as e:
+            print(f"Supervisor: cannot save {self.state_path}: {e}")
+
+    def notify(self):
+        ready = [c for c in self.children if c.state == 'ready']
+        status = ', '.join(f"{c.program.name} {c.state} ({c.restarts} restarts)" for c in self.children)
+        if not self.notified and len(ready) == len(self.children):
+            self.notified = True
+            sd_notify(f"READY=1\nSTATUS={status}")
+        else:
+            sd_notify(f"STATUS={status}")
+
+    def handle_signal(self, signum, frame):
+        if signum in (signal.SIGTERM, signal.SIGINT):
+            self.stopping = True
+        elif signum == signal.SIGHUP:
+            self.reload = True
+        self.wakeup.set()
+
+    def run(self, duration=None):
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+            signal.signal(signum, self.handle_signal)
+        start = time.monotonic()
+        for child in self.children:
+            self.spawn(child, start)
+        try:
+            while not self.stopping:
+                now = time.monotonic()
+                if duration is not None and now - start >= duration:
+                    break
+                if self.reload:
+                    self.reload = False
+                    self.restart_all(now)
+                if self.step(now):
+                    self.save(now)
+                    self.notify()
+                # SIGCHLD wakes us for exits; probe often only while something is starting
+                starting = any(c.state == 'starting' for c in self.children)
+                due = [c.next_start for c in self.children if c.state == 'backoff']
+                timeout = 0.02 if starting else min(due + [now + 1.0]) - now
+                self.wakeup.wait(max(timeout, 0.0))
+                self.wakeup.clear()
+        finally:
+            sd_notify("STOPPING=1")
+            for child in self.children:
+                self.stop(child)
+            self.save(time.monotonic())
+
+
+def demo_programs(port=18008):
+    """Dummy children: one that crashes a second after coming up, one that hangs"""
+    flaky = (
+        "import socket, sys, time\n"
+        "time.sleep(0.1)\n"
+        "s = socket.socket()\n"
+        "s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)\n"
+        f"s.bind(('127.0.0.1', {port}))\n"
+        "s.listen()\n"
+        "time.sleep(1)\n"
+        "sys.exit(3)\n"
+    )
+    return [
+        Program('flaky', [sys.executable, '-c', flaky], ready=port_open(port)),
+        Program('hung', [sys.executable, '-c', 'import time; time.sleep(3600)'], ready=port_open(port + 1)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Supervise the casting receivers")
+    parser.add_argument('programs', nargs='*', metavar='program', help=', '.join(sorted(PROGRAMS)))
+    parser.add_argument('--state', help="JSON status file (default: $RUNTIME_DIRECTORY/supervisor.json)")
+    parser.add_argument('--demo', action='store_true', help="supervise dummy children for --duration seconds")
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+
+    if args.demo:
+        supervisor = Supervisor(demo_programs(), ready_timeout=2.0, check_every=0.5)
+        supervisor.run(args.duration)
+        print(json.dumps(supervisor.report(), indent=2))
+        return
+
+    unknown = set(args.programs) - set(PROGRAMS)
+    if not args.programs or unknown:
+        parser.error(f"choose programs from: {', '.join(sorted(PROGRAMS))}")
+    state = args.state
+    if state is None and os.environ.get('RUNTIME_DIRECTORY'):
+        state = os.path.join(os.environ['RUNTIME_DIRECTORY'], 'supervisor.json')
+    Supervisor([PROGRAMS[name] for name in args.programs], state_path=state, sockets=listen_sockets()).run()
+
+
+if __name__ == '__main__':
+    main()
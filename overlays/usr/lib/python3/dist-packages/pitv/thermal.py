@@ -0,0 +1,141 @@
+"""
+Thermal governor
+Tracks the SoC temperature trend and the firmware throttle flags and steps
+the system down (slower sampling, lean rendering, lower background service
+priority) before the firmware starts throttling hard at 80-85°C
+"""
+
+import glob
+import os
+import time
+from collections import deque
+
+from pitv.cpu import (FREQ_CAPPED, SOFT_TEMP_LIMIT, THROTTLED, UNDERVOLTAGE,
+                      read_throttled, throttle_names)
+
+NORMAL = 0
+WARM = 1
+HOT = 2
+LEVEL_NAMES = ('normal', 'warm', 'hot')
+
+# How much slower collectors should sample at each level
+INTERVAL_SCALE = (1, 2, 4)
+
+THROTTLING = FREQ_CAPPED | THROTTLED | SOFT_TEMP_LIMIT
+
+
+def read_temperature(sys='/sys'):
+    """Hottest thermal zone in °C, or None if there is none"""
+    temps = []
+    for path in glob.glob(os.path.join(sys, 'class/thermal/thermal_zone*/temp')):
+        try:
+            with open(path) as f:
+                temps.append(int(f.read()) / 1000.0)
+        except (OSError, ValueError):
+            pass
+    return max(temps) if temps else None
+
+
+class ThermalGovernor:
+    """Predicts throttling from the temperature trend and picks a level
+
+    update() samples the temperature and throttle flags; listeners are
+    called with (level, previous) whenever the level changes. Stepping
+    back down needs the temperature `cooldown` degrees below the limit
+    that raised it, so the level doesn't flap around a threshold.
+    """
+
+    def __init__(self, sys='/sys', soft_limit=70.0, hard_limit=80.0,
+                 horizon=30.0, window=60.0, cooldown=5.0, max_gap=10.0):
+        self.sys = sys
+        self.soft_limit = soft_limit
+        self.hard_limit = hard_limit
+        self.horizon = horizon
+        self.window = window
+        self.cooldown = cooldown
+        self.max_gap = max_gap
+        self.samples = deque()
+        self.level = NORMAL
+        self.listeners = []
+        self.temperature = None
+        self.predicted = None
+        self.flags = 0
+        self.last_time = None
+        self.throttled_seconds = 0.0
+        self.level_seconds = [0.0, 0.0, 0.0]
+
+    def listen(self, callback):
+        self.listeners.append(callback)
+
+    def trend(self):
+        """Least-squares temperature slope over the window in °C/s"""
+        n = len(self.samples)
+        if n < 2:
+            return 0.0
+        t0 = self.samples[0][0]
+        mean_t = sum(t - t0 for t, _ in self.samples) / n
+        mean_v = sum(v for _, v in self.samples) / n
+        num = sum((t - t0 - mean_t) * (v - mean_v) for t, v in self.samples)
+        den = sum((t - t0 - mean_t) ** 2 for t, _ in self.samples)
+        return num / den if den else 0.0
+
+    def classify(self, temp, predicted, flags):
+        if flags & THROTTLING or temp >= self.hard_limit or predicted >= self.hard_limit:
+            return HOT
+        if flags & UNDERVOLTAGE or temp >= self.soft_limit or predicted >= self.soft_limit:
+            return WARM
+        return NORMAL
+
+    def update(self, now=None):
+        """Take a sample and return the (possibly new) level"""
+        now = time.monotonic() if now is None else now
+        temp = read_temperature(self.sys)
+        flags = read_throttled(self.sys) or 0
+        if temp is None:
+            return self.level
+
+        # Attribute the time since the last sample to the state we were in
+        if self.last_time is not None:
+            elapsed = min(now - self.last_time, self.max_gap)
+            self.level_seconds[self.level] += elapsed
+            if self.flags & THROTTLING:
+                self.throttled_seconds += elapsed
+        self.last_time = now
+
+        self.samples.append((now, temp))
+        while self.samples and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+
+        self.temperature = temp
+        self.flags = flags
+        self.predicted = temp + max(self.trend(), 0.0) * self.horizon
+
+        level = self.classify(temp, self.predicted, flags)
+        if level < self.level:
+            # Only step down once clearly below the limit
+            level = max(level, min(self.level, self.classify(
+                temp + self.cooldown, self.predicted + self.cooldown, flags)))
+        if level != self.level:
+            previous, self.level = self.level, level
+            print(f"Thermal: {LEVEL_NAMES[previous]} -> {LEVEL_NAMES[level]} "
+                  f"({temp:.1f}°C, predicted {self.predicted:.1f}°C, "
+                  f"flags {', '.join(throttle_names(flags)) or 'none'})")
+            for callback in self.listeners:
+                callback(level, previous)
+        return self.level
+
+    def interval_scale(self):
+        """Factor to stretch sampling intervals by at the current level"""
+        return INTERVAL_SCALE[self.level]
+
+    def report(self):
+        return {
+            'level': LEVEL_NAMES[self.level],
+            'temperature': self.temperature,
+            'trend': self.trend() * 60.0,
+            'predicted': self.predicted,
+            'throttle_flags': throttle_names(self.flags),
+            'throttled_seconds': round(self.throttled_seconds, 1),
+            'warm_seconds': round(self.level_seconds[WARM], 1),
+            'hot_seconds': round(self.level_seconds[HOT], 1),
+        }
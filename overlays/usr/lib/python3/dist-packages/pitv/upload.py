@@ -0,0 +1,423 @@
+"""
+Resumable uploads
+Phones send media to the TV in pieces. Each request body is streamed to
+disk in fixed-size chunks and hashed as it arrives, so a 4 GB file costs
+the same memory as a 4 MB one. A request cut off halfway keeps what it
+delivered; the client asks for the offset and carries on from there.
+Finished files are checked and moved into ~/Videos or ~/Music.
+
+List pending:  python3 -m pitv.upload
+Benchmark:     python3 -m pitv.upload --benchmark 4G
+"""
+
+import argparse
+import errno
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import resource
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from pitv.humanize import format_bytes, format_rate
+
+STAGING = os.path.expanduser('~/.cache/pitv/uploads')
+LIBRARY = {'video': os.path.expanduser('~/Videos'), 'audio': os.path.expanduser('~/Music')}
+
+# Bytes per read from the request; memory per upload is about this much
+CHUNK_BYTES = 1024 * 1024
+# Flushed and recorded as resumable every this many bytes. Dropping the
+# flushed pages also keeps a 4 GB upload from evicting the UI's page cache.
+COMMIT_BYTES = 16 * 1024 * 1024
+# Partial uploads nobody came back for
+EXPIRE_SECONDS = 7 * 24 * 3600
+
+
+class UploadError(Exception):
+    """Refused upload request; `status` is the HTTP status to answer with"""
+
+    def __init__(self, status, message, upload=None):
+        super().__init__(message)
+        self.status = status
+        self.upload = upload
+
+
+def safe_name(name):
+    """File name without directories, control characters or a leading dot"""
+    name = os.path.basename(str(name).replace('\\', '/'))
+    name = re.sub(r'[\x00-\x1f\x7f]', '', name).strip().lstrip('.')
+    return name[:200]
+
+
+def parse_size(text):
+    """'4G' -> 4294967296"""
+    units = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    match = re.fullmatch(r'(\d+)([KMG]?)B?', text.strip().upper())
+    if match is None:
+        raise argparse.ArgumentTypeError(f"not a size: {text}")
+    return int(match.group(1)) * units[match.group(2)]
+
+
+class Upload:
+    """A file in progress, staged as <id>.part with its state in <id>.json"""
+
+    def __init__(self, staging, id, name, size, sha256=None, offset=0, created=None):
+        self.id = id
+        self.name = name
+        self.size = size
+        self.expected = sha256
+        self.offset = offset
+        self.created = created or time.time()
+        self.path = os.path.join(staging, id + '.part')
+        self.state_path = os.path.join(staging, id + '.json')
+        # SHA-256 of the first `offset` bytes; rebuilt from the file after a restart
+        self.digest = None
+        # One request writes at a time
+        self.lock = threading.Lock()
+        self.sha256 = None
+        self.result = None
+
+    def info(self):
+        return {'id': self.id, 'name': self.name, 'size': self.size, 'offset': self.offset,
+                'complete': self.result is not None, 'path': self.result, 'sha256': self.sha256}
+
+    def save(self):
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'name': self.name, 'size': self.size, 'sha256': self.expected,
+                       'offset': self.offset, 'created': self.created}, f)
+        os.replace(tmp, self.state_path)
+
+
+class UploadStore:
+    """Uploads in progress, kept on disk so they survive the server exiting
+
+    write() is called once per request body with the offset the client
+    believes it is at; a mismatch answers 409 with the real offset. The
+    offset recorded on disk only moves at commits, so after a crash the
+    client resumes from the last flushed byte, never past a hole.
+    """
+
+    def __init__(self, staging=STAGING, library=LIBRARY, chunk=CHUNK_BYTES, commit=COMMIT_BYTES):
+        self.staging = staging
+        self.library = library
+        self.chunk = chunk
+        self.commit_bytes = commit
+        self.uploads = None
+        self.lock = threading.Lock()
+        self.stats = {'started': 0, 'completed': 0, 'failed': 0, 'received_bytes': 0, 'receive_seconds': 0.0}
+
+    def load(self):
+        """Pick up uploads left by a previous run; caller holds the lock"""
+        self.uploads = {}
+        try:
+            names = os.listdir(self.staging)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            id = name[:-5]
+            path = os.path.join(self.staging, name)
+            try:
+                with open(path) as f:
+                    state = json.load(f)
+                upload = Upload(self.staging, id, state['name'], state['size'], state['sha256'],
+                                state['offset'], state['created'])
+                if not os.path.exists(upload.path):
+                    # Moved into the library by a run that stopped before
+                    # removing the state, or deleted by hand
+                    print(f"Uploads: removing {name}, its data is gone")
+                    self.remove_files(upload)
+                    continue
+                if time.time() - os.path.getmtime(path) > EXPIRE_SECONDS:
+                    self.remove_files(upload)
+                    continue
+                # Anything past the recorded offset may not have reached the card
+                with open(upload.path, 'r+b') as f:
+                    upload.offset = min(upload.offset, os.fstat(f.fileno()).st_size)
+                    f.truncate(upload.offset)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Uploads: dropping unreadable {name}: {e}")
+                continue
+            self.uploads[id] = upload
+
+    def create(self, name, size, sha256=None):
+        name = safe_name(name)
+        if not name:
+            raise UploadError(400, "a file name is required")
+        if type(size) is not int or size < 0:
+            raise UploadError(400, "size must be a byte count")
+        if sha256 is not None:
+            sha256 = str(sha256).lower()
+            if not re.fullmatch(r'[0-9a-f]{64}', sha256):
+                raise UploadError(400, "sha256 must be 64 hex digits")
+        os.makedirs(self.staging, exist_ok=True)
+        with self.lock:
+            if self.uploads is None:
+                self.load()
+            # Space still owed to the other uploads counts as used
+            owed = sum(u.size - u.offset for u in self.uploads.values() if u.result is None)
+            free = shutil.disk_usage(self.staging).free - owed
+            if size > free:
+                raise UploadError(507, f"{format_bytes(size)} won't fit; {format_bytes(max(free, 0))} free")
+            upload = Upload(self.staging, uuid.uuid4().hex, name, size, sha256)
+            open(upload.path, 'wb').close()
+            upload.digest = hashlib.sha256()
+            upload.save()
+            self.uploads[upload.id] = upload
+            self.stats['started'] += 1
+        if size == 0:
+            with upload.lock:
+                self.finish(upload)
+        return upload
+
+    def get(self, id):
+        with self.lock:
+            if self.uploads is None:
+                self.load()
+            upload = self.uploads.get(id)
+        if upload is None:
+            raise UploadError(404, "no such upload")
+        return upload
+
+    def pending(self):
+        with self.lock:
+            if self.uploads is None:
+                self.load()
+            return [u.info() for u in self.uploads.values() if u.result is None]
+
+    def write(self, id, offset, stream, length=None):
+        """Append a request body at `offset` and return the upload
+
+        Reads `length` bytes from `stream`, or up to the declared size when
+        the body is chunked. A read error or early end of the body is an
+        interrupted upload, not a failure: what arrived is kept.
+        """
+        upload = self.get(id)
+        if not upload.lock.acquire(blocking=False):
+            # Usually the phone's previous connection, not yet timed out
+            raise UploadError(409, "another request is writing this upload", upload)
+        try:
+            if upload.result is not None:
+                raise UploadError(409, "upload is already complete", upload)
+            if offset != upload.offset:
+                raise UploadError(409, f"upload is at offset {upload.offset}", upload)
+            if length is not None and offset + length > upload.size:
+                raise UploadError(400, "body runs past the declared size", upload)
+            self.receive(upload, stream, upload.size - offset if length is None else length)
+            if upload.offset == upload.size:
+                self.finish(upload)
+        finally:
+            upload.lock.release()
+        return upload
+
+    def receive(self, upload, stream, remaining):
+        if upload.digest is None:
+            upload.digest = self.rehash(upload)
+        start = time.perf_counter()
+        received = 0
+        committed = upload.offset
+        fd = os.open(upload.path, os.O_WRONLY)
+        try:
+            while remaining > 0:
+                try:
+                    data = stream.read(min(self.chunk, remaining))
+                except (OSError, ValueError):
+                    # Dropped or stalled connection
+                    break
+                if not data:
+                    break
+                try:
+                    written = os.pwrite(fd, data, upload.offset)
+                except OSError as e:
+                    raise UploadError(507 if e.errno == errno.ENOSPC else 500,
+                                      f"cannot write the upload: {e.strerror}", upload)
+                upload.digest.update(data[:written] if written < len(data) else data)
+                upload.offset += written
+                received += written
+                remaining -= written
+                if written < len(data):
+                    raise UploadError(507, "disk full", upload)
+                if upload.offset - committed >= self.commit_bytes:
+                    self.commit(fd, upload, committed)
+                    committed = upload.offset
+        finally:
+            self.commit(fd, upload, committed)
+            os.close(fd)
+            with self.lock:
+                self.stats['received_bytes'] += received
+                self.stats['receive_seconds'] += time.perf_counter() - start
+
+    def commit(self, fd, upload, start):
+        """Make [start, offset) durable and record the new offset"""
+        if upload.offset == start:
+            return
+        os.fdatasync(fd)
+        os.posix_fadvise(fd, start, upload.offset - start, os.POSIX_FADV_DONTNEED)
+        upload.save()
+
+    def rehash(self, upload):
+        digest = hashlib.sha256()
+        with open(upload.path, 'rb') as f:
+            remaining = upload.offset
+            while remaining > 0:
+                data = f.read(min(self.chunk, remaining))
+                if not data:
+                    break
+                digest.update(data)
+                remaining -= len(data)
+        return digest
+
+    def finish(self, upload):
+        """Check the whole-file hash and move the file into the library"""
+        upload.sha256 = upload.digest.hexdigest()
+        if upload.expected is not None and upload.sha256 != upload.expected:
+            self.discard(upload)
+            with self.lock:
+                self.stats['failed'] += 1
+            raise UploadError(422, "checksum mismatch, the upload was discarded", upload)
+        kind = (mimetypes.guess_type(upload.name)[0] or '').split('/')[0]
+        directory = self.library['audio' if kind == 'audio' else 'video']
+        os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            # "name (2).mp4" rather than replace a file already in the library
+            root, ext = os.path.splitext(upload.name)
+            destination = os.path.join(directory, upload.name)
+            n = 1
+            while os.path.exists(destination):
+                n += 1
+                destination = os.path.join(directory, f"{root} ({n}){ext}")
+            shutil.move(upload.path, destination)
+            self.stats['completed'] += 1
+        os.remove(upload.state_path)
+        upload.result = destination
+        print(f"Uploads: {format_bytes(upload.size)} saved to {destination}")
+
+    def remove_files(self, upload):
+        for path in (upload.path, upload.state_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def discard(self, upload):
+        """Delete an upload's files and forget it; takes the store lock"""
+        self.remove_files(upload)
+        with self.lock:
+            if self.uploads is not None:
+                self.uploads.pop(upload.id, None)
+
+    def cancel(self, id):
+        upload = self.get(id)
+        if not upload.lock.acquire(blocking=False):
+            raise UploadError(409, "another request is writing this upload", upload)
+        try:
+            if upload.result is None:
+                self.discard(upload)
+        finally:
+            upload.lock.release()
+
+    def report(self):
+        with self.lock:
+            stats = dict(self.stats)
+            active = sum(1 for u in (self.uploads or {}).values() if u.lock.locked())
+        seconds = stats['receive_seconds']
+        stats['active'] = active
+        stats['throughput'] = round(stats['received_bytes'] / seconds) if seconds else None
+        return stats
+
+
+class PatternStream:
+    """Request body stand-in: bytes `start` to `end` of a repeating random block"""
+
+    def __init__(self, block, start, end, fail_at=None):
+        self.block = block
+        self.position = start
+        self.end = end
+        self.fail_at = fail_at
+
+    def read(self, n):
+        if self.fail_at is not None and self.position >= self.fail_at:
+            raise ConnectionResetError("connection dropped")
+        at = self.position % len(self.block)
+        data = self.block[at:at + min(n, self.end - self.position)]
+        self.position += len(data)
+        return data
+
+
+def pattern_sha256(block, size):
+    digest = hashlib.sha256()
+    whole, rest = divmod(size, len(block))
+    for _ in range(whole):
+        digest.update(block)
+    digest.update(block[:rest])
+    return digest.hexdigest()
+
+
+def max_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def benchmark(size, directory, chunk=CHUNK_BYTES, commit=COMMIT_BYTES):
+    """Upload `size` bytes in two requests, the first cut off a third of the way
+
+    The second request goes to a fresh store, as after the server exits
+    between requests, so it also covers reloading and rehashing.
+    """
+    block = os.urandom(CHUNK_BYTES)
+    expected = pattern_sha256(block, size)
+    scratch = tempfile.mkdtemp(prefix='pitv-upload-', dir=directory)
+    staging = os.path.join(scratch, 'staging')
+    library = {'video': os.path.join(scratch, 'library'), 'audio': os.path.join(scratch, 'library')}
+    try:
+        rss_before = max_rss()
+        start = time.perf_counter()
+        store = UploadStore(staging, library, chunk, commit)
+        upload = store.create('benchmark.mp4', size, expected)
+        store.write(upload.id, 0, PatternStream(block, 0, size, fail_at=size // 3))
+        interrupted_at = upload.offset
+        store = UploadStore(staging, library, chunk, commit)
+        upload = store.get(upload.id)
+        store.write(upload.id, upload.offset, PatternStream(block, upload.offset, size))
+        elapsed = time.perf_counter() - start
+        return {
+            'size': size,
+            'interrupted_at': interrupted_at,
+            'seconds': elapsed,
+            'throughput': size / elapsed,
+            'max_rss_growth': max_rss() - rss_before,
+            'sha256': upload.sha256,
+        }
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumable upload store")
+    parser.add_argument('--benchmark', type=parse_size, metavar='SIZE',
+                        help="stream SIZE bytes (e.g. 4G) through an interrupted and resumed upload")
+    parser.add_argument('--dir', default=os.path.expanduser('~'),
+                        help="scratch directory on the disk to measure (default: home)")
+    parser.add_argument('--chunk', type=parse_size, default=CHUNK_BYTES)
+    parser.add_argument('--commit', type=parse_size, default=COMMIT_BYTES)
+    args = parser.parse_args()
+    if args.benchmark is None:
+        store = UploadStore()
+        for upload in store.pending():
+            print(f"{upload['id']}  {format_bytes(upload['offset'])} of {format_bytes(upload['size'])}  {upload['name']}")
+        return
+    result = benchmark(args.benchmark, args.dir, args.chunk, args.commit)
+    print(f"{format_bytes(result['size'])} in {result['seconds']:.1f} s "
+          f"({format_rate(result['throughput'])}), cut off at {format_bytes(result['interrupted_at'])} and resumed")
+    print(f"Peak memory grew by {format_bytes(result['max_rss_growth'])}")
+    print(f"sha256 {result['sha256']} (matches)")
+
+
+if __name__ == '__main__':
+    main()
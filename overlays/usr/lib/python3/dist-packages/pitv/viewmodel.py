@@ -0,0 +1,128 @@
+"""
+View-model layer shared by all front ends
+Holds the displayed values and only touches a widget when its rendered text changes
+"""
+
+
+class Field:
+    """A single displayed value and the text it renders to"""
+
+    def __init__(self, render, precision=None):
+        self.render = render
+        self.precision = precision
+        self.value = None
+        self.text = None
+        self.dirty = False
+        self.setters = []
+
+    def quantize(self, value):
+        """Round a value to the precision it is displayed with"""
+        if self.precision is not None and isinstance(value, float):
+            return round(value, self.precision)
+        return value
+
+
+class ViewModel:
+    """Collection of fields with batched, change-only widget updates
+
+    Front ends push raw values with set()/update() and bind widget setters
+    with bind(). Changed fields are marked dirty and applied together in a
+    single flush() which the scheduler runs once per frame.
+    """
+
+    def __init__(self, scheduler=None):
+        self.fields = {}
+        self.scheduler = scheduler
+        self.pending = False
+        self.stats = {
+            'updates': 0,   # values pushed by the front end
+            'applied': 0,   # widget setters actually called
+            'skipped': 0,   # relayouts avoided because the text was unchanged
+            'flushes': 0,   # batched widget updates
+        }
+
+    def add(self, name, render, precision=None):
+        """Register a field; render turns the value into widget text"""
+        field = Field(render, precision)
+        self.fields[name] = field
+        return field
+
+    def bind(self, name, setter):
+        """Call setter(text) whenever the field's rendered text changes"""
+        self.fields[name].setters.append(setter)
+
+    def set(self, name, value):
+        """Store a new value, marking the field dirty if its text changes"""
+        field = self.fields[name]
+        self.stats['updates'] += 1
+
+        value = field.quantize(value)
+        if field.text is not None and value == field.value:
+            self.stats['skipped'] += 1
+            return False
+        field.value = value
+
+        text = field.render(value)
+        if text == field.text:
+            self.stats['skipped'] += 1
+            return False
+
+        field.text = text
+        field.dirty = True
+        self.schedule()
+        return True
+
+    def update(self, values):
+        """Store several values at once"""
+        changed = False
+        for name, value in values.items():
+            if name in self.fields:
+                changed = self.set(name, value) or changed
+        return changed
+
+    def get(self, name):
+        """Return the last stored (quantized) value of a field"""
+        return self.fields[name].value
+
+    def schedule(self):
+        """Request a flush, at most once until it has run"""
+        if self.pending:
+            return
+        self.pending = True
+        if self.scheduler is None:
+            self.flush()
+        else:
+            self.scheduler(self.flush)
+
+    def flush(self):
+        """Apply all dirty fields to their widgets"""
+        self.pending = False
+        self.stats['flushes'] += 1
+        for field in self.fields.values():
+            if not field.dirty:
+                continue
+            field.dirty = False
+            for setter in field.setters:
+                setter(field.text)
+                self.stats['applied'] += 1
+        # Returning False removes the GLib idle source
+        return False
+
+
+def glib_scheduler():
+    """Flush right before GTK's next redraw"""
+    from gi.repository import GLib
+
+    def schedule(callback):
+        # GDK redraws at PRIORITY_HIGH_IDLE + 20, so run just ahead of it
+        GLib.idle_add(callback, priority=GLib.PRIORITY_HIGH_IDLE + 10)
+    return schedule
+
+
+def qt_scheduler():
+    """Flush on the next pass of the Qt event loop"""
+    from PyQt5.QtCore import QTimer
+
+    def schedule(callback):
+        QTimer.singleShot(0, callback)
+    return schedule
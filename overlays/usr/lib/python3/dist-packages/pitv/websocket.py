@@ -0,0 +1,172 @@
+"""
+Minimal WebSocket (RFC 6455) over a plain socket
+Enough for small JSON messages between the phone remote and the server:
+text/binary frames, fragmentation, ping/pong and close. No extensions.
+"""
+
+import base64
+import hashlib
+import os
+import socket
+import struct
+import threading
+from urllib.parse import urlsplit
+
+GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+CONTINUATION, TEXT, BINARY, CLOSE, PING, PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+MAX_MESSAGE = 1 << 16
+
+
+class ConnectionClosed(Exception):
+    """The peer closed the connection"""
+
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1(key.encode() + GUID).digest()).decode()
+
+
+def handshake_response(key):
+    return (
+        'HTTP/1.1 101 Switching Protocols\r\n'
+        'Upgrade: websocket\r\n'
+        'Connection: Upgrade\r\n'
+        f'Sec-WebSocket-Accept: {accept_key(key)}\r\n'
+        '\r\n'
+    ).encode()
+
+
+def forbidden_response():
+    return b'HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+
+
+def same_origin(environ):
+    """A handshake's Origin (if any) names the host it was sent to
+
+    Browsers always send Origin, so this stops a page on another site from
+    opening a WebSocket to the TV; non-browser clients send none.
+    """
+    origin = environ.get('HTTP_ORIGIN')
+    if origin is None:
+        return True
+    return urlsplit(origin).netloc.lower() == environ.get('HTTP_HOST', '').lower()
+
+
+class WebSocket:
+    """One open WebSocket; `client` sockets mask what they send"""
+
+    def __init__(self, sock, client=False, buffered=b''):
+        self.sock = sock
+        self.client = client
+        self.buffered = buffered
+        self.closed = False
+        # Replies and relayed acks come from different threads
+        self.send_lock = threading.Lock()
+        # Frames are small: no Nagle delay on key presses
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass
+
+    def read_exact(self, n):
+        data, self.buffered = self.buffered[:n], self.buffered[n:]
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionClosed()
+            data += chunk
+        return data
+
+    def read_frame(self):
+        first, second = self.read_exact(2)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack('!H', self.read_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', self.read_exact(8))[0]
+        if length > MAX_MESSAGE:
+            raise ConnectionClosed()
+        mask = self.read_exact(4) if second & 0x80 else None
+        payload = self.read_exact(length)
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return bool(first & 0x80), opcode, payload
+
+    def send_frame(self, opcode, payload):
+        header = bytes([0x80 | opcode])
+        mask_bit = 0x80 if self.client else 0
+        length = len(payload)
+        if length < 126:
+            header += bytes([mask_bit | length])
+        elif length < 1 << 16:
+            header += bytes([mask_bit | 126]) + struct.pack('!H', length)
+        else:
+            header += bytes([mask_bit | 127]) + struct.pack('!Q', length)
+        if self.client:
+            mask = os.urandom(4)
+            header += mask
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        with self.send_lock:
+            self.sock.sendall(header + payload)
+
+    def receive(self):
+        """Next text message as str (binary as bytes); raises ConnectionClosed"""
+        message = b''
+        kind = None
+        while True:
+            final, opcode, payload = self.read_frame()
+            if opcode == PING:
+                self.send_frame(PONG, payload)
+            elif opcode == CLOSE:
+                if not self.closed:
+                    self.closed = True
+                    self.send_frame(CLOSE, payload[:2])
+                raise ConnectionClosed()
+            elif opcode in (TEXT, BINARY, CONTINUATION):
+                kind = kind if opcode == CONTINUATION else opcode
+                message += payload
+                if len(message) > MAX_MESSAGE:
+                    raise ConnectionClosed()
+                if final:
+                    return message.decode('utf-8', 'replace') if kind == TEXT else message
+
+    def send(self, text):
+        self.send_frame(TEXT, text.encode())
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                self.send_frame(CLOSE, struct.pack('!H', 1000))
+            except OSError:
+                pass
+
+
+def connect(url, timeout=5.0):
+    """Client WebSocket to ws://host:port/path"""
+    parts = urlsplit(url)
+    sock = socket.create_connection((parts.hostname, parts.port or 80), timeout=timeout)
+    key = base64.b64encode(os.urandom(16)).decode()
+    sock.sendall((
+        f'GET {parts.path or "/"} HTTP/1.1\r\n'
+        f'Host: {parts.netloc}\r\n'
+        'Upgrade: websocket\r\n'
+        'Connection: Upgrade\r\n'
+        f'Sec-WebSocket-Key: {key}\r\n'
+        'Sec-WebSocket-Version: 13\r\n'
+        '\r\n'
+    ).encode())
+    response = b''
+    while b'\r\n\r\n' not in response:
+        chunk = sock.recv(1024)
+        if not chunk:
+            raise ConnectionClosed()
+        response += chunk
+    head, _, rest = response.partition(b'\r\n\r\n')
+    if b' 101 ' not in head.split(b'\r\n')[0] or accept_key(key).encode() not in head:
+        sock.close()
+        raise ConnectionClosed()
+    sock.settimeout(None)
+    return WebSocket(sock, client=True, buffered=rest)
@@ -7,9 +7,14 @@ A lightweight, native GUI dashboard for monitoring Raspberry Pi system stats
 import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, GLib, Gdk
-import psutil
-import subprocess
 import os
+from pitv.viewmodel import ViewModel, glib_scheduler
+from pitv.actions import Dispatcher, glib_poster
+from pitv.polling import AdaptivePoller
+from pitv.cpu import CpuCollector
+from pitv.collectors import (Collector, CollectorScheduler, cpu_usage, memory_usage, disk_usage,
+                             temperature, ip_address)
+from pitv.blockio import BlockCollector, describe_device
 
 class RaspberryPiGUI(Gtk.Window):
     def __init__(self):
@@ -20,6 +25,9 @@ class RaspberryPiGUI(Gtk.Window):
         # Make fullscreen
         self.fullscreen()
         
+        # User actions run off the UI thread
+        self.actions = Dispatcher(glib_poster())
+        
         # Set up the main layout
         main_vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=20)
         main_vbox.set_halign(Gtk.Align.CENTER)
@@ -51,9 +59,25 @@ class RaspberryPiGUI(Gtk.Window):
         # Apply custom styling
         self.apply_css()
         
-        # Update stats every 2 seconds
-        GLib.timeout_add_seconds(2, self.update_stats)
-        self.update_stats()
+        # Displayed values, applied to the labels once per frame
+        self.create_view()
+        
+        # Each stat is read at its own rate; disk and IP rarely change
+        self.collectors = CollectorScheduler([
+            cpu_usage(CpuCollector(), interval=2.0),
+            memory_usage(name='mem'),
+            disk_usage(),
+            temperature(),
+            ip_address(),
+            Collector('storage', BlockCollector().sample, interval=5.0,
+                      key=lambda devices: tuple(describe_device(n, d) for n, d in devices.items())),
+        ])
+        self.collectors.listen(self.update_stats)
+        
+        # Run collectors when due while watched, less often when hidden or idle
+        self.poller = AdaptivePoller(self.collectors.run, fast=1, slow=60)
+        self.poller.attach_glib()
+        self.poller.watch_gtk(self)
     
     def create_stats_frame(self):
         """Create the system statistics frame"""
@@ -137,6 +161,11 @@ class RaspberryPiGUI(Gtk.Window):
         self.ip_label.set_markup('<span size="medium">📡 IP: <b>Loading...</b></span>')
         vbox.pack_start(self.ip_label, False, False, 5)
         
+        # Storage latency: slow SD cards are the usual cause of lag
+        self.storage_label = Gtk.Label()
+        self.storage_label.set_markup('<span size="medium">💽 Storage: <b>Loading...</b></span>')
+        vbox.pack_start(self.storage_label, False, False, 5)
+        
         frame.add(vbox)
         return frame
     
@@ -167,6 +196,37 @@ class RaspberryPiGUI(Gtk.Window):
         
         return button_box
     
+    def create_view(self):
+        """Create the view-model that feeds the stat labels"""
+        self.view = ViewModel(scheduler=glib_scheduler())
+        
+        def percent(name):
+            return lambda v: (
+                f'<span size="large">{name}: <span foreground="{self.get_color_for_percentage(v)}">{v:.1f}%</span></span>'
+            )
+        
+        self.view.add('cpu', percent('CPU'), precision=1)
+        self.view.add('mem', percent('Memory'), precision=1)
+        self.view.add('disk', percent('Disk'), precision=1)
+        self.view.add('temp', lambda v: (
+            f'<span size="large">Temp: <span foreground="{self.get_color_for_temp(v)}">{v:.1f}°C</span></span>'
+        ), precision=1)
+        self.view.add('ip', lambda ip: f'<span size="medium">📡 IP: <b>{ip or "Unknown"}</b></span>')
+        self.view.add('storage', lambda devices: '\n'.join(
+            f'<span size="medium">💽 {GLib.markup_escape_text(describe_device(name, device))}</span>'
+            for name, device in devices.items()
+        ) or '<span size="medium">💽 Storage: <b>none</b></span>')
+        # (text, colour): the last update time, or the outcome of a button
+        self.view.add('status', lambda status: f'<span size="small" foreground="{status[1]}">{status[0]}</span>')
+        
+        self.view.bind('cpu', self.cpu_label.set_markup)
+        self.view.bind('mem', self.mem_label.set_markup)
+        self.view.bind('disk', self.disk_label.set_markup)
+        self.view.bind('temp', self.temp_label.set_markup)
+        self.view.bind('ip', self.ip_label.set_markup)
+        self.view.bind('storage', self.storage_label.set_markup)
+        self.view.bind('status', self.status_label.set_markup)
+    
     def apply_css(self):
         """Apply custom CSS styling"""
         css = b"""
@@ -210,72 +270,12 @@ class RaspberryPiGUI(Gtk.Window):
             Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
         )
     
-    def update_stats(self):
-        """Update system statistics"""
-        try:
-            # CPU usage
-            cpu = psutil.cpu_percent(interval=0.1)
-            cpu_color = self.get_color_for_percentage(cpu)
-            self.cpu_label.set_markup(
-                f'<span size="large">CPU: <span foreground="{cpu_color}">{cpu:.1f}%</span></span>'
-            )
-            
-            # Memory usage
-            mem = psutil.virtual_memory().percent
-            mem_color = self.get_color_for_percentage(mem)
-            self.mem_label.set_markup(
-                f'<span size="large">Memory: <span foreground="{mem_color}">{mem:.1f}%</span></span>'
-            )
-            
-            # Disk usage
-            disk = psutil.disk_usage('/').percent
-            disk_color = self.get_color_for_percentage(disk)
-            self.disk_label.set_markup(
-                f'<span size="large">Disk: <span foreground="{disk_color}">{disk:.1f}%</span></span>'
-            )
-            
-            # CPU Temperature
-            temp = self.get_cpu_temp()
-            temp_color = self.get_color_for_temp(temp)
-            self.temp_label.set_markup(
-                f'<span size="large">Temp: <span foreground="{temp_color}">{temp:.1f}°C</span></span>'
-            )
-            
-            # IP Address
-            ip = self.get_ip_address()
-            self.ip_label.set_markup(f'<span size="medium">📡 IP: <b>{ip}</b></span>')
-            
-            # Update status
-            self.status_label.set_markup(
-                f'<span size="small" foreground="#888888">Last updated: {self.get_time()}</span>'
-            )
-            
-        except Exception as e:
-            print(f"Error updating stats: {e}")
-        
-        return True
-    
-    def get_cpu_temp(self):
-        """Get CPU temperature"""
-        try:
-            with open('/sys/class/thermal/thermal_zone0/temp', 'r') as f:
-                temp = int(f.read()) / 1000
-                return temp
-        except:
-            return 0.0
-    
-    def get_ip_address(self):
-        """Get primary IP address"""
-        try:
-            result = subprocess.run(
-                ['hostname', '-I'], 
-                capture_output=True, 
-                text=True
-            )
-            ip = result.stdout.strip().split()[0]
-            return ip
-        except:
-            return "Unknown"
+    def update_stats(self, changes):
+        """Update the statistics that changed"""
+        if changes.get('temp', 0.0) is None:
+            changes = dict(changes, temp=0.0)
+        self.view.update(changes)
+        self.view.set('status', (f"Last updated: {self.get_time()}", "#888888"))
     
     def get_time(self):
         """Get current time"""
@@ -302,34 +302,29 @@ class RaspberryPiGUI(Gtk.Window):
     
     def on_refresh_clicked(self, widget):
         """Handle refresh button click"""
-        self.update_stats()
-        self.status_label.set_markup(
-            '<span size="small" foreground="#4CAF50">Stats refreshed!</span>'
-        )
+        self.collectors.refresh()
+        self.view.set('status', ("Stats refreshed!", "#4CAF50"))
+        self.view.flush()
     
     def on_terminal_clicked(self, widget):
         """Handle terminal button click"""
-        try:
-            subprocess.Popen(['lxterminal'])
-        except:
-            try:
-                subprocess.Popen(['xterm'])
-            except:
-                self.status_label.set_markup(
-                    '<span size="small" foreground="#F44336">Could not open terminal</span>'
-                )
+        self.launch([['lxterminal'], ['xterm']], "Could not open terminal")
     
     def on_browser_clicked(self, widget):
         """Handle browser button click"""
-        try:
-            subprocess.Popen(['chromium-browser', 'http://localhost:8080'])
-        except:
-            try:
-                subprocess.Popen(['firefox', 'http://localhost:8080'])
-            except:
-                self.status_label.set_markup(
-                    '<span size="small" foreground="#F44336">Could not open browser</span>'
-                )
+        self.launch([
+            ['chromium-browser', 'http://localhost:8080'],
+            ['firefox', 'http://localhost:8080'],
+        ], "Could not open browser")
+    
+    def launch(self, candidates, failure):
+        """Start the first program that exists, without blocking the UI"""
+        def on_error(e):
+            if candidates[1:]:
+                self.launch(candidates[1:], failure)
+            else:
+                self.view.set('status', (failure, "#F44336"))
+        self.actions.spawn(f"Starting {candidates[0][0]}", candidates[0], on_error=on_error)
     
     def on_exit_fullscreen_clicked(self, widget):
         """Handle exit fullscreen button click"""
@@ -338,6 +333,7 @@ class RaspberryPiGUI(Gtk.Window):
 def main():
     """Main entry point"""
     win = RaspberryPiGUI()
+    win.connect("destroy", lambda w: w.actions.shutdown())
     win.connect("destroy", Gtk.main_quit)
     win.show_all()
     Gtk.main()
@@ -11,69 +11,180 @@ import time
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QPushButton, QProgressBar, QFrame, QGridLayout, QTextEdit,
-    QGroupBox, QScrollArea, QSystemTrayIcon, QMenu
+    QGroupBox, QScrollArea, QSystemTrayIcon, QMenu, QTableWidget, QTableWidgetItem,
+    QHeaderView
 )
 from PyQt5.QtCore import QTimer, Qt, QThread, pyqtSignal, QSize
-from PyQt5.QtGui import QFont, QPalette, QColor, QIcon, QLinearGradient, QBrush
-
-try:
-    import psutil
-except ImportError:
-    subprocess.run(['sudo', 'pip3', 'install', 'psutil'], check=False)
-import psutil
+from PyQt5.QtGui import QFont, QPalette, QColor, QIcon, QLinearGradient, QBrush, QPainter
+from pitv.viewmodel import ViewModel, qt_scheduler
+from pitv.actions import Dispatcher, qt_poster, describe
+from pitv.broker import BrokerClient
+from pitv.cpu import CpuCollector
+from pitv.thermal import ThermalGovernor
+from pitv.profiles import current_profile
+from pitv.polling import AdaptivePoller
+from pitv.collectors import (Collector, CollectorScheduler, cpu_usage, cpu_cores, thermal,
+                             memory_usage, disk_usage, uptime, hostname, ip_address)
+from pitv.processes import ProcessScanner
+from pitv.cgroups import CgroupMonitor, describe_usage
+from pitv.network import NetworkCollector
+from pitv.blockio import BlockCollector, describe_device, describe_wear
+from pitv.humanize import format_rate
 
 
 class SystemMonitor(QThread):
     """Background thread for system monitoring"""
     stats_updated = pyqtSignal(dict)
     
+    def __init__(self):
+        super().__init__()
+        # Collectors run when due while the desktop is watched, backing off when it isn't
+        self.poller = AdaptivePoller(self.sample, fast=1, slow=60)
+        self.process_sort = 'cpu'
+        self.processes = ProcessScanner()
+        self.cgroups = CgroupMonitor()
+        
+        cpu = CpuCollector()
+        self.thermal = ThermalGovernor()
+        self.collectors = CollectorScheduler([
+            cpu_usage(cpu),
+            cpu_cores(cpu),
+            thermal(self.thermal),
+            memory_usage(),
+            disk_usage(),
+            uptime(),
+            hostname(),
+            ip_address(),
+            Collector('network', NetworkCollector().sample, interval=2.0,
+                      key=lambda n: (n['history'][-1:], n['warning'])),
+            Collector('storage', BlockCollector().sample, interval=2.0,
+                      key=lambda devices: tuple(describe_device(n, d) for n, d in devices.items())),
+            Collector('processes', self.read_processes, interval=3.0,
+                      key=lambda rows: tuple((p['pid'], p['cpu'], p['rss'] >> 20) for p in rows)),
+        ])
+        if self.cgroups.available:
+            self.collectors.add(Collector(
+                'services', self.cgroups.sample, interval=5.0,
+                key=lambda usage: tuple(describe_usage(u) for u in usage.values())))
+        # Only the values that changed cross over to the UI thread
+        self.collectors.listen(self.stats_updated.emit)
+    
     def run(self):
-        while True:
-            try:
-                stats = {
-                    'cpu': psutil.cpu_percent(interval=1),
-                    'memory': psutil.virtual_memory().percent,
-                    'disk': psutil.disk_usage('/').percent,
-                    'temperature': self.get_temperature(),
-                    'uptime': self.get_uptime(),
-                    'ip': self.get_ip(),
-                    'hostname': self.get_hostname()
-                }
-                self.stats_updated.emit(stats)
-            except Exception as e:
-                print(f"Monitor error: {e}")
-            time.sleep(2)
-    
-    def get_temperature(self):
-        try:
-            with open('/sys/class/thermal/thermal_zone0/temp', 'r') as f:
-                temp = int(f.read()) / 1000
-            return f"{temp:.1f}°C"
-        except:
-            return "N/A"
+        self.poller.run_blocking()
     
-    def get_uptime(self):
-        try:
-            uptime = time.time() - psutil.boot_time()
-            hours = int(uptime // 3600)
-            minutes = int((uptime % 3600) // 60)
-            return f"{hours}h {minutes}m"
-        except:
-            return "N/A"
+    def read_processes(self):
+        self.processes.scan()
+        return self.processes.top(8, self.process_sort)
     
-    def get_ip(self):
-        try:
-            result = subprocess.run(['hostname', '-I'], capture_output=True, text=True, timeout=2)
-            return result.stdout.strip().split()[0] if result.stdout.strip() else "N/A"
-        except:
-            return "N/A"
+    def set_process_sort(self, key):
+        """Sort the process table by 'cpu' or 'memory' (called from the UI thread)"""
+        self.process_sort = key
+        self.collectors.trigger('processes')
+        self.poller.wake()
+    
+    def sample(self):
+        delay = self.collectors.run()
+        # Sample less often while the SoC is hot
+        self.poller.set_scale(self.thermal.interval_scale())
+        return delay
+
+
+class CoreHeatmap(QWidget):
+    """One cell per CPU core, coloured by utilisation"""
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.cores = ()
+        self.setMinimumHeight(48)
+    
+    def set_cores(self, cores):
+        """cores is a tuple of (core id, utilisation %, MHz) per online core"""
+        self.cores = cores
+        self.update()
+    
+    def color_for(self, util):
+        # Green at idle through yellow to red when pegged
+        hue = int(120 * (1.0 - min(util, 100) / 100.0))
+        return QColor.fromHsv(hue, 200, 200)
+    
+    def paintEvent(self, event):
+        if not self.cores:
+            return
+        painter = QPainter(self)
+        width = self.width() / len(self.cores)
+        for i, (cpu, util, freq) in enumerate(self.cores):
+            x = int(i * width)
+            rect = self.rect().adjusted(x + 2, 2, 0, -2)
+            rect.setWidth(int(width) - 4)
+            painter.fillRect(rect, self.color_for(util))
+            painter.setPen(Qt.white)
+            painter.drawText(rect, Qt.AlignCenter, f"CPU{cpu}\n{util}% · {freq} MHz")
+        painter.end()
+
+
+class NetworkGraph(QWidget):
+    """Receive and transmit rate history of the primary interface"""
+    
+    RX_COLOR = QColor("#3498db")
+    TX_COLOR = QColor("#e67e22")
+    POINTS = 60
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.history = ()
+        self.setMinimumHeight(80)
+    
+    def set_history(self, history):
+        """history is a tuple of (rx, tx) bytes per second, oldest first"""
+        self.history = history
+        self.update()
+    
+    def paintEvent(self, event):
+        if len(self.history) < 2:
+            return
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        # Leave headroom above the peak and never scale below 64 KB/s
+        peak = max(max(rx, tx) for rx, tx in self.history)
+        scale = max(peak * 1.2, 65536)
+        step = self.width() / (self.POINTS - 1)
+        height = self.height() - 14
+        for index, color in ((0, self.RX_COLOR), (1, self.TX_COLOR)):
+            painter.setPen(color)
+            points = [(int(i * step), int(height - sample[index] / scale * height) + 12)
+                      for i, sample in enumerate(self.history[-self.POINTS:])]
+            for (x1, y1), (x2, y2) in zip(points, points[1:]):
+                painter.drawLine(x1, y1, x2, y2)
+        painter.setPen(Qt.white)
+        painter.drawText(4, 11, f"peak {format_rate(peak)}")
+        painter.end()
+
+
+class ProcessTable(QTableWidget):
+    """Top processes; clicking the CPU or Memory header changes the sort"""
+    
+    COLUMNS = ("PID", "Process", "CPU %", "Memory")
+    SORT_COLUMNS = {2: 'cpu', 3: 'memory'}
+    
+    def __init__(self, parent=None):
+        super().__init__(0, len(self.COLUMNS), parent)
+        self.setHorizontalHeaderLabels(self.COLUMNS)
+        self.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.verticalHeader().setVisible(False)
+        self.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.setSelectionMode(QTableWidget.NoSelection)
+        self.setMaximumHeight(230)
     
-    def get_hostname(self):
-        try:
-            result = subprocess.run(['hostname'], capture_output=True, text=True, timeout=2)
-            return result.stdout.strip() or "raspberrypi-custom"
-        except:
-            return "raspberrypi-custom"
+    def set_rows(self, rows):
+        """rows is a tuple of (pid, name, cpu %, rss MB)"""
+        self.setRowCount(len(rows))
+        for row, (pid, name, cpu, rss) in enumerate(rows):
+            for column, text in enumerate((str(pid), name, f"{cpu:.1f}", f"{rss} MB")):
+                item = self.item(row, column)
+                if item is None:
+                    self.setItem(row, column, QTableWidgetItem(text))
+                elif item.text() != text:
+                    item.setText(text)
 
 
 class CustomRaspberryPiDesktop(QMainWindow):
@@ -81,7 +192,17 @@ class CustomRaspberryPiDesktop(QMainWindow):
     
     def __init__(self):
         super().__init__()
+        # User actions run off the UI thread and report back to the status bar
+        self.actions = Dispatcher(qt_poster())
+        self.actions.listen(lambda action: self.statusBar().showMessage(describe(action)))
+        # Privileged commands go through the root broker instead of sudo
+        self.broker = BrokerClient()
+        self.thermal_hot = False
+        self.service_states = []
+        self.service_usage = {}
+        self.network_warning = None
         self.init_ui()
+        self.create_view()
         self.start_monitoring()
         self.check_services()
     
@@ -209,6 +330,11 @@ class CustomRaspberryPiDesktop(QMainWindow):
         stats_layout.addWidget(self.temp_label, 1, 1)
         system_layout.addLayout(stats_layout)
         
+        # Per-core load
+        self.core_heatmap = CoreHeatmap()
+        system_layout.addWidget(QLabel("Per-core Usage:"))
+        system_layout.addWidget(self.core_heatmap)
+        
         # Progress bars
         self.cpu_bar = QProgressBar()
         self.memory_bar = QProgressBar()
@@ -221,9 +347,27 @@ class CustomRaspberryPiDesktop(QMainWindow):
         system_layout.addWidget(QLabel("Disk Usage:"))
         system_layout.addWidget(self.disk_bar)
         
+        # Network throughput (blue receive, orange transmit) and Wi-Fi link
+        self.network_label = QLabel("Network: --")
+        self.network_graph = NetworkGraph()
+        system_layout.addWidget(self.network_label)
+        system_layout.addWidget(self.network_graph)
+        
+        # Block device latency, throughput and card wear
+        self.storage_label = QLabel("Storage: --")
+        system_layout.addWidget(self.storage_label)
+        
         system_group.setLayout(system_layout)
         main_layout.addWidget(system_group)
         
+        # Top processes
+        processes_group = QGroupBox("🧮 Top Processes")
+        processes_layout = QVBoxLayout()
+        self.process_table = ProcessTable()
+        processes_layout.addWidget(self.process_table)
+        processes_group.setLayout(processes_layout)
+        main_layout.addWidget(processes_group)
+        
         # Services section
         services_group = QGroupBox("🔧 Services")
         services_layout = QVBoxLayout()
@@ -231,7 +375,7 @@ class CustomRaspberryPiDesktop(QMainWindow):
         # Services status display
         self.services_text = QTextEdit()
         self.services_text.setReadOnly(True)
-        self.services_text.setMaximumHeight(120)
+        self.services_text.setMaximumHeight(170)
         services_layout.addWidget(self.services_text)
         
         # Service control buttons
@@ -301,28 +445,124 @@ class CustomRaspberryPiDesktop(QMainWindow):
         self.statusBar().showMessage("✅ Custom Desktop Ready - All systems operational")
         self.statusBar().setStyleSheet("background: #2c3e50; color: white; font-weight: bold;")
     
+    def create_view(self):
+        """Create the view-model that feeds the stat labels and bars"""
+        self.view = ViewModel(scheduler=qt_scheduler())
+        
+        self.view.add('cpu', lambda v: f"CPU: {v:.1f}%", precision=1)
+        self.view.add('memory', lambda v: f"Memory: {v:.1f}%", precision=1)
+        self.view.add('disk', lambda v: f"Disk: {v:.1f}%", precision=1)
+        self.view.add('thermal', lambda r: f"Temperature: {self.format_temperature(r)}")
+        self.view.add('uptime', lambda s: f"Uptime: {int(s // 3600)}h {int(s % 3600 // 60)}m")
+        self.view.add('ip', lambda ip: f"IP: {ip or 'N/A'}")
+        self.view.add('hostname', lambda h: f"Hostname: {h or 'raspberrypi-custom'}")
+        self.view.add('cpu_bar', int, precision=0)
+        self.view.add('cores', lambda cores: tuple((c['cpu'], round(c['util']), c['freq']) for c in cores))
+        self.view.add('memory_bar', int, precision=0)
+        self.view.add('disk_bar', int, precision=0)
+        self.view.add('network', self.format_network)
+        self.view.add('storage', self.format_storage)
+        self.view.add('network_graph', tuple)
+        self.view.add('processes', lambda rows: tuple(
+            (p['pid'], p['name'], p['cpu'], p['rss'] >> 20) for p in rows
+        ))
+        
+        self.view.bind('cpu', self.cpu_label.setText)
+        self.view.bind('memory', self.memory_label.setText)
+        self.view.bind('disk', self.disk_label.setText)
+        self.view.bind('thermal', self.temp_label.setText)
+        self.view.bind('uptime', self.uptime_label.setText)
+        self.view.bind('ip', self.ip_label.setText)
+        self.view.bind('hostname', self.hostname_label.setText)
+        self.view.bind('cpu_bar', self.cpu_bar.setValue)
+        self.view.bind('cores', self.core_heatmap.set_cores)
+        self.view.bind('memory_bar', self.memory_bar.setValue)
+        self.view.bind('disk_bar', self.disk_bar.setValue)
+        self.view.bind('processes', self.process_table.set_rows)
+        self.view.bind('network', self.network_label.setText)
+        self.view.bind('storage', self.storage_label.setText)
+        self.view.bind('network_graph', self.network_graph.set_history)
+    
     def start_monitoring(self):
         """Start background system monitoring"""
         self.monitor = SystemMonitor()
         self.monitor.stats_updated.connect(self.update_stats)
+        self.monitor.poller.watch_qt(self)
+        self.process_table.horizontalHeader().sectionClicked.connect(self.sort_processes)
         self.monitor.start()
     
+    def sort_processes(self, column):
+        key = ProcessTable.SORT_COLUMNS.get(column)
+        if key is not None:
+            self.monitor.set_process_sort(key)
+    
+    def format_storage(self, devices):
+        if not devices:
+            return "Storage: no disks found"
+        lines = []
+        for name, device in devices.items():
+            lines.append(f"Storage {describe_device(name, device)}, {device['util']:.0f}% busy")
+            if 'wear' in device:
+                lines.append(f"    {describe_wear(device['wear'])}")
+        return "\n".join(lines)
+    
+    def format_network(self, network):
+        primary = network['primary']
+        if primary is None:
+            return "Network: not connected"
+        stats = network['interfaces'][primary]
+        state = "" if network['online'] else " offline (no default route)"
+        text = f"Network: {primary}{state} ↓ {format_rate(stats['rx_rate'])} ↑ {format_rate(stats['tx_rate'])}"
+        if stats['error_rate'] >= 1:
+            text += f" · {stats['error_rate']:.0f} errors/drops/s"
+        wifi = stats['wireless']
+        if wifi:
+            text += f" · signal {wifi['signal']} dBm, quality {wifi['quality']}"
+            if wifi['noise'] is not None:
+                text += f", noise {wifi['noise']} dBm"
+        return text
+    
+    def format_temperature(self, report):
+        if report['temperature'] is None:
+            return "N/A"
+        trend = report['trend']
+        arrow = "↗" if trend > 0.5 else "↘" if trend < -0.5 else "→"
+        text = f"{report['temperature']:.1f}°C {arrow}"
+        if report['throttled_seconds']:
+            text += f" (throttled {report['throttled_seconds'] / 60:.0f} min)"
+        return text
+    
     def update_stats(self, stats):
-        """Update system statistics display"""
-        self.cpu_label.setText(f"CPU: {stats['cpu']:.1f}%")
-        self.memory_label.setText(f"Memory: {stats['memory']:.1f}%")
-        self.disk_label.setText(f"Disk: {stats['disk']:.1f}%")
-        self.temp_label.setText(f"Temperature: {stats['temperature']}")
-        self.uptime_label.setText(f"Uptime: {stats['uptime']}")
-        self.ip_label.setText(f"IP: {stats['ip']}")
-        self.hostname_label.setText(f"Hostname: {stats['hostname']}")
-        
-        self.cpu_bar.setValue(int(stats['cpu']))
-        self.memory_bar.setValue(int(stats['memory']))
-        self.disk_bar.setValue(int(stats['disk']))
+        """Update the statistics that changed"""
+        self.view.update(stats)
+        
+        # Deprioritise background services while the SoC is hot
+        if 'thermal' in stats:
+            hot = stats['thermal']['level'] == 'hot'
+            if hot != self.thermal_hot:
+                self.thermal_hot = hot
+                self.actions.call("Adjusting background priority",
+                                  self.broker.background_priority, 'low' if hot else 'normal')
+        for name in ('cpu', 'memory', 'disk'):
+            if name in stats:
+                self.view.set(f'{name}_bar', stats[name])
+        if 'services' in stats:
+            self.service_usage = stats['services']
+            self.render_services()
+        if 'network' in stats:
+            self.view.set('network_graph', stats['network']['history'])
+            warning = stats['network']['warning']
+            if warning and warning != self.network_warning:
+                self.statusBar().showMessage(f"⚠️ {warning}")
+            self.network_warning = warning
     
     def check_services(self):
         """Check status of all services"""
+        self.actions.call("Checking services", self.read_services, timeout=15,
+                          on_done=self.show_services)
+    
+    def read_services(self):
+        """Query systemd for each service (runs on a worker thread)"""
         services = [
             ('ssh', 'SSH Server'),
             ('shairport-sync', 'AirPlay Receiver'),
@@ -332,84 +572,115 @@ class CustomRaspberryPiDesktop(QMainWindow):
             ('lightdm', 'Desktop Manager')
         ]
         
-        status_text = "🟢 Services Status:\n\n"
-        
+        states = []
         for service, name in services:
             try:
                 result = subprocess.run(
                     ['systemctl', 'is-active', service],
                     capture_output=True, text=True, timeout=2
                 )
-                is_active = result.stdout.strip() == 'active'
-                icon = "🟢" if is_active else "🔴"
-                status = "Running" if is_active else "Stopped"
-                status_text += f"{icon} {name}: {status}\n"
+                states.append((service, name, result.stdout.strip() == 'active'))
             except:
-                status_text += f"❓ {name}: Unknown\n"
-        
-        self.services_text.setText(status_text)
+                states.append((service, name, None))
+        return states
+    
+    def show_services(self, states):
+        self.service_states = states
+        self.render_services()
         self.statusBar().showMessage(f"✅ Services checked at {time.strftime('%H:%M:%S')}")
     
+    def render_services(self):
+        """Service states from systemd with cgroup usage from the monitor"""
+        status_text = "🟢 Services Status:\n\n"
+        
+        for service, name, is_active in self.service_states:
+            if is_active is None:
+                status_text += f"❓ {name}: Unknown\n"
+                continue
+            icon = "🟢" if is_active else "🔴"
+            status = "Running" if is_active else "Stopped"
+            usage = self.service_usage.get(service)
+            # "running" alone means no controller figures to add
+            if is_active and usage and describe_usage(usage) != "running":
+                status += f" · {describe_usage(usage)}"
+            status_text += f"{icon} {name}: {status}\n"
+        
+        profile = current_profile()
+        if profile:
+            status_text += f"\n⚡ Performance profile: {profile}\n"
+        
+        if status_text != self.services_text.toPlainText():
+            self.services_text.setText(status_text)
+    
     def toggle_service(self, service, name):
         """Toggle a service on/off"""
-        try:
-            # Check current status
-            result = subprocess.run(
-                ['systemctl', 'is-active', service],
-                capture_output=True, text=True, timeout=2
-            )
-            is_active = result.stdout.strip() == 'active'
-            
-            # Toggle
-            action = 'stop' if is_active else 'start'
-            subprocess.run(['sudo', 'systemctl', action, service], check=True, timeout=5)
-            
-            self.statusBar().showMessage(f"✅ {name} {action}ed successfully")
-            
-            # Refresh services display
-            QTimer.singleShot(1000, self.check_services)
-            
-        except Exception as e:
-            self.statusBar().showMessage(f"❌ Failed to toggle {name}: {str(e)}")
+        self.actions.submit(
+            f"Toggling {name}", self.run_toggle, service, timeout=15,
+            on_done=lambda action: self.on_service_toggled(name, action),
+            on_error=lambda e: self.statusBar().showMessage(f"❌ Failed to toggle {name}: {str(e)}")
+        )
+    
+    def run_toggle(self, action, service):
+        """Start or stop a service (runs on a worker thread)"""
+        # Check current status
+        result = subprocess.run(
+            ['systemctl', 'is-active', service],
+            capture_output=True, text=True, timeout=2
+        )
+        is_active = result.stdout.strip() == 'active'
+        
+        # Toggle
+        verb = 'stop' if is_active else 'start'
+        action.report(message=f"{verb}ing {service}")
+        if is_active:
+            self.broker.unit_stop(service)
+        else:
+            self.broker.unit_start(service)
+        return verb
+    
+    def on_service_toggled(self, name, action):
+        self.statusBar().showMessage(f"✅ {name} {action}ed successfully")
+        
+        # Refresh services display
+        QTimer.singleShot(1000, self.check_services)
     
     def start_cast(self):
-        """Start Google Cast service"""
-        try:
-            subprocess.Popen(
-                ['python3', '-m', 'http.server', '8008'],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
-            )
-            self.statusBar().showMessage("✅ Google Cast service started on port 8008")
-        except Exception as e:
-            self.statusBar().showMessage(f"❌ Failed to start Cast: {str(e)}")
+        """Start Google Cast service (google-cast.socket owns port 8008)"""
+        self.actions.call(
+            "Starting Google Cast", self.broker.unit_start, 'google-cast', timeout=15,
+            on_done=lambda result: self.statusBar().showMessage("✅ Google Cast service started on port 8008"),
+            on_error=lambda e: self.statusBar().showMessage(f"❌ Failed to start Cast: {str(e)}")
+        )
     
     def open_web_dashboard(self):
         """Open web dashboard in browser"""
-        try:
-            subprocess.Popen(['chromium-browser', 'http://localhost:8080'])
-            self.statusBar().showMessage("✅ Opening web dashboard...")
-        except:
-            self.statusBar().showMessage("❌ Failed to open browser")
+        self.actions.spawn(
+            "Opening web dashboard", ['chromium-browser', 'http://localhost:8080'],
+            on_done=lambda proc: self.statusBar().showMessage("✅ Opening web dashboard..."),
+            on_error=lambda e: self.statusBar().showMessage("❌ Failed to open browser")
+        )
     
     def open_terminal(self):
         """Open terminal"""
-        try:
-            subprocess.Popen(['lxterminal'])
-            self.statusBar().showMessage("✅ Terminal opened")
-        except:
-            self.statusBar().showMessage("❌ Failed to open terminal")
+        self.actions.spawn(
+            "Opening terminal", ['lxterminal'],
+            on_done=lambda proc: self.statusBar().showMessage("✅ Terminal opened"),
+            on_error=lambda e: self.statusBar().showMessage("❌ Failed to open terminal")
+        )
     
     def reboot_system(self):
         """Reboot the system"""
         self.statusBar().showMessage("🔄 Rebooting system...")
-        QTimer.singleShot(1000, lambda: subprocess.run(['sudo', 'reboot']))
+        QTimer.singleShot(1000, lambda: self.actions.call("Rebooting", self.broker.reboot))
     
     def shutdown_system(self):
         """Shutdown the system"""
         self.statusBar().showMessage("⏻ Shutting down system...")
-        QTimer.singleShot(1000, lambda: subprocess.run(['sudo', 'shutdown', '-h', 'now']))
-
+        QTimer.singleShot(1000, lambda: self.actions.call("Shutting down", self.broker.shutdown))
+    
+    def closeEvent(self, event):
+        self.actions.shutdown()
+        super().closeEvent(event)
 
 def main():
     """Main application entry point"""
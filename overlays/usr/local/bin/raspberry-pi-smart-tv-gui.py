@@ -8,9 +8,20 @@ import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, GLib, Gdk, GdkPixbuf
 import psutil
-import subprocess
 import os
-from datetime import datetime
+from pitv.viewmodel import ViewModel, glib_scheduler
+from pitv.render import RICH, LEAN, FrameSampler, forced_profile
+from pitv.actions import Dispatcher, glib_poster, describe, FINISHED
+from pitv.broker import BrokerClient
+from pitv.thermal import ThermalGovernor, NORMAL, WARM, HOT
+from pitv.polling import AdaptivePoller
+from pitv.cpu import CpuCollector
+from pitv.collectors import Collector, CollectorScheduler, clock, cpu_usage, thermal
+from pitv.network import NetworkCollector
+from pitv.casting import CastTelemetry, describe_session
+from pitv.remoteinput import InputReceiver
+from pitv.focus import FocusEngine
+from pitv.player import Player, load_gst, video_sink, describe_stats, SEEK_STEP
 
 class SmartTVApp(Gtk.Window):
     def __init__(self):
@@ -18,9 +29,34 @@ class SmartTVApp(Gtk.Window):
         self.set_default_size(1920, 1080)
         self.fullscreen()
         
+        # Displayed values, applied to the labels once per frame
+        self.view = ViewModel(scheduler=glib_scheduler())
+        
+        # User actions run off the UI thread and report back here
+        self.actions = Dispatcher(glib_poster())
+        self.actions.listen(self.on_action_event)
+        self.action_clear_id = None
+        
+        # Privileged commands go through the root broker instead of sudo
+        self.broker = BrokerClient()
+        
+        # Live AirPlay / Google Cast sessions for the casting cards
+        self.casting = CastTelemetry()
+        self.casting.start()
+        
+        # Cards by widget, so the remote's select key can activate them
+        self.card_actions = {}
+        
+        # Home screen and, once prewarmed, the embedded player share the window
+        self.stack = Gtk.Stack()
+        self.add(self.stack)
+        self.player = None
+        self.player_stats_id = None
+        self.stream_url = 'http://'
+        
         # Main container
         self.main_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
-        self.add(self.main_box)
+        self.stack.add_named(self.main_box, 'home')
         
         # Top bar
         self.create_top_bar()
@@ -38,6 +74,10 @@ class SmartTVApp(Gtk.Window):
         self.content_box.set_margin_bottom(30)
         scrolled.add(self.content_box)
         
+        # Arrow keys and the phone remote move focus between cards
+        self.focus_engine = FocusEngine(self.content_box, scrolled.get_vadjustment())
+        self.connect("key-press-event", self.on_key_press)
+        
         # Add sections
         self.create_featured_section()
         self.create_casting_section()
@@ -45,12 +85,50 @@ class SmartTVApp(Gtk.Window):
         self.create_apps_section()
         self.create_system_section()
         
-        # Apply styling
-        self.apply_css()
+        # Apply styling, then measure frame times to pick the final profile
+        self.css_provider = Gtk.CssProvider()
+        Gtk.StyleContext.add_provider_for_screen(
+            Gdk.Screen.get_default(),
+            self.css_provider,
+            Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
+        )
+        self.render_profile = None
+        profile = forced_profile()
+        self.preferred_profile = profile or RICH
+        self.apply_css(self.preferred_profile)
+        if profile is None:
+            self.frame_sampler = FrameSampler()
+            self.add_tick_callback(self.on_calibration_tick)
+        
+        # Step down before the SoC throttles
+        self.thermal = ThermalGovernor()
+        self.thermal.listen(self.on_thermal_change)
+        
+        # Each status value is read at its own rate and only shown when it changes
+        self.collectors = CollectorScheduler([
+            clock('%H:%M'),
+            cpu_usage(CpuCollector(), interval=2.0),
+            thermal(self.thermal, name='temp', interval=5.0),
+            Collector('wifi', NetworkCollector().sample, interval=5.0, key=self.wifi_key),
+            Collector('airplay', lambda: self.casting.session('airplay'), interval=2.0, key=self.session_key),
+            Collector('cast', lambda: self.casting.session('cast'), interval=2.0, key=self.session_key),
+        ])
+        self.collectors.listen(self.update_status)
+        
+        # Run collectors when due while watched, back off when hidden or idle
+        self.poller = AdaptivePoller(self.collectors.run, fast=1, slow=120)
+        self.poller.attach_glib()
+        self.poller.watch_gtk(self)
+        
+        # Phone remote events from remote-control-server (/ws/input)
+        try:
+            self.remote_input = InputReceiver(self.on_remote_input)
+            self.remote_input.attach_glib()
+        except OSError as e:
+            print(f"Remote input unavailable: {e}")
         
-        # Update stats
-        GLib.timeout_add_seconds(5, self.update_status)
-        self.update_status()
+        # Load GStreamer after the first frame so it doesn't delay the home screen
+        GLib.idle_add(self.prewarm_player)
     
     def create_top_bar(self):
         """Create top navigation bar like Smart TV"""
@@ -78,6 +156,15 @@ class SmartTVApp(Gtk.Window):
         # Status info
         self.status_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=15)
         
+        # Last user action
+        self.action_label = Gtk.Label()
+        self.status_box.pack_start(self.action_label, False, False, 0)
+        
+        # Network link
+        self.wifi_indicator = Gtk.Label()
+        self.wifi_indicator.set_markup('<span size="large">📶</span>')
+        self.status_box.pack_start(self.wifi_indicator, False, False, 0)
+        
         # Time
         self.time_label = Gtk.Label()
         self.time_label.set_markup('<span size="large">⏰ 00:00</span>')
@@ -96,6 +183,18 @@ class SmartTVApp(Gtk.Window):
         top_bar.pack_start(self.status_box, False, False, 0)
         
         self.main_box.pack_start(top_bar, False, False, 0)
+        
+        self.view.add('time', lambda t: f'<span size="large">⏰ {t}</span>')
+        self.view.add('cpu', lambda v: f'<span size="large">💻 {v:.0f}%</span>', precision=0)
+        self.view.add('temp', lambda r: (
+            f'<span size="large">{"🔥" if r["level"] == "hot" else "🌡️"} '
+            f'{r["temperature"]:.0f}°C{" ⚠️" if r["level"] != "normal" else ""}</span>'
+        ))
+        self.view.add('wifi', lambda n: f'<span size="large">{self.describe_link(n)}</span>')
+        self.view.bind('wifi', self.wifi_indicator.set_markup)
+        self.view.bind('time', self.time_label.set_markup)
+        self.view.bind('cpu', self.cpu_indicator.set_markup)
+        self.view.bind('temp', self.temp_indicator.set_markup)
     
     def create_featured_section(self):
         """Create featured/hero section"""
@@ -138,14 +237,14 @@ class SmartTVApp(Gtk.Window):
         grid.set_selection_mode(Gtk.SelectionMode.NONE)
         
         casting_apps = [
-            ("📱 AirPlay", "Cast from iPhone/iPad/Mac", self.on_airplay_info),
-            ("📺 Google Cast", "Cast from Android/Chrome", self.on_cast_info),
-            ("🖥️ Miracast", "Wireless Display", self.on_miracast_info),
-            ("🎵 Audio Stream", "Stream Music & Audio", self.on_audio_info),
+            ("📱 AirPlay", "Cast from iPhone/iPad/Mac", self.on_airplay_info, 'airplay'),
+            ("📺 Google Cast", "Cast from Android/Chrome", self.on_cast_info, 'cast'),
+            ("🖥️ Miracast", "Wireless Display", self.on_miracast_info, None),
+            ("🎵 Audio Stream", "Stream Music & Audio", self.on_audio_info, None),
         ]
         
-        for app_name, app_desc, callback in casting_apps:
-            card = self.create_app_card(app_name, app_desc, callback)
+        for app_name, app_desc, callback, status in casting_apps:
+            card = self.create_app_card(app_name, app_desc, callback, status)
             grid.add(card)
         
         section_box.pack_start(grid, False, False, 0)
@@ -167,7 +266,7 @@ class SmartTVApp(Gtk.Window):
         grid.set_selection_mode(Gtk.SelectionMode.NONE)
         
         media_apps = [
-            ("🎥 VLC Player", "Play Videos & Music", self.on_launch_vlc),
+            ("🎥 Media Player", "Play Videos & Music", self.on_launch_media),
             ("🌐 YouTube", "Browse YouTube", self.on_launch_youtube),
             ("📺 Live TV", "IPTV Streaming", self.on_launch_iptv),
             ("🎵 Spotify Web", "Music Streaming", self.on_launch_spotify),
@@ -249,6 +348,7 @@ class SmartTVApp(Gtk.Window):
         event_box = Gtk.EventBox()
         event_box.connect("button-press-event", lambda w, e: callback())
         event_box.set_name("featured-card")
+        self.make_focusable(event_box, callback)
         
         card_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=15)
         card_box.set_margin_start(40)
@@ -267,13 +367,14 @@ class SmartTVApp(Gtk.Window):
         event_box.add(card_box)
         return event_box
     
-    def create_app_card(self, title, subtitle, callback):
-        """Create an app card tile"""
+    def create_app_card(self, title, subtitle, callback, status=None):
+        """Create an app card tile, optionally with a live status line bound to a view field"""
         event_box = Gtk.EventBox()
         event_box.connect("button-press-event", lambda w, e: callback())
         event_box.connect("enter-notify-event", self.on_card_hover)
         event_box.connect("leave-notify-event", self.on_card_leave)
         event_box.set_name("app-card")
+        self.make_focusable(event_box, callback)
         
         card_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
         card_box.set_size_request(250, 150)
@@ -296,20 +397,59 @@ class SmartTVApp(Gtk.Window):
         subtitle_label.set_max_width_chars(25)
         card_box.pack_start(subtitle_label, False, False, 0)
         
+        if status is not None:
+            status_label = Gtk.Label()
+            status_label.set_line_wrap(True)
+            status_label.set_max_width_chars(30)
+            card_box.pack_start(status_label, False, False, 0)
+            self.view.add(status, lambda s: f'<span size="small">{GLib.markup_escape_text(describe_session(s))}</span>')
+            self.view.bind(status, status_label.set_markup)
+            self.view.set(status, None)
+        
         event_box.add(card_box)
         return event_box
     
+    def make_focusable(self, card, callback):
+        """Let a card take keyboard/remote focus, highlighted like a hover"""
+        card.set_can_focus(True)
+        card.connect("focus-in-event", self.on_card_hover)
+        card.connect("focus-out-event", self.on_card_leave)
+        card.connect("key-press-event", self.on_card_key)
+        self.card_actions[card] = callback
+        self.focus_engine.add(card)
+    
+    ARROW_KEYS = {
+        Gdk.KEY_Up: 'up',
+        Gdk.KEY_Down: 'down',
+        Gdk.KEY_Left: 'left',
+        Gdk.KEY_Right: 'right',
+    }
+    
+    def on_key_press(self, widget, event):
+        if self.player_visible():
+            return self.on_player_key(event.keyval)
+        direction = self.ARROW_KEYS.get(event.keyval)
+        if direction is None:
+            return False
+        self.focus_engine.move(direction)
+        return True
+    
+    def on_card_key(self, widget, event):
+        if event.keyval in (Gdk.KEY_Return, Gdk.KEY_KP_Enter, Gdk.KEY_space):
+            self.card_actions[widget]()
+            return True
+        return False
+    
     def on_card_hover(self, widget, event):
         """Handle card hover effect"""
-        widget.set_name("app-card-hover")
+        widget.get_style_context().add_class("hover")
     
     def on_card_leave(self, widget, event):
         """Handle card leave effect"""
-        widget.set_name("app-card")
+        widget.get_style_context().remove_class("hover")
     
-    def apply_css(self):
-        """Apply Smart TV styling"""
-        css = b"""
+    # Full styling: gradients, shadows and transitions
+    RICH_CSS = b"""
         window {
             background: linear-gradient(135deg, #0f0c29, #302b63, #24243e);
         }
@@ -331,7 +471,11 @@ class SmartTVApp(Gtk.Window):
             transition: all 0.3s ease;
         }
         
-        #app-card-hover {
+        #featured-card.hover {
+            box-shadow: 0 0 0 4px #ffffff, 0 10px 40px rgba(0,0,0,0.5);
+        }
+        
+        #app-card.hover {
             background: rgba(255, 255, 255, 0.2);
             border: 2px solid #667eea;
             border-radius: 15px;
@@ -351,41 +495,136 @@ class SmartTVApp(Gtk.Window):
         button:hover {
             background: rgba(118, 75, 162, 0.9);
         }
-        """
         
-        css_provider = Gtk.CssProvider()
-        css_provider.load_from_data(css)
-        screen = Gdk.Screen.get_default()
-        style_context = Gtk.StyleContext()
-        style_context.add_provider_for_screen(
-            screen,
-            css_provider,
-            Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
-        )
+        #player-stats {
+            background: rgba(0, 0, 0, 0.6);
+            border-radius: 10px;
+            padding: 15px;
+            font-family: monospace;
+        }
+        """
     
-    def update_status(self):
-        """Update status indicators"""
-        try:
-            # Time
-            current_time = datetime.now().strftime("%H:%M")
-            self.time_label.set_markup(f'<span size="large">⏰ {current_time}</span>')
-            
-            # CPU
-            cpu = psutil.cpu_percent(interval=0.1)
-            self.cpu_indicator.set_markup(f'<span size="large">💻 {cpu:.0f}%</span>')
-            
-            # Temperature
-            try:
-                with open('/sys/class/thermal/thermal_zone0/temp', 'r') as f:
-                    temp = int(f.read()) / 1000
-                self.temp_indicator.set_markup(f'<span size="large">🌡️ {temp:.0f}°C</span>')
-            except:
-                pass
-                
-        except Exception as e:
-            print(f"Error updating status: {e}")
+    # Low-power styling: flat opaque colours, no shadows or transitions
+    LEAN_CSS = b"""
+        window {
+            background: #1d1a45;
+        }
         
-        return True
+        label {
+            color: #ffffff;
+        }
+        
+        #featured-card {
+            background: #6c63c7;
+            border-radius: 20px;
+        }
+        
+        #app-card {
+            background: #34315a;
+            border: 2px solid #4a4770;
+            border-radius: 15px;
+        }
+        
+        #featured-card.hover {
+            background: #7d75d8;
+        }
+        
+        #app-card.hover {
+            background: #403d68;
+            border-color: #667eea;
+        }
+        
+        button {
+            background: #667eea;
+            color: #ffffff;
+            border: none;
+            border-radius: 10px;
+            padding: 15px 30px;
+            font-weight: bold;
+            font-size: 16px;
+        }
+        
+        button:hover {
+            background: #764ba2;
+        }
+        
+        #player-stats {
+            background: #000000;
+            padding: 15px;
+            font-family: monospace;
+        }
+        """
+    
+    def apply_css(self, profile=RICH):
+        """Apply Smart TV styling for the given render profile"""
+        if profile == self.render_profile:
+            return
+        self.render_profile = profile
+        self.css_provider.load_from_data(self.LEAN_CSS if profile == LEAN else self.RICH_CSS)
+        # Lean profile: jump to the focused card instead of easing
+        self.focus_engine.animate = profile != LEAN
+    
+    def on_calibration_tick(self, widget, frame_clock):
+        """Sample frame times after startup, then settle on a profile"""
+        if self.frame_sampler.add(frame_clock.get_frame_time() / 1000000.0):
+            # Keep repainting the whole window so the samples reflect the styling cost
+            self.queue_draw()
+            return GLib.SOURCE_CONTINUE
+        
+        self.preferred_profile = self.frame_sampler.choose()
+        print(f"Render profile: {self.preferred_profile} ({self.frame_sampler.summary()})")
+        if self.thermal.level == NORMAL:
+            self.apply_css(self.preferred_profile)
+        return GLib.SOURCE_REMOVE
+    
+    def on_thermal_change(self, level, previous):
+        """Shed load while the SoC is warm, restore it once it cools down"""
+        self.apply_css(LEAN if level >= WARM else self.preferred_profile)
+        
+        # Sample less often while hot
+        self.poller.set_scale(self.thermal.interval_scale())
+        
+        if level == HOT:
+            self.actions.call("Lowering background priority", self.broker.background_priority, 'low')
+        elif previous == HOT:
+            self.actions.call("Restoring background priority", self.broker.background_priority, 'normal')
+    
+    def update_status(self, changes):
+        """Update status indicators with the values that changed"""
+        for name, value in changes.items():
+            if name == 'temp' and value['temperature'] is None:
+                continue
+            self.view.set(name, value)
+        if 'wifi' in changes:
+            warning = changes['wifi']['warning']
+            if warning and warning != self.wifi_indicator.get_tooltip_text():
+                print(f"Network: {warning}")
+            self.wifi_indicator.set_tooltip_text(warning)
+    
+    def wifi_key(self, network):
+        """Only what the indicator shows counts as a change"""
+        primary = network['primary']
+        stats = network['interfaces'].get(primary) if primary else None
+        wifi = stats and stats['wireless']
+        return primary, network['online'], wifi and wifi['bars'], wifi and wifi['signal'], network['warning']
+    
+    def session_key(self, session):
+        """Redraw a casting card for what it shows, not for every sample"""
+        if session is None:
+            return None
+        return (session['client'], session['state'], session['codec'], session['bitrate'],
+                session['sync_error_ms'], session['underruns'], session['errors'],
+                session['artist'], session['title'], int(session['duration'] // 60))
+    
+    def describe_link(self, network):
+        primary = network['primary']
+        if not network['online']:
+            return "📵"
+        wifi = network['interfaces'][primary]['wireless']
+        if wifi is None:
+            return "🔌"
+        bars = "▂▄▆█"[:wifi['bars']].ljust(4, "·")
+        return f"📶 {bars} {wifi['signal']} dBm{' ⚠️' if network['warning'] else ''}"
     
     # Callback functions
     def on_open_casting_info(self):
@@ -399,12 +638,22 @@ class SmartTVApp(Gtk.Window):
         self.show_info_dialog("AirPlay Receiver",
             "Cast from your iPhone, iPad, or Mac\n\n" +
             "Device name: Raspberry Pi Custom OS\n" +
-            "Status: Active and ready")
+            f"Status: {describe_session(self.casting.session('airplay'))}" +
+            self.recent_sessions('airplay'))
     
     def on_cast_info(self):
         self.show_info_dialog("Google Cast",
             "Cast from Android devices or Chrome browser\n\n" +
-            "Look for this device in your Cast menu")
+            "Look for 'Raspberry Pi Custom OS' in YouTube's Cast menu\n" +
+            f"Status: {describe_session(self.casting.session('cast'))}" +
+            self.recent_sessions('cast'))
+    
+    def recent_sessions(self, protocol, n=3):
+        """The last few finished sessions for an info dialog"""
+        history = [s for s in self.casting.snapshot()['history'] if s['protocol'] == protocol][-n:]
+        if not history:
+            return ""
+        return "\n\nRecent sessions:\n" + "\n".join(describe_session(s) for s in reversed(history))
     
     def on_miracast_info(self):
         self.show_info_dialog("Miracast",
@@ -416,47 +665,165 @@ class SmartTVApp(Gtk.Window):
             "Stream music and audio to your Pi\n\n" +
             "Supports AirPlay audio and Bluetooth")
     
-    def on_launch_vlc(self):
-        subprocess.Popen(['vlc'])
+    def on_launch_media(self):
+        if self.player is None:
+            self.launch(['vlc'])
+            return
+        dialog = Gtk.FileChooserDialog(title="Play a video or song", transient_for=self,
+                                       action=Gtk.FileChooserAction.OPEN)
+        dialog.add_buttons("_Cancel", Gtk.ResponseType.CANCEL, "_Play", Gtk.ResponseType.OK)
+        videos = os.path.expanduser('~/Videos')
+        dialog.set_current_folder(videos if os.path.isdir(videos) else os.path.expanduser('~'))
+        media = Gtk.FileFilter()
+        media.set_name("Videos and music")
+        media.add_mime_type('video/*')
+        media.add_mime_type('audio/*')
+        dialog.add_filter(media)
+        dialog.connect("response", self.on_media_chosen)
+        dialog.show()
+    
+    def on_media_chosen(self, dialog, response):
+        uri = dialog.get_uri() if response == Gtk.ResponseType.OK else None
+        dialog.destroy()
+        if uri:
+            self.play_media(uri)
     
     def on_launch_youtube(self):
-        subprocess.Popen(['chromium-browser', '--app=https://www.youtube.com/tv'])
+        self.launch(['chromium-browser', '--app=https://www.youtube.com/tv'])
     
     def on_launch_iptv(self):
-        subprocess.Popen(['vlc', 'http://'])
+        dialog = Gtk.MessageDialog(
+            transient_for=self,
+            flags=0,
+            message_type=Gtk.MessageType.QUESTION,
+            buttons=Gtk.ButtonsType.OK_CANCEL,
+            text="Live TV"
+        )
+        dialog.format_secondary_text("Stream address:")
+        entry = Gtk.Entry()
+        entry.set_text(self.stream_url)
+        entry.set_activates_default(True)
+        dialog.get_message_area().pack_start(entry, False, False, 0)
+        entry.show()
+        dialog.set_default_response(Gtk.ResponseType.OK)
+        dialog.connect("response", self.on_stream_chosen, entry)
+        dialog.show()
+    
+    def on_stream_chosen(self, dialog, response, entry):
+        url = entry.get_text().strip()
+        dialog.destroy()
+        if response == Gtk.ResponseType.OK and '://' in url:
+            self.stream_url = url
+            self.play_media(url)
+    
+    def prewarm_player(self):
+        """Build the player view and take its pipeline to READY"""
+        Gst = load_gst()
+        sink, stats_sink, widget = video_sink(Gst) if Gst is not None else (None, None, None)
+        if sink is None:
+            print("GStreamer video sink unavailable, media opens in VLC")
+            return False
+        try:
+            self.player = Player(Gst, sink, stats_sink, on_error=self.on_player_error, on_eos=self.close_player)
+        except OSError as e:
+            print(f"Embedded player unavailable: {e}")
+            return False
+        overlay = Gtk.Overlay()
+        overlay.add(widget)
+        self.player_stats = Gtk.Label()
+        self.player_stats.set_name("player-stats")
+        self.player_stats.set_halign(Gtk.Align.START)
+        self.player_stats.set_valign(Gtk.Align.START)
+        self.player_stats.set_margin_start(40)
+        self.player_stats.set_margin_top(40)
+        overlay.add_overlay(self.player_stats)
+        overlay.show_all()
+        self.stack.add_named(overlay, 'player')
+        return False
+    
+    def player_visible(self):
+        return self.stack.get_visible_child_name() == 'player'
+    
+    def play_media(self, uri):
+        """Play in the embedded player, or hand the URI to VLC without one"""
+        if self.player is None:
+            self.launch(['vlc', uri])
+            return
+        self.player.play(uri)
+        self.player_stats.set_text("")
+        self.stack.set_visible_child_name('player')
+        if self.player_stats_id is None:
+            self.player_stats_id = GLib.timeout_add(500, self.update_player_stats)
+    
+    def update_player_stats(self):
+        if not self.player_visible():
+            self.player_stats_id = None
+            return False
+        self.player_stats.set_text(describe_stats(self.player.summary()))
+        return True
+    
+    def close_player(self):
+        self.player.stop()
+        self.stack.set_visible_child_name('home')
+    
+    def on_player_error(self, message):
+        self.close_player()
+        self.show_info_dialog("Playback failed", message)
+    
+    def on_player_key(self, keyval):
+        if keyval in (Gdk.KEY_Escape, Gdk.KEY_BackSpace):
+            self.close_player()
+        elif keyval in (Gdk.KEY_space, Gdk.KEY_Return, Gdk.KEY_KP_Enter):
+            self.player.toggle_pause()
+        elif keyval == Gdk.KEY_Left:
+            self.player.seek(-SEEK_STEP)
+        elif keyval == Gdk.KEY_Right:
+            self.player.seek(SEEK_STEP)
+        else:
+            return False
+        return True
     
     def on_launch_spotify(self):
-        subprocess.Popen(['chromium-browser', '--app=https://open.spotify.com'])
+        self.launch(['chromium-browser', '--app=https://open.spotify.com'])
     
     def on_launch_radio(self):
-        subprocess.Popen(['chromium-browser', '--app=https://radio.garden'])
+        self.launch(['chromium-browser', '--app=https://radio.garden'])
     
     def on_launch_plex(self):
-        subprocess.Popen(['chromium-browser', '--app=https://app.plex.tv'])
+        self.launch(['chromium-browser', '--app=https://app.plex.tv'])
     
     def on_launch_twitch(self):
-        subprocess.Popen(['chromium-browser', '--app=https://www.twitch.tv'])
+        self.launch(['chromium-browser', '--app=https://www.twitch.tv'])
     
     def on_launch_gaming(self):
-        subprocess.Popen(['chromium-browser', '--app=https://play.geforcenow.com'])
+        self.launch(['chromium-browser', '--app=https://play.geforcenow.com'])
     
     def on_launch_browser(self):
-        subprocess.Popen(['chromium-browser'])
+        self.launch(['chromium-browser'])
     
     def on_launch_files(self):
-        subprocess.Popen(['pcmanfm'])
+        self.launch(['pcmanfm'])
     
     def on_launch_terminal(self):
-        subprocess.Popen(['lxterminal'])
+        self.launch(['lxterminal'])
     
     def on_launch_dashboard(self):
-        subprocess.Popen(['chromium-browser', 'http://localhost:8080'])
+        self.launch(['chromium-browser', 'http://localhost:8080'])
     
     def on_system_info(self):
-        cpu = psutil.cpu_percent()
-        mem = psutil.virtual_memory().percent
-        disk = psutil.disk_usage('/').percent
-        
+        self.actions.call("Reading system info", self.sample_system_info,
+                          timeout=10, on_done=self.show_system_info)
+    
+    def sample_system_info(self):
+        """Sample system stats (runs on a worker thread)"""
+        return (
+            psutil.cpu_percent(interval=0.5),
+            psutil.virtual_memory().percent,
+            psutil.disk_usage('/').percent,
+        )
+    
+    def show_system_info(self, stats):
+        cpu, mem, disk = stats
         self.show_info_dialog("System Information",
             f"CPU Usage: {cpu:.1f}%\n" +
             f"Memory Usage: {mem:.1f}%\n" +
@@ -465,10 +832,10 @@ class SmartTVApp(Gtk.Window):
             f"User: pi")
     
     def on_network_settings(self):
-        subprocess.Popen(['lxterminal', '-e', 'nmtui'])
+        self.launch(['lxterminal', '-e', 'nmtui'])
     
     def on_audio_settings(self):
-        subprocess.Popen(['pavucontrol'])
+        self.launch(['pavucontrol'])
     
     def on_display_settings(self):
         self.show_info_dialog("Display Settings",
@@ -488,13 +855,15 @@ class SmartTVApp(Gtk.Window):
         dialog.add_button("Shutdown", 2)
         dialog.add_button("Cancel", Gtk.ResponseType.CANCEL)
         
-        response = dialog.run()
+        dialog.connect("response", self.on_power_response)
+        dialog.show()
+    
+    def on_power_response(self, dialog, response):
+        dialog.destroy()
         if response == 1:
-            subprocess.run(['sudo', 'reboot'])
+            self.actions.call("Restarting", self.broker.reboot, timeout=30)
         elif response == 2:
-            subprocess.run(['sudo', 'shutdown', '-h', 'now'])
-        
-        dialog.destroy()
+            self.actions.call("Shutting down", self.broker.shutdown, timeout=30)
     
     def on_about(self):
         self.show_info_dialog("About Raspberry Pi Smart TV",
@@ -509,6 +878,56 @@ class SmartTVApp(Gtk.Window):
             "Default credentials:\n" +
             "User: pi | Password: raspberry")
     
+    REMOTE_DIRECTIONS = {
+        'up': Gtk.DirectionType.UP,
+        'down': Gtk.DirectionType.DOWN,
+        'left': Gtk.DirectionType.LEFT,
+        'right': Gtk.DirectionType.RIGHT,
+    }
+    
+    def on_remote_input(self, event):
+        """Apply a (coalesced) phone remote event; runs on the main loop"""
+        # Someone is using the TV even though no key reached the window
+        self.poller.input()
+        # An open dialog takes the keys first
+        dialog = next((w for w in Gtk.Window.list_toplevels()
+                       if isinstance(w, Gtk.Dialog) and w.get_visible()), None)
+        window = dialog or self
+        if event['type'] == 'text':
+            focus = window.get_focus()
+            if isinstance(focus, Gtk.Entry):
+                focus.emit("insert-at-cursor", event['text'])
+            return
+        key = event['key']
+        if dialog is None and self.player_visible():
+            if key in ('left', 'right'):
+                self.player.seek(SEEK_STEP * event['count'] * (1 if key == 'right' else -1))
+            elif key == 'select':
+                self.player.toggle_pause()
+            elif key in ('back', 'home'):
+                self.close_player()
+            return
+        if key in self.REMOTE_DIRECTIONS:
+            # Repeats that piled up while we were busy move in one go
+            if dialog is None:
+                self.focus_engine.move(key, event['count'])
+            else:
+                for _ in range(event['count']):
+                    dialog.child_focus(self.REMOTE_DIRECTIONS[key])
+        elif key == 'select':
+            focus = window.get_focus()
+            if focus in self.card_actions:
+                self.card_actions[focus]()
+            else:
+                window.activate_focus()
+        elif key == 'back':
+            if dialog is not None:
+                dialog.response(Gtk.ResponseType.DELETE_EVENT)
+        elif key == 'home':
+            if dialog is None:
+                self.set_focus(None)
+                self.focus_engine.move('up')
+    
     def show_info_dialog(self, title, message):
         """Show an information dialog"""
         dialog = Gtk.MessageDialog(
@@ -519,11 +938,32 @@ class SmartTVApp(Gtk.Window):
             text=title
         )
         dialog.format_secondary_text(message)
-        dialog.run()
-        dialog.destroy()
+        dialog.connect("response", lambda d, r: d.destroy())
+        dialog.show()
+    
+    def launch(self, argv):
+        """Start an application without blocking the UI"""
+        self.actions.spawn(f"Starting {argv[0]}", argv)
+    
+    def on_action_event(self, action):
+        """Show action progress in the top bar"""
+        self.action_label.set_markup(f'<span size="large">{GLib.markup_escape_text(describe(action))}</span>')
+        if self.action_clear_id is not None:
+            GLib.source_remove(self.action_clear_id)
+            self.action_clear_id = None
+        if action.state in FINISHED:
+            self.action_clear_id = GLib.timeout_add_seconds(4, self.clear_action_label)
+    
+    def clear_action_label(self):
+        self.action_label.set_text("")
+        self.action_clear_id = None
+        return False
 
 def main():
     win = SmartTVApp()
+    win.connect("destroy", lambda w: w.actions.shutdown())
+    win.connect("destroy", lambda w: w.player and w.player.shutdown())
+    win.connect("destroy", lambda w: print(f"Status polling: {w.poller.summary()}"))
     win.connect("destroy", Gtk.main_quit)
     win.connect("key-press-event", lambda w, e: w.unfullscreen() if e.keyval == Gdk.KEY_F11 else None)
     win.show_all()
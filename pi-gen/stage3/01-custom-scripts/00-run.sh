@@ -7,8 +7,6 @@ mkdir -p /home/pi/.config/autostart
 
 # Install scripts
 install -m 755 /tmp/stage3-files/raspberry-pi-gui.py /usr/local/bin/
-install -m 755 /tmp/stage3-files/airplay-service /usr/local/bin/
-install -m 755 /tmp/stage3-files/google-cast-service /usr/local/bin/
 install -m 755 /tmp/stage3-files/remote-control-server /usr/local/bin/
 
 # Create autostart desktop entry for GUI
@@ -52,9 +50,12 @@ Description=AirPlay Receiver
 After=network.target
 
 [Service]
-Type=forking
-ExecStart=/usr/local/bin/airplay-service start
-ExecStop=/usr/local/bin/airplay-service stop
+# pitv.supervisor runs shairport-sync, probes it and restarts it with backoff
+Type=notify
+ExecStart=/usr/bin/python3 -m pitv.supervisor airplay
+ExecReload=/bin/kill -HUP \$MAINPID
+RuntimeDirectory=pitv-airplay
+SyslogIdentifier=shairport-sync
 Restart=always
 
 [Install]
@@ -67,14 +68,43 @@ Description=Google Cast Receiver
 After=network.target
 
 [Service]
-Type=forking
-ExecStart=/usr/local/bin/google-cast-service start
-ExecStop=/usr/local/bin/google-cast-service stop
+# Started by google-cast.socket; exits after 10 idle minutes
+Type=notify
+ExecStart=/usr/bin/python3 -m pitv.supervisor google-cast
+ExecReload=/bin/kill -HUP \$MAINPID
+RuntimeDirectory=pitv-google-cast
+SyslogIdentifier=google-cast
+Restart=on-failure
+# DIAL launches YouTube TV on the desktop session
+User=pi
+Environment=DISPLAY=:0 XAUTHORITY=/home/pi/.Xauthority
+CAST
+
+cat > /etc/systemd/system/google-cast.socket << 'CASTSOCKET'
+[Unit]
+Description=Google Cast Receiver socket
+
+[Socket]
+ListenStream=0.0.0.0:8008
+
+[Install]
+WantedBy=sockets.target
+CASTSOCKET
+
+cat > /etc/systemd/system/pitv-ssdp.service << 'SSDP'
+[Unit]
+Description=SSDP discovery for the DIAL (YouTube) receiver
+After=network.target
+
+[Service]
+Type=simple
+ExecStart=/usr/bin/python3 -m pitv.ssdp
 Restart=always
+User=pi
 
 [Install]
 WantedBy=multi-user.target
-CAST
+SSDP
 
 cat > /etc/systemd/system/remote-control.service << 'REMOTE'
 [Unit]
@@ -82,19 +112,100 @@ Description=Remote Control Web Server
 After=network.target
 
 [Service]
+# Started by remote-control.socket; exits after 5 idle minutes
 Type=simple
-ExecStart=/usr/bin/python3 /usr/local/bin/remote-control-server
-Restart=always
+ExecStart=/usr/bin/python3 /usr/local/bin/remote-control-server --idle-timeout 300
+Restart=on-failure
+User=pi
+# For the /api/screen preview
+Environment=DISPLAY=:0 XAUTHORITY=/home/pi/.Xauthority
+REMOTE
+
+cat > /etc/systemd/system/remote-control.socket << 'REMOTESOCKET'
+[Unit]
+Description=Remote Control Web Server socket
+
+[Socket]
+ListenStream=0.0.0.0:8080
+
+[Install]
+WantedBy=sockets.target
+REMOTESOCKET
+
+# Not enabled by default: turn it on for the one Pi that watches the others
+cat > /etc/systemd/system/pitv-fleet-hub.service << 'FLEETHUB'
+[Unit]
+Description=Fleet hub: aggregated status of all Pi TVs
+After=network-online.target
+Wants=network-online.target
+
+[Service]
+Type=simple
+# Devices from /etc/pitv/fleet.conf ([name] host[:port] per line) plus SSDP discovery
+ExecStart=/usr/bin/python3 -m pitv.fleet --config /etc/pitv/fleet.conf --discover --port 8090
+Restart=on-failure
 User=pi
 
 [Install]
 WantedBy=multi-user.target
-REMOTE
+FLEETHUB
+
+cat > /etc/systemd/system/pitv-broker.service << 'BROKER'
+[Unit]
+Description=Privileged command broker for the GUIs
+After=local-fs.target
+
+[Service]
+Type=simple
+ExecStart=/usr/bin/python3 -m pitv.broker --allow-user pi
+Restart=always
+
+[Install]
+WantedBy=multi-user.target
+BROKER
+
+cat > /etc/systemd/system/pitv-profiles.service << 'PROFILES'
+[Unit]
+Description=Activity-based CPU governor and IRQ affinity profiles
+After=local-fs.target
+
+[Service]
+Type=simple
+ExecStart=/usr/bin/python3 -m pitv.profiles
+Restart=always
+
+[Install]
+WantedBy=multi-user.target
+PROFILES
+
+# Directory-size index for /api/storage/usage. Long-lived so it sees every
+# change, and root so its inotify watches don't come out of pi's allowance
+cat > /etc/systemd/system/pitv-diskusage.service << 'DISKUSAGE'
+[Unit]
+Description=Directory-size index for the storage analyzer
+After=local-fs.target
+
+[Service]
+Type=simple
+ExecStart=/usr/bin/python3 -m pitv.diskusage --serve /
+CacheDirectory=pitv
+CacheDirectoryMode=0755
+Nice=19
+IOSchedulingClass=idle
+Restart=on-failure
+
+[Install]
+WantedBy=multi-user.target
+DISKUSAGE
 
 # Enable services
 systemctl enable airplay.service
-systemctl enable google-cast.service
-systemctl enable remote-control.service
+systemctl enable pitv-broker.service
+systemctl enable pitv-profiles.service
+systemctl enable pitv-diskusage.service
+systemctl enable google-cast.socket
+systemctl enable pitv-ssdp.service
+systemctl enable remote-control.socket
 
 # Configure Samba
 cat >> /etc/samba/smb.conf << 'SAMBA'
@@ -115,3 +226,14 @@ EOFCHROOT
 # Copy files to a temporary location in the image
 install -d "${ROOTFS_DIR}/tmp/stage3-files"
 install -m 644 files/* "${ROOTFS_DIR}/tmp/stage3-files/"
+
+# Install the shared Python package used by the GUIs and the web server
+install -d "${ROOTFS_DIR}/usr/lib/python3/dist-packages/pitv"
+install -m 644 "${BASE_DIR}/../overlays/usr/lib/python3/dist-packages/pitv/"*.py \
+    "${ROOTFS_DIR}/usr/lib/python3/dist-packages/pitv/"
+
+# /usr/lib/python3/dist-packages is on sys.path for every Debian python3;
+# fail the build here rather than ship GUIs that can't import it
+on_chroot << 'EOFCHECK'
+python3 -c "import pitv; print('pitv installed at', pitv.__path__[0])"
+EOFCHECK
@@ -7,15 +7,22 @@ Professional interface with PyQt5
 import sys
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QLabel, QFrame, QPushButton, QGridLayout)
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont, QPalette, QColor
-import psutil
 import socket
 from datetime import datetime
+from pitv.viewmodel import ViewModel, qt_scheduler
+from pitv.polling import AdaptivePoller
+from pitv.cpu import CpuCollector
+from pitv.collectors import (Collector, CollectorScheduler, clock, cpu_usage, memory_usage,
+                             disk_usage, temperature, uptime, hostname, ip_address)
+from pitv.cgroups import CgroupMonitor, describe_usage
+from pitv.blockio import BlockCollector, describe_device
 
 class ServiceWidget(QFrame):
-    def __init__(self, name, parent=None):
+    def __init__(self, name, unit=None, parent=None):
         super().__init__(parent)
+        self.unit = unit
         self.setFrameStyle(QFrame.StyledPanel | QFrame.Raised)
         self.setStyleSheet("""
             QFrame {
@@ -45,6 +52,13 @@ class ServiceWidget(QFrame):
         layout.addWidget(self.status)
         
         self.setLayout(layout)
+    
+    def set_usage(self, text):
+        """Show the unit's cgroup usage, or that it is stopped"""
+        color = "#e74c3c" if text == "stopped" else "#27ae60"
+        self.indicator.setStyleSheet(f"color: {color}; font-size: 20px;")
+        self.status.setStyleSheet(f"color: {color}; font-size: 12px;")
+        self.status.setText({'stopped': "Stopped", 'running': "Running"}.get(text, text))
 
 class StatWidget(QFrame):
     def __init__(self, label, value, parent=None):
@@ -80,10 +94,26 @@ class RaspberryPiDashboard(QMainWindow):
         super().__init__()
         self.init_ui()
         
-        # Setup update timer
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_stats)
-        self.timer.start(2000)  # Update every 2 seconds
+        # Each stat is read at its own rate and only displayed when it changes
+        self.collectors = CollectorScheduler([
+            cpu_usage(CpuCollector(), interval=2.0),
+            memory_usage(),
+            disk_usage(),
+            temperature(),
+            clock(),
+            uptime(),
+            hostname(),
+            ip_address(),
+            Collector('storage', BlockCollector().sample, interval=5.0,
+                      key=lambda devices: tuple(describe_device(n, d) for n, d in devices.items())),
+        ])
+        self.add_service_collectors()
+        self.collectors.listen(self.view.update)
+        
+        # Run collectors when due while watched, less often when hidden or idle
+        self.poller = AdaptivePoller(self.collectors.run, fast=1, slow=60)
+        self.poller.attach_qt()
+        self.poller.watch_qt(self)
     
     def init_ui(self):
         self.setWindowTitle("🍓 Raspberry Pi 3B Custom OS")
@@ -163,8 +193,32 @@ class RaspberryPiDashboard(QMainWindow):
         
         central_widget.setLayout(main_layout)
         
-        # Initial update
-        self.update_stats()
+        # Displayed values, applied to the widgets once per frame
+        self.create_view()
+    
+    def create_view(self):
+        self.view = ViewModel(scheduler=qt_scheduler())
+        
+        self.view.add('cpu', lambda v: f"{v:.1f}%", precision=1)
+        self.view.add('memory', lambda v: f"{v:.1f}%", precision=1)
+        self.view.add('disk', lambda v: f"{v:.1f}%", precision=1)
+        self.view.add('temp', lambda t: f"{t:.1f}°C" if t is not None else "N/A")
+        self.view.add('time', str)
+        self.view.add('uptime', self.format_uptime)
+        self.view.add('hostname', str)
+        self.view.add('ip', lambda ip: ip or "Not connected")
+        self.view.add('storage', lambda devices: "\n".join(
+            describe_device(name, device) for name, device in devices.items()) or "No disks")
+        
+        self.view.bind('cpu', self.cpu_stat.update_value)
+        self.view.bind('memory', self.memory_stat.update_value)
+        self.view.bind('disk', self.disk_stat.update_value)
+        self.view.bind('temp', self.temp_stat.update_value)
+        self.view.bind('time', self.time_label.setText)
+        self.view.bind('uptime', self.uptime_label.setText)
+        self.view.bind('hostname', self.hostname_label.setText)
+        self.view.bind('ip', self.ip_label.setText)
+        self.view.bind('storage', self.storage_label.setText)
     
     def create_header(self):
         header = QFrame()
@@ -211,13 +265,13 @@ class RaspberryPiDashboard(QMainWindow):
         
         # IP Address
         layout.addWidget(QLabel("IP Address:"), 0, 2)
-        self.ip_label = QLabel(self.get_ip())
+        self.ip_label = QLabel("...")
         self.ip_label.setStyleSheet("color: white; font-weight: bold;")
         layout.addWidget(self.ip_label, 0, 3)
         
         # Uptime
         layout.addWidget(QLabel("Uptime:"), 1, 0)
-        self.uptime_label = QLabel(self.get_uptime())
+        self.uptime_label = QLabel("...")
         self.uptime_label.setStyleSheet("color: white; font-weight: bold;")
         layout.addWidget(self.uptime_label, 1, 1)
         
@@ -227,6 +281,14 @@ class RaspberryPiDashboard(QMainWindow):
         self.time_label.setStyleSheet("color: white; font-weight: bold;")
         layout.addWidget(self.time_label, 1, 3)
         
+        # Storage I/O
+        storage_caption = QLabel("Storage:")
+        storage_caption.setStyleSheet("color: #bdc3c7; font-size: 12px;")
+        layout.addWidget(storage_caption, 2, 0)
+        self.storage_label = QLabel("...")
+        self.storage_label.setStyleSheet("color: white; font-weight: bold;")
+        layout.addWidget(self.storage_label, 2, 1, 1, 3)
+        
         for i in range(4):
             label = layout.itemAtPosition(0, i).widget() if i < 2 else layout.itemAtPosition(1, i-2).widget()
             if label and isinstance(label, QLabel) and label.text().endswith(':'):
@@ -253,18 +315,21 @@ class RaspberryPiDashboard(QMainWindow):
         
         services_layout = QGridLayout()
         services = [
-            "AirPlay Receiver",
-            "Google Cast",
-            "WiFi Security Tools",
-            "Remote Control Server",
-            "File Server (Samba)",
-            "GUI Dashboard"
+            ("AirPlay Receiver", 'airplay'),
+            ("Google Cast", 'google-cast'),
+            ("WiFi Security Tools", None),
+            ("Remote Control Server", 'remote-control'),
+            ("File Server (Samba)", 'smbd'),
+            ("GUI Dashboard", None)
         ]
         
-        for i, service in enumerate(services):
+        self.service_widgets = []
+        for i, (service, unit) in enumerate(services):
             row = i // 2
             col = i % 2
-            services_layout.addWidget(ServiceWidget(service), row, col)
+            widget = ServiceWidget(service, unit)
+            self.service_widgets.append(widget)
+            services_layout.addWidget(widget, row, col)
         
         layout.addLayout(services_layout)
         frame.setLayout(layout)
@@ -307,59 +372,24 @@ class RaspberryPiDashboard(QMainWindow):
         frame.setLayout(layout)
         return frame
     
-    def get_ip(self):
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-            return ip
-        except:
-            return "Not connected"
-    
-    def get_uptime(self):
-        try:
-            with open('/proc/uptime', 'r') as f:
-                uptime_seconds = float(f.readline().split()[0])
-                hours = int(uptime_seconds // 3600)
-                minutes = int((uptime_seconds % 3600) // 60)
-                return f"{hours}h {minutes}m"
-        except:
-            return "Unknown"
-    
-    def get_temperature(self):
-        try:
-            with open('/sys/class/thermal/thermal_zone0/temp', 'r') as f:
-                temp = float(f.read()) / 1000.0
-                return f"{temp:.1f}°C"
-        except:
-            return "N/A"
+    def add_service_collectors(self):
+        """Per-unit cgroup usage every 5 seconds, if the system uses cgroup v2"""
+        self.cgroups = CgroupMonitor([w.unit for w in self.service_widgets if w.unit])
+        if not self.cgroups.available:
+            return
+        for widget in self.service_widgets:
+            if widget.unit is None:
+                continue
+            name = f'service:{widget.unit}'
+            self.view.add(name, describe_usage)
+            self.view.bind(name, widget.set_usage)
+            self.collectors.add(Collector(name, lambda unit=widget.unit: self.cgroups.sample_unit(unit),
+                                          interval=5.0, key=describe_usage))
     
-    def update_stats(self):
-        try:
-            # Update CPU
-            cpu = psutil.cpu_percent(interval=0.1)
-            self.cpu_stat.update_value(f"{cpu:.1f}%")
-            
-            # Update Memory
-            memory = psutil.virtual_memory().percent
-            self.memory_stat.update_value(f"{memory:.1f}%")
-            
-            # Update Disk
-            disk = psutil.disk_usage('/').percent
-            self.disk_stat.update_value(f"{disk:.1f}%")
-            
-            # Update Temperature
-            temp = self.get_temperature()
-            self.temp_stat.update_value(temp)
-            
-            # Update time
-            self.time_label.setText(datetime.now().strftime("%H:%M:%S"))
-            
-            # Update uptime
-            self.uptime_label.setText(self.get_uptime())
-        except Exception as e:
-            print(f"Error updating stats: {e}")
+    def format_uptime(self, seconds):
+        hours = int(seconds // 3600)
+        minutes = int((seconds % 3600) // 60)
+        return f"{hours}h {minutes}m"
     
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_Escape:
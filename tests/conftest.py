@@ -0,0 +1,92 @@
+"""
+Tests for the shared pitv package, run against fake /proc, sysfs and
+cgroupfs trees, loopback sockets and stand-in servers
+
+Run with:  python3 -m pytest tests
+"""
+
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+# The package lives in the overlay tree, at the path it is installed to
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'overlays', 'usr', 'lib', 'python3', 'dist-packages'))
+
+
+class UpgradeServer:
+    """Loopback stand-in for werkzeug handing a request's socket to serve_wsgi
+
+    Each connection's request headers become a WSGI environ with
+    'werkzeug.socket'; `serve(environ)` runs on its own thread, and a
+    request it declines gets a 400 like the Flask views return.
+    """
+
+    def __init__(self, serve):
+        self.serve = serve
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.port = self.listener.getsockname()[1]
+        self.threads = []
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def url(self, path):
+        return f'ws://127.0.0.1:{self.port}{path}'
+
+    def accept(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            thread = threading.Thread(target=self.handle, args=(conn,), daemon=True)
+            self.threads.append(thread)
+            thread.start()
+
+    def handle(self, conn):
+        head = b''
+        while b'\r\n\r\n' not in head:
+            chunk = conn.recv(1024)
+            if not chunk:
+                conn.close()
+                return
+            head += chunk
+        lines = head.partition(b'\r\n\r\n')[0].decode().split('\r\n')
+        environ = {'werkzeug.socket': conn, 'REQUEST_METHOD': lines[0].split()[0]}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            environ['HTTP_' + name.strip().upper().replace('-', '_')] = value.strip()
+        try:
+            if not self.serve(environ):
+                conn.sendall(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+        finally:
+            conn.close()
+
+    def handshake(self, path, **headers):
+        """Raw upgrade request; returns the response status line"""
+        lines = [f'GET {path} HTTP/1.1', f'Host: 127.0.0.1:{self.port}', 'Upgrade: websocket',
+                 'Connection: Upgrade', 'Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==',
+                 'Sec-WebSocket-Version: 13']
+        lines += [f'{name.replace("_", "-")}: {value}' for name, value in headers.items()]
+        with socket.create_connection(('127.0.0.1', self.port), timeout=2.0) as sock:
+            sock.sendall(('\r\n'.join(lines) + '\r\n\r\n').encode())
+            return sock.recv(1024).split(b'\r\n')[0].decode()
+
+    def close(self):
+        self.listener.close()
+        for thread in self.threads:
+            thread.join(5.0)
+
+
+@pytest.fixture
+def upgrade_server():
+    servers = []
+
+    def start(serve):
+        servers.append(UpgradeServer(serve))
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.close()
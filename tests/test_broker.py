@@ -0,0 +1,199 @@
+import os
+import socket
+import threading
+
+import pytest
+
+from pitv.broker import (BACKGROUND_PRIORITY, BAD_REQUEST, DENIED, FAILED, HEADER, OK, PING, REBOOT,
+                         SET_GOVERNOR, UNIT_RESTART, UNIT_START, Broker, BrokerClient, BrokerError,
+                         BrokerServer, FakeBackend, encode, read_frame)
+
+UID = 1000
+GID = 1000
+
+
+def make_broker(**kwargs):
+    backend = FakeBackend()
+    return Broker(backend, **kwargs), backend
+
+
+def test_allowed_user_runs_command():
+    broker, backend = make_broker(allowed_uids=[UID])
+    assert broker.execute(UNIT_START, 'ssh', 1, UID, GID) == (OK, '')
+    assert backend.calls == [('unit', 'start', 'ssh')]
+
+
+def test_root_is_always_allowed():
+    broker, backend = make_broker()
+    assert broker.execute(REBOOT, '', 1, 0, 0)[0] == OK
+    assert backend.calls == [('reboot',)]
+
+
+def test_other_users_are_denied():
+    broker, backend = make_broker(allowed_uids=[UID])
+    assert broker.execute(UNIT_RESTART, 'ssh', 1, 1001, 1001) == (DENIED, "permission denied")
+    assert backend.calls == []
+
+
+def test_allowed_group():
+    broker, backend = make_broker(allowed_gids=[GID])
+    assert broker.execute(UNIT_START, 'nginx', 1, 1001, GID)[0] == OK
+    assert broker.execute(UNIT_START, 'nginx', 1, 1001, 1001)[0] == DENIED
+
+
+def test_ping_needs_no_authorization():
+    broker, backend = make_broker()
+    assert broker.execute(PING, '', 1, 1001, 1001) == (OK, 'pong')
+
+
+@pytest.mark.parametrize('op, arg', [
+    (UNIT_START, 'sshd'),
+    (UNIT_START, '../../etc/passwd'),
+    (UNIT_RESTART, 'systemd-journald'),
+    (SET_GOVERNOR, 'turbo'),
+    (BACKGROUND_PRIORITY, 'lowest'),
+])
+def test_arguments_outside_the_allow_lists(op, arg):
+    broker, backend = make_broker(allowed_uids=[UID])
+    status, message = broker.execute(op, arg, 1, UID, GID)
+    assert status == BAD_REQUEST
+    assert 'not allowed' in message
+    assert backend.calls == []
+
+
+def test_allow_list_is_checked_before_authorization():
+    # An unauthorized caller learns nothing more than a bad argument
+    broker, backend = make_broker()
+    assert broker.execute(SET_GOVERNOR, 'turbo', 1, 1001, 1001)[0] == BAD_REQUEST
+
+
+def test_unknown_opcode():
+    broker, backend = make_broker(allowed_uids=[UID])
+    assert broker.execute(99, '', 1, UID, GID) == (BAD_REQUEST, "unknown command 99")
+
+
+def test_backend_failure_is_reported():
+    broker, backend = make_broker(allowed_uids=[UID])
+
+    def fail(governor):
+        raise OSError("read-only file system")
+    backend.set_governor = fail
+    assert broker.execute(SET_GOVERNOR, 'powersave', 1, UID, GID) == (FAILED, "read-only file system")
+
+
+def test_frame_round_trip():
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(encode(UNIT_START, 'google-cast') + encode(PING))
+        assert read_frame(b) == (UNIT_START, 'google-cast')
+        assert read_frame(b) == (PING, '')
+        a.close()
+        assert read_frame(b) is None
+
+
+def test_frame_cut_off_mid_payload():
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(encode(UNIT_START, 'google-cast')[:-3])
+        a.close()
+        with pytest.raises(ConnectionError):
+            read_frame(b)
+
+
+def test_oversized_payload_is_truncated():
+    frame = encode(OK, 'x' * 70000)
+    assert HEADER.unpack(frame[:HEADER.size]) == (OK, 0xffff)
+    assert len(frame) == HEADER.size + 0xffff
+
+
+@pytest.fixture
+def server(tmp_path):
+    """A broker on a Unix socket that lets the test's own user in"""
+    started = []
+
+    def start(allowed_uids=(os.getuid(),)):
+        backend = FakeBackend()
+        server = BrokerServer(str(tmp_path / 'broker.sock'), Broker(backend, allowed_uids))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        started.append(server)
+        return server, backend
+
+    yield start
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+def test_client_over_socket(server, tmp_path):
+    _, backend = server()
+    client = BrokerClient(str(tmp_path / 'broker.sock'))
+    assert client.ping() == 'pong'
+    client.unit_start('google-cast')
+    client.background_priority('low')
+    assert backend.calls == [('unit', 'start', 'google-cast'), ('background_priority', 'low')]
+    assert client.latency is not None
+
+
+def test_client_denied_over_socket(server, tmp_path):
+    server(allowed_uids=())
+    client = BrokerClient(str(tmp_path / 'broker.sock'))
+    if os.getuid() == 0:
+        pytest.skip("root is always allowed")
+    with pytest.raises(BrokerError, match="permission denied"):
+        client.reboot()
+
+
+def test_client_reconnects_after_broker_restart(server, tmp_path):
+    first, _ = server()
+    client = BrokerClient(str(tmp_path / 'broker.sock'))
+    client.ping()
+    first.shutdown()
+    first.server_close()
+    # The kept connection is now stale: sending on it fails and is retried
+    client.sock.shutdown(socket.SHUT_RDWR)
+    _, backend = server()
+    client.unit_start('ssh')
+    assert backend.calls == [('unit', 'start', 'ssh')]
+
+
+def test_no_broker(tmp_path):
+    client = BrokerClient(str(tmp_path / 'missing.sock'))
+    with pytest.raises(BrokerError, match="broker unavailable"):
+        client.ping()
+
+
+class SilentBroker:
+    """Reads requests and never answers, or hangs up without answering"""
+
+    def __init__(self, path, hang_up):
+        self.requests = []
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        self.listener.listen()
+        self.hang_up = hang_up
+        self.connections = []
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            self.connections.append(conn)
+            frame = read_frame(conn)
+            if frame is not None:
+                self.requests.append(frame)
+            if self.hang_up:
+                conn.close()
+
+
+@pytest.mark.parametrize('hang_up', [False, True])
+def test_written_request_is_never_sent_twice(tmp_path, hang_up):
+    broker = SilentBroker(str(tmp_path / 'broker.sock'), hang_up)
+    client = BrokerClient(str(tmp_path / 'broker.sock'), timeout=0.3)
+    with pytest.raises(BrokerError):
+        client.reboot()
+    assert broker.requests == [(REBOOT, '')]
+    assert client.sock is None
+    broker.listener.close()
@@ -0,0 +1,143 @@
+import os
+
+import pytest
+
+from pitv.casting import (CastTelemetry, StatisticsParser, describe_session, parse_access, parse_metadata,
+                          served_path)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def chunks(name, size):
+    with open(os.path.join(FIXTURES, name), errors='replace') as f:
+        yield from iter(lambda: f.read(size), '')
+
+
+def replay(telemetry, name, now=0.0):
+    for type_, code, data in parse_metadata(chunks(name, 4096)):
+        telemetry.feed_metadata(type_, code, data, now=now)
+
+
+def test_items_straddling_chunks():
+    whole = list(parse_metadata(chunks('airplay-metadata.xml', 1 << 20)))
+    assert len(whole) == 16
+    assert list(parse_metadata(chunks('airplay-metadata.xml', 7))) == whole
+    assert whole[2] == ('ssnc', 'snam', b"Alex's iPhone")
+    assert whole[4] == ('ssnc', 'abeg', b'')
+    # Cover art comes through intact
+    assert whole[11][2] == bytes(range(256)) * 8
+
+
+def test_lost_sync_recovers_at_next_item():
+    junk = '<item><type>' + 'x' * (1 << 20)
+    with open(os.path.join(FIXTURES, 'airplay-metadata.xml')) as f:
+        recorded = f.read()
+    assert len(list(parse_metadata([junk, recorded]))) == 16
+
+
+def test_session_from_recorded_stream():
+    telemetry = CastTelemetry()
+    replay(telemetry, 'airplay-metadata.xml', now=100.0)
+    session = telemetry.snapshot(now=160.0)['airplay']
+    assert session['client'] == "Alex's iPhone"
+    assert session['address'] == '192.168.1.23'
+    assert session['user_agent'] == 'AirPlay/620.8.2'
+    assert session['codec'] == 'AAC'
+    assert session['bitrate'] == 256000
+    assert (session['artist'], session['title']) == ('Daft Punk', 'Digital Love')
+    assert session['state'] == 'paused'
+    assert session['flushes'] == 2
+    assert session['duration'] == 60.0
+    assert describe_session(session).endswith("Daft Punk — Digital Love")
+
+
+def test_session_end_goes_to_history():
+    telemetry = CastTelemetry()
+    replay(telemetry, 'airplay-metadata.xml', now=0.0)
+    replay(telemetry, 'airplay-session-end.xml', now=300.0)
+    snapshot = telemetry.snapshot(now=400.0)
+    assert snapshot['airplay'] is None
+    ended, = snapshot['history']
+    assert ended['state'] == 'ended'
+    assert ended['duration'] == 300.0
+
+
+def test_statistics_log():
+    telemetry = CastTelemetry()
+    replay(telemetry, 'airplay-metadata.xml')
+    with open(os.path.join(FIXTURES, 'airplay-statistics.log')) as f:
+        for now, line in enumerate(f):
+            telemetry.feed_statistics(line, now=float(now))
+    session = telemetry.snapshot(now=5.0)['airplay']
+    assert session['sync_error_ms'] == -2.75
+    # Missing plus too late, played as silence
+    assert session['underruns'] == 5
+    assert len(session['samples']) == 2
+    assert "⚠️ 5 dropouts" in describe_session(session)
+
+
+def test_statistics_without_session_are_ignored():
+    telemetry = CastTelemetry()
+    with open(os.path.join(FIXTURES, 'airplay-statistics.log')) as f:
+        for line in f:
+            telemetry.feed_statistics(line)
+    assert telemetry.snapshot()['airplay'] is None
+
+
+def test_comma_separated_statistics():
+    parser = StatisticsParser()
+    assert parser.feed("sync error in milliseconds, total packets, missing packets, late packets, "
+                       "too late packets, resend requests, min DAC queue size") is None
+    assert parser.feed("0.5, 100, 1, 2, 3, 4, 4000") == {
+        'sync_error_ms': 0.5, 'packets': 100, 'missing': 1, 'late': 2, 'too_late': 3,
+        'resends': 4, 'dac_queue': 4000}
+
+
+def test_access_log_lines():
+    assert parse_access('192.168.1.30 - - [19/Oct/2026 20:14:03] "GET /Videos/clip.mp4 HTTP/1.1" 200 -') == \
+        ('192.168.1.30', 'GET', '/Videos/clip.mp4', 200, None)
+    assert parse_access('Serving HTTP on 0.0.0.0 port 8008') is None
+
+
+def test_cast_sessions_from_access_log(tmp_path):
+    (tmp_path / 'Videos').mkdir()
+    (tmp_path / 'Videos/clip.mp4').write_bytes(b'\0' * 1000000)
+    telemetry = CastTelemetry(cast_root=str(tmp_path), idle=30.0)
+    telemetry.feed_access('192.168.1.30 - - [19/Oct/2026 20:14:03] "GET /Videos/clip.mp4?t=1 HTTP/1.1" 200 -', now=0.0)
+    telemetry.feed_access('192.168.1.30 - - [19/Oct/2026 20:14:05] "GET /Videos/missing.mp4 HTTP/1.1" 404 -', now=2.0)
+    telemetry.feed_access('192.168.1.31 - - [19/Oct/2026 20:14:05] "GET /Music/a.flac HTTP/1.1" 200 5000', now=2.0)
+    session, other = sorted(telemetry.snapshot(now=4.0)['cast'], key=lambda s: s['client'])
+    assert session['codec'] == 'H.264/AAC'
+    assert session['title'] == 'clip.mp4'
+    assert session['bytes'] == 1000000
+    assert (session['requests'], session['errors']) == (2, 1)
+    assert other['bytes'] == 5000 and other['codec'] == 'FLAC'
+
+    # Quiet for longer than `idle`: ended
+    snapshot = telemetry.snapshot(now=40.0)
+    assert snapshot['cast'] == []
+    assert [s['state'] for s in snapshot['history']] == ['ended', 'ended']
+
+
+@pytest.mark.parametrize('session, text', [(None, "Ready")])
+def test_describe_no_session(session, text):
+    assert describe_session(session) == text
+
+
+def test_access_log_paths_are_decoded_and_confined(tmp_path):
+    root = tmp_path / 'cast'
+    (root / 'Videos').mkdir(parents=True)
+    (root / 'Videos/Holiday 2026 – Día 1.mp4').write_bytes(b'\0' * 250000)
+    (tmp_path / 'secret.mkv').write_bytes(b'\0' * 999)
+    telemetry = CastTelemetry(cast_root=str(root))
+    telemetry.feed_access('192.168.1.30 - - [19/Oct/2026 20:14:03] '
+                          '"GET /Videos/Holiday%202026%20%E2%80%93%20D%C3%ADa%201.mp4 HTTP/1.1" 200 -', now=0.0)
+    assert telemetry.snapshot(now=0.5)['cast'][0]['title'] == 'Holiday 2026 – Día 1.mp4'
+    telemetry.feed_access('192.168.1.30 - - [19/Oct/2026 20:14:04] "GET /Videos/../../secret.mkv HTTP/1.1" 200 -',
+                          now=1.0)
+    session, = telemetry.snapshot(now=2.0)['cast']
+    # The escape attempt resolves inside the root, where there is no such file
+    assert session['bytes'] == 250000
+    assert session['title'] == 'secret.mkv'
+    assert served_path('/Videos/Holiday%202026.mp4?t=3#x') == 'Videos/Holiday 2026.mp4'
+    assert served_path('/a/./b/../../../etc/passwd') == 'etc/passwd'
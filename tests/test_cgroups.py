@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from pitv.cgroups import CgroupMonitor, describe_usage, write_fake_unit
+
+
+@pytest.fixture
+def root(tmp_path):
+    return str(tmp_path)
+
+
+def unit_file(root, unit, name):
+    return os.path.join(root, 'system.slice', f'{unit}.service', name)
+
+
+def test_available_only_on_unified_hierarchy(root):
+    assert not CgroupMonitor((), root).available
+    write_fake_unit(root, 'ssh')
+    assert CgroupMonitor((), root).available
+
+
+def test_missing_directory_means_stopped(root):
+    write_fake_unit(root, 'ssh')
+    usage = CgroupMonitor(('ssh', 'smbd'), root).sample(now=0)
+    assert usage['smbd'] is None
+    assert usage['ssh'] is not None
+    assert describe_usage(None) == "stopped"
+
+
+def test_rates_between_samples(root):
+    monitor = CgroupMonitor(('nginx',), root)
+    write_fake_unit(root, 'nginx', cpu_usec=2000000, memory=8 << 20, rbytes=1000, wbytes=0)
+    first = monitor.sample_unit('nginx', now=10)
+    assert first['cpu'] == 0.0
+    assert first['cpu_seconds'] == 2.0
+    write_fake_unit(root, 'nginx', cpu_usec=2500000, memory=9 << 20, rbytes=5000, wbytes=4096)
+    usage = monitor.sample_unit('nginx', now=12)
+    assert usage['cpu'] == pytest.approx(25.0)
+    assert usage['read_rate'] == pytest.approx(2000.0)
+    assert usage['write_rate'] == pytest.approx(2048.0)
+    assert usage['memory'] == 9 << 20
+
+
+def test_restart_resets_counters(root):
+    monitor = CgroupMonitor(('nginx',), root)
+    write_fake_unit(root, 'nginx', cpu_usec=9000000)
+    monitor.sample_unit('nginx', now=0)
+    write_fake_unit(root, 'nginx', cpu_usec=100000)
+    assert monitor.sample_unit('nginx', now=5)['cpu'] == 0.0
+
+
+def test_memory_controller_disabled(root):
+    # Raspberry Pi kernels boot with cgroup_disable=memory
+    write_fake_unit(root, 'ssh', cpu_usec=1500000)
+    os.remove(unit_file(root, 'ssh', 'memory.current'))
+    os.remove(unit_file(root, 'ssh', 'memory.peak'))
+    usage = CgroupMonitor(('ssh',), root).sample_unit('ssh', now=0)
+    assert usage is not None
+    assert usage['memory'] is None and usage['memory_peak'] is None
+    assert describe_usage(usage) == "CPU 0.0% (1s)"
+
+
+def test_no_controller_files_still_running(root):
+    write_fake_unit(root, 'ssh')
+    for name in ('cpu.stat', 'memory.current', 'memory.peak', 'io.stat'):
+        os.remove(unit_file(root, 'ssh', name))
+    usage = CgroupMonitor(('ssh',), root).sample_unit('ssh', now=0)
+    assert usage['cpu'] is None
+    assert describe_usage(usage) == "running"
+
+
+def test_peak_falls_back_to_highest_seen(root):
+    monitor = CgroupMonitor(('ssh',), root)
+    write_fake_unit(root, 'ssh', memory=30 << 20)
+    os.remove(unit_file(root, 'ssh', 'memory.peak'))
+    monitor.sample_unit('ssh', now=0)
+    write_fake_unit(root, 'ssh', memory=10 << 20)
+    os.remove(unit_file(root, 'ssh', 'memory.peak'))
+    assert monitor.sample_unit('ssh', now=1)['memory_peak'] == 30 << 20
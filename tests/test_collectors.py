@@ -0,0 +1,161 @@
+from pitv.collectors import Collector, CollectorScheduler, TimerWheel
+
+
+class Counter:
+    """read() for a collector: counts calls and returns the next value"""
+
+    def __init__(self, values=None):
+        self.calls = 0
+        self.values = values
+
+    def __call__(self):
+        self.calls += 1
+        if self.values is None:
+            return self.calls
+        return self.values[min(self.calls, len(self.values)) - 1]
+
+
+def scheduler(*collectors, resolution=0.5, size=256):
+    s = CollectorScheduler(collectors, resolution=resolution, size=size)
+    # Ticks counted from 0 so tests can pass plain times
+    s.origin = 0.0
+    return s
+
+
+def test_wheel_due_entries():
+    wheel = TimerWheel(resolution=1.0, size=8)
+    wheel.schedule(3, 'a')
+    wheel.schedule(3, 'b')
+    wheel.schedule(5, 'c')
+    assert wheel.next_tick() == 3
+    assert wheel.advance(2) == []
+    assert sorted(item for _, item in wheel.advance(4)) == ['a', 'b']
+    assert wheel.advance(4) == []
+    assert wheel.advance(100) == [(5, 'c')]
+    assert wheel.next_tick() is None
+
+
+def test_wheel_entries_more_than_one_turn_away():
+    wheel = TimerWheel(resolution=1.0, size=8)
+    wheel.schedule(20, 'far')
+    wheel.schedule(4, 'near')
+    # Slot 4 holds both; only the near one is due this turn
+    assert wheel.advance(12) == [(4, 'near')]
+    assert wheel.slots[4] == [(20, 'far')]
+    assert wheel.next_tick() == 20
+    assert wheel.advance(19) == []
+    assert wheel.advance(20) == [(20, 'far')]
+
+
+def test_first_run_reports_everything_then_only_changes():
+    steady = Counter([7.0])
+    rising = Counter()
+    s = scheduler(Collector('steady', steady, interval=1.0), Collector('rising', rising, interval=1.0))
+    seen = []
+    s.listen(seen.append)
+    s.run(now=0.0)
+    assert seen == [{'steady': 7.0, 'rising': 1}]
+    s.refresh()
+    assert seen[-1] == {'rising': 2}
+    assert s.values == {'steady': 7.0, 'rising': 2}
+
+
+def test_precision_and_key_decide_what_changed():
+    s = scheduler(Collector('temp', Counter([50.01, 50.04, 50.2]), interval=1.0, precision=1),
+                  Collector('uptime', Counter([60.0, 90.0, 130.0]), interval=1.0, key=lambda v: int(v // 60)))
+    changes = []
+    s.listen(changes.append)
+    for _ in range(3):
+        s.refresh()
+    assert changes == [{'temp': 50.01, 'uptime': 60.0}, {'temp': 50.2, 'uptime': 130.0}]
+
+
+def test_rescheduled_from_the_due_tick():
+    read = Counter()
+    collector = Collector('c', read, interval=1.0)
+    s = scheduler(collector)
+    s.run(now=0.0)
+    # One interval is two ticks; an empty wheel places it as late as possible
+    assert collector.next_tick == 2
+    # Run late, at tick 3: the next run stays on the grid at 4, not 5
+    s.run(now=1.6)
+    assert (read.calls, collector.next_tick) == (2, 4)
+    # Overslept by more than an interval: no catching up, just the next one
+    s.run(now=3.6)
+    assert (read.calls, collector.next_tick) == (3, 9)
+    assert s.next_delay(3.6) == 4.5 - 3.6
+
+
+def test_refresh_leaves_a_stale_entry_behind():
+    read = Counter()
+    collector = Collector('c', read, interval=2.0)
+    s = CollectorScheduler([collector], resolution=0.5)
+    start = s.origin
+    s.run(now=start)
+    assert collector.next_tick == 4
+    # refresh() runs on the real clock: pretend 1.6 s have passed (tick 3)
+    s.origin = start - 1.6
+    s.refresh()
+    s.origin = start
+    assert (read.calls, collector.next_tick) == (2, 7)
+    # The old entry at tick 4 is still on the wheel but no longer counts
+    s.run(now=start + 2.0)
+    assert read.calls == 2
+    s.run(now=start + 3.5)
+    assert read.calls == 3
+
+
+def test_first_placement_spreads_collectors():
+    collectors = [Collector(f'c{i}', Counter(), interval=2.0) for i in range(4)]
+    s = scheduler(*collectors)
+    s.run(now=0.0)
+    ticks = sorted(c.next_tick for c in collectors)
+    assert ticks == [1, 2, 3, 4]
+
+
+def test_first_placement_avoids_a_loaded_tick():
+    heavy = Collector('heavy', Counter(), interval=1.0)
+    s = scheduler(heavy)
+    s.run(now=0.0)
+    assert heavy.next_tick == 2
+    heavy.cost = 1000000.0
+    light = Collector('light', Counter(), interval=1.0)
+    s.add(light)
+    s.run(now=0.0)
+    assert light.next_tick == 1
+
+
+def test_watched_and_fallback_collectors():
+    triggers = []
+
+    def watch(trigger):
+        triggers.append(trigger)
+        return True
+    read = Counter()
+    evented = Collector('ip', read, interval=None, watch=watch)
+    polled = Collector('ip6', Counter(), interval=None, watch=lambda trigger: False, fallback=30.0)
+    s = scheduler(evented, polled)
+    assert polled.interval == 30.0
+    assert s.next_delay(0.0) == 0.0
+    s.run(now=0.0)
+    assert evented.next_tick is None
+    assert s.next_delay(0.0) == 30.0
+    s.run(now=10.0)
+    assert read.calls == 1
+    triggers[0]()
+    assert s.next_delay(10.0) == 0.0
+    s.run(now=10.0)
+    assert read.calls == 2
+
+
+def test_failing_collector_keeps_its_schedule():
+    def broken():
+        raise OSError("gone")
+    collector = Collector('broken', broken, interval=1.0)
+    s = scheduler(collector)
+    s.run(now=0.0)
+    s.run(now=1.0)
+    assert collector.errors == 2
+    assert collector.next_tick == 4
+    report, = s.report()
+    assert (report['runs'], report['errors']) == (0, 2)
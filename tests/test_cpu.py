@@ -0,0 +1,103 @@
+import pytest
+
+from pitv.cpu import FREQ_CAPPED, UNDERVOLTAGE, CpuCollector, read_throttled, throttle_names
+
+
+def write_stat(proc, rows):
+    """rows: {name: (user, nice, system, idle, iowait, irq, softirq, steal)}"""
+    lines = [f"{name} {' '.join(map(str, values))} 0 0\n" for name, values in rows.items()]
+    (proc / 'stat').write_text(''.join(lines) + "intr 12345 0 0\nctxt 999\n")
+
+
+def write_freq(sys, cpu, khz):
+    path = sys / f'devices/system/cpu/cpu{cpu}/cpufreq'
+    path.mkdir(parents=True, exist_ok=True)
+    (path / 'scaling_cur_freq').write_text(f'{khz}\n')
+
+
+@pytest.fixture
+def roots(tmp_path):
+    proc, sys = tmp_path / 'proc', tmp_path / 'sys'
+    proc.mkdir()
+    sys.mkdir()
+    return proc, sys
+
+
+def test_deltas_between_two_snapshots(roots):
+    proc, sys = roots
+    write_stat(proc, {
+        'cpu': (100, 0, 100, 800, 0, 0, 0, 0),
+        'cpu0': (50, 0, 50, 400, 0, 0, 0, 0),
+        'cpu1': (50, 0, 50, 400, 0, 0, 0, 0),
+    })
+    write_freq(sys, 0, 1500000)
+    write_freq(sys, 1, 600000)
+    collector = CpuCollector(str(proc), str(sys))
+    # cpu0 busy for 75 of 100 ticks, cpu1 idle apart from 20 ticks of iowait and 10 stolen
+    write_stat(proc, {
+        'cpu': (175, 0, 100, 895, 20, 0, 0, 10),
+        'cpu0': (125, 0, 50, 425, 0, 0, 0, 0),
+        'cpu1': (50, 0, 50, 470, 20, 0, 0, 10),
+    })
+    sample = collector.sample()
+    cpu0, cpu1 = sample['cores']
+    assert cpu0['cpu'] == 0 and cpu0['util'] == pytest.approx(75.0)
+    assert cpu0['freq'] == 1500
+    assert cpu1['util'] == pytest.approx(10.0)
+    assert cpu1['iowait'] == pytest.approx(20.0)
+    assert cpu1['steal'] == pytest.approx(10.0)
+    assert cpu1['freq'] == 600
+    assert sample['total']['util'] == pytest.approx(100.0 * 85 / 200)
+
+
+def test_offline_core_keeps_real_ids(roots):
+    proc, sys = roots
+    rows = {'cpu': (0,) * 8, 'cpu0': (0,) * 8, 'cpu2': (0,) * 8, 'cpu3': (0,) * 8}
+    write_stat(proc, rows)
+    collector = CpuCollector(str(proc), str(sys))
+    rows['cpu2'] = (10, 0, 0, 10, 0, 0, 0, 0)
+    write_stat(proc, rows)
+    cores = collector.sample()['cores']
+    assert [core['cpu'] for core in cores] == [0, 2, 3]
+    assert cores[1]['util'] == pytest.approx(50.0)
+    # No cpufreq directory: frequency unknown, not an error
+    assert cores[1]['freq'] == 0
+
+
+def test_core_coming_online_restarts_deltas(roots):
+    proc, sys = roots
+    write_stat(proc, {'cpu': (10,) * 8, 'cpu0': (10,) * 8})
+    collector = CpuCollector(str(proc), str(sys))
+    write_stat(proc, {'cpu': (20,) * 8, 'cpu0': (10,) * 8, 'cpu1': (10,) * 8})
+    sample = collector.sample()
+    assert [core['cpu'] for core in sample['cores']] == [0, 1]
+    for row in [sample['total']] + sample['cores']:
+        assert 0.0 <= row['util'] <= 100.0
+
+
+def test_idle_interval_is_not_a_division_by_zero(roots):
+    proc, sys = roots
+    write_stat(proc, {'cpu': (5,) * 8, 'cpu0': (5,) * 8})
+    collector = CpuCollector(str(proc), str(sys))
+    assert collector.sample()['total']['util'] == 0.0
+
+
+def test_latest_shares_recent_sample(roots):
+    proc, sys = roots
+    write_stat(proc, {'cpu': (5,) * 8, 'cpu0': (5,) * 8})
+    collector = CpuCollector(str(proc), str(sys))
+    first = collector.latest(max_age=60)
+    assert collector.latest(max_age=60) is first
+    assert collector.latest(max_age=0) is not first
+
+
+def test_throttle_flags(roots):
+    proc, sys = roots
+    assert read_throttled(str(sys)) is None
+    firmware = sys / 'devices/platform/soc/soc:firmware'
+    firmware.mkdir(parents=True)
+    (firmware / 'get_throttled').write_text('0x50003\n')
+    flags = read_throttled(str(sys))
+    assert flags == 0x50003
+    assert throttle_names(flags) == ['under-voltage', 'frequency capped']
+    assert throttle_names(UNDERVOLTAGE | FREQ_CAPPED) == throttle_names(flags)
@@ -0,0 +1,182 @@
+import json
+import os
+import time
+
+import pytest
+
+from pitv.diskusage import DiskUsageIndex, Inotify
+
+
+def du(path):
+    """Allocated bytes of the files below path, as the index counts them"""
+    total = 0
+    for directory, dirs, files in os.walk(path):
+        for name in files:
+            total += os.lstat(os.path.join(directory, name)).st_blocks * 512
+    return total
+
+
+def write(path, size):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / 'root'
+    write(root / 'home/pi/Videos/film.mkv', 300000)
+    write(root / 'home/pi/notes.txt', 1000)
+    write(root / 'var/log/syslog', 50000)
+    write(root / 'usr/lib/libfoo.so', 120000)
+    (root / 'media').mkdir()
+    return root
+
+
+def scanned(root, **options):
+    index = DiskUsageIndex(str(root), path=options.pop('path', None), settle=0.0, **options)
+    index.device = os.stat(index.root).st_dev
+    index.scan_tree(index.root)
+    return index
+
+
+def test_initial_totals(tree):
+    index = scanned(tree)
+    assert index.total[str(tree)] == du(tree)
+    assert index.total[str(tree / 'home')] == du(tree / 'home')
+    assert index.own[str(tree / 'home/pi')] == os.lstat(tree / 'home/pi/notes.txt').st_blocks * 512
+    top = index.top(str(tree), n=2)
+    assert [child['path'] for child in top['children']] == [str(tree / 'home'), str(tree / 'usr')]
+    assert index.largest(1) == [{'path': str(tree / 'home/pi/Videos'), 'size': du(tree / 'home/pi/Videos')}]
+    assert index.top(str(tree / 'nowhere')) is None
+
+
+def test_create_delete_and_grow(tree):
+    index = scanned(tree)
+    write(tree / 'var/log/journal/system.journal', 80000)
+    os.remove(tree / 'home/pi/notes.txt')
+    with open(tree / 'usr/lib/libfoo.so', 'ab') as f:
+        f.write(os.urandom(40000))
+    index.dirty.update({str(tree / 'var/log'), str(tree / 'home/pi'), str(tree / 'usr/lib')})
+    index.process_dirty()
+    for path in (tree, tree / 'var', tree / 'var/log/journal', tree / 'home', tree / 'usr'):
+        assert index.total[str(path)] == du(path)
+
+    (tree / 'var/log/journal/system.journal').unlink()
+    (tree / 'var/log/journal').rmdir()
+    index.dirty.add(str(tree / 'var/log'))
+    index.process_dirty()
+    assert str(tree / 'var/log/journal') not in index.own
+    assert index.total[str(tree)] == du(tree)
+
+
+def test_reload_counts_a_file_grown_in_place(tree, tmp_path):
+    saved = str(tmp_path / 'index.json')
+    scanned(tree, path=saved).save()
+    log = tree / 'var/log'
+    mtime = os.stat(log).st_mtime_ns
+    with open(log / 'syslog', 'ab') as f:
+        f.write(os.urandom(500000))
+    # Appending leaves the directory alone: an mtime check would miss it
+    assert os.stat(log).st_mtime_ns == mtime
+
+    index = DiskUsageIndex(str(tree), path=saved, settle=0.0)
+    index.device = os.stat(index.root).st_dev
+    assert index.load()
+    assert index.total[str(tree)] < du(tree)
+    index.reconcile()
+    assert index.total[str(log)] == du(log)
+    assert index.total[str(tree)] == du(tree)
+
+
+def test_loads_index_with_mtimes(tree, tmp_path):
+    saved = tmp_path / 'index.json'
+    saved.write_text(json.dumps({'root': str(tree), 'dirs': [[str(tree), 10, 1.0], [str(tree / 'usr'), 5, 2.0]]}))
+    index = DiskUsageIndex(str(tree), path=str(saved))
+    assert index.load()
+    assert index.total[str(tree)] == 15
+
+
+def test_only_growing_directories_are_watched(tree):
+    index = DiskUsageIndex(str(tree), path=None, settle=0.0)
+    index.device = os.stat(index.root).st_dev
+    index.inotify = Inotify()
+    try:
+        index.scan_tree(index.root)
+        watched = set(index.inotify.wds)
+        assert str(tree / 'home/pi/Videos') in watched
+        assert str(tree / 'var/log') in watched
+        assert str(tree / 'media') in watched
+        assert str(tree) not in watched
+        assert str(tree / 'usr/lib') in index.unwatched
+        report = index.report()
+        assert (report['watched'], report['unwatched']) == (len(watched), 3)
+
+        # Polled directories still catch up on the next rescan
+        write(tree / 'usr/lib/libbar.so', 70000)
+        index.reconcile(set(index.unwatched))
+        assert index.total[str(tree)] == du(tree)
+    finally:
+        index.inotify.close()
+
+
+def test_watched_directory_follows_events(tree):
+    index = DiskUsageIndex(str(tree), path=None, settle=0.0)
+    index.device = os.stat(index.root).st_dev
+    index.inotify = Inotify()
+    try:
+        index.scan_tree(index.root)
+        with open(tree / 'var/log/syslog', 'ab') as f:
+            f.write(os.urandom(200000))
+        write(tree / 'home/pi/Downloads/big.iso', 100000)
+        deadline = time.monotonic() + 5
+        while index.total[str(tree)] != du(tree) and time.monotonic() < deadline:
+            index.poll(0.1)
+        assert index.total[str(tree)] == du(tree)
+    finally:
+        index.inotify.close()
+
+
+def test_server_follows_the_saved_index(tree, tmp_path):
+    saved = str(tmp_path / 'index.json')
+    indexer = scanned(tree, path=saved)
+    indexer.save()
+    reader = DiskUsageIndex(str(tree), path=saved)
+    assert reader.follow()
+    assert reader.total[str(tree)] == du(tree)
+    assert reader.report()['directories'] == len(indexer.own)
+
+    write(tree / 'home/pi/more.bin', 90000)
+    indexer.dirty.add(str(tree / 'home/pi'))
+    indexer.process_dirty()
+    indexer.save()
+    # A new save is picked up (mtime resolution permitting)
+    os.utime(saved, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    reader.follow()
+    assert reader.total[str(tree)] == du(tree)
+
+
+def test_not_ready_without_a_saved_index(tmp_path):
+    reader = DiskUsageIndex(str(tmp_path), path=str(tmp_path / 'missing.json'))
+    assert not reader.follow()
+    assert reader.report()['ready'] is False
+
+
+def test_run_saves_on_stop(tree, tmp_path):
+    saved = tmp_path / 'index.json'
+    index = DiskUsageIndex(str(tree), path=str(saved), settle=0.05)
+    thread = index.start()
+    deadline = time.monotonic() + 5
+    while not index.ready and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert index.ready
+    write(tree / 'var/cache/apt/pkgcache.bin', 60000)
+    while index.total[str(tree)] != du(tree) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    index.stop()
+    thread.join(5)
+    assert not thread.is_alive()
+    reader = DiskUsageIndex(str(tree), path=str(saved))
+    assert reader.follow()
+    assert reader.total[str(tree)] == du(tree)
+    assert reader.report()['watched'] > 0
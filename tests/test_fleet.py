@@ -0,0 +1,188 @@
+import asyncio
+import json
+
+import pytest
+
+from pitv.fleet import (DOWN, INITIAL_TIMEOUT, MAX_TIMEOUT, MIN_TIMEOUT, UP, Device, Hub,
+                        load_config, parse_address, serve_http, simulate, stand_in)
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 30))
+
+
+def port_of(server):
+    return server.sockets[0].getsockname()[1]
+
+
+async def scripted(responses):
+    """A TV that gives the canned responses in turn, one connection each,
+    closing the connection after every answer without saying so"""
+    answers = iter(responses)
+
+    async def handle(reader, writer):
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        writer.write(next(answers))
+        await writer.drain()
+        writer.close()
+    return await asyncio.start_server(handle, '127.0.0.1', 0)
+
+
+def ok(status, headers=True):
+    body = json.dumps(status).encode()
+    if not headers:
+        return b'HTTP/1.1 200 OK\r\n\r\n' + body
+    return b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n' % len(body) + body
+
+
+def test_timeout_follows_round_trips():
+    device = Device(0, 'tv', '127.0.0.1')
+    assert device.timeout() == INITIAL_TIMEOUT
+    device.observe(0.2)
+    assert device.timeout() == pytest.approx(0.6)
+    for _ in range(50):
+        device.observe(0.001)
+    assert device.timeout() == MIN_TIMEOUT
+    for _ in range(5):
+        device.observe(8.0)
+    assert device.timeout() == MAX_TIMEOUT
+
+
+def test_poll_reuses_connection():
+    async def scenario():
+        server = await stand_in(latency=(0.001, 0.002), hang=0.0)
+        hub = Hub([('tv-1', '127.0.0.1', port_of(server))])
+        device, = hub.devices
+        results = [await hub.poll(device) for _ in range(3)]
+        server.close()
+        device.close()
+        return hub, results
+    hub, results = run(scenario())
+    assert results == [True, True, True]
+    assert hub.stats['connects'] == 1
+    row = hub.table.row(0)
+    assert row['state'] == 'up'
+    assert 0.0 <= row['cpu'] <= 100.0
+    assert row['rtt_ms'] > 0
+    assert len(hub.latencies) == 3
+
+
+def test_idle_connection_closed_by_tv_is_retried():
+    async def scenario():
+        server = await scripted([ok({'cpu': 10.0}), ok({'cpu': 20.0})])
+        hub = Hub([('tv-1', '127.0.0.1', port_of(server))])
+        device, = hub.devices
+        first = await hub.poll(device)
+        await asyncio.sleep(0.05)
+        second = await hub.poll(device)
+        server.close()
+        return hub, first, second
+    hub, first, second = run(scenario())
+    assert (first, second) == (True, True)
+    assert hub.stats['connects'] == 2
+    assert hub.table.row(0)['cpu'] == 20.0
+
+
+def test_body_without_length_and_bad_status():
+    async def scenario():
+        server = await scripted([ok({'memory': 42.5}, headers=False),
+                                 b'HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n',
+                                 b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\n{{{'])
+        hub = Hub([('tv-1', '127.0.0.1', port_of(server))])
+        device, = hub.devices
+        results = [await hub.poll(device) for _ in range(3)]
+        server.close()
+        return hub, results
+    hub, results = run(scenario())
+    assert results == [True, False, False]
+    assert hub.table.row(0)['memory'] == 42.5
+
+
+def test_hung_tv_times_out():
+    async def scenario():
+        server = await stand_in(hang=1.0)
+        hub = Hub([('tv-1', '127.0.0.1', port_of(server))])
+        device, = hub.devices
+        # Seen answering quickly before: the shortest timeout applies
+        device.observe(0.001)
+        result = await hub.poll(device)
+        server.close()
+        return hub, device, result
+    hub, device, result = run(scenario())
+    assert result is False
+    assert hub.stats['timeouts'] == 1
+    assert device.writer is None
+
+
+def test_refused_connection():
+    async def scenario():
+        server = await stand_in()
+        port = port_of(server)
+        server.close()
+        await server.wait_closed()
+        hub = Hub([('tv-1', '127.0.0.1', port)])
+        return await hub.poll(hub.devices[0])
+    assert run(scenario()) is False
+
+
+def test_table_summary_and_cached_json():
+    hub = Hub([('a', '10.0.0.1', 8080), ('b', '10.0.0.2', 8080), ('c', '10.0.0.3', 8081)])
+    table = hub.table
+    table.update(0, {'cpu': 10.0, 'memory': 40.0}, 0.004)
+    table.update(1, {'cpu': 30.0, 'memory': None}, 0.006)
+    table.fail(2)
+    assert [table.state[i] for i in range(3)] == [UP, UP, DOWN]
+    assert table.summary() == {'devices': 3, 'up': 2, 'down': 1, 'cpu': 20.0, 'memory': 20.0}
+    body = hub.fleet_json()
+    assert hub.fleet_json() is body
+    data = json.loads(body)
+    assert data['devices'][2] == {'name': 'c', 'address': '10.0.0.3:8081', 'state': 'down', 'cpu': 0.0,
+                                  'memory': 0.0, 'rtt_ms': 0.0, 'seen': None, 'failures': 1}
+    table.fail(2)
+    assert hub.fleet_json() is not body
+
+
+def test_dashboard_api():
+    async def scenario():
+        hub = Hub([('a', '10.0.0.1', 8080)])
+        hub.table.update(0, {'cpu': 12.5, 'memory': 50.0}, 0.01)
+        server = await serve_http(hub, 0, host='127.0.0.1')
+        reader, writer = await asyncio.open_connection('127.0.0.1', port_of(server))
+        answers = []
+        for path in ('/api/fleet', '/nowhere', '/'):
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: hub\r\n\r\n'.encode())
+            status = await reader.readline()
+            length = 0
+            while (line := await reader.readline()) != b'\r\n':
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            answers.append((status.split()[1], await reader.readexactly(length)))
+        writer.close()
+        server.close()
+        return answers
+    fleet, missing, page = run(scenario())
+    assert fleet[0] == b'200'
+    assert json.loads(fleet[1])['summary']['cpu'] == 12.5
+    assert missing[0] == b'404'
+    assert page[0] == b'200' and b'Pi TV Fleet' in page[1]
+
+
+def test_config(tmp_path):
+    path = tmp_path / 'fleet.conf'
+    path.write_text("# living room and kitchen\n"
+                    "lounge 192.168.1.20\n"
+                    "kitchen 192.168.1.21:8081  # older image\n"
+                    "\n"
+                    "tv-3.local\n")
+    assert load_config(str(path)) == [('lounge', '192.168.1.20', 8080), ('kitchen', '192.168.1.21', 8081),
+                                      ('tv-3.local', 'tv-3.local', 8080)]
+    assert parse_address('fe80::1') == ('fe80::1', 8080)
+
+
+def test_simulated_fleet():
+    report = run(simulate(20, 1.5, 0.5, dead=0.0))
+    assert report['devices'] == 20
+    assert report['polls'] >= 20
+    assert report['connects'] <= report['polls']
+    assert report['api_bytes'] > 0
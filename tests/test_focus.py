@@ -0,0 +1,177 @@
+import random
+
+import pytest
+
+from pitv.focus import FocusEngine, SpatialIndex, benchmark
+
+# A full-width featured card over a section of six cards and one of three wide ones
+FEATURED = [('featured', 0, 0, 1600, 300)]
+SMALL = [(f's{i}', i * 270, 320, 250, 150) for i in range(6)]
+WIDE = [(f'w{i}', i * 540, 500, 520, 150) for i in range(3)]
+
+
+@pytest.fixture
+def index():
+    rects = FEATURED + SMALL + WIDE
+    random.Random(1).shuffle(rects)
+    return SpatialIndex(rects)
+
+
+def test_rows(index):
+    assert [keys for centres, keys in index.rows] == [
+        ['featured'], ['s0', 's1', 's2', 's3', 's4', 's5'], ['w0', 'w1', 'w2']]
+    assert len(index) == 10
+    assert index.first() == 'featured'
+
+
+def test_ragged_tops_share_a_row():
+    index = SpatialIndex([('a', 0, 0, 100, 100), ('b', 110, 4, 100, 100), ('c', 220, 99, 100, 100),
+                          ('d', 0, 200, 100, 100)])
+    assert [keys for centres, keys in index.rows] == [['a', 'b', 'c'], ['d']]
+
+
+@pytest.mark.parametrize('key, direction, expected', [
+    # The featured card's centre is midway between s2 and s3: ties go left
+    ('featured', 'down', 's2'),
+    ('s0', 'up', 'featured'),
+    ('s5', 'up', 'featured'),
+    # Narrow to wide: the closest centre wins
+    ('s1', 'down', 'w0'),
+    ('s2', 'down', 'w1'),
+    ('s4', 'down', 'w2'),
+    ('s5', 'down', 'w2'),
+    # Wide to narrow: each centre is midway between two small cards
+    ('w0', 'up', 's0'),
+    ('w1', 'up', 's2'),
+    ('w2', 'up', 's4'),
+    ('s2', 'right', 's3'),
+    ('w1', 'left', 'w0'),
+])
+def test_neighbours(index, key, direction, expected):
+    assert index.neighbour(key, direction) == expected
+
+
+@pytest.mark.parametrize('key, direction', [
+    ('featured', 'up'), ('featured', 'left'), ('featured', 'right'),
+    ('s0', 'left'), ('s5', 'right'), ('w0', 'down'), ('w2', 'down'), ('w2', 'right'),
+])
+def test_edges(index, key, direction):
+    assert index.neighbour(key, direction) is None
+
+
+def test_empty_index():
+    index = SpatialIndex([])
+    assert len(index) == 0
+    assert index.first() is None
+
+
+def test_benchmark_grid():
+    result = benchmark(600, columns=6, moves=1000)
+    assert (result['cards'], result['rows']) == (600, 100)
+
+
+class Signals:
+    def __init__(self):
+        self.handlers = {}
+
+    def connect(self, name, handler):
+        self.handlers[name] = handler
+
+
+class FakeCard(Signals):
+    def __init__(self, name, x, y, width, height, engine_focus):
+        super().__init__()
+        self.name = name
+        self.rect = (x, y, width, height)
+        self.engine_focus = engine_focus
+        self.focused = False
+
+    def get_mapped(self):
+        return True
+
+    def get_parent(self):
+        return None
+
+    def translate_coordinates(self, ancestor, x, y):
+        return True, self.rect[0] + x, self.rect[1] + y
+
+    def get_allocated_width(self):
+        return self.rect[2]
+
+    def get_allocated_height(self):
+        return self.rect[3]
+
+    def has_focus(self):
+        return self.focused
+
+    def grab_focus(self):
+        for card in self.engine_focus:
+            card.focused = False
+        self.focused = True
+        self.handlers['focus-in-event'](self, None)
+
+
+class FakeAdjustment:
+    def __init__(self, page):
+        self.value = 0.0
+        self.page = page
+
+    def get_value(self):
+        return self.value
+
+    def set_value(self, value):
+        self.value = value
+
+    def get_page_size(self):
+        return self.page
+
+    def get_lower(self):
+        return 0.0
+
+    def get_upper(self):
+        return 2000.0
+
+
+@pytest.fixture
+def engine():
+    engine = FocusEngine(Signals(), FakeAdjustment(page=400))
+    engine.animate = False
+    cards = []
+    for rect in FEATURED + SMALL + WIDE:
+        cards.append(FakeCard(*rect, engine_focus=cards))
+        engine.add(cards[-1])
+    return engine
+
+
+def test_move_counts_steps_and_stops_at_edges(engine):
+    # Nothing focused yet: the first card
+    assert engine.move('right').name == 'featured'
+    assert engine.move('down').name == 's2'
+    # Held left, coalesced into one move of two steps
+    assert engine.move('left', count=2).name == 's0'
+    # Runs out of row after five steps
+    assert engine.move('right', count=8).name == 's5'
+    assert engine.move('down', count=5).name == 'w2'
+    assert engine.move('up', count=2).name == 'featured'
+    # Already at the edge: focus stays put and no move is counted
+    assert engine.move('up').name == 'featured'
+    assert engine.stats['moves'] == 6
+    assert engine.stats['rebuilds'] == 1
+
+
+def test_move_scrolls_card_into_view(engine):
+    engine.move('down')
+    engine.move('down', count=2)
+    assert engine.focused.name == 'w1'
+    # Bottom edge 650 plus the margin, less the 400 page
+    assert engine.adjustment.get_value() == 650 + FocusEngine.MARGIN - 400
+    engine.move('up', count=2)
+    assert engine.adjustment.get_value() == 0.0
+
+
+def test_reallocation_rebuilds_index(engine):
+    engine.move('down')
+    engine.container.handlers['size-allocate']()
+    assert engine.index is None
+    engine.move('down')
+    assert engine.stats['rebuilds'] == 2
@@ -0,0 +1,170 @@
+import gzip
+import math
+import threading
+import time
+
+from pitv.cgroups import CgroupMonitor, write_fake_unit
+from pitv.metrics import (Histogram, MetricsCache, MetricWriter, format_value, write_network,
+                          write_services)
+
+
+def families(text):
+    """Family names in the order their samples appear, one entry per run"""
+    runs = []
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            runs.append(line.split()[2])
+    return runs
+
+
+def samples(text):
+    assert text.endswith('# EOF\n')
+    return [line for line in text.splitlines() if not line.startswith('#')]
+
+
+def test_format_value():
+    assert format_value(3.0) == '3'
+    assert format_value(0.25) == '0.25'
+    assert format_value(None) == 'NaN'
+    assert format_value(math.inf) == '+Inf'
+
+
+def test_writer_groups_interleaved_families():
+    writer = MetricWriter()
+    # A per-device loop writes each family once per device
+    for device in ('mmcblk0', 'sda'):
+        writer.gauge('pitv_a', "A", 1, {'device': device})
+        writer.counter('pitv_b', "B", 2, {'device': device})
+    writer.gauge('pitv_c', "C\nwith \"quotes\"", 3, unit='bytes')
+    text = writer.text()
+    assert families(text) == ['pitv_a', 'pitv_b', 'pitv_c']
+    assert samples(text) == [
+        'pitv_a{device="mmcblk0"} 1', 'pitv_a{device="sda"} 1',
+        'pitv_b_total{device="mmcblk0"} 2', 'pitv_b_total{device="sda"} 2',
+        'pitv_c 3']
+    assert '# UNIT pitv_c bytes\n# HELP pitv_c C\\nwith \\"quotes\\"\n' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('pitv_latency_seconds', "Latency", ('route',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, '/api')
+    histogram.observe(0.2, '/metrics')
+    writer = MetricWriter()
+    histogram.write(writer)
+    assert samples(writer.text()) == [
+        # A value on a bound falls in that bucket
+        'pitv_latency_seconds_bucket{route="/api",le="0.1"} 2',
+        'pitv_latency_seconds_bucket{route="/api",le="1.0"} 3',
+        'pitv_latency_seconds_bucket{route="/api",le="+Inf"} 4',
+        'pitv_latency_seconds_count{route="/api"} 4',
+        'pitv_latency_seconds_sum{route="/api"} 3.65',
+        'pitv_latency_seconds_bucket{route="/metrics",le="0.1"} 0',
+        'pitv_latency_seconds_bucket{route="/metrics",le="1.0"} 1',
+        'pitv_latency_seconds_bucket{route="/metrics",le="+Inf"} 1',
+        'pitv_latency_seconds_count{route="/metrics"} 1',
+        'pitv_latency_seconds_sum{route="/metrics"} 0.2',
+    ]
+    assert families(writer.text()) == ['pitv_latency_seconds']
+
+
+def test_cache_collects_once_for_concurrent_scrapes():
+    calls = []
+    started = threading.Event()
+
+    def collect(writer):
+        calls.append(1)
+        started.set()
+        # Slow enough for every scraper to arrive mid-collection
+        time.sleep(0.2)
+        writer.gauge('pitv_x', "X", len(calls))
+
+    cache = MetricsCache(collect, interval=60.0)
+    results = []
+
+    def scrape():
+        results.append(cache.latest())
+
+    threads = [threading.Thread(target=scrape) for _ in range(8)]
+    threads[0].start()
+    started.wait(1.0)
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert len(results) == 8
+    # Every scraper got the same cycle's bytes
+    assert all(text is results[0][0] and compressed is results[0][1] for text, compressed in results)
+    text, compressed = results[0]
+    assert gzip.decompress(compressed) == text
+    assert b'pitv_x 1\n' in text
+    assert cache.stats['scrapes'] == 8
+    assert cache.stats['collections'] == 1
+
+
+def test_cache_collects_again_after_interval():
+    calls = []
+    cache = MetricsCache(lambda writer: calls.append(1), interval=0.0)
+    cache.latest()
+    text, _ = cache.latest()
+    assert len(calls) == 2
+    assert b'pitv_metrics_collections_total 2\n' in text
+
+
+def test_write_network():
+    wifi = {'quality': 50, 'signal': -72, 'noise': None, 'bars': 2, 'capacity': 4000000}
+    sample = {
+        'online': True,
+        'primary': 'wlan0',
+        'interfaces': {
+            'wlan0': {'rx_rate': 1250.4, 'tx_rate': 10.0, 'errors': 3, 'dropped': 1, 'error_rate': 0.5,
+                      'wireless': wifi},
+            'eth0': {'rx_rate': 0.0, 'tx_rate': 0.0, 'errors': 0, 'dropped': 0, 'error_rate': 0.0,
+                     'wireless': None},
+        },
+    }
+    writer = MetricWriter()
+    write_network(writer, sample)
+    lines = samples(writer.text())
+    assert 'pitv_network_online 1' in lines
+    assert 'pitv_network_primary{interface="wlan0"} 1' in lines
+    assert 'pitv_network_primary{interface="eth0"} 0' in lines
+    assert 'pitv_network_receive_bytes_per_second{interface="wlan0"} 1250' in lines
+    assert 'pitv_network_errors_total{interface="wlan0"} 3' in lines
+    assert 'pitv_network_dropped_total{interface="wlan0"} 1' in lines
+    assert 'pitv_wifi_signal_dbm{interface="wlan0"} -72' in lines
+    assert 'pitv_wifi_capacity_bits_per_second{interface="wlan0"} 4000000' in lines
+    # No noise figure from this driver, and no Wi-Fi figures for Ethernet
+    assert not any(line.startswith('pitv_wifi_noise_dbm') for line in lines)
+    assert not any(line.startswith('pitv_wifi_') and 'eth0' in line for line in lines)
+    assert len(families(writer.text())) == len(set(families(writer.text())))
+
+
+def test_write_services(tmp_path):
+    root = str(tmp_path)
+    write_fake_unit(root, 'ssh', cpu_usec=1000000, memory=4 << 20, memory_peak=6 << 20, rbytes=4096, wbytes=512)
+    monitor = CgroupMonitor(('ssh', 'smbd'), root)
+    monitor.sample(now=0)
+    write_fake_unit(root, 'ssh', cpu_usec=1500000, memory=4 << 20, memory_peak=6 << 20, rbytes=4096, wbytes=512)
+    writer = MetricWriter()
+    write_services(writer, monitor.sample(now=2))
+    lines = samples(writer.text())
+    assert 'pitv_service_running{unit="smbd"} 0' in lines
+    assert 'pitv_service_running{unit="ssh"} 1' in lines
+    assert 'pitv_service_cpu_seconds_total{unit="ssh"} 1.5' in lines
+    assert 'pitv_service_cpu_ratio{unit="ssh"} 0.25' in lines
+    assert f'pitv_service_memory_peak_bytes{{unit="ssh"}} {6 << 20}' in lines
+    assert 'pitv_service_read_bytes_total{unit="ssh"} 4096' in lines
+    # A stopped unit has nothing but its running flag
+    assert [line for line in lines if 'smbd' in line] == ['pitv_service_running{unit="smbd"} 0']
+
+
+def test_write_services_without_memory_controller():
+    usage = {'lightdm': {'cpu_seconds': None, 'cpu': None, 'memory': None, 'memory_peak': None,
+                         'read_bytes': 0, 'write_bytes': 0, 'read_rate': 0.0, 'write_rate': 0.0}}
+    writer = MetricWriter()
+    write_services(writer, usage)
+    lines = samples(writer.text())
+    assert 'pitv_service_running{unit="lightdm"} 1' in lines
+    assert not any('cpu' in line or 'memory' in line for line in lines)
@@ -0,0 +1,44 @@
+import pytest
+
+from pitv.network import NetworkCollector
+
+DEV_HEADER = ("Inter-|   Receive                                                |  Transmit\n"
+              " face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed\n")
+ROUTE_HEADER = "Iface\tDestination\tGateway \tFlags\tRefCnt\tUse\tMetric\tMask\t\tMTU\tWindow\tIRTT\n"
+
+
+def write_proc(proc, rx, tx, default=None):
+    (proc / 'net').mkdir(parents=True, exist_ok=True)
+    (proc / 'net/dev').write_text(
+        DEV_HEADER
+        + "    lo: 500 5 0 0 0 0 0 0 500 5 0 0 0 0 0 0\n"
+        + f"  eth0: {rx} 10 0 0 0 0 0 0 {tx} 10 0 0 0 0 0 0\n")
+    routes = ["eth0\t0001A8C0\t00000000\t0001\t0\t0\t0\t00FFFFFF\t0\t0\t0\n"]
+    if default:
+        routes.insert(0, f"{default}\t00000000\t0101A8C0\t0003\t0\t0\t0\t00000000\t0\t0\t0\n")
+    (proc / 'net/route').write_text(ROUTE_HEADER + ''.join(routes))
+
+
+def test_default_route_is_online(tmp_path):
+    write_proc(tmp_path, 0, 0, default='eth0')
+    collector = NetworkCollector(str(tmp_path), alpha=1.0)
+    collector.sample(now=0)
+    write_proc(tmp_path, 4000, 1000, default='eth0')
+    network = collector.sample(now=2)
+    assert network['online'] and network['primary'] == 'eth0'
+    assert network['interfaces']['eth0']['rx_rate'] == pytest.approx(2000.0)
+    assert 'lo' not in network['interfaces']
+
+
+def test_lan_only_is_offline_but_shows_counters(tmp_path):
+    write_proc(tmp_path, 0, 0)
+    network = NetworkCollector(str(tmp_path)).sample(now=0)
+    assert not network['online']
+    assert network['primary'] == 'eth0'
+
+
+def test_default_route_on_missing_interface_is_offline(tmp_path):
+    write_proc(tmp_path, 0, 0, default='wlan0')
+    network = NetworkCollector(str(tmp_path)).sample(now=0)
+    assert not network['online']
+    assert network['primary'] == 'eth0'
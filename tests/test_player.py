@@ -0,0 +1,121 @@
+import time
+
+import pytest
+
+from pitv.player import PLAY_FLAGS, PlaybackStats, Player, describe_stats, load_gst, make_test_clip, wait_for
+
+Gst = load_gst()
+needs_gst = pytest.mark.skipif(Gst is None, reason="GStreamer (gir1.2-gstreamer-1.0) is not installed")
+
+
+def summary(**values):
+    base = {'first_frame_ms': None, 'seek_ms': None, 'rendered': 0, 'dropped': 0, 'decode_ms': None,
+            'buffer_percent': None, 'position': None, 'duration': None}
+    base.update(values)
+    return base
+
+
+def test_describe_stats_minimal():
+    assert describe_stats(summary()) == "rendered 0 · dropped 0"
+
+
+def test_describe_stats_full():
+    text = describe_stats(summary(first_frame_ms=212.4, seek_ms=88.6, rendered=1500, dropped=3, decode_ms=4.25,
+                                  buffer_percent=80, position=75.2, duration=3600.0))
+    assert text.split('\n') == [
+        "first frame 212 ms", "last seek 89 ms", "rendered 1500 · dropped 3", "decode 4.2 ms/frame",
+        "buffer 80%", "1:15 / 60:00"]
+
+
+def test_describe_stats_position_rounds_up_to_the_minute():
+    assert describe_stats(summary(position=59.7)).endswith("\n1:00")
+    # A live stream has no duration
+    assert describe_stats(summary(position=5.0, duration=None)).endswith("\n0:05")
+
+
+def test_first_frame_is_timed_once():
+    stats = PlaybackStats()
+    stats.frame()
+    # Nothing started: not a first frame
+    assert stats.first_frame_ms is None
+    stats.started = time.monotonic() - 0.25
+    stats.frame()
+    first = stats.first_frame_ms
+    assert 250.0 <= first < 1000.0
+    stats.frame()
+    assert stats.first_frame_ms == first
+
+
+def test_seek_is_timed_to_the_next_frame():
+    stats = PlaybackStats()
+    stats.seek_started = time.monotonic() - 0.1
+    stats.frame()
+    assert 100.0 <= stats.seek_ms < 1000.0
+    assert stats.seek_started is None
+    seek = stats.seek_ms
+    stats.frame()
+    assert stats.seek_ms == seek
+
+
+def test_decode_times_match_timestamps():
+    stats = PlaybackStats()
+    stats.decode_in(1000)
+    stats.decode_in(2000)
+    stats.decode_out(2000)
+    # Output without a matching input (e.g. after a flush) is ignored
+    stats.decode_out(3000)
+    assert len(stats.decode) == 1
+    assert list(stats.pending) == [1000]
+
+
+def test_unmatched_decode_inputs_are_bounded():
+    stats = PlaybackStats()
+    for pts in range(200):
+        stats.decode_in(pts)
+    assert len(stats.pending) <= 65
+
+
+def test_reset_between_videos():
+    stats = PlaybackStats()
+    stats.started = time.monotonic()
+    stats.frame()
+    stats.buffering = 50
+    stats.decode_in(1)
+    stats.decode_out(1)
+    stats.reset()
+    assert (stats.started, stats.first_frame_ms, stats.seek_ms, stats.buffering) == (None, None, None, None)
+    assert not stats.decode and not stats.pending
+
+
+@pytest.fixture
+def player():
+    sink = Gst.ElementFactory.make('fakesink', None)
+    sink.set_property('sync', True)
+    player = Player(Gst, sink)
+    yield player
+    player.shutdown()
+
+
+@needs_gst
+def test_player_is_prewarmed(player):
+    assert player.playbin.get_state(Gst.CLOCK_TIME_NONE)[1] == Gst.State.READY
+    assert player.playbin.get_property('flags') == PLAY_FLAGS
+    assert not player.playing()
+
+
+@needs_gst
+def test_play_times_first_frame_and_seek(player, tmp_path):
+    try:
+        clip = make_test_clip(Gst, str(tmp_path), seconds=8, size=(320, 240))
+    except OSError as e:
+        pytest.skip(str(e))
+    player.play(Gst.filename_to_uri(clip))
+    assert wait_for(lambda: player.stats.first_frame_ms) is not None
+    assert wait_for(lambda: player.summary()['position'] or None) is not None
+    assert player.seek(2)
+    assert wait_for(lambda: player.stats.seek_ms) is not None
+    summary = player.summary()
+    assert summary['rendered'] > 0
+    assert summary['duration'] == pytest.approx(8.0, abs=0.5)
+    player.stop()
+    assert player.playbin.get_state(Gst.CLOCK_TIME_NONE)[1] == Gst.State.READY
@@ -0,0 +1,149 @@
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from pitv.profiles import CASTING, IDLE, ActivityDetector, ProfileManager, current_profile
+
+TCP_HEADER = "  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid\n"
+
+
+class FakeRoot:
+    """sysfs and procfs of a four-core Pi with a USB LAN and SDIO Wi-Fi"""
+
+    def __init__(self, root, cpus=4):
+        self.root = root
+        self.proc = root / 'proc'
+        for cpu in range(cpus):
+            cpufreq = root / f'sys/devices/system/cpu/cpu{cpu}/cpufreq'
+            cpufreq.mkdir(parents=True)
+            (cpufreq / 'scaling_governor').write_text('ondemand\n')
+            (cpufreq / 'scaling_available_governors').write_text('ondemand powersave performance\n')
+        (root / 'sys/devices/system/cpu/cpufreq').mkdir()
+        (self.proc / 'net').mkdir(parents=True)
+        (self.proc / 'interrupts').write_text(
+            "           CPU0       CPU1       CPU2       CPU3\n"
+            " 17:       1000          0          0          0  ARMCTRL-level  1 Edge      3f00b880.mailbox\n"
+            " 56:      52000          0          0          0  ARMCTRL-level 64 Edge      dwc_otg, dwc_otg_pcd\n"
+            " 62:       9000          0          0          0  ARMCTRL-level 70 Edge      mmc1\n"
+            "IPI0:         0          0          0          0  CPU wakeup interrupts\n")
+        for irq in (17, 56, 62):
+            (self.proc / f'irq/{irq}').mkdir(parents=True)
+            (self.proc / f'irq/{irq}/smp_affinity').write_text('f\n')
+        self.connections([])
+
+    def connections(self, sessions):
+        """sessions: (local port, state) pairs"""
+        lines = [f"   {i}: 0100007F:{port:04X} 0A00000B:D431 {state} 00000000:00000000 00:00000000 00000000  1000\n"
+                 for i, (port, state) in enumerate(sessions)]
+        (self.proc / 'net/tcp').write_text(TCP_HEADER + ''.join(lines))
+
+    def process(self, pid, comm, ticks):
+        path = self.proc / str(pid)
+        path.mkdir(exist_ok=True)
+        (path / 'comm').write_text(comm + '\n')
+        # utime and stime are fields 14 and 15; comm in parentheses may hold spaces
+        (path / 'stat').write_text(f"{pid} ({comm}) S 1 {pid} {pid} 0 -1 0 0 0 0 0 {ticks} 0 0 0 20 0 1\n")
+
+    def governor(self, cpu):
+        return (self.root / f'sys/devices/system/cpu/cpu{cpu}/cpufreq/scaling_governor').read_text()
+
+    def affinity(self, irq):
+        return (self.proc / f'irq/{irq}/smp_affinity').read_text()
+
+
+@pytest.fixture
+def fake(tmp_path):
+    return FakeRoot(tmp_path)
+
+
+def test_established_cast_sessions_only(fake):
+    fake.connections([(8008, '01'), (7000, '01'), (8008, '0A'), (22, '01')])
+    assert ActivityDetector(str(fake.proc)).tcp_sessions() == 2
+
+
+def test_busy_receiver(fake):
+    detector = ActivityDetector(str(fake.proc), cpu_threshold=0.02)
+    fake.process(412, 'shairport-sync', 100)
+    fake.process(413, 'bash', 5000)
+    assert detector.detect(now=0) == (False, [])
+    fake.process(412, 'shairport-sync', 100 + detector.ticks_per_second)
+    assert detector.detect(now=10) == (True, ['shairport-sync busy'])
+    assert detector.detect(now=20) == (False, [])
+
+
+def test_receiver_restart_is_rescanned(fake):
+    detector = ActivityDetector(str(fake.proc))
+    fake.process(412, 'shairport-sync', 100)
+    detector.detect(now=0)
+    shutil.rmtree(fake.proc / '412')
+    fake.process(530, 'shairport-sync', 0)
+    detector.detect(now=5)
+    assert set(detector.pids) == {530}
+
+
+def test_casting_profile_keeps_network_irqs_off_the_ui_core(fake):
+    manager = ProfileManager(str(fake.root), ui_core=0, enter_checks=2, idle_seconds=60)
+    assert manager.check(now=0) == IDLE
+    fake.connections([(8008, '01')])
+    # One check isn't enough to switch
+    assert manager.check(now=5) == IDLE
+    assert manager.check(now=10) == CASTING
+    assert all(fake.governor(cpu) == 'performance' for cpu in range(4))
+    assert fake.affinity(56) == 'e'
+    assert fake.affinity(62) == 'e'
+    # Not a network device
+    assert fake.affinity(17) == 'f\n'
+    assert current_profile(str(fake.root / 'run/pitv/profile')) == CASTING
+
+
+def test_back_to_idle_after_quiet_period(fake):
+    manager = ProfileManager(str(fake.root), enter_checks=1, idle_seconds=60)
+    fake.connections([(5000, '01')])
+    assert manager.check(now=0) == CASTING
+    fake.connections([])
+    assert manager.check(now=30) == CASTING
+    assert manager.check(now=61) == IDLE
+    assert fake.governor(0) == 'ondemand'
+    assert fake.affinity(56) == 'f'
+    assert [t[1:] for t in manager.transitions] == [(None, CASTING), (CASTING, IDLE)]
+
+
+def test_powersave_without_ondemand(fake):
+    (fake.root / 'sys/devices/system/cpu/cpu0/cpufreq/scaling_available_governors').write_text('performance powersave\n')
+    manager = ProfileManager(str(fake.root))
+    manager.check(now=0)
+    assert fake.governor(3) == 'powersave'
+
+
+def test_stop_restores_defaults_and_withdraws_state(fake):
+    manager = ProfileManager(str(fake.root), enter_checks=1)
+    fake.connections([(8008, '01')])
+    assert manager.check(now=0) == CASTING
+    state = str(fake.root / 'run/pitv/profile')
+    assert current_profile(state) == CASTING
+    manager.stop()
+    assert current_profile(state) is None
+    assert all(fake.governor(cpu) == 'ondemand' for cpu in range(4))
+    assert fake.affinity(56) == 'f'
+    # Stopping twice (or before any check) is harmless
+    manager.stop()
+
+
+def test_sigterm_runs_stop(fake):
+    fake.connections([(8008, '01')])
+    state = fake.root / 'run/pitv/profile'
+    process = subprocess.Popen([sys.executable, '-m', 'pitv.profiles', '--root', str(fake.root),
+                                '--interval', '0.05'], env={'PYTHONPATH': ':'.join(sys.path)},
+                               stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while current_profile(str(state)) != CASTING and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert fake.governor(0) == 'performance'
+    process.send_signal(signal.SIGTERM)
+    assert process.wait(10) == 0
+    assert not state.exists()
+    assert fake.governor(0) == 'ondemand'
@@ -0,0 +1,171 @@
+import json
+import select
+import socket
+import threading
+import time
+
+import pytest
+
+from pitv.remoteinput import (DIRECTIONS, KEYS, InputReceiver, InputRelay, LatencyStats, coalesce,
+                              generate_trace, replay, serve_wsgi)
+from pitv.websocket import connect, same_origin
+
+
+class FakeUI:
+    """The TV interface end: receives events on a pumped InputReceiver"""
+
+    def __init__(self, path, delay=0.0):
+        self.events = []
+        self.delay = delay
+        self.receiver = InputReceiver(self.handle, path)
+        self.running = True
+        self.thread = threading.Thread(target=self.pump, daemon=True)
+        self.thread.start()
+
+    def handle(self, event):
+        self.events.append(event)
+        time.sleep(self.delay)
+
+    def pump(self):
+        while self.running:
+            if select.select([self.receiver.sock], [], [], 0.05)[0]:
+                self.receiver.dispatch()
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        self.receiver.close()
+
+
+@pytest.fixture
+def channel(tmp_path, upgrade_server):
+    """Relay behind a loopback server, with a fake UI on the input socket"""
+    path = str(tmp_path / 'input.sock')
+    relay = InputRelay(path)
+    server = upgrade_server(lambda environ: serve_wsgi(environ, relay))
+    ui = FakeUI(path)
+    yield relay, server, ui
+    ui.close()
+
+
+def key(k, seq, sender=None):
+    return {'type': 'key', 'key': k, 'seq': seq, 'sent': 1000.0 + seq, 'sender': sender, 'client': 1}
+
+
+def test_coalesce_repeats_and_text():
+    events = [key('down', 1), key('down', 2), key('down', 3), key('select', 4), key('select', 5),
+              {'type': 'text', 'text': 'ab', 'seq': 6}, {'type': 'text', 'text': 'c', 'seq': 7}]
+    merged = coalesce(events)
+    assert [(e['type'], e.get('key'), e['count']) for e in merged] == [
+        ('key', 'down', 3), ('key', 'select', 1), ('key', 'select', 1), ('text', None, 1)]
+    assert [part[2] for part in merged[0]['parts']] == [1, 2, 3]
+    # Typing is joined up rather than repeated
+    assert merged[3]['text'] == 'abc'
+    assert len(merged[3]['parts']) == 2
+
+
+def test_generated_trace():
+    trace = generate_trace(300, seed=7)
+    assert trace == generate_trace(300, seed=7)
+    assert len(trace) == 300
+    assert all(step['key'] in KEYS for step in trace)
+    assert [step['at'] for step in trace] == sorted(step['at'] for step in trace)
+    # Held keys show up as runs of one direction
+    runs = sum(1 for a, b in zip(trace, trace[1:]) if a['key'] == b['key'] in DIRECTIONS)
+    assert runs > 0
+
+
+def test_percentiles():
+    stats = LatencyStats(size=100)
+    assert stats.percentiles() == {'count': 0}
+    for latency in range(1, 201):
+        stats.add(float(latency))
+    stats.add(None)
+    assert stats.percentiles() == {'count': 100, 'p50': 151.0, 'p90': 191.0, 'p99': 200.0, 'max': 200.0}
+
+
+def test_receiver_acks_every_part(tmp_path):
+    events = []
+    receiver = InputReceiver(events.append, str(tmp_path / 'input.sock'))
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as phone:
+        phone.bind('')
+        phone.settimeout(2.0)
+        for seq in (1, 2):
+            phone.sendto(json.dumps({'type': 'key', 'key': 'left', 'client': 9, 'seq': seq}).encode(),
+                         receiver.path)
+        phone.sendto(b'not json', receiver.path)
+        phone.sendto(json.dumps({'type': 'key', 'key': 'eject'}).encode(), receiver.path)
+        receiver.dispatch()
+        acks = [json.loads(phone.recv(4096)) for _ in range(2)]
+    receiver.close()
+    event, = events
+    assert (event['key'], event['count']) == ('left', 2)
+    assert [(ack['client'], ack['seq'], ack['coalesced']) for ack in acks] == [(9, 1, 2), (9, 2, 2)]
+
+
+def test_replay_trace(channel):
+    relay, server, ui = channel
+    # A generated trace, squeezed to run quickly, with some typing mixed in
+    trace = [dict(step, at=step['at'] / 20) for step in generate_trace(60, seed=3)]
+    trace[10:10] = [{'at': trace[9]['at'], 'text': 'news'}]
+    result = replay(server.url('/ws/input'), trace)
+    assert (result['sent'], result['acked']) == (61, 61)
+    assert result['count'] == 61
+    assert 'error' not in result
+    received = sum(event['count'] for event in ui.events)
+    assert received == 61
+    assert relay.report()['events'] == 61
+
+
+def test_replay_without_tv(tmp_path, upgrade_server):
+    relay = InputRelay(str(tmp_path / 'nobody.sock'))
+    server = upgrade_server(lambda environ: serve_wsgi(environ, relay))
+    result = replay(server.url('/ws/input'), [{'at': 0, 'key': 'up'}], timeout=1.0)
+    assert result['error'] == 'TV interface is not running'
+
+
+def test_malformed_messages_keep_the_connection(channel):
+    relay, server, ui = channel
+    ws = connect(server.url('/ws/input'))
+    ws.send(json.dumps({'type': 'sync', 't1': 1.0}))
+    ws.send(json.dumps({'type': 'sync', 't1': 'soon', 'tc': 2.0}))
+    ws.send(json.dumps({'type': 'key', 'key': 'up', 'seq': 1, 't': 'now'}))
+    ws.send(json.dumps(['key', 'down']))
+    ws.send(json.dumps({'type': 'key', 'key': 'select', 'seq': 2}))
+    acked = []
+    deadline = time.monotonic() + 2.0
+    while len(acked) < 2 and time.monotonic() < deadline:
+        message = json.loads(ws.receive())
+        if message['type'] == 'ack':
+            acked.append(message['seq'])
+    ws.close()
+    assert acked == [1, 2]
+    assert [event['key'] for event in ui.events] == ['up', 'select']
+
+
+def test_cross_origin_handshake_refused(channel):
+    relay, server, ui = channel
+    assert server.handshake('/ws/input', Origin='http://evil.example') == 'HTTP/1.1 403 Forbidden'
+    assert server.handshake('/ws/input', Origin='null') == 'HTTP/1.1 403 Forbidden'
+    assert server.handshake('/ws/input', Origin=f'http://127.0.0.1:{server.port}') == \
+        'HTTP/1.1 101 Switching Protocols'
+    assert server.handshake('/ws/input') == 'HTTP/1.1 101 Switching Protocols'
+    assert relay.report()['events'] == 0
+
+
+def test_plain_get_is_not_an_upgrade():
+    assert not serve_wsgi({'HTTP_HOST': 'pi:8080'}, relay=None)
+
+
+@pytest.mark.parametrize('origin, host, allowed', [
+    (None, 'pi.local:8080', True),
+    ('http://pi.local:8080', 'pi.local:8080', True),
+    ('http://PI.local:8080', 'pi.local:8080', True),
+    ('http://pi.local:8081', 'pi.local:8080', False),
+    ('https://attacker.example', 'pi.local:8080', False),
+])
+def test_same_origin(origin, host, allowed):
+    environ = {'HTTP_HOST': host}
+    if origin is not None:
+        environ['HTTP_ORIGIN'] = origin
+    assert same_origin(environ) == allowed
@@ -0,0 +1,214 @@
+import struct
+import threading
+import time
+import zlib
+
+import pytest
+
+from pitv import screen
+from pitv.screen import (FRAME_HEADER, TILE_HEADER, ScreenStreamer, SyntheticSource, TileDiffer, downscale,
+                         X11Source, encode_png, pack, serve_wsgi)
+from pitv.websocket import connect
+
+
+def small_source():
+    return SyntheticSource(320, 240)
+
+
+def decode_png(png):
+    """(width, height, RGB rows) of an unfiltered 8-bit RGB PNG"""
+    assert png[:8] == b'\x89PNG\r\n\x1a\n'
+    chunks = {}
+    at = 8
+    while at < len(png):
+        length, = struct.unpack('!I', png[at:at + 4])
+        kind, data = png[at + 4:at + 8], png[at + 8:at + 8 + length]
+        crc, = struct.unpack('!I', png[at + 8 + length:at + 12 + length])
+        assert crc == zlib.crc32(kind + data)
+        chunks[kind] = data
+        at += 12 + length
+    width, height, depth, colour = struct.unpack('!IIBB', chunks[b'IHDR'][:10])
+    assert (depth, colour) == (8, 2)
+    raw = zlib.decompress(chunks[b'IDAT'])
+    line = 1 + width * 3
+    rows = [raw[y * line:(y + 1) * line] for y in range(height)]
+    assert all(row[0] == 0 for row in rows)
+    return width, height, [row[1:] for row in rows]
+
+
+def unpack(message):
+    """Frame size and {(x, y): (w, h, png)} from a preview message"""
+    size = FRAME_HEADER.unpack_from(message)
+    at = FRAME_HEADER.size
+    tiles = {}
+    while at < len(message):
+        x, y, w, h, length = TILE_HEADER.unpack_from(message, at)
+        at += TILE_HEADER.size
+        tiles[(x, y)] = (w, h, message[at:at + length])
+        at += length
+    return size, tiles
+
+
+def test_downscale_picks_pixels_and_swaps_to_rgb():
+    # 4x2 BGRX frame with padding at the end of each line
+    stride = 4 * 4 + 8
+    rows = [b''.join(bytes([x, y, 100 + x, 0]) for x in range(4)) + b'\xff' * 8 for y in range(2)]
+    width, height, rgb = downscale(4, 2, stride, b''.join(rows), 2)
+    assert (width, height) == (2, 1)
+    assert rgb == bytes([100, 0, 0, 102, 0, 2])
+
+
+def test_png_round_trip():
+    rows = [bytes(range(y, y + 9)) for y in range(5)]
+    assert decode_png(encode_png(3, 5, rows)) == (3, 5, rows)
+
+
+def test_tile_differ():
+    width, height = 70, 40
+    rgb = bytearray(width * height * 3)
+    differ = TileDiffer(tile=32)
+    changed = differ.update(width, height, bytes(rgb))
+    # Edge tiles are cut to the frame
+    assert {key: (w, h) for key, (w, h, png) in changed.items()} == {
+        (0, 0): (32, 32), (32, 0): (32, 32), (64, 0): (6, 32),
+        (0, 32): (32, 8), (32, 32): (32, 8), (64, 32): (6, 8)}
+    assert differ.update(width, height, bytes(rgb)) == {}
+    rgb[(35 * width + 40) * 3] = 255
+    changed = differ.update(width, height, bytes(rgb))
+    assert list(changed) == [(32, 32)]
+    w, h, png = changed[(32, 32)]
+    _, _, rows = decode_png(png)
+    assert rows[3][8 * 3] == 255
+    assert differ.full()[(32, 32)] == changed[(32, 32)]
+    # A new resolution starts over
+    assert len(differ.update(32, 32, bytes(32 * 32 * 3))) == 1
+
+
+def test_pack_orders_tiles_by_row():
+    tiles = {(32, 0): (32, 32, b'b'), (0, 32): (32, 8, b'cc'), (0, 0): (32, 32, b'a')}
+    message = pack((64, 40), tiles)
+    assert unpack(message) == ((64, 40), tiles)
+    positions = [TILE_HEADER.unpack_from(message, at)[:2] for at in (4, 4 + 12 + 1, 4 + 24 + 2)]
+    assert positions == [(0, 0), (32, 0), (0, 32)]
+
+
+def test_synthetic_frames_change_a_little():
+    streamer = ScreenStreamer(small_source, scale=2, tile=16)
+    source = small_source()
+    first = streamer.frame(source)
+    assert len(first) == (160 // 16) * (120 // 16 + 1)
+    second = streamer.frame(source)
+    assert 0 < len(second) < len(first) // 2
+    assert streamer.stats['frames'] == 2
+
+
+def test_frame_swaps_tiles_in_under_the_lock():
+    streamer = ScreenStreamer(small_source, scale=2, tile=16)
+    source = small_source()
+    streamer.frame(source)
+    before = streamer.differ.tiles
+    kept = dict(before)
+    done = threading.Event()
+    with streamer.lock:
+        worker = threading.Thread(target=lambda: (streamer.frame(source), done.set()))
+        worker.start()
+        # Diffed and encoded, but held back from readers until the lock is free
+        assert not done.wait(0.5)
+        assert streamer.differ.tiles is before
+    worker.join()
+    assert streamer.differ.tiles is not before
+    # Whoever was iterating the old tiles saw them unchanged
+    assert before == kept
+
+
+class FakeX11:
+    """Records the calls libX11 would get; every function returns 0"""
+
+    def __init__(self):
+        self.handlers = []
+
+    def __getattr__(self, name):
+        def function(*args):
+            return 0
+        # Kept, so prototypes set on it stay set
+        setattr(self, name, function)
+        return function
+
+    def XSetErrorHandler(self, handler):
+        self.handlers.append(handler)
+
+
+def test_x11_error_handler_installed_once(monkeypatch):
+    libraries = []
+
+    def load(path):
+        libraries.append(FakeX11())
+        return libraries[-1]
+    monkeypatch.setattr(screen, 'x11', None)
+    monkeypatch.setattr(screen.ctypes.util, 'find_library', lambda name: 'libX11.so.6')
+    monkeypatch.setattr(screen.ctypes, 'CDLL', load)
+    # A snapshot per request makes and drops a source each time
+    for _ in range(3):
+        source = X11Source()
+        del source
+    library, = libraries
+    assert library.handlers == [screen.IGNORE_ERRORS]
+
+
+def test_x11_missing(monkeypatch):
+    monkeypatch.setattr(screen, 'x11', None)
+    monkeypatch.setattr(screen.ctypes.util, 'find_library', lambda name: None)
+    with pytest.raises(OSError):
+        X11Source()
+
+
+def test_snapshot_without_viewers():
+    streamer = ScreenStreamer(small_source, scale=4)
+    width, height, rows = decode_png(streamer.snapshot())
+    assert (width, height) == (80, 60)
+    assert streamer.thread is None
+
+
+@pytest.fixture
+def preview(upgrade_server):
+    streamer = ScreenStreamer(small_source, fps=20.0, scale=2, tile=32)
+    server = upgrade_server(lambda environ: serve_wsgi(environ, streamer))
+    return streamer, server
+
+
+def test_viewer_gets_full_frame_then_changes(preview):
+    streamer, server = preview
+    ws = connect(server.url('/api/screen'))
+    size, tiles = unpack(ws.receive())
+    assert size == (160, 120)
+    # The first message may still be partial if it raced the first capture
+    seen = set(tiles)
+    for _ in range(10):
+        size, tiles = unpack(ws.receive())
+        seen |= set(tiles)
+    assert seen == {(x, y) for x in range(0, 160, 32) for y in range(0, 120, 32)}
+    # Counted once sent, which may trail what has arrived
+    assert streamer.report()['viewers'][0]['frames'] >= 10
+
+    # A second viewer joining mid-stream gets every tile at once
+    late = connect(server.url('/api/screen'))
+    assert len(unpack(late.receive())[1]) == len(seen)
+    late.close()
+    ws.close()
+    deadline = time.monotonic() + 5.0
+    while streamer.thread is not None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    # Nobody watching: capture stops
+    assert streamer.thread is None
+    assert streamer.report()['viewers'] == []
+
+
+def test_cross_origin_viewer_refused(preview):
+    streamer, server = preview
+    assert server.handshake('/api/screen', Origin='http://evil.example') == 'HTTP/1.1 403 Forbidden'
+    assert streamer.thread is None
+    assert streamer.report()['viewers'] == []
+
+
+def test_plain_get_is_not_an_upgrade():
+    assert not serve_wsgi({'HTTP_HOST': 'pi:8080'}, streamer=None)
@@ -0,0 +1,146 @@
+import asyncio
+import socket
+import threading
+
+import pytest
+
+from pitv.dial import DESCRIPTION_PATH, SERVICE_TYPE, UUID, app_pids
+from pitv.ssdp import (SSDP_GROUP, SSDP_PORT, TARGETS, RateLimiter, SSDPResponder, local_address,
+                       multicast_socket, parse_request, search)
+
+
+def m_search(target, man='"ssdp:discover"'):
+    return (
+        'M-SEARCH * HTTP/1.1\r\n'
+        f'HOST: {SSDP_GROUP}:{SSDP_PORT}\r\n'
+        f'MAN: {man}\r\n'
+        'MX: 1\r\n'
+        f'ST: {target}\r\n'
+        '\r\n'
+    ).encode()
+
+
+class RecordingTransport:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, addr):
+        self.sent.append((data, addr))
+
+
+@pytest.fixture
+def responder():
+    responder = SSDPResponder(port=8008)
+    responder.connection_made(RecordingTransport())
+    return responder
+
+
+def test_parse_request():
+    line, headers = parse_request(m_search(SERVICE_TYPE))
+    assert line == 'M-SEARCH * HTTP/1.1'
+    assert headers['st'] == SERVICE_TYPE
+    assert headers['man'] == '"ssdp:discover"'
+
+
+def test_reply_to_one_target(responder):
+    responder.datagram_received(m_search(SERVICE_TYPE), ('127.0.0.1', 40000))
+    (data, addr), = responder.transport.sent
+    assert addr == ('127.0.0.1', 40000)
+    line, headers = parse_request(data)
+    assert line == 'HTTP/1.1 200 OK'
+    assert headers['location'] == f'http://127.0.0.1:8008{DESCRIPTION_PATH}'
+    assert headers['usn'] == f'uuid:{UUID}::{SERVICE_TYPE}'
+    # Serialized once, reused for the next search
+    responder.datagram_received(m_search(SERVICE_TYPE), ('127.0.0.1', 40001))
+    assert responder.transport.sent[1][0] is data
+
+
+def test_ssdp_all_and_ignored_searches(responder):
+    responder.datagram_received(m_search('ssdp:all'), ('127.0.0.1', 40000))
+    assert [parse_request(data)[1]['st'] for data, _ in responder.transport.sent] == list(TARGETS)
+    responder.transport.sent.clear()
+    responder.datagram_received(m_search('urn:schemas-upnp-org:device:MediaRenderer:1'), ('127.0.0.1', 40000))
+    responder.datagram_received(m_search(SERVICE_TYPE, man='"ssdp:other"'), ('127.0.0.1', 40000))
+    responder.datagram_received(b'NOTIFY * HTTP/1.1\r\n\r\n', ('127.0.0.1', 40000))
+    assert responder.transport.sent == []
+    assert responder.stats == {'searches': 3, 'replies': 4, 'limited': 0}
+
+
+def test_storm_is_rate_limited():
+    responder = SSDPResponder(limiter=RateLimiter(rate=0.0, burst=3.0))
+    responder.connection_made(RecordingTransport())
+    for _ in range(10):
+        responder.datagram_received(m_search(SERVICE_TYPE), ('127.0.0.1', 40000))
+    assert len(responder.transport.sent) == 3
+    assert responder.stats['limited'] == 7
+
+
+def test_rate_limiter_refills():
+    limiter = RateLimiter(rate=1.0, burst=2.0, total_rate=100.0, total_burst=3.0)
+    assert [limiter.allow('a', 0.0) for _ in range(3)] == [True, True, False]
+    # The shared bucket caps senders together
+    assert [limiter.allow('b', 0.0) for _ in range(2)] == [True, False]
+    assert limiter.allow('a', 1.0)
+    assert not limiter.allow('a', 1.0)
+
+
+def test_notify(responder):
+    alive = responder.notify('192.168.1.50', 'ssdp:alive')
+    byebye = responder.notify('192.168.1.50', 'ssdp:byebye')
+    assert len(alive) == len(byebye) == len(TARGETS)
+    _, headers = parse_request(alive[0])
+    assert headers['nts'] == 'ssdp:alive'
+    assert headers['location'] == f'http://192.168.1.50:8008{DESCRIPTION_PATH}'
+    _, headers = parse_request(byebye[0])
+    assert headers['nts'] == 'ssdp:byebye'
+    assert 'location' not in headers
+
+
+def test_local_address():
+    assert local_address('127.0.0.1') == '127.0.0.1'
+
+
+@pytest.fixture
+def live_responder():
+    """The responder on the real SSDP port, joined to the group on loopback"""
+    try:
+        sock = multicast_socket('127.0.0.1')
+    except OSError as e:
+        pytest.skip(f"no multicast on loopback: {e}")
+    loop = asyncio.new_event_loop()
+    responder = SSDPResponder()
+    transport, _ = loop.run_until_complete(loop.create_datagram_endpoint(lambda: responder, sock=sock))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield responder
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    transport.close()
+    loop.close()
+
+
+def test_multicast_search_on_loopback(live_responder):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+        client.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton('127.0.0.1'))
+        client.settimeout(2.0)
+        client.sendto(m_search(SERVICE_TYPE), (SSDP_GROUP, SSDP_PORT))
+        data, peer = client.recvfrom(2048)
+    _, headers = parse_request(data)
+    assert headers['st'] == SERVICE_TYPE
+    assert headers['location'] == f'http://127.0.0.1:8008{DESCRIPTION_PATH}'
+
+
+def test_search_client(live_responder):
+    replies = search('127.0.0.1', target='ssdp:all', count=2, timeout=0.5)
+    assert len(replies) == 2 * len(TARGETS)
+    assert all(peer[0] == '127.0.0.1' for _, peer, _ in replies)
+
+
+def test_app_pids(tmp_path):
+    for pid, argv in ((100, ['chromium', '--app=https://www.youtube.com/tv?pairingCode=1']),
+                      (101, ['chromium', '--app=https://example.com']),
+                      (102, [])):
+        (tmp_path / str(pid)).mkdir()
+        (tmp_path / str(pid) / 'cmdline').write_bytes(b'\0'.join(a.encode() for a in argv))
+    (tmp_path / 'self').mkdir()
+    assert app_pids(['chromium-browser', '--app=https://www.youtube.com/tv'], str(tmp_path)) == [100]
@@ -0,0 +1,187 @@
+import json
+import os
+import signal
+import socket
+import sys
+
+import pytest
+
+from pitv.supervisor import Program, Supervisor, demo_programs, fifo_exists, port_open
+
+
+def dummy(name, code='import time; time.sleep(3600)', ready=lambda: False, **options):
+    """A child running a bit of Python"""
+    return Program(name, [sys.executable, '-c', code], ready=ready, stop_timeout=1.0, **options)
+
+
+@pytest.fixture
+def supervisors():
+    """Supervisors made by a test; their children are stopped afterwards"""
+    made = []
+    handlers = {signum: signal.getsignal(signum)
+                for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD)}
+
+    def make(*programs, **options):
+        supervisor = Supervisor(programs, **options)
+        made.append(supervisor)
+        return supervisor
+    yield make
+    for supervisor in made:
+        for child in supervisor.children:
+            supervisor.stop(child)
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+
+def exited(child):
+    child.process.wait(5)
+
+
+def test_backoff_doubles_up_to_maximum(supervisors):
+    supervisor = supervisors(dummy('crash', 'raise SystemExit(3)'), initial=0.5, maximum=2.0, stable=60.0)
+    child, = supervisor.children
+    supervisor.spawn(child, 0.0)
+    delays = []
+    now = 0.0
+    for _ in range(5):
+        exited(child)
+        # Exit noticed and restart scheduled
+        supervisor.step(now)
+        delays.append(child.next_start - now if child.state == 'backoff' else 0.0)
+        now = child.next_start
+        if child.state == 'backoff':
+            supervisor.step(now)
+        assert child.state == 'starting'
+    assert delays == [0.0, 0.5, 1.0, 2.0, 2.0]
+    assert (child.crashes, child.restarts, child.last_exit) == (5, 5, 3)
+
+
+def test_stable_run_resets_backoff(supervisors):
+    supervisor = supervisors(dummy('crash', 'raise SystemExit(1)'), initial=0.5, stable=60.0)
+    child, = supervisor.children
+    supervisor.spawn(child, 0.0)
+    for now in (0.0, 1.0):
+        exited(child)
+        supervisor.step(now)
+        supervisor.step(child.next_start)
+    exited(child)
+    # Up for longer than `stable`: restarted straight away
+    supervisor.step(100.0)
+    assert child.state == 'starting'
+    assert child.consecutive == 1
+
+
+def test_recovery_measured_from_exit_to_ready(supervisors, tmp_path):
+    marker = tmp_path / 'up'
+    program = dummy('server', ready=marker.exists)
+    supervisor = supervisors(program)
+    child, = supervisor.children
+    supervisor.spawn(child, 0.0)
+    supervisor.step(0.1)
+    assert child.state == 'starting'
+    marker.touch()
+    supervisor.step(0.2)
+    assert child.state == 'ready'
+    assert not child.recoveries
+
+    marker.unlink()
+    supervisor.kill(child, signal.SIGKILL)
+    exited(child)
+    supervisor.step(10.0)
+    assert (child.state, child.last_exit) == ('starting', -signal.SIGKILL)
+    supervisor.step(11.0)
+    marker.touch()
+    supervisor.step(12.5)
+    assert child.state == 'ready'
+    assert list(child.recoveries) == [2.5]
+    report = supervisor.report(now=20.0)['server']
+    assert (report['uptime'], report['restarts'], report['last_recovery']) == (7.5, 1, 2.5)
+
+
+def test_unhealthy_child_is_killed(supervisors, tmp_path):
+    marker = tmp_path / 'up'
+    marker.touch()
+    supervisor = supervisors(dummy('server', ready=marker.exists), check_every=1.0, unhealthy_after=3)
+    child, = supervisor.children
+    supervisor.spawn(child, 0.0)
+    supervisor.step(0.0)
+    assert child.state == 'ready'
+    marker.unlink()
+    for now in (1.0, 2.0):
+        supervisor.step(now)
+        assert child.process.poll() is None
+    supervisor.step(3.0)
+    exited(child)
+    supervisor.step(3.1)
+    assert child.last_exit == -signal.SIGKILL
+    assert child.state == 'starting'
+
+
+def test_hung_start_is_killed(supervisors):
+    supervisor = supervisors(dummy('hung'), ready_timeout=5.0)
+    child, = supervisor.children
+    supervisor.spawn(child, 0.0)
+    supervisor.step(4.9)
+    assert child.process.poll() is None
+    supervisor.step(5.0)
+    exited(child)
+    supervisor.step(5.1)
+    assert (child.crashes, child.last_exit) == (1, -signal.SIGKILL)
+
+
+def test_missing_program_backs_off(supervisors):
+    supervisor = supervisors(Program('missing', ['/nonexistent/receiver'], ready=lambda: True))
+    child, = supervisor.children
+    supervisor.spawn(child, 0.0)
+    assert (child.state, child.last_exit, child.crashes) == ('backoff', None, 1)
+
+
+def test_on_demand_idle_exit_stops_supervisor(supervisors):
+    with socket.socket() as listener:
+        listener.bind(('127.0.0.1', 0))
+        listener.listen()
+        program = dummy('cast', 'import os; assert os.environ["LISTEN_FDS"] == "1"', on_demand=True)
+        supervisor = supervisors(program, sockets=[listener])
+        child, = supervisor.children
+        supervisor.spawn(child, 0.0)
+        exited(child)
+        supervisor.step(1.0)
+    assert child.state == 'stopped'
+    assert child.crashes == 0
+    assert supervisor.stopping
+
+
+def test_state_file(supervisors, tmp_path):
+    path = tmp_path / 'supervisor.json'
+    supervisor = supervisors(dummy('hung'), state_path=str(path))
+    supervisor.spawn(supervisor.children[0], 0.0)
+    supervisor.save(1.0)
+    state = json.loads(path.read_text())
+    assert state['hung']['state'] == 'starting'
+    assert state['hung']['pid'] == supervisor.children[0].process.pid
+
+
+def test_probes(tmp_path):
+    with socket.socket() as listener:
+        listener.bind(('127.0.0.1', 0))
+        listener.listen()
+        port = listener.getsockname()[1]
+        assert port_open(port)()
+    assert not port_open(port)()
+    pipe = tmp_path / 'pipe'
+    assert not fifo_exists(str(pipe))()
+    os.mkfifo(pipe)
+    assert fifo_exists(str(pipe))()
+
+
+def test_run_with_demo_children(supervisors):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    supervisor = supervisors(*demo_programs(port), ready_timeout=1.0, check_every=0.5)
+    supervisor.run(2.5)
+    report = supervisor.report()
+    assert report['flaky']['restarts'] >= 1
+    assert report['flaky']['recoveries']
+    assert report['hung']['crashes'] >= 1
+    assert all(child.process.poll() is not None for child in supervisor.children)
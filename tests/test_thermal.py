@@ -0,0 +1,94 @@
+import pytest
+
+from pitv.thermal import HOT, NORMAL, WARM, ThermalGovernor, read_temperature
+
+
+class FakeSoc:
+    """Thermal zones and firmware throttle flags in a fake sysfs root"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def set(self, *celsius, flags=None):
+        for zone, value in enumerate(celsius):
+            path = self.root / f'class/thermal/thermal_zone{zone}'
+            path.mkdir(parents=True, exist_ok=True)
+            (path / 'temp').write_text(f'{int(value * 1000)}\n')
+        if flags is not None:
+            firmware = self.root / 'devices/platform/soc/soc:firmware'
+            firmware.mkdir(parents=True, exist_ok=True)
+            (firmware / 'get_throttled').write_text(f'{flags:#x}\n')
+
+
+@pytest.fixture
+def soc(tmp_path):
+    return FakeSoc(tmp_path)
+
+
+def test_hottest_zone(soc):
+    assert read_temperature(str(soc.root)) is None
+    soc.set(48.5, 61.25)
+    assert read_temperature(str(soc.root)) == 61.25
+
+
+def test_cool_and_steady_stays_normal(soc):
+    governor = ThermalGovernor(str(soc.root))
+    for t in range(0, 60, 5):
+        soc.set(55.0)
+        assert governor.update(now=t) == NORMAL
+
+
+def test_rising_trend_steps_down_before_the_limit(soc):
+    governor = ThermalGovernor(str(soc.root), soft_limit=70.0, horizon=30.0)
+    levels = []
+    governor.listen(lambda level, previous: levels.append((level, previous)))
+    # 0.2 °C/s: 30 s ahead is 6 °C hotter
+    for t in range(0, 35, 5):
+        soc.set(60.0 + 0.2 * t)
+        governor.update(now=t)
+    assert governor.temperature < 70.0
+    assert governor.predicted >= 70.0
+    assert governor.level == WARM
+    assert levels == [(WARM, NORMAL)]
+
+
+def test_throttle_flags_mean_hot(soc):
+    governor = ThermalGovernor(str(soc.root))
+    soc.set(60.0, flags=0x4)
+    assert governor.update(now=0) == HOT
+    assert governor.report()['throttle_flags'] == ['throttled']
+
+
+def test_undervoltage_alone_is_warm(soc):
+    governor = ThermalGovernor(str(soc.root))
+    soc.set(50.0, flags=0x1)
+    assert governor.update(now=0) == WARM
+
+
+def test_cooldown_hysteresis(soc):
+    governor = ThermalGovernor(str(soc.root), soft_limit=70.0, cooldown=5.0)
+    soc.set(71.0)
+    assert governor.update(now=0) == WARM
+    soc.set(67.0)
+    assert governor.update(now=10) == WARM
+    soc.set(64.0)
+    assert governor.update(now=20) == NORMAL
+
+
+def test_time_at_each_level(soc):
+    governor = ThermalGovernor(str(soc.root), max_gap=10.0)
+    soc.set(82.0)
+    governor.update(now=0)
+    governor.update(now=4)
+    # A long gap (suspend, stalled loop) counts for at most max_gap
+    governor.update(now=100)
+    report = governor.report()
+    assert report['hot_seconds'] == 14.0
+    assert report['warm_seconds'] == 0.0
+    assert governor.interval_scale() == 4
+
+
+def test_no_sensor_keeps_level(soc):
+    governor = ThermalGovernor(str(soc.root))
+    assert governor.update(now=0) == NORMAL
+    assert governor.temperature is None
@@ -0,0 +1,209 @@
+import io
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from pitv.upload import (EXPIRE_SECONDS, PatternStream, UploadError, UploadStore, parse_size, pattern_sha256,
+                         safe_name)
+
+# A multiple of the store's chunk, so reads are never cut short by the pattern wrapping
+BLOCK = bytes(range(256)) * 4
+SIZE = 10000
+
+
+def pattern(start, end):
+    stream = PatternStream(BLOCK, start, end)
+    return b''.join(iter(lambda: stream.read(end), b''))
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    staging = str(tmp_path / 'staging')
+    library = {'video': str(tmp_path / 'Videos'), 'audio': str(tmp_path / 'Music')}
+    return staging, library
+
+
+@pytest.fixture
+def store(dirs):
+    staging, library = dirs
+    return UploadStore(staging, library, chunk=512, commit=2048)
+
+
+def reopen(store):
+    """A new store on the same directories, as after the server restarts"""
+    return UploadStore(store.staging, store.library, store.chunk, store.commit_bytes)
+
+
+def test_safe_name_and_sizes():
+    assert safe_name('../../etc/passwd') == 'passwd'
+    assert safe_name('C:\\Users\\me\\.clip\n.mp4') == 'clip.mp4'
+    assert parse_size('4G') == 4 << 30
+    assert parse_size('512kb') == 512 << 10
+
+
+def test_upload_in_one_request(store):
+    upload = store.create('holiday.mp4', SIZE, pattern_sha256(BLOCK, SIZE))
+    store.write(upload.id, 0, PatternStream(BLOCK, 0, SIZE), length=SIZE)
+    assert upload.result == os.path.join(store.library['video'], 'holiday.mp4')
+    with open(upload.result, 'rb') as f:
+        assert f.read() == pattern(0, SIZE)
+    assert upload.info()['complete']
+    assert os.listdir(store.staging) == []
+    assert store.report()['completed'] == 1
+
+
+def test_offset_mismatch_is_409_with_the_real_offset(store):
+    upload = store.create('clip.mp4', SIZE)
+    store.write(upload.id, 0, PatternStream(BLOCK, 0, 3000), length=3000)
+    with pytest.raises(UploadError) as raised:
+        store.write(upload.id, 2000, PatternStream(BLOCK, 2000, 4000), length=2000)
+    assert raised.value.status == 409
+    assert raised.value.upload.info()['offset'] == 3000
+    # Nothing was written by the refused request
+    assert os.path.getsize(upload.path) == 3000
+
+
+def test_interrupted_body_is_kept_and_resumed(store):
+    expected = pattern_sha256(BLOCK, SIZE)
+    upload = store.create('clip.mp4', SIZE, expected)
+    # The connection drops partway: not an error, the bytes that arrived stay
+    store.write(upload.id, 0, PatternStream(BLOCK, 0, SIZE, fail_at=4500))
+    assert upload.offset == 4608
+    assert upload.result is None
+    with open(upload.state_path) as f:
+        assert json.load(f)['offset'] == 4608
+    # A body that just ends early is the same
+    store.write(upload.id, upload.offset, io.BytesIO(pattern(4608, 6000)))
+    assert upload.offset == 6000
+    store.write(upload.id, upload.offset, PatternStream(BLOCK, upload.offset, SIZE))
+    assert upload.sha256 == expected
+    assert upload.result is not None
+
+
+def test_reload_truncates_to_committed_offset_and_rehashes(store):
+    expected = pattern_sha256(BLOCK, SIZE)
+    upload = store.create('clip.mp4', SIZE, expected)
+    store.write(upload.id, 0, PatternStream(BLOCK, 0, 5000), length=5000)
+    # The server died after more bytes reached the file but before they were recorded
+    with open(upload.path, 'ab') as f:
+        f.write(b'\xff' * 1500)
+    store = reopen(store)
+    resumed = store.get(upload.id)
+    assert resumed is not upload
+    assert resumed.offset == 5000
+    assert os.path.getsize(resumed.path) == 5000
+    assert resumed.digest is None
+    store.write(resumed.id, 5000, PatternStream(BLOCK, 5000, SIZE))
+    # The hash of the first 5000 bytes was rebuilt from the file
+    assert resumed.sha256 == expected
+    assert resumed.result is not None
+
+
+def test_reload_keeps_a_shorter_file_s_length(store):
+    upload = store.create('clip.mp4', SIZE)
+    store.write(upload.id, 0, PatternStream(BLOCK, 0, 5000), length=5000)
+    # The recorded offset got ahead of what reached the card
+    os.truncate(upload.path, 4000)
+    assert reopen(store).get(upload.id).offset == 4000
+
+
+def test_checksum_mismatch_is_422_and_discards(store):
+    upload = store.create('clip.mp4', SIZE, 'ab' * 32)
+    with pytest.raises(UploadError) as raised:
+        store.write(upload.id, 0, PatternStream(BLOCK, 0, SIZE))
+    assert raised.value.status == 422
+    assert os.listdir(store.staging) == []
+    assert not os.path.exists(os.path.join(store.library['video'], 'clip.mp4'))
+    assert store.pending() == []
+    with pytest.raises(UploadError) as raised:
+        store.get(upload.id)
+    assert raised.value.status == 404
+    assert store.report()['failed'] == 1
+
+
+def test_name_collision_numbers_the_new_file(store):
+    paths = []
+    for _ in range(3):
+        upload = store.create('song.mp3', 100)
+        store.write(upload.id, 0, PatternStream(BLOCK, 0, 100))
+        paths.append(upload.result)
+    music = store.library['audio']
+    assert paths == [os.path.join(music, 'song.mp3'), os.path.join(music, 'song (2).mp3'),
+                     os.path.join(music, 'song (3).mp3')]
+
+
+def test_zero_byte_upload_completes_on_create(store):
+    upload = store.create('empty.mp4', 0, pattern_sha256(BLOCK, 0))
+    assert upload.result == os.path.join(store.library['video'], 'empty.mp4')
+    assert os.path.getsize(upload.result) == 0
+    assert store.pending() == []
+    with pytest.raises(UploadError) as raised:
+        store.write(upload.id, 0, io.BytesIO(b''))
+    assert raised.value.status == 409
+
+
+def test_body_past_declared_size_is_400(store):
+    upload = store.create('clip.mp4', 100)
+    with pytest.raises(UploadError) as raised:
+        store.write(upload.id, 0, io.BytesIO(b'x' * 200), length=200)
+    assert raised.value.status == 400
+    assert upload.offset == 0
+
+
+@pytest.mark.parametrize('name, size, sha256', [
+    ('', 10, None), ('.', 10, None), ('clip.mp4', -1, None), ('clip.mp4', '10', None),
+    ('clip.mp4', 10, 'not hex'),
+])
+def test_bad_create_is_400(store, name, size, sha256):
+    with pytest.raises(UploadError) as raised:
+        store.create(name, size, sha256)
+    assert raised.value.status == 400
+
+
+def test_one_writer_at_a_time(store):
+    upload = store.create('clip.mp4', SIZE)
+    with upload.lock:
+        with pytest.raises(UploadError) as raised:
+            store.write(upload.id, 0, PatternStream(BLOCK, 0, SIZE))
+    assert raised.value.status == 409
+
+
+def test_state_left_by_a_finished_upload_is_removed(store):
+    upload = store.create('clip.mp4', SIZE)
+    store.write(upload.id, 0, PatternStream(BLOCK, 0, 5000), length=5000)
+    # Stopped between moving the file into the library and removing the state
+    os.remove(upload.path)
+    store = reopen(store)
+    assert store.pending() == []
+    assert os.listdir(store.staging) == []
+
+
+def test_expired_uploads_are_dropped_on_load(store):
+    upload = store.create('clip.mp4', SIZE)
+    old = time.time() - EXPIRE_SECONDS - 60
+    os.utime(upload.state_path, (old, old))
+    assert reopen(store).pending() == []
+    assert os.listdir(store.staging) == []
+
+
+def test_cancel_while_others_create(store):
+    uploads = [store.create(f'clip{i}.mp4', SIZE) for i in range(20)]
+    errors = []
+
+    def create():
+        try:
+            for i in range(20):
+                store.create(f'more{i}.mp4', 10)
+        except Exception as e:
+            errors.append(e)
+
+    creator = threading.Thread(target=create)
+    creator.start()
+    for upload in uploads:
+        store.cancel(upload.id)
+    creator.join()
+    assert errors == []
+    assert sorted(u['name'] for u in store.pending()) == sorted(f'more{i}.mp4' for i in range(20))